@@ -0,0 +1,256 @@
+# LLM_Test/SQL_columnar.py
+
+import sqlite3
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from SQL_query_guard import count_rows
+
+# Rows fetched from the cursor per chunk when building a ColumnarResult
+FETCH_CHUNK_ROWS = 65536
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+# A text column is dictionary-encoded when it has at most this many distinct values
+# and they are at most half of the rows (Gender, Name, 'HH:MM' times, ...)
+DICT_MAX_DISTINCT = 65536
+
+
+class DictColumn:
+    """
+    Dictionary-encoded text column: int32 codes into a value table, -1 is NULL.
+    Indexing and iteration give the decoded values, so it can stand in for a list,
+    while mode / counts / equality filters run on the integer codes.
+    """
+
+    def __init__(self, codes: array, values: List[str]):
+        self.codes = codes
+        self.values = values
+
+    @classmethod
+    def encode(cls, raw: List[Optional[str]]) -> "DictColumn":
+        table: Dict[str, int] = {}
+        codes = array("i", (-1 if v is None else table.setdefault(v, len(table)) for v in raw))
+        return cls(codes, list(table.keys()))
+
+    @classmethod
+    def concat(cls, parts: List["DictColumn"]) -> "DictColumn":
+        """Merge columns with different value tables by re-coding into one table."""
+        table: Dict[str, int] = {}
+        codes = array("i")
+        for part in parts:
+            remap = [table.setdefault(v, len(table)) for v in part.values]
+            codes.extend(-1 if c < 0 else remap[c] for c in part.codes)
+        return cls(codes, list(table.keys()))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [None if c < 0 else self.values[c] for c in self.codes[item]]
+        c = self.codes[item]
+        return None if c < 0 else self.values[c]
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        values = self.values
+        return (None if c < 0 else values[c] for c in self.codes)
+
+    def __repr__(self) -> str:
+        return f"DictColumn(rows={len(self.codes)}, distinct={len(self.values)})"
+
+    def code_of(self, value: str) -> Optional[int]:
+        try:
+            return self.values.index(value)
+        except ValueError:
+            return None
+
+    def code_counts(self) -> List[int]:
+        """Occurrences of every value, indexed by code (NULLs are not counted)."""
+        # Counter's C counting loop over small ints is much faster than a Python loop
+        by_code = Counter(self.codes)
+        return [by_code.get(c, 0) for c in range(len(self.values))]
+
+    def value_counts(self) -> Dict[str, int]:
+        return dict(zip(self.values, self.code_counts()))
+
+    def mode(self) -> Tuple[Optional[str], int]:
+        counts = self.code_counts()
+        if not counts:
+            return None, 0
+        best = max(range(len(counts)), key=counts.__getitem__)
+        return self.values[best], counts[best]
+
+    def take(self, indices) -> "DictColumn":
+        codes = self.codes
+        return DictColumn(array("i", (codes[i] for i in indices)), self.values)
+
+    def slice(self, start: int, stop: int) -> "DictColumn":
+        return DictColumn(self.codes[start:stop], self.values)
+
+
+def typed_column(values: List[Any]):
+    """
+    Pack a column into a typed buffer when possible:
+    all int -> array('q'), all int/float -> array('d'),
+    low-cardinality text -> DictColumn, otherwise keep the Python list.
+    NULLs keep a numeric column as a list, so there is no validity bitmap to carry around.
+    """
+    if values and all(type(v) is int and _INT64_MIN <= v <= _INT64_MAX for v in values):
+        return array("q", values)
+    if values and all(type(v) in (int, float) for v in values):
+        return array("d", values)
+    if values and all(v is None or type(v) is str for v in values):
+        distinct = len(set(values))
+        if distinct <= DICT_MAX_DISTINCT and distinct * 2 <= len(values):
+            return DictColumn.encode(values)
+    return list(values)
+
+
+class ColumnarResult:
+    """
+    A Query / tool result stored column by column instead of as a list of row dicts.
+    Numeric columns are array.array buffers (buffer protocol, zero-copy memoryview and
+    Arrow export), low-cardinality text columns are DictColumns, others stay Python lists.
+    """
+
+    def __init__(self, columns: Dict[str, Any], num_rows: int):
+        self.columns = columns
+        self.num_rows = num_rows
+
+    # ---- construction ----
+    @classmethod
+    def from_cursor(cls, cursor: sqlite3.Cursor, chunk_rows: int = FETCH_CHUNK_ROWS) -> "ColumnarResult":
+        """Build directly from the cursor in chunks, never materializing row dicts."""
+        names = [desc[0] for desc in cursor.description]
+        raw: List[List[Any]] = [[] for _ in names]
+        num_rows = 0
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            num_rows += len(chunk)
+            count_rows(len(chunk))
+            for col_values, chunk_values in zip(raw, zip(*chunk)):
+                col_values.extend(chunk_values)
+        return cls({name: typed_column(values) for name, values in zip(names, raw)}, num_rows)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "ColumnarResult":
+        names: List[str] = []
+        for row in rows[:1]:
+            names = list(row.keys())
+        columns = {name: typed_column([row.get(name) for row in rows]) for name in names}
+        return cls(columns, len(rows))
+
+    # ---- access ----
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __getitem__(self, item):
+        # Slices give row dicts, so the existing "[DEBUG] data[:5]" previews keep working
+        if isinstance(item, slice):
+            return self.to_rows(item.start, item.stop)
+        raise TypeError("ColumnarResult only supports slicing, use column(name) for a column")
+
+    def __repr__(self) -> str:
+        return f"ColumnarResult(rows={self.num_rows}, columns={list(self.columns.keys())})"
+
+    def column_names(self) -> List[str]:
+        return list(self.columns.keys())
+
+    def column(self, name: str):
+        if name not in self.columns:
+            raise KeyError(f"Column '{name}' not in result, available columns: {self.column_names()}")
+        return self.columns[name]
+
+    def column_buffer(self, name: str) -> Optional[memoryview]:
+        """Zero-copy view of a numeric column, or None if the column is not a typed buffer."""
+        col = self.column(name)
+        return memoryview(col) if isinstance(col, array) else None
+
+    def take(self, indices) -> "ColumnarResult":
+        """New result with the rows at the given indices (e.g. after sorting)."""
+        columns = {}
+        for name, col in self.columns.items():
+            if isinstance(col, DictColumn):
+                columns[name] = col.take(indices)
+                continue
+            picked = [col[i] for i in indices]
+            columns[name] = array(col.typecode, picked) if isinstance(col, array) else picked
+        return ColumnarResult(columns, len(indices))
+
+    def filter_in(self, name: str, values: List[Any]) -> "ColumnarResult":
+        """Rows where column is one of values (NULL never matches); a DictColumn compares integer codes."""
+        col = self.column(name)
+        if isinstance(col, DictColumn):
+            codes = {c for c in map(col.code_of, values) if c is not None}
+            indices = [i for i, c in enumerate(col.codes) if c in codes]
+        else:
+            wanted = set(values)
+            indices = [i for i, v in enumerate(col) if v is not None and v in wanted]
+        return self.take(indices)
+
+    def value_counts(self, name: str) -> Dict[Any, int]:
+        """Group-by-style count of every distinct value of a column."""
+        col = self.column(name)
+        if isinstance(col, DictColumn):
+            return col.value_counts()
+        counts: Dict[Any, int] = {}
+        for v in col:
+            counts[v] = counts.get(v, 0) + 1
+        return counts
+
+    # ---- conversion ----
+    def to_rows(self, start: Optional[int] = None, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        names = self.column_names()
+        cols = [self.columns[n][start:stop] for n in names]
+        return [dict(zip(names, values)) for values in zip(*cols)]
+
+    def iter_batches(self, batch_rows: int = FETCH_CHUNK_ROWS) -> Iterator["ColumnarResult"]:
+        for start in range(0, self.num_rows, batch_rows):
+            stop = min(start + batch_rows, self.num_rows)
+            yield ColumnarResult(
+                {n: c.slice(start, stop) if isinstance(c, DictColumn) else c[start:stop] for n, c in self.columns.items()},
+                stop - start,
+            )
+
+    def to_arrow(self):
+        """
+        Export as a pyarrow.RecordBatch. Typed columns are wrapped without copying;
+        text/mixed columns are converted by pyarrow. pyarrow is optional.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for to_arrow(), install it with 'pip install pyarrow'")
+
+        arrays = []
+        for name, col in self.columns.items():
+            if isinstance(col, array) and col.typecode == "q":
+                arrays.append(pa.Array.from_buffers(pa.int64(), len(col), [None, pa.py_buffer(col)]))
+            elif isinstance(col, array):
+                arrays.append(pa.Array.from_buffers(pa.float64(), len(col), [None, pa.py_buffer(col)]))
+            elif isinstance(col, DictColumn):
+                indices = pa.array(col.codes, type=pa.int32(), mask=[c < 0 for c in col.codes])
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(col.values, type=pa.string())))
+            else:
+                arrays.append(pa.array(col))
+        return pa.RecordBatch.from_arrays(arrays, names=self.column_names())
+
+
+def column_values(data: Any, column: Optional[str]) -> Any:
+    """
+    The values an aggregation tool works on:
+    - ColumnarResult + column -> that column buffer (no per-row conversion)
+    - list of dicts + column  -> the extracted column
+    - plain list              -> itself
+    """
+    if isinstance(data, ColumnarResult):
+        if column is None:
+            raise ValueError("'column' is required when data is a columnar result")
+        return data.column(column)
+    if column is not None and data and isinstance(data[0], dict):
+        return [row.get(column) for row in data]
+    return data
@@ -0,0 +1,197 @@
+# LLM_Test/SQL_connection_pool.py
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from SQL_query_guard import current_guard
+
+# Idle connections kept per database file
+POOL_SIZE_PER_DB = 8
+
+# PRAGMA settings applied to every pooled connection, by profile name.
+# "read_optimized" is the Query path: big mmap window and page cache, temp tables in RAM,
+# and query_only so a bad plan cannot write.
+# "journal_mode" rewrites the database header, so it is only honoured on write profiles
+# (no query_only): a read path must never change the user's file.
+# "archive" is for daily sheets that never change again: opened with ?immutable=1,
+# so SQLite skips all locking and change detection.
+ACCESS_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "read_optimized": {
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,   # negative = KiB, i.e. 64 MiB
+        "temp_store": "MEMORY",
+        "query_only": True,
+    },
+    "archive": {
+        "immutable": True,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+        "query_only": True,
+    },
+}
+
+DEFAULT_PROFILE = os.getenv("SQL_ACCESS_PROFILE", "read_optimized")
+# Comma separated globs of database files treated as archived, e.g. "*/archive/*.db"
+ARCHIVE_PATTERNS = [p for p in os.getenv("SQL_ARCHIVE_PATTERNS", "").split(",") if p]
+
+
+def resolve_profile(db_path: str, profile: Optional[str] = None) -> str:
+    if profile:
+        return profile
+    if db_path != ":memory:" and any(fnmatch(db_path, p) for p in ARCHIVE_PATTERNS):
+        return "archive"
+    return DEFAULT_PROFILE
+
+
+def open_with_profile(db_path: str, profile: str) -> sqlite3.Connection:
+    """Open a connection and apply the PRAGMAs of the given access profile."""
+    settings = ACCESS_PROFILES[profile]
+
+    if settings.get("immutable") and db_path != ":memory:":
+        uri = Path(db_path).resolve().as_uri() + "?immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+
+    for pragma in ("mmap_size", "cache_size", "temp_store"):
+        if pragma in settings:
+            conn.execute(f"PRAGMA {pragma} = {settings[pragma]}")
+    if "journal_mode" in settings and not settings.get("query_only") and db_path != ":memory:":
+        try:
+            conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+        except sqlite3.OperationalError as ex:
+            # e.g. read-only file system: keep the current journal mode
+            print(f"[WARN][ConnectionPool] Cannot switch {db_path} to {settings['journal_mode']}: {ex}")
+    if settings.get("query_only"):
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Keeps open sqlite3 connections per (database path, access profile) so repeated
+    Query calls (and the parallel fan-out threads) do not reconnect every time,
+    and keep their warm page cache and mmap window between calls.
+    """
+
+    def __init__(self, size_per_db: int = POOL_SIZE_PER_DB):
+        self.size_per_db = size_per_db
+        self._idle: Dict[Tuple[str, str], "queue.LifoQueue[sqlite3.Connection]"] = {}
+        self._lock = threading.Lock()
+
+    def _queue_for(self, key: Tuple[str, str]) -> "queue.LifoQueue[sqlite3.Connection]":
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = queue.LifoQueue(maxsize=self.size_per_db)
+            return self._idle[key]
+
+    @contextmanager
+    def connection(self, db_path: str, profile: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+        profile = resolve_profile(db_path, profile)
+        idle = self._queue_for((db_path, profile))
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = open_with_profile(db_path, profile)
+
+        # The current Query / plan guard can time out or cancel statements on this connection
+        guard = current_guard()
+        broken = False
+        try:
+            if guard is None:
+                yield conn
+            else:
+                with guard.attached(conn):
+                    yield conn
+        except sqlite3.DatabaseError:
+            broken = True
+            raise
+        finally:
+            if broken:
+                conn.close()
+            else:
+                if conn.in_transaction:
+                    conn.rollback()
+                try:
+                    idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idles = list(self._idle.values())
+            self._idle = {}
+        for idle in idles:
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+_pool = ConnectionPool()
+
+
+def get_connection_pool() -> ConnectionPool:
+    return _pool
+
+
+if __name__ == "__main__":
+    # Benchmark: cold (new connection) and warm (pooled connection) latency per profile
+    # python SQL_connection_pool.py [rows]
+    import random
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tmp_dir = tempfile.mkdtemp()
+    bench_db = os.path.join(tmp_dir, "bench_workers.db")
+
+    conn = sqlite3.connect(bench_db)
+    conn.execute(
+        "CREATE TABLE Workers (ID INTEGER, Name TEXT, Gender TEXT, Start_Time TEXT, End_Time TEXT, "
+        "Plan_Number INTEGER, Real_Number INTEGER, Qualified_Number INTEGER, Others TEXT)"
+    )
+    rnd = random.Random(0)
+    conn.executemany(
+        "INSERT INTO Workers VALUES (?,?,?,?,?,?,?,?,?)",
+        (
+            (10000 + i, f"Worker {i}", rnd.choice(["Male", "Female"]),
+             f"{rnd.randint(6, 11):02d}:{rnd.randint(0, 59):02d}",
+             f"{rnd.randint(12, 22):02d}:{rnd.randint(0, 59):02d}",
+             rnd.randint(0, 100), rnd.randint(0, 100), rnd.randint(0, 100), "")
+            for i in range(n_rows)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+    sql = "SELECT Gender, AVG(Real_Number), COUNT(*) FROM Workers WHERE Real_Number > 50 GROUP BY Gender"
+    print(f"[BENCH] {n_rows} rows, query: {sql}")
+    for profile in ("default", "read_optimized", "archive"):
+        pool = ConnectionPool()
+        t0 = time.perf_counter()
+        with pool.connection(bench_db, profile) as c:
+            c.execute(sql).fetchall()
+        cold = time.perf_counter() - t0
+
+        warm_runs = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            with pool.connection(bench_db, profile) as c:
+                c.execute(sql).fetchall()
+            warm_runs.append(time.perf_counter() - t0)
+        pool.close_all()
+        print(f"[BENCH] {profile:15s} cold={cold * 1000:8.1f} ms  warm(best of 5)={min(warm_runs) * 1000:8.1f} ms")
+
+    shutil.rmtree(tmp_dir, ignore_errors=True)
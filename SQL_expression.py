@@ -0,0 +1,423 @@
+# LLM_Test/SQL_expression.py
+
+import ast
+import re
+from array import array
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from SQL_utils import TIME_COLUMNS, sql_minutes_expr, sql_safe_div_expr
+
+# Column types of a worker sheet, as far as arithmetic is concerned
+BASE_SCHEMA = {
+    "ID": "number",
+    "Name": "text",
+    "Gender": "text",
+    "Start_Time": "time",
+    "End_Time": "time",
+    "Plan_Number": "number",
+    "Real_Number": "number",
+    "Qualified_Number": "number",
+    "Others": "text",
+}
+
+_BIN_OPS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+_UNARY_OPS = {ast.USub: "-", ast.UAdd: "+"}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=256)
+def parse_expression(text: str) -> ast.AST:
+    """
+    Parse an arithmetic expression such as "(Real_Number - Plan_Number) / Work_Time".
+    Only + - * /, unary +/-, parentheses, column names and numeric literals are accepted.
+    The parsed tree is cached, so the same expression is parsed once per process.
+    """
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression '{text}': {e.msg}")
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.Load)) or type(node) in _BIN_OPS or type(node) in _UNARY_OPS:
+            continue
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            continue
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            continue
+        if isinstance(node, ast.Name):
+            continue
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            continue
+        raise ExpressionError(f"Unsupported element '{type(node).__name__}' in expression '{text}'")
+    return tree.body
+
+
+def expression_columns(node: ast.AST) -> Set[str]:
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def type_check(node: ast.AST, schema: Dict[str, str]):
+    """
+    Every column must exist in the schema and be numeric (number or 'HH:MM' time).
+    schema maps column name -> "number" | "time" | "text".
+    """
+    for col in sorted(expression_columns(node)):
+        if col not in schema:
+            raise ExpressionError(f"Unknown column '{col}', available columns: {sorted(schema.keys())}")
+        if schema[col] == "text":
+            raise ExpressionError(f"Column '{col}' is text and cannot be used in arithmetic")
+
+
+def schema_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Schema of an intermediate result: known base types, everything else taken from the first row."""
+    schema = {}
+    if rows:
+        for col, val in rows[0].items():
+            if col in BASE_SCHEMA:
+                schema[col] = BASE_SCHEMA[col]
+            elif isinstance(val, str) and ":" not in val:
+                schema[col] = "text"
+            else:
+                schema[col] = "number"
+    return schema
+
+
+def _to_python(node: ast.AST, local_of: Dict[str, str]) -> str:
+    if isinstance(node, ast.BinOp):
+        a = _to_python(node.left, local_of)
+        b = _to_python(node.right, local_of)
+        if isinstance(node.op, ast.Div):
+            return f"_div({a}, {b})"
+        return f"({a} {_BIN_OPS[type(node.op)]} {b})"
+    if isinstance(node, ast.UnaryOp):
+        return f"({_UNARY_OPS[type(node.op)]}{_to_python(node.operand, local_of)})"
+    if isinstance(node, ast.Name):
+        return local_of[node.id]
+    return repr(float(node.value))
+
+
+def _safe_div(a: float, b: float) -> float:
+    # Same convention as DivisionTool: dividing by zero gives 0.0
+    return 0.0 if b == 0 else a / b
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text: str, output_column: str) -> Callable:
+    """
+    Compile the expression into fn(rows, parse) that writes output_column into each row
+    in a single pass. Each referenced column is read and parsed once per row.
+    A NULL (None) operand makes the result None, as in the SQL pushdown.
+    """
+    node = parse_expression(text)
+    cols = sorted(expression_columns(node))
+    local_of = {c: f"v{i}" for i, c in enumerate(cols)}
+
+    lines = ["def _expr(rows, parse):", "    for row in rows:"]
+    for c in cols:
+        lines.append(f"        {local_of[c]} = row[{c!r}]")
+        lines.append(f"        {local_of[c]} = None if {local_of[c]} is None else parse({local_of[c]})")
+    value = _to_python(node, local_of)
+    if cols:
+        value = f"None if {' or '.join(f'{local_of[c]} is None' for c in cols)} else {value}"
+    lines.append(f"        row[{output_column!r}] = {value}")
+    lines.append("    return rows")
+
+    namespace: Dict[str, Any] = {"_div": _safe_div}
+    exec(compile("\n".join(lines), "<expression>", "exec"), namespace)
+    return namespace["_expr"]
+
+
+def to_sql(node: ast.AST) -> str:
+    """
+    Translate the expression to SQLite. 'HH:MM' columns are converted to minutes and
+    division by zero yields 0.0, like the Python evaluation.
+    """
+    if isinstance(node, ast.BinOp):
+        a = to_sql(node.left)
+        b = to_sql(node.right)
+        if isinstance(node.op, ast.Div):
+            return sql_safe_div_expr(a, b)
+        return f"({a} {_BIN_OPS[type(node.op)]} {b})"
+    if isinstance(node, ast.UnaryOp):
+        return f"({_UNARY_OPS[type(node.op)]}{to_sql(node.operand)})"
+    if isinstance(node, ast.Name):
+        if node.id in TIME_COLUMNS:
+            return sql_minutes_expr(node.id)
+        return node.id
+    return repr(float(node.value))
+
+
+# ---- Predicates (Filter) ----
+_CMP_OPS = {ast.Gt: ">", ast.GtE: ">=", ast.Lt: "<", ast.LtE: "<=", ast.Eq: "==", ast.NotEq: "!="}
+_SQL_CMP = {">": ">", ">=": ">=", "<": "<", "<=": "<=", "==": "=", "!=": "<>"}
+_HHMM_RE = re.compile(r"^\d{1,2}:\d{2}$")
+# SQL spellings the LLM tends to use: AND / OR / NOT, a single "=" and "<>"
+_SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|\b(?:AND|OR|NOT)\b|<>|(?<![<>=!])=(?!=)", re.IGNORECASE)
+
+
+def _python_spelling(text: str) -> str:
+    def replace(match):
+        token = match.group(0)
+        if token[0] in "'\"":
+            return token
+        if token == "<>":
+            return "!="
+        if token == "=":
+            return "=="
+        return token.lower()
+    return _SQL_TOKEN_RE.sub(replace, text)
+
+
+@lru_cache(maxsize=256)
+def parse_predicate(text: str) -> ast.AST:
+    """
+    Parse a row condition such as "Difference > 0 and Gender == 'Female'" (SQL's AND / OR / = / <> also work).
+    Comparisons, and / or / not, arithmetic over columns, numbers and string literals are accepted;
+    'HH:MM' strings compared with time columns are used as minutes.
+    """
+    try:
+        tree = ast.parse(_python_spelling(text.strip()), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid predicate '{text}': {e.msg}")
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.Load, ast.And, ast.Or, ast.Not, ast.BoolOp, ast.Compare, ast.Name)):
+            continue
+        if type(node) in _CMP_OPS or type(node) in _BIN_OPS or type(node) in _UNARY_OPS:
+            continue
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            continue
+        if isinstance(node, ast.UnaryOp) and (type(node.op) in _UNARY_OPS or isinstance(node.op, ast.Not)):
+            continue
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) and not isinstance(node.value, bool):
+            continue
+        raise ExpressionError(f"Unsupported element '{type(node).__name__}' in predicate '{text}'")
+    if not isinstance(tree.body, (ast.Compare, ast.BoolOp)) and not (
+            isinstance(tree.body, ast.UnaryOp) and isinstance(tree.body.op, ast.Not)):
+        raise ExpressionError(f"Predicate '{text}' is not a condition (use a comparison such as 'X > 0')")
+    return tree.body
+
+
+def _text_operands(node: ast.AST) -> Set[str]:
+    """Columns compared directly with a plain (non 'HH:MM') string: they are used as text, not parsed."""
+    cols = set()
+    for cmp in (n for n in ast.walk(node) if isinstance(n, ast.Compare)):
+        operands = [cmp.left] + list(cmp.comparators)
+        if any(isinstance(o, ast.Constant) and isinstance(o.value, str) and not _HHMM_RE.match(o.value) for o in operands):
+            cols |= {o.id for o in operands if isinstance(o, ast.Name)}
+    return cols
+
+
+def type_check_predicate(node: ast.AST, schema: Dict[str, str]):
+    for col in sorted(expression_columns(node)):
+        if col not in schema:
+            raise ExpressionError(f"Unknown column '{col}', available columns: {sorted(schema.keys())}")
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.BinOp):
+            type_check(sub, schema)
+
+
+def _minutes(value: str) -> float:
+    hh, mm = value.split(":")
+    return float(hh) * 60.0 + float(mm)
+
+
+def _and3(*values):
+    # SQL AND: false wins over NULL (None), NULL wins over true
+    if False in values:
+        return False
+    return None if None in values else True
+
+
+def _or3(*values):
+    if True in values:
+        return True
+    return None if None in values else False
+
+
+def _not3(value):
+    return None if value is None else not value
+
+
+def _predicate_to_python(node: ast.AST, local_of: Dict[str, str]) -> str:
+    if isinstance(node, ast.BoolOp):
+        combine = "_and3" if isinstance(node.op, ast.And) else "_or3"
+        return f"{combine}(" + ", ".join(_predicate_to_python(v, local_of) for v in node.values) + ")"
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return f"_not3({_predicate_to_python(node.operand, local_of)})"
+    if isinstance(node, ast.Compare):
+        parts = [_predicate_to_python(node.left, local_of)]
+        for op, right in zip(node.ops, node.comparators):
+            parts += [_CMP_OPS[type(op)], _predicate_to_python(right, local_of)]
+        # A comparison with a NULL operand is NULL, as in SQL
+        nulls = " or ".join(f"{local_of[c]} is None" for c in sorted(expression_columns(node)))
+        if nulls:
+            return f"(None if {nulls} else (" + " ".join(parts) + "))"
+        return "(" + " ".join(parts) + ")"
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return repr(_minutes(node.value)) if _HHMM_RE.match(node.value) else repr(node.value)
+    return _to_python(node, local_of)
+
+
+@lru_cache(maxsize=256)
+def compile_predicate(text: str) -> Callable:
+    """
+    Compile the predicate into fn(columns, parse) -> list of bools, evaluated column-wise:
+    columns maps each referenced column to a sequence of values (a chunk of rows).
+    Typed array columns are used as they are, others are parsed once per value;
+    NULLs follow SQL's three-valued logic, and only rows where the predicate is true match.
+    """
+    node = parse_predicate(text)
+    cols = sorted(expression_columns(node))
+    text_cols = _text_operands(node)
+    local_of = {c: f"v{i}" for i, c in enumerate(cols)}
+
+    lines = ["def _mask(columns, parse):"]
+    for i, c in enumerate(cols):
+        lines.append(f"    c{i} = columns[{c!r}]")
+        if c not in text_cols:
+            lines.append(f"    if not isinstance(c{i}, _array):")
+            lines.append(f"        c{i} = [None if v is None else parse(v) for v in c{i}]")
+    if not cols:
+        lines.append(f"    return [{_predicate_to_python(node, local_of)}]")
+    else:
+        targets = ", ".join(local_of[c] for c in cols) + ("," if len(cols) == 1 else "")
+        lines.append(
+            f"    return [{_predicate_to_python(node, local_of)} is True "
+            f"for {targets} in zip({', '.join(f'c{i}' for i in range(len(cols)))})]"
+        )
+
+    namespace: Dict[str, Any] = {"_div": _safe_div, "_array": array, "_and3": _and3, "_or3": _or3, "_not3": _not3}
+    exec(compile("\n".join(lines), "<predicate>", "exec"), namespace)
+    return namespace["_mask"]
+
+
+def equality_values(node: ast.AST) -> Optional[Tuple[str, List[str]]]:
+    """
+    (column, values) if the predicate is "col == 'a'" or an OR of such comparisons on one
+    column (SQL's IN), with plain text literals; None for any other predicate.
+    Lets a dictionary-encoded column be filtered by comparing integer codes.
+    """
+    terms = node.values if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.Or) else [node]
+    column, values = None, []
+    for term in terms:
+        if not (isinstance(term, ast.Compare) and len(term.ops) == 1 and isinstance(term.ops[0], ast.Eq)):
+            return None
+        operands = [term.left, term.comparators[0]]
+        names = [o.id for o in operands if isinstance(o, ast.Name)]
+        literals = [o.value for o in operands if isinstance(o, ast.Constant) and isinstance(o.value, str)]
+        if len(names) != 1 or len(literals) != 1 or _HHMM_RE.match(literals[0]) or names[0] != (column or names[0]):
+            return None
+        column = names[0]
+        values.append(literals[0])
+    return column, values
+
+
+def predicate_to_sql(node: ast.AST, aliases: Dict[str, str] = None) -> str:
+    """
+    Translate the predicate to a SQLite condition. aliases maps computed column names
+    to their expression text (conditions["expressions"] of a Query), which is inlined.
+    """
+    aliases = aliases or {}
+    if isinstance(node, ast.BoolOp):
+        joiner = " AND " if isinstance(node.op, ast.And) else " OR "
+        return "(" + joiner.join(predicate_to_sql(v, aliases) for v in node.values) + ")"
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return f"(NOT {predicate_to_sql(node.operand, aliases)})"
+    if isinstance(node, ast.Compare):
+        text_cols = _text_operands(node)
+        operands = [node.left] + list(node.comparators)
+        terms = []
+        for i, op in enumerate(node.ops):
+            a = _operand_sql(operands[i], aliases, text_cols)
+            b = _operand_sql(operands[i + 1], aliases, text_cols)
+            terms.append(f"{a} {_SQL_CMP[_CMP_OPS[type(op)]]} {b}")
+        return terms[0] if len(terms) == 1 else "(" + " AND ".join(terms) + ")"
+    raise ExpressionError(f"Unsupported predicate element '{type(node).__name__}'")
+
+
+def _operand_sql(node: ast.AST, aliases: Dict[str, str], text_cols: Set[str]) -> str:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        if _HHMM_RE.match(node.value):
+            return repr(_minutes(node.value))
+        return "'" + node.value.replace("'", "''") + "'"
+    if isinstance(node, ast.Name) and node.id in aliases:
+        return to_sql(parse_expression(aliases[node.id]))
+    if isinstance(node, ast.Name) and node.id in text_cols:
+        return node.id
+    # to_sql turns every constant into a REAL literal and time columns into minutes
+    return to_sql(node)
+
+
+def push_expressions_into_query(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    An Expression right after a Query that only uses base columns is folded into the
+    Query as conditions["expressions"][output_column] and computed by SQLite.
+    A Filter right after a Query whose predicate only uses base columns and those pushed
+    expressions is folded into the Query's WHERE.
+    """
+    new_ops = []
+    for op in operations:
+        prev = new_ops[-1] if new_ops else None
+        args = op.get("args", {})
+        if (
+            op.get("tool_name") in ("Expression", "Filter")
+            and prev is not None
+            and prev.get("tool_name") == "Query"
+            and args.get("data") == "$result_of_previous_tool"
+        ):
+            fold = _fold_expression if op["tool_name"] == "Expression" else _fold_filter
+            if fold(prev.setdefault("args", {}).setdefault("conditions", {}), args):
+                continue
+        new_ops.append(op)
+    return new_ops
+
+
+def _fold_expression(conds: Dict[str, Any], args: Dict[str, Any]) -> bool:
+    try:
+        node = parse_expression(args["expression"])
+        type_check(node, BASE_SCHEMA)
+        if not args["output_column"].isidentifier():
+            raise ExpressionError(f"Bad output column '{args['output_column']}'")
+    except (ExpressionError, KeyError):
+        return False
+    conds.setdefault("expressions", {})[args["output_column"]] = args["expression"]
+    print(f"[DEBUG][Expression] pushed '{args['expression']}' AS {args['output_column']} into Query")
+    return True
+
+
+def _fold_filter(conds: Dict[str, Any], args: Dict[str, Any]) -> bool:
+    # A LIMIT applies before a Python-side filter, so the filter cannot become part of the WHERE
+    if conds.get("limit") is not None:
+        return False
+    aliases = conds.get("expressions") or {}
+    schema = dict(BASE_SCHEMA)
+    schema.update({alias: "number" for alias in aliases})
+    try:
+        node = parse_predicate(args["predicate"])
+        type_check_predicate(node, schema)
+        condition = predicate_to_sql(node, aliases)
+    except (ExpressionError, KeyError):
+        return False
+    conds["where"] = f"({conds['where']}) AND {condition}" if conds.get("where") else condition
+    print(f"[DEBUG][Filter] pushed '{args['predicate']}' into Query WHERE")
+    return True
+
+
+def expression_select_list(expressions: Dict[str, str]) -> List[str]:
+    """SELECT items for conditions["expressions"] of a Query."""
+    items = []
+    for alias, text in expressions.items():
+        node = parse_expression(text)
+        type_check(node, BASE_SCHEMA)
+        items.append(f"{to_sql(node)} AS {alias}")
+    return items
+
+
+if __name__ == "__main__":
+    example = "(Real_Number - Plan_Number) / (End_Time - Start_Time)"
+    print("[DEBUG][Expression] SQL =>", to_sql(parse_expression(example)))
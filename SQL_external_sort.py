@@ -0,0 +1,148 @@
+# LLM_Test/SQL_external_sort.py
+
+import heapq
+import itertools
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# Rows sorted in memory at once; larger inputs are sorted in runs that are spilled to temp files
+SORT_MEMORY_ROWS = int(os.getenv("SQL_SORT_MEMORY_ROWS", "1000000"))
+# Runs merged at once; more runs are merged in several passes so the open files stay bounded
+MAX_MERGE_FANIN = int(os.getenv("SQL_SORT_MAX_FANIN", "64"))
+# Rows pickled together in a run file
+SPILL_BATCH_ROWS = 4096
+
+
+def sort_spec(field_index: Any, reverse: Any = False) -> List[Tuple[str, bool]]:
+    """
+    (column, descending) per sort key from "Qualified_KPI" / ["Gender", "Qualified_KPI"]
+    and reverse as one bool for all keys or one bool per key.
+    """
+    columns = [field_index] if isinstance(field_index, str) else list(field_index or [])
+    if not columns or not all(isinstance(c, str) for c in columns):
+        raise ValueError(f"Sorting needs a column name or a list of column names, got {field_index}")
+    flags = list(reverse) if isinstance(reverse, (list, tuple)) else [bool(reverse)] * len(columns)
+    if len(flags) != len(columns):
+        raise ValueError(f"Sorting got {len(columns)} columns but {len(flags)} reverse flags")
+    return [(c, bool(f)) for c, f in zip(columns, flags)]
+
+
+def _null_first(value: Any) -> Tuple[bool, Any]:
+    # NULLs sort before every value, as in SQLite
+    return (value is not None, value)
+
+
+class _MixedKey:
+    """Merge key for mixed ascending / descending columns: compares column by column."""
+    __slots__ = ("values", "descending")
+
+    def __init__(self, values: Tuple, descending: Tuple[bool, ...]):
+        self.values = values
+        self.descending = descending
+
+    def __lt__(self, other: "_MixedKey") -> bool:
+        for a, b, desc in zip(self.values, other.values, self.descending):
+            if a == b:
+                continue
+            return a > b if desc else a < b
+        return False
+
+    def __eq__(self, other: "_MixedKey") -> bool:
+        # heapq.merge breaks ties by run order only if equal keys compare equal
+        return self.values == other.values
+
+
+def merge_key(spec: List[Tuple[str, bool]]) -> Tuple[Callable[[Dict[str, Any]], Any], bool]:
+    """(key function, reverse) for heapq.merge over runs sorted by spec."""
+    columns = [c for c, _ in spec]
+    descending = tuple(d for _, d in spec)
+    if len(set(descending)) == 1:
+        return (lambda row: tuple(_null_first(row.get(c)) for c in columns)), descending[0]
+    return (lambda row: _MixedKey(tuple(_null_first(row.get(c)) for c in columns), descending)), False
+
+
+def sort_run(rows: List[Dict[str, Any]], spec: List[Tuple[str, bool]]) -> List[Dict[str, Any]]:
+    """
+    Sort one in-memory run in place: one stable sort per key, least significant key first,
+    so mixed directions need no key wrapper.
+    """
+    for column, descending in reversed(spec):
+        rows.sort(key=lambda row: _null_first(row.get(column)), reverse=descending)
+    return rows
+
+
+def _spill(rows: Iterable[Dict[str, Any]], tmp_dir: str = None) -> str:
+    fd, path = tempfile.mkstemp(prefix="sql_sort_", suffix=".run", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as f:
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, SPILL_BATCH_ROWS))
+            if not batch:
+                break
+            pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _merge(paths: List[str], spec: List[Tuple[str, bool]]) -> Iterator[Dict[str, Any]]:
+    key, reverse = merge_key(spec)
+    return heapq.merge(*(_read_run(p) for p in paths), key=key, reverse=reverse)
+
+
+def external_sort(rows: Iterable[Dict[str, Any]], spec: List[Tuple[str, bool]],
+                  memory_rows: int = None, tmp_dir: str = None) -> Iterator[Dict[str, Any]]:
+    """
+    Sort rows that may not fit in memory and stream them back in order.
+    Runs of memory_rows rows are sorted in memory and spilled to temp files, then k-way
+    merged (in several passes above MAX_MERGE_FANIN runs). An input that fits in one run
+    never touches the disk. The sort is stable; run files are removed when the stream ends.
+    """
+    memory_rows = max(1, memory_rows or SORT_MEMORY_ROWS)
+    rows = iter(rows)
+    run = sort_run(list(itertools.islice(rows, memory_rows)), spec)
+    peek = next(rows, None)
+    if peek is None:
+        yield from run
+        return
+
+    paths: List[str] = []
+    created: List[str] = []
+    try:
+        while run:
+            paths.append(_spill(run, tmp_dir))
+            created.append(paths[-1])
+            # Free the spilled run before the next one is read
+            run = None
+            if peek is None:
+                break
+            run = sort_run([peek] + list(itertools.islice(rows, memory_rows - 1)), spec)
+            peek = next(rows, None)
+        print(f"[DEBUG][ExternalSort] spilled {len(paths)} runs of up to {memory_rows} rows")
+
+        while len(paths) > MAX_MERGE_FANIN:
+            merged = []
+            for start in range(0, len(paths), MAX_MERGE_FANIN):
+                group = paths[start:start + MAX_MERGE_FANIN]
+                merged.append(_spill(_merge(group, spec), tmp_dir))
+                created.append(merged[-1])
+                for p in group:
+                    os.remove(p)
+            paths = merged
+            print(f"[DEBUG][ExternalSort] intermediate merge pass => {len(paths)} runs")
+
+        yield from _merge(paths, spec)
+    finally:
+        for p in created:
+            if os.path.exists(p):
+                os.remove(p)
@@ -0,0 +1,46 @@
+# LLM_Test/SQL_fake_llm.py
+
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from SQL_rule_planner import plan_request
+
+# Simulated parse model round trip, so load tests see realistic LLM wait times
+FAKE_LLM_LATENCY_MS = float(os.getenv("SQL_FAKE_LLM_LATENCY_MS", "800"))
+# Optional JSON file {"request text": {"success": true, "operations": [...]}, ...} with canned answers
+FAKE_LLM_PLANS = os.getenv("SQL_FAKE_LLM_PLANS")
+
+_REQUEST_MARKER = "User request: "
+
+
+def _load_plans(path: Optional[str]) -> Dict[str, Any]:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {text.strip(): plan for text, plan in json.load(f).items()}
+
+
+def make_fake_parse_model(latency_ms: float = FAKE_LLM_LATENCY_MS, plans_path: Optional[str] = FAKE_LLM_PLANS):
+    """
+    Stand-in for the parse model (SQL_FAKE_LLM=1): no network and no API key.
+    Answers with the canned plan of the user request if there is one, else with the rule
+    planner's plan whatever its confidence, after sleeping latency_ms. It is a Runnable,
+    so `prompt_template | model` with .invoke() / .stream() works as with ChatOpenAI.
+    """
+    plans = _load_plans(plans_path)
+
+    def respond(prompt_value: Any) -> AIMessage:
+        text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        request = text.rsplit(_REQUEST_MARKER, 1)[-1].strip()
+        time.sleep(latency_ms / 1000)
+        plan = plans.get(request)
+        if plan is None:
+            plan, _ = plan_request(request)
+        return AIMessage(content=json.dumps(plan or {"success": False, "operations": []}))
+
+    return RunnableLambda(respond, name="fake_parse_model")
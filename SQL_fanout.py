@@ -0,0 +1,192 @@
+# LLM_Test/SQL_fanout.py
+
+import contextvars
+import glob
+import heapq
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterator, List, Tuple
+
+from SQL_columnar import FETCH_CHUNK_ROWS
+from SQL_connection_pool import get_connection_pool
+from SQL_query_builder import build_select_sql
+from SQL_query_guard import count_rows
+from SQL_utils import TIME_COLUMNS, where_for_table
+
+# Column added to every fan-out row to tell where it came from
+SOURCE_COLUMN = "_source"
+FANOUT_WORKERS = 8
+# SQLite's default SQLITE_MAX_ATTACHED is 10
+MAX_ATTACHED = 10
+
+
+def has_glob(text: str) -> bool:
+    return isinstance(text, str) and any(ch in text for ch in "*?[")
+
+
+def _is_internal_table(name: str) -> bool:
+    # SQLite's own tables, the watermark table and the materialized <table>_KPI tables
+    return name.startswith(("sqlite_", "_")) or name.endswith("_KPI")
+
+
+def expand_sources(db_path: str, table: str) -> List[Tuple[str, str]]:
+    """
+    Expand a file glob ("E:/Dataset/*.db") and / or a table glob ("Sheet_*_02_2025")
+    into the list of (db_file, table) pairs to scan.
+    """
+    db_files = sorted(glob.glob(db_path)) if has_glob(db_path) else [db_path]
+    pool = get_connection_pool()
+
+    sources = []
+    for db_file in db_files:
+        if not has_glob(table):
+            sources.append((db_file, table))
+            continue
+        with pool.connection(db_file) as conn:
+            names = [r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table','view') ORDER BY name"
+            )]
+        sources += [
+            (db_file, name) for name in names
+            if fnmatchcase(name, table) and not _is_internal_table(name)
+        ]
+    print(f"[DEBUG][FanOut] {db_path} / {table} => {len(sources)} sources")
+    return sources
+
+
+def _source_tag(db_file: str, table: str, multi_file: bool) -> str:
+    return f"{os.path.basename(db_file)}:{table}" if multi_file else table
+
+
+def _scan_one(db_file: str, table: str, conditions: Dict[str, Any], tag: str) -> List[Dict[str, Any]]:
+    sub_conditions = dict(conditions)
+    sub_conditions["table"] = table
+    # Sources of one glob may store times as 'HH:MM' text or as integer minutes
+    sub_conditions["where"] = where_for_table(db_file, table, conditions.get("where"))
+    sql_query = build_select_sql(sub_conditions)
+    with get_connection_pool().connection(db_file, conditions.get("access_profile")) as conn:
+        cursor = conn.execute(sql_query)
+        columns = [desc[0] for desc in cursor.description]
+        rows = []
+        for chunk in iter(lambda: cursor.fetchmany(FETCH_CHUNK_ROWS), []):
+            count_rows(len(chunk))
+            for row in chunk:
+                row_dict = dict(zip(columns, row))
+                row_dict[SOURCE_COLUMN] = tag
+                rows.append(row_dict)
+    return rows
+
+
+def _merge_key(value: Any, time_column: bool) -> Tuple[int, Any]:
+    """
+    Merge key in SQLite's cross-type order (NULL < numbers < text < blobs), so rows of
+    sheets storing a column with different types never compare str with int.
+    Times are compared in minutes whether a sheet stores 'HH:MM' text or integer minutes;
+    zero-padded 'HH:MM' text sorts the same way in SQLite, so every run stays in key order.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        if time_column and ":" in value:
+            hours, _, minutes = value.partition(":")
+            try:
+                return (1, int(hours) * 60 + int(minutes))
+            except ValueError:
+                pass
+        return (2, value)
+    return (3, value)
+
+
+def iter_fanout(db_path: str, conditions: Dict[str, Any], max_workers: int = FANOUT_WORKERS) -> Iterator[Dict[str, Any]]:
+    """
+    Run the same Query on every matching source in parallel threads (sqlite3 releases the GIL
+    while scanning) and iterate over the merged rows. Each thread reads its whole source into
+    memory; unsorted results are yielded as each source finishes, with conditions["order_by"]
+    every source is sorted by SQLite and the runs are k-way merged lazily.
+    conditions["limit"] applies to each source and to the merged rows.
+    """
+    rows = _iter_fanout_unlimited(db_path, conditions, max_workers)
+    if conditions.get("limit") is not None:
+        rows = itertools.islice(rows, int(conditions["limit"]))
+    return rows
+
+
+def _iter_fanout_unlimited(db_path: str, conditions: Dict[str, Any], max_workers: int) -> Iterator[Dict[str, Any]]:
+    sources = expand_sources(db_path, conditions.get("table", ""))
+    if not sources:
+        return
+    multi_file = len({db_file for db_file, _ in sources}) > 1
+    order_by = conditions.get("order_by")
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(sources))) as executor:
+        # Each thread runs in a copy of the caller's context, so the current Query guard applies to it too
+        futures = [
+            executor.submit(contextvars.copy_context().run, _scan_one, db_file, table, conditions,
+                            _source_tag(db_file, table, multi_file))
+            for db_file, table in sources
+        ]
+        if not order_by:
+            for f in as_completed(futures):
+                yield from f.result()
+            return
+        runs = [f.result() for f in futures]
+
+    # Each run comes out of SQLite with NULLs first (last with DESC), so None must compare too
+    time_column = order_by in TIME_COLUMNS
+    yield from heapq.merge(
+        *runs,
+        key=lambda r: _merge_key(r.get(order_by), time_column),
+        reverse=bool(conditions.get("reverse")),
+    )
+
+
+def union_all_query(db_path: str, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Alternative single-statement plan: ATTACH the files and let SQLite run one
+    UNION ALL with a literal source tag. Limited to MAX_ATTACHED files.
+    """
+    sources = expand_sources(db_path, conditions.get("table", ""))
+    if not sources:
+        return []
+    db_files = sorted({db_file for db_file, _ in sources})
+    if len(db_files) > MAX_ATTACHED:
+        raise ValueError(f"Union mode supports at most {MAX_ATTACHED} database files, got {len(db_files)}")
+    multi_file = len(db_files) > 1
+    alias_of = {db_file: f"src{i}" for i, db_file in enumerate(db_files)}
+
+    branch_conditions = {k: v for k, v in conditions.items() if k not in ("order_by", "reverse", "limit")}
+    parts = []
+    for db_file, table in sources:
+        sub = dict(branch_conditions)
+        sub["table"] = f'{alias_of[db_file]}."{table}"'
+        sub["where"] = where_for_table(db_file, table, branch_conditions.get("where"))
+        tag = _source_tag(db_file, table, multi_file).replace("'", "''")
+        parts.append(build_select_sql(sub, extra_select=[f"'{tag}' AS {SOURCE_COLUMN}"]))
+    sql_query = " UNION ALL ".join(parts)
+    if conditions.get("order_by"):
+        sql_query += f" ORDER BY {conditions['order_by']} {'DESC' if conditions.get('reverse') else 'ASC'}"
+    if conditions.get("limit") is not None:
+        sql_query += f" LIMIT {int(conditions['limit'])}"
+    print(f"[DEBUG][FanOut] union SQL => {sql_query}")
+
+    with get_connection_pool().connection(":memory:") as conn:
+        # A failed ATTACH must not leave the others attached to the pooled connection
+        attached = []
+        try:
+            for db_file, alias in alias_of.items():
+                conn.execute("ATTACH DATABASE ? AS " + alias, (db_file,))
+                attached.append(alias)
+            cursor = conn.execute(sql_query)
+            columns = [desc[0] for desc in cursor.description]
+            rows = []
+            for chunk in iter(lambda: cursor.fetchmany(FETCH_CHUNK_ROWS), []):
+                count_rows(len(chunk))
+                rows.extend(dict(zip(columns, row)) for row in chunk)
+            return rows
+        finally:
+            for alias in attached:
+                conn.execute(f"DETACH DATABASE {alias}")
@@ -0,0 +1,152 @@
+# LLM_Test/SQL_fusion.py
+
+import re
+from typing import Any, Callable, Dict, List, Set
+
+# Row-wise arithmetic tools that can be fused, and the operator each one applies
+ARITHMETIC_OPS = {
+    "Addition": "+",
+    "Subtraction": "-",
+    "Multiplication": "*",
+    "Division": "/",
+}
+
+PREVIOUS_RESULT = "$result_of_previous_tool"
+
+
+def is_fusable(op: Dict[str, Any]) -> bool:
+    """A column-based arithmetic op (not the 'number1','number2' scalar mode)."""
+    args = op.get("args", {})
+    return (
+        op.get("tool_name") in ARITHMETIC_OPS
+        and isinstance(args.get("number_columns"), list)
+        and len(args["number_columns"]) == 2
+        and isinstance(args.get("output_column"), str)
+        and "data" in args
+    )
+
+
+def _collect_strings(value: Any, out: List[str]):
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_strings(v, out)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _collect_strings(v, out)
+
+
+def referenced_columns(operations: List[Dict[str, Any]], candidates: Set[str]) -> Set[str]:
+    """
+    Which of the candidate column names are mentioned anywhere in the args of the operations.
+    Strings such as a where clause are matched by whole word, so this errs on the side of keeping.
+    """
+    strings = []
+    for op in operations:
+        _collect_strings(op.get("args", {}), strings)
+    found = set()
+    for col in candidates:
+        pattern = re.compile(rf"\b{re.escape(col)}\b")
+        if any(s == col or pattern.search(s) for s in strings):
+            found.add(col)
+    return found
+
+
+def fuse_arithmetic_ops(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace every run of two or more consecutive row-wise arithmetic ops by one
+    'FusedArithmetic' op, so that the rows are traversed once instead of once per tool.
+    Only the last output of a run and the outputs referenced by later ops are written
+    back into the rows.
+    """
+    fused_ops = []
+    i = 0
+    while i < len(operations):
+        op = operations[i]
+        if not is_fusable(op):
+            fused_ops.append(op)
+            i += 1
+            continue
+
+        run = [op]
+        j = i + 1
+        while j < len(operations) and is_fusable(operations[j]) \
+                and operations[j]["args"]["data"] == PREVIOUS_RESULT:
+            run.append(operations[j])
+            j += 1
+
+        if len(run) == 1:
+            fused_ops.append(op)
+            i += 1
+            continue
+
+        steps = [
+            {
+                "op": ARITHMETIC_OPS[r["tool_name"]],
+                "inputs": list(r["args"]["number_columns"]),
+                "output": r["args"]["output_column"],
+            }
+            for r in run
+        ]
+        outputs = {s["output"] for s in steps}
+        materialize = referenced_columns(operations[j:], outputs)
+        materialize.add(steps[-1]["output"])
+
+        fused = {
+            "tool_name": "FusedArithmetic",
+            "args": {
+                "data": run[0]["args"]["data"],
+                "steps": steps,
+                "materialize": [s["output"] for s in steps if s["output"] in materialize],
+            },
+        }
+        print(f"[DEBUG][Fusion] fused {[r['tool_name'] for r in run]} => materialize {fused['args']['materialize']}")
+        fused_ops.append(fused)
+        i = j
+
+    return fused_ops
+
+
+def compile_steps(steps: List[Dict[str, Any]], materialize: List[str]) -> Callable:
+    """
+    Generate one Python function evaluating all the steps for each row in a single pass.
+    Every source column is read and parsed once per row; intermediate values live in locals.
+    The returned function is called as fn(rows, parse) and returns the count of zero divisors.
+    """
+    lines = ["def _fused(rows, parse):", "    zero_div = 0", "    for row in rows:"]
+    local_of = {}
+    counter = 0
+
+    def operand(col: str) -> str:
+        nonlocal counter
+        if col not in local_of:
+            local_of[col] = f"v{counter}"
+            counter += 1
+            lines.append(f"        {local_of[col]} = parse(row[{col!r}])")
+        return local_of[col]
+
+    for step in steps:
+        a = operand(step["inputs"][0])
+        b = operand(step["inputs"][1])
+        out_var = f"v{counter}"
+        counter += 1
+        if step["op"] == "/":
+            lines.append(f"        if {b} == 0:")
+            lines.append("            zero_div += 1")
+            lines.append(f"            {out_var} = 0.0")
+            lines.append("        else:")
+            lines.append(f"            {out_var} = {a} / {b}")
+        else:
+            lines.append(f"        {out_var} = {a} {step['op']} {b}")
+        # A later step reading this output uses the local instead of the row
+        local_of[step["output"]] = out_var
+
+    for col in materialize:
+        lines.append(f"        row[{col!r}] = {local_of[col]}")
+    lines.append("    return zero_div")
+
+    source = "\n".join(lines)
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, "<fused_arithmetic>", "exec"), namespace)
+    return namespace["_fused"]
@@ -0,0 +1,200 @@
+# LLM_Test/SQL_groupby.py
+
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from SQL_columnar import FETCH_CHUNK_ROWS, ColumnarResult
+from SQL_expression import ExpressionError, parse_expression, to_sql
+
+AGG_FUNCS = ("sum", "avg", "min", "max", "count", "mode")
+# Functions SQLite can compute; "mode" always runs in Python
+SQL_AGG_FUNCS = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+# Functions that read numbers ('HH:MM' times as minutes); count / mode use the raw values
+NUMERIC_AGG_FUNCS = {"sum", "avg", "min", "max"}
+
+
+def group_by_columns(by: Any) -> List[str]:
+    columns = [by] if isinstance(by, str) else list(by or [])
+    if not columns:
+        raise ValueError("GroupBy needs at least one 'by' column")
+    return columns
+
+
+def normalize_aggregates(aggregates: Any) -> List[Dict[str, str]]:
+    """
+    Accepts [{"func": "avg", "column": "Qualified_KPI", "output_column": "..."}, ...]
+    or the short form {"Qualified_KPI": "avg", "ID": ["count", "max"]}.
+    Returns the long form with output_column defaulting to "<func>_<column>".
+    """
+    if isinstance(aggregates, dict):
+        items = []
+        for column, funcs in aggregates.items():
+            for func in ([funcs] if isinstance(funcs, str) else funcs):
+                items.append({"func": func, "column": column})
+        aggregates = items
+    normalized = []
+    for agg in aggregates or []:
+        func = str(agg.get("func", "")).lower()
+        if func == "mean":
+            func = "avg"
+        if func not in AGG_FUNCS:
+            raise ValueError(f"Unknown aggregate function '{agg.get('func')}', must be one of {list(AGG_FUNCS)}")
+        column = agg.get("column") or "*"
+        if column == "*" and func != "count":
+            raise ValueError(f"Aggregate '{func}' needs a column")
+        output = agg.get("output_column") or ("count" if column == "*" else f"{func}_{column}")
+        normalized.append({"func": func, "column": column, "output_column": output})
+    if not normalized:
+        raise ValueError("GroupBy needs at least one aggregate")
+    return normalized
+
+
+def iter_column_chunks(data: Any, columns: List[str], chunk_rows: int = FETCH_CHUNK_ROWS) -> Iterator[Dict[str, Sequence]]:
+    """The given columns of a ColumnarResult or a row list, chunk_rows rows at a time."""
+    if isinstance(data, ColumnarResult):
+        cols = {c: data.column(c) for c in columns}
+        for start in range(0, data.num_rows, chunk_rows):
+            yield {c: col[start:start + chunk_rows] for c, col in cols.items()}
+        return
+    for start in range(0, len(data), chunk_rows):
+        rows = data[start:start + chunk_rows]
+        yield {c: [row.get(c) for row in rows] for c in columns}
+
+
+def _number(value: Any, parse: Callable) -> Any:
+    # Text stays text, so min / max also work on Name
+    if isinstance(value, str) and ":" not in value:
+        try:
+            return parse(value)
+        except ValueError:
+            return value
+    return parse(value)
+
+
+def hash_aggregate(chunks: Iterable[Dict[str, Sequence]], by: List[str], aggregates: List[Dict[str, str]],
+                   parse: Callable) -> List[Dict[str, Any]]:
+    """
+    Single-pass hash aggregation over column chunks. One hash table entry per group holds
+    the running state of every aggregate; NULLs are skipped (count("*") counts rows).
+    Groups come out in first-seen order.
+    """
+    groups: Dict[Tuple, List[Any]] = {}
+    for chunk in chunks:
+        keys = list(zip(*(chunk[b] for b in by)))
+        for key in keys:
+            if key not in groups:
+                groups[key] = [_initial(agg["func"]) for agg in aggregates]
+        for index, agg in enumerate(aggregates):
+            func, column = agg["func"], agg["column"]
+            if column == "*":
+                for key in keys:
+                    groups[key][index] += 1
+                continue
+            for key, value in zip(keys, chunk[column]):
+                if value is None:
+                    continue
+                state = groups[key]
+                if func == "count":
+                    state[index] += 1
+                elif func == "mode":
+                    state[index][value] += 1
+                else:
+                    value = _number(value, parse)
+                    acc = state[index]
+                    if func == "sum":
+                        state[index] = acc + value
+                    elif func == "avg":
+                        acc[0] += value
+                        acc[1] += 1
+                    elif func == "min":
+                        state[index] = value if acc is None or value < acc else acc
+                    else:
+                        state[index] = value if acc is None or value > acc else acc
+
+    rows = []
+    for key, states in groups.items():
+        row = dict(zip(by, key))
+        for agg, state in zip(aggregates, states):
+            row[agg["output_column"]] = _final(agg["func"], state)
+        rows.append(row)
+    return rows
+
+
+def _initial(func: str) -> Any:
+    if func in ("sum", "count"):
+        return 0
+    if func == "avg":
+        return [0.0, 0]
+    if func == "mode":
+        return Counter()
+    return None
+
+
+def _final(func: str, state: Any) -> Any:
+    if func == "avg":
+        return state[0] / state[1] if state[1] else None
+    if func == "mode":
+        return state.most_common(1)[0][0] if state else None
+    return state
+
+
+# ---- SQL pushdown ----
+def group_by_select(conditions: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """
+    SELECT items and GROUP BY items for conditions["group_by"] / conditions["aggregates"].
+    Columns that are pushed expressions are inlined; time columns are aggregated as minutes.
+    """
+    expressions = conditions.get("expressions") or {}
+
+    def column_sql(column: str, numeric: bool) -> str:
+        if column in expressions:
+            return to_sql(parse_expression(expressions[column]))
+        return to_sql(parse_expression(column)) if numeric else column
+
+    group_items = [column_sql(c, False) for c in conditions["group_by"]]
+    select_items = [f"{item} AS {c}" if item != c else c for item, c in zip(group_items, conditions["group_by"])]
+    for agg in conditions["aggregates"]:
+        func, column = agg["func"], agg["column"]
+        arg = "*" if column == "*" else column_sql(column, func in NUMERIC_AGG_FUNCS)
+        select_items.append(f"{SQL_AGG_FUNCS[func]}({arg}) AS {agg['output_column']}")
+    return select_items, group_items
+
+
+def push_group_by_into_query(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    A GroupBy right after a Query is computed by SQLite as GROUP BY when every aggregate
+    has an SQL equivalent (not mode) and the Query has no LIMIT / ORDER BY / glob source.
+    """
+    new_ops = []
+    for op in operations:
+        prev = new_ops[-1] if new_ops else None
+        args = op.get("args", {})
+        if (
+            op.get("tool_name") == "GroupBy"
+            and prev is not None
+            and prev.get("tool_name") == "Query"
+            and args.get("data") == "$result_of_previous_tool"
+        ):
+            conds = prev.setdefault("args", {}).setdefault("conditions", {})
+            try:
+                by = group_by_columns(args.get("by"))
+                aggregates = normalize_aggregates(args.get("aggregates"))
+                pushable = (
+                    all(agg["func"] in SQL_AGG_FUNCS for agg in aggregates)
+                    and conds.get("limit") is None
+                    and not conds.get("order_by")
+                    and "*" not in prev["args"].get("db_path", "") + conds.get("table", "")
+                    and all(c.isidentifier() for c in by)
+                )
+                if pushable:
+                    trial = dict(conds, group_by=by, aggregates=aggregates)
+                    group_by_select(trial)
+            except (ValueError, ExpressionError):
+                pushable = False
+            if pushable:
+                conds["group_by"] = by
+                conds["aggregates"] = aggregates
+                print(f"[DEBUG][GroupBy] pushed GROUP BY {by} into Query")
+                continue
+        new_ops.append(op)
+    return new_ops
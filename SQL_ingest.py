@@ -0,0 +1,476 @@
+# LLM_Test/SQL_ingest.py
+
+import argparse
+import csv
+import datetime
+import gc
+import itertools
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from SQL_kpi_views import drop_kpi_table, materialize_kpi_table
+from SQL_utils import REAL_COLUMNS, TIME_COLUMNS, map_column_name
+
+# Rows validated and inserted per executemany() call
+INGEST_BATCH_ROWS = int(os.getenv("SQL_INGEST_BATCH_ROWS", "50000"))
+# Bad rows printed per file (all of them are counted)
+MAX_REPORTED_ERRORS = 10
+TIME_FORMATS = ("minutes", "hhmm")
+INTEGER_COLUMNS = ["ID", "Plan_Number", "Real_Number", "Qualified_Number"]
+
+# Connection settings for the load only: no rollback journal on disk, no fsync per commit,
+# a 256 MiB page cache and an exclusive lock. A crash mid-load can corrupt the file, so the
+# settings are per connection and end with the load; the Query pool opens its own connections.
+BULK_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+
+_DATE_RES = [
+    (re.compile(r"(?<!\d)(\d{2})[_\-.]?(\d{2})[_\-.]?(\d{4})(?!\d)"), lambda m: (m.group(1), m.group(2), m.group(3))),
+    (re.compile(r"(?<!\d)(\d{4})[_\-.](\d{2})[_\-.](\d{2})(?!\d)"), lambda m: (m.group(3), m.group(2), m.group(1))),
+]
+
+# Every valid time cell: 'HH:MM' (and 'H:MM' before 10:00) -> minutes since midnight
+_HHMM_TEXT = [f"{m // 60:02d}:{m % 60:02d}" for m in range(1440)]
+_HHMM_MINUTES = {**{text: m for m, text in enumerate(_HHMM_TEXT)}, **{text[1:]: m for m, text in enumerate(_HHMM_TEXT[:600])}}
+
+
+class IngestError(ValueError):
+    pass
+
+
+# ---- value conversion ----
+def minutes_of(value: Any) -> Optional[int]:
+    """
+    Minutes since midnight of one time cell: 'HH:MM', 'H:MM', 'HH:MM:SS', a datetime.time,
+    an Excel day fraction (0 <= x < 1) or a whole number of minutes. NULL / '' stay NULL.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (datetime.time, datetime.datetime)):
+        minutes = value.hour * 60 + value.minute
+    elif isinstance(value, float) and 0 <= value < 1:
+        minutes = round(value * 1440)
+    elif isinstance(value, str) and ":" in value:
+        parts = value.strip().split(":")
+        if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+            raise ValueError(f"not a time: {value!r}")
+        minutes = int(parts[0]) * 60 + int(parts[1])
+        if int(parts[1]) > 59:
+            raise ValueError(f"not a time: {value!r}")
+    else:
+        minutes = _whole_number(value)
+    if not 0 <= minutes < 1440:
+        raise ValueError(f"time out of the day: {value!r}")
+    return minutes
+
+
+def _whole_number(value: Any) -> int:
+    if isinstance(value, str):
+        value = value.strip()
+        return int(value) if value.lstrip("-").isdigit() else _whole_number(float(value))
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"not a whole number: {value!r}")
+    return int(value)
+
+
+def count_of(value: Any) -> Optional[int]:
+    """A non-negative whole number (ID and the *_Number columns); NULL / '' stay NULL."""
+    if value is None or value == "":
+        return None
+    number = _whole_number(value)
+    if number < 0:
+        raise ValueError(f"negative count: {value!r}")
+    return number
+
+
+def text_of(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def format_hhmm(minutes: Optional[int]) -> Optional[str]:
+    return None if minutes is None else _HHMM_TEXT[minutes]
+
+
+def _fast_minutes(values: Sequence) -> List[Optional[int]]:
+    # The common CSV case, every cell a valid 'HH:MM' / 'H:MM': there are only 1440 of them, so the
+    # column is validated and converted by one dict lookup per cell (KeyError on anything else)
+    return list(map(_HHMM_MINUTES.__getitem__, values))
+
+
+def _fast_counts(values: Sequence) -> List[Optional[int]]:
+    # Whole numbers as str or int / float (CSV, Excel): int() over the column, then one range check.
+    # int() truncates floats, so non-str columns must compare equal to their int values
+    numbers = list(map(int, values))
+    if set(map(type, values)) != {str} and numbers != list(values):
+        raise ValueError("not all whole numbers")
+    if min(numbers, default=0) < 0:
+        raise ValueError("negative count")
+    return numbers
+
+
+def _fast_text(values: Sequence) -> List[Optional[str]]:
+    return [v or None for v in map(str.strip, values)]
+
+
+# Column -> (whole-column fast path, checked per-cell conversion); other columns are text
+COLUMN_CONVERTERS: Dict[str, Tuple[Callable, Callable]] = {
+    **{c: (_fast_counts, count_of) for c in INTEGER_COLUMNS},
+    **{c: (_fast_minutes, minutes_of) for c in TIME_COLUMNS},
+}
+
+
+def convert_column(name: str, values: Sequence) -> Tuple[List[Any], Dict[int, str]]:
+    """
+    Validate and convert one column of a batch: (values, {row index: error}).
+    The column is first converted as a whole with the fast path; only when that fails is it
+    converted cell by cell to find (and report) the bad cells.
+    """
+    fast, convert = COLUMN_CONVERTERS.get(name, (_fast_text, text_of))
+    try:
+        return fast(values), {}
+    except (ValueError, TypeError, KeyError):
+        pass
+    out: List[Any] = []
+    bad: Dict[int, str] = {}
+    for i, value in enumerate(values):
+        try:
+            out.append(convert(value))
+        except (ValueError, TypeError) as ex:
+            out.append(None)
+            bad[i] = f"{name}: {ex}"
+    return out, bad
+
+
+def convert_batch(columns: List[Optional[str]], rows: List[Sequence], time_format: str = "minutes") -> Tuple[List[Tuple], Dict[int, str]]:
+    """
+    Column-at-a-time validation of a batch of raw rows: rows are transposed, every column is
+    converted in one pass, and the rows with a bad cell are dropped. columns has one entry per
+    source column, None for the skipped ones. Returns (good rows, {row index: error}).
+    """
+    width = len(columns)
+    if set(map(len, rows)) != {width}:
+        # zip() stops at the shortest row: pad short rows and cut long ones first
+        rows = [tuple(r[:width]) + (None,) * (width - len(r)) for r in rows]
+    cells = list(zip(*rows))
+    converted, bad = [], {}
+    for name, values in zip(columns, cells):
+        if name is None:
+            continue
+        out, col_bad = convert_column(name, values)
+        if name in TIME_COLUMNS and time_format == "hhmm":
+            out = [format_hhmm(m) for m in out]
+        converted.append(out)
+        for i, error in col_bad.items():
+            bad.setdefault(i, error)
+    good = list(zip(*converted))
+    if bad:
+        good = [row for i, row in enumerate(good) if i not in bad]
+    return good, bad
+
+
+# ---- sources ----
+def map_header(header: Sequence[Any]) -> List[Optional[str]]:
+    """Worker sheet column of each header cell (synonyms and near-misses corrected), None for unknown ones."""
+    mapped: List[Optional[str]] = []
+    for cell in header:
+        name = map_column_name(str(cell or "").strip())
+        if name not in REAL_COLUMNS:
+            print(f"[WARN][Ingest] column '{cell}' is not a worker sheet column, skipped")
+            name = None
+        elif name in mapped:
+            raise IngestError(f"columns '{cell}' and '{header[mapped.index(name)]}' both map to {name}")
+        mapped.append(name)
+    if "ID" not in mapped:
+        raise IngestError(f"no ID column in header {list(header)}")
+    return mapped
+
+
+def _chunks(rows: Iterator[Sequence], batch_rows: int) -> Iterator[List[Sequence]]:
+    while True:
+        batch = list(itertools.islice(rows, batch_rows))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_csv(path: str, batch_rows: int = INGEST_BATCH_ROWS) -> Iterator[Tuple[str, List[Any], Iterator[List[Sequence]]]]:
+    """One (sheet name, header, batches of raw rows) for a CSV file; the delimiter is sniffed."""
+    f = open(path, "r", newline="", encoding="utf-8-sig")
+    try:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, [])
+        yield os.path.splitext(os.path.basename(path))[0], header, _chunks(reader, batch_rows)
+    finally:
+        f.close()
+
+
+def iter_excel(path: str, batch_rows: int = INGEST_BATCH_ROWS) -> Iterator[Tuple[str, List[Any], Iterator[List[Sequence]]]]:
+    """One (sheet name, header, batches of raw rows) per worksheet, read in streaming mode."""
+    try:
+        import openpyxl
+    except ImportError:
+        raise IngestError("reading Excel files needs openpyxl (pip install openpyxl), or export the sheets as CSV")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            if any(cell is not None for cell in header):
+                yield sheet.title, header, _chunks(rows, batch_rows)
+    finally:
+        workbook.close()
+
+
+def iter_sources(path: str, batch_rows: int = INGEST_BATCH_ROWS):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return iter_excel(path, batch_rows)
+    return iter_csv(path, batch_rows)
+
+
+def table_name_for(sheet: str, prefix: str = "Workers") -> str:
+    """
+    Per-day table name in the naming of the existing sheets: a date in the file / sheet name
+    (17_02_2025, 17022025, 2025-02-17) gives Workers_17022025; anything else is used as is.
+    """
+    for date_re, parts in _DATE_RES:
+        m = date_re.search(sheet)
+        if m:
+            day, month, year = parts(m)
+            return f"{prefix}_{day}{month}{year}"
+    name = re.sub(r"\W+", "_", sheet).strip("_")
+    if not name:
+        raise IngestError(f"cannot derive a table name from '{sheet}'")
+    return name if not name[0].isdigit() else f"{prefix}_{name}"
+
+
+# ---- loading ----
+def create_table_sql(table: str, time_format: str = "minutes") -> str:
+    time_decl = "INTEGER" if time_format == "minutes" else "TEXT"
+    decls = {c: "INTEGER" if c in INTEGER_COLUMNS else time_decl if c in TIME_COLUMNS else "TEXT" for c in REAL_COLUMNS}
+    checks = [f'CHECK("{c}" >= 0)' for c in INTEGER_COLUMNS[1:]]
+    if time_format == "minutes":
+        checks += [f'CHECK("{c}" BETWEEN 0 AND 1439)' for c in TIME_COLUMNS]
+    else:
+        checks += [f"CHECK(\"{c}\" GLOB '[0-1][0-9]:[0-5][0-9]' OR \"{c}\" GLOB '2[0-3]:[0-5][0-9]')" for c in TIME_COLUMNS]
+    body = ",\n\t".join([f'"{c}"\t{decls[c]}' for c in REAL_COLUMNS] + checks)
+    return f'CREATE TABLE "{table}" (\n\t{body}\n)'
+
+
+def apply_bulk_pragmas(conn: sqlite3.Connection):
+    for pragma, value in BULK_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _drop_indexes(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Drop the secondary indexes of table and return their CREATE statements, to rebuild them after the load."""
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                           (table,)).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def load_sheet(conn: sqlite3.Connection, table: str, header: Sequence[Any], batches: Iterator[List[Sequence]],
+               time_format: str = "minutes", if_exists: str = "fail", index_columns: Sequence[str] = (),
+               strict: bool = False) -> Dict[str, Any]:
+    """
+    Load one sheet into table in a single transaction: create (or replace / append to) the
+    table, drop its indexes, executemany() each validated batch, then build the indexes once
+    over the loaded rows. Bad rows are skipped and reported; with strict the load is rolled back.
+    """
+    mapped = map_header(header)
+    columns = [name for name in mapped if name is not None]
+    stats = {"table": table, "rows": 0, "bad_rows": 0}
+    start = time.perf_counter()
+
+    conn.execute("BEGIN")
+    try:
+        if _table_exists(conn, table):
+            if if_exists == "fail":
+                raise IngestError(f"table {table} already exists (use --replace or --append)")
+            if if_exists == "replace":
+                conn.execute(f'DROP TABLE "{table}"')
+                # Its KPI rows and watermark describe the old rows
+                drop_kpi_table(conn, table)
+            else:
+                # Appended rows keep the time format the table already has
+                decls = {r[1]: (r[2] or "").upper() for r in conn.execute(f'PRAGMA table_info("{table}")')}
+                existing = "minutes" if any("INT" in decls.get(c, "") for c in TIME_COLUMNS) else "hhmm"
+                if existing != time_format:
+                    print(f"[WARN][Ingest] {table} stores times as {existing}, appending as {existing}")
+                    time_format = existing
+        if not _table_exists(conn, table):
+            conn.execute(create_table_sql(table, time_format))
+        deferred = _drop_indexes(conn, table)
+        deferred += [f'CREATE INDEX IF NOT EXISTS "idx_{table}_{c}" ON "{table}" ("{c}")' for c in index_columns]
+
+        quoted = ", ".join(f'"{c}"' for c in columns)
+        insert_sql = f'INSERT INTO "{table}" ({quoted}) VALUES ({", ".join("?" * len(columns))})'
+        consumed = 0
+        for batch in batches:
+            rows, bad = convert_batch(mapped, batch, time_format)
+            for i, error in sorted(bad.items()):
+                if stats["bad_rows"] < MAX_REPORTED_ERRORS:
+                    # Source line: +2 for the header line and 1-based numbering
+                    print(f"[WARN][Ingest] {table} line {consumed + i + 2}: {error}")
+                stats["bad_rows"] += 1
+            if bad and strict:
+                raise IngestError(f"{len(bad)} invalid rows in {table} (first: {bad[min(bad)]})")
+            conn.executemany(insert_sql, rows)
+            stats["rows"] += len(rows)
+            consumed += len(batch)
+
+        index_start = time.perf_counter()
+        for sql in deferred:
+            conn.execute(sql)
+        stats["index_s"] = round(time.perf_counter() - index_start, 3)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"[DEBUG][Ingest] {table}: {stats['rows']} rows ({stats['bad_rows']} bad) in {stats['seconds']:.2f} s, "
+          f"{len(deferred)} indexes built in {stats['index_s']:.2f} s")
+    return stats
+
+
+def ingest(db_path: str, paths: Sequence[str], time_format: str = "minutes", if_exists: str = "fail",
+           table: Optional[str] = None, index_columns: Sequence[str] = (), strict: bool = False,
+           batch_rows: int = INGEST_BATCH_ROWS, kpi: bool = False) -> List[Dict[str, Any]]:
+    """
+    Load CSV / Excel exports of worker sheets into per-day tables of db_path.
+    Every sheet (a CSV file or an Excel worksheet) is one transaction; times are stored as
+    integer minutes since midnight (time_format="minutes") or as 'HH:MM' text ("hhmm").
+    With kpi, every loaded table also gets its materialized KPI table (SQL_kpi_views.py).
+    """
+    if time_format not in TIME_FORMATS:
+        raise IngestError(f"time_format must be one of {list(TIME_FORMATS)}, got {time_format}")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Batches allocate millions of tuples and none of them forms a reference cycle, but every
+    # collection of the cyclic GC would still walk them all: it is off for the load
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        apply_bulk_pragmas(conn)
+        results = []
+        for path in paths:
+            for sheet, header, batches in iter_sources(path, batch_rows):
+                target = table or table_name_for(sheet)
+                results.append(load_sheet(conn, target, header, batches, time_format, if_exists,
+                                          index_columns, strict))
+                if kpi:
+                    materialize_kpi_table(conn, target)
+        conn.execute("PRAGMA optimize")
+        return results
+    finally:
+        conn.close()
+        if gc_enabled:
+            gc.enable()
+
+
+# ---- benchmark ----
+def write_bench_csv(path: str, n_rows: int, seed: int = 0):
+    import random
+    rnd = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(REAL_COLUMNS)
+        writer.writerows(
+            (10000 + i, f"Worker {i}", rnd.choice(["Male", "Female"]),
+             f"{rnd.randint(6, 11):02d}:{rnd.randint(0, 59):02d}", f"{rnd.randint(12, 22):02d}:{rnd.randint(0, 59):02d}",
+             rnd.randint(0, 100), rnd.randint(0, 100), rnd.randint(0, 100), "")
+            for i in range(n_rows)
+        )
+
+
+def naive_load(db_path: str, csv_path: str, table: str) -> int:
+    """Baseline: default PRAGMAs, index created first, one INSERT and one commit per 1000 rows."""
+    conn = sqlite3.connect(db_path)
+    conn.execute(create_table_sql(table, "hhmm"))
+    conn.execute(f'CREATE INDEX "idx_{table}_ID" ON "{table}" ("ID")')
+    n = 0
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            conn.execute(f'INSERT INTO "{table}" VALUES (?,?,?,?,?,?,?,?,?)',
+                         (int(row[0]), row[1], row[2], row[3], row[4], int(row[5]), int(row[6]), int(row[7]), row[8]))
+            n += 1
+            if n % 1000 == 0:
+                conn.commit()
+    conn.commit()
+    conn.close()
+    return n
+
+
+if __name__ == "__main__":
+    # python SQL_ingest.py Dataset/workers.db exports/Workers_21012025.csv exports/February.xlsx [--replace] [--index ID]
+    # python SQL_ingest.py --bench [rows]
+    parser = argparse.ArgumentParser(description="Bulk load CSV / Excel worker sheets into per-day SQLite tables")
+    parser.add_argument("db_path", nargs="?")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--table", help="load every sheet into this table instead of one table per day")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--replace", action="store_true", help="drop and recreate existing tables")
+    mode.add_argument("--append", action="store_true", help="append to existing tables")
+    parser.add_argument("--time-format", choices=TIME_FORMATS, default="minutes")
+    parser.add_argument("--index", default="", help="comma separated columns to index after the load")
+    parser.add_argument("--strict", action="store_true", help="roll back a sheet with any invalid row")
+    parser.add_argument("--batch", type=int, default=INGEST_BATCH_ROWS)
+    parser.add_argument("--kpi", action="store_true", help="also materialize the KPI table of every loaded table")
+    parser.add_argument("--bench", type=int, nargs="?", const=1_000_000, metavar="ROWS")
+    args = parser.parse_args()
+
+    if args.bench:
+        import shutil
+        import tempfile
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(tmp_dir, "Workers_01012025.csv")
+            write_bench_csv(csv_path, args.bench)
+            print(f"[BENCH] {args.bench} rows, {os.path.getsize(csv_path) / 1e6:.1f} MB CSV")
+
+            t0 = time.perf_counter()
+            [bulk] = ingest(os.path.join(tmp_dir, "bulk.db"), [csv_path], index_columns=["ID"], batch_rows=args.batch)
+            bulk_s = time.perf_counter() - t0
+            print(f"[BENCH] bulk  : {bulk_s:7.2f} s  {bulk['rows'] / bulk_s * 60 / 1e6:6.2f} M rows/min")
+
+            naive_rows = min(args.bench, 200_000)
+            naive_csv = os.path.join(tmp_dir, "naive.csv")
+            write_bench_csv(naive_csv, naive_rows)
+            t0 = time.perf_counter()
+            naive_load(os.path.join(tmp_dir, "naive.db"), naive_csv, "Workers_01012025")
+            naive_s = time.perf_counter() - t0
+            print(f"[BENCH] naive : {naive_s:7.2f} s  {naive_rows / naive_s * 60 / 1e6:6.2f} M rows/min ({naive_rows} rows)")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    else:
+        if not args.db_path or not args.files:
+            parser.error("db_path and at least one CSV / Excel file are required")
+        try:
+            ingest(args.db_path, args.files, args.time_format, "replace" if args.replace else "append" if args.append else "fail",
+                   args.table, [c for c in args.index.split(",") if c], args.strict, args.batch, args.kpi)
+        except IngestError as e:
+            parser.exit(1, f"[ERROR][Ingest] {e}\n")
@@ -0,0 +1,315 @@
+# LLM_Test/SQL_join.py
+
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from SQL_columnar import FETCH_CHUNK_ROWS, ColumnarResult
+from SQL_connection_pool import get_connection_pool
+from SQL_fanout import has_glob, iter_fanout
+from SQL_query_builder import build_select_sql
+from SQL_query_guard import count_rows
+from SQL_utils import table_columns, where_for_table
+
+JOIN_HOWS = ("inner", "left")
+# Added to a right-side column whose name is already used by the left side
+RIGHT_SUFFIX = "_right"
+
+
+def join_keys(on: Any) -> List[Tuple[str, str]]:
+    """
+    (left column, right column) pairs from "ID", ["ID", "Name"],
+    {"left": "ID", "right": "Worker_ID"} or [["ID", "Worker_ID"], ...].
+    """
+    if isinstance(on, str):
+        pairs = [(on, on)]
+    elif isinstance(on, dict):
+        left, right = on.get("left"), on.get("right")
+        left = [left] if isinstance(left, str) else list(left or [])
+        right = [right] if isinstance(right, str) else list(right or [])
+        if len(left) != len(right):
+            raise ValueError(f"Join needs as many left as right key columns, got {left} and {right}")
+        pairs = list(zip(left, right))
+    else:
+        pairs = [(k, k) if isinstance(k, str) else tuple(k) for k in (on or [])]
+    if not pairs or any(len(p) != 2 or not all(isinstance(c, str) and c for c in p) for p in pairs):
+        raise ValueError(f"Join 'on' must name the key column(s), got {on}")
+    return pairs
+
+
+def is_query_spec(right: Any) -> bool:
+    """The right side is {"db_path": ..., "conditions": {...}} rather than literal rows."""
+    return isinstance(right, dict) and "db_path" in right
+
+
+def joined_columns(left_cols: List[str], right_cols: List[str], keys: List[Tuple[str, str]],
+                   suffix: str = RIGHT_SUFFIX) -> List[Tuple[str, str]]:
+    """
+    (right column, output name) of the right-side columns added to each left row.
+    A right key that has the same name as its left key is not repeated.
+    """
+    shared_keys = {r for l, r in keys if l == r}
+    taken = set(left_cols)
+    added = []
+    for col in right_cols:
+        if col in shared_keys:
+            continue
+        name = col + suffix if col in taken else col
+        taken.add(name)
+        added.append((col, name))
+    return added
+
+
+# ---- Python hash join ----
+def iter_rows(data: Any, chunk_rows: int = FETCH_CHUNK_ROWS) -> Iterator[Dict[str, Any]]:
+    """Rows of a ColumnarResult (converted chunk by chunk) or of any row iterable."""
+    if isinstance(data, ColumnarResult):
+        for start in range(0, data.num_rows, chunk_rows):
+            yield from data.to_rows(start, start + chunk_rows)
+        return
+    yield from data
+
+
+def iter_query_rows(db_path: str, conditions: Dict[str, Any], chunk_rows: int = FETCH_CHUNK_ROWS) -> Iterator[Dict[str, Any]]:
+    """Stream the rows of a single-table Query with fetchmany instead of materializing them."""
+    sql_query = build_select_sql(conditions)
+    print(f"[DEBUG][Join] stream SQL => {sql_query}")
+    with get_connection_pool().connection(db_path, conditions.get("access_profile")) as conn:
+        cursor = conn.execute(sql_query)
+        columns = [desc[0] for desc in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            count_rows(len(rows))
+            for row in rows:
+                yield dict(zip(columns, row))
+
+
+def count_query_rows(db_path: str, conditions: Dict[str, Any]) -> Optional[int]:
+    """Row count of a Query, computed by SQLite; None if it cannot be counted."""
+    sub = {k: v for k, v in conditions.items() if k not in ("order_by", "reverse", "format")}
+    try:
+        with get_connection_pool().connection(db_path, conditions.get("access_profile")) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM ({build_select_sql(sub)})").fetchone()[0]
+    except Exception as ex:
+        print("[WARN][Join] cannot count right side rows:", ex)
+        return None
+
+
+def hash_join(build_rows: Iterable[Dict[str, Any]], probe_rows: Iterable[Dict[str, Any]],
+              keys: List[Tuple[str, str]], how: str = "inner", suffix: str = RIGHT_SUFFIX,
+              build_is_left: bool = False) -> List[Dict[str, Any]]:
+    """
+    Classic hash join: one pass over the build side fills a hash table key -> rows,
+    then the probe side is streamed through it. build_is_left says which side was built.
+    NULL keys never match. how="left" keeps left rows without a match, right columns as None.
+    Output rows are left columns followed by the right columns (see joined_columns).
+    """
+    if how not in JOIN_HOWS:
+        raise ValueError(f"Unknown join type '{how}', must be one of {list(JOIN_HOWS)}")
+    build_keys = [l for l, _ in keys] if build_is_left else [r for _, r in keys]
+    probe_keys = [r for _, r in keys] if build_is_left else [l for l, _ in keys]
+
+    table: Dict[Tuple, List[Dict[str, Any]]] = {}
+    build_list = []
+    for row in build_rows:
+        build_list.append(row)
+        key = tuple(row.get(k) for k in build_keys)
+        if None not in key:
+            table.setdefault(key, []).append(row)
+
+    probe_iter = iter(probe_rows)
+    first_probe = next(probe_iter, None)
+    left_sample = (build_list[0] if build_list else None) if build_is_left else first_probe
+    right_sample = first_probe if build_is_left else (build_list[0] if build_list else None)
+    left_cols = list(left_sample.keys()) if left_sample else []
+    right_cols = list(right_sample.keys()) if right_sample else []
+    added = joined_columns(left_cols, right_cols, keys, suffix)
+
+    def merge(left: Dict[str, Any], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        row = dict(left)
+        for col, name in added:
+            row[name] = right.get(col) if right is not None else None
+        return row
+
+    result = []
+    matched_left = set()
+    if first_probe is not None:
+        for probe in _prepend(first_probe, probe_iter):
+            matches = table.get(tuple(probe.get(k) for k in probe_keys), ())
+            if build_is_left:
+                for left in matches:
+                    matched_left.add(id(left))
+                    result.append(merge(left, probe))
+            else:
+                if matches:
+                    result.extend(merge(probe, right) for right in matches)
+                elif how == "left":
+                    result.append(merge(probe, None))
+    if how == "left" and build_is_left:
+        result.extend(merge(left, None) for left in build_list if id(left) not in matched_left)
+    return result
+
+
+def _prepend(first: Dict[str, Any], rest: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    yield first
+    yield from rest
+
+
+def join_rows(left: Any, right: Any, keys: List[Tuple[str, str]], how: str = "inner",
+              suffix: str = RIGHT_SUFFIX, chunk_rows: int = FETCH_CHUNK_ROWS) -> List[Dict[str, Any]]:
+    """
+    Join left rows (row list or ColumnarResult) with right rows or a right Query spec.
+    The smaller side is built into the hash table, the larger one is streamed; a right
+    Query larger than the left rows is read with fetchmany and never held in memory.
+    """
+    left_size = len(left)
+    if is_query_spec(right):
+        db_path, conditions = right["db_path"], dict(right.get("conditions") or {})
+        conditions.pop("format", None)
+        if has_glob(db_path) or has_glob(conditions.get("table", "")):
+            # Many sheets / files: size unknown, the merged fan-out stream is the probe side
+            right_size, right_rows = None, iter_fanout(db_path, conditions)
+        else:
+            conditions["where"] = where_for_table(db_path, conditions.get("table", ""), conditions.get("where"))
+            right_size = count_query_rows(db_path, conditions)
+            right_rows = iter_query_rows(db_path, conditions, chunk_rows)
+    else:
+        right_size = len(right)
+        right_rows = iter_rows(right, chunk_rows)
+
+    build_is_left = right_size is None or left_size < right_size
+    print(f"[DEBUG][Join] left={left_size} rows, right={right_size} rows, build side={'left' if build_is_left else 'right'}")
+    if build_is_left:
+        return hash_join(iter_rows(left, chunk_rows), right_rows, keys, how, suffix, build_is_left=True)
+    return hash_join(right_rows, iter_rows(left, chunk_rows), keys, how, suffix, build_is_left=False)
+
+
+# ---- SQL pushdown ----
+def query_columns(db_path: str, conditions: Dict[str, Any]) -> Optional[List[str]]:
+    """Output column names of a single-table Query, None if they cannot be known without running it."""
+    if conditions.get("group_by"):
+        return list(conditions["group_by"]) + [a["output_column"] for a in conditions["aggregates"]]
+    columns = []
+    for field in conditions.get("fields", ["*"]):
+        if field == "*":
+            table_cols = [name for name, _ in table_columns(db_path, conditions.get("table", ""))]
+            if not table_cols:
+                return None
+            columns += table_cols
+        elif field.isidentifier():
+            columns.append(field)
+        else:
+            return None
+    return columns + list(conditions.get("expressions") or {})
+
+
+def join_select_sql(left_conditions: Dict[str, Any], join: Dict[str, Any], left_table: str, right_table: str,
+                    left_cols: List[str], right_cols: List[str]) -> str:
+    """SELECT l.*, r.<added columns> FROM (<left query>) l [LEFT] JOIN (<right query>) r ON <keys>."""
+    keys = [tuple(k) for k in join["on"]]
+    left_sub = {k: v for k, v in left_conditions.items() if k not in ("join", "format")}
+    left_sub["table"] = left_table
+    right_sub = {k: v for k, v in join["conditions"].items() if k != "format"}
+    right_sub["table"] = right_table
+
+    select_items = [f'l."{c}"' for c in left_cols]
+    for col, name in joined_columns(left_cols, right_cols, keys, join.get("suffix", RIGHT_SUFFIX)):
+        select_items.append(f'r."{col}"' + (f' AS "{name}"' if name != col else ""))
+    on_sql = " AND ".join(f'l."{l}" = r."{r}"' for l, r in keys)
+    join_sql = "LEFT JOIN" if join.get("how", "inner") == "left" else "JOIN"
+    return (f"SELECT {', '.join(select_items)} FROM ({build_select_sql(left_sub)}) AS l "
+            f"{join_sql} ({build_select_sql(right_sub)}) AS r ON {on_sql}")
+
+
+def join_query(db_path: str, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Run a Query whose conditions["join"] was pushed down by push_join_into_query:
+    both database files are ATTACHed to one in-memory connection and SQLite runs the JOIN.
+    """
+    join = conditions["join"]
+    right_db = join["db_path"]
+    # The left where is converted by the Query tool, the right one is converted for its own table
+    right_conditions = join["conditions"]
+    join = dict(join, conditions=dict(right_conditions, where=where_for_table(
+        right_db, right_conditions.get("table", ""), right_conditions.get("where"))))
+    left_cols = query_columns(db_path, conditions)
+    right_cols = query_columns(right_db, join["conditions"])
+    if left_cols is None or right_cols is None:
+        raise ValueError("Join pushdown needs the column names of both sides")
+
+    same_file = os.path.abspath(right_db) == os.path.abspath(db_path)
+    alias_of = {"jl": db_path} if same_file else {"jl": db_path, "jr": right_db}
+    sql_query = join_select_sql(
+        conditions, join,
+        f'jl."{conditions.get("table", "")}"',
+        f'{"jl" if same_file else "jr"}."{join["conditions"].get("table", "")}"',
+        left_cols, right_cols,
+    )
+    print(f"[DEBUG][Join] pushed SQL => {sql_query}")
+
+    with get_connection_pool().connection(":memory:") as conn:
+        # A failed ATTACH must not leave the others attached to the pooled connection
+        attached = []
+        try:
+            for alias, db_file in alias_of.items():
+                conn.execute("ATTACH DATABASE ? AS " + alias, (db_file,))
+                attached.append(alias)
+            cursor = conn.execute(sql_query)
+            columns = [desc[0] for desc in cursor.description]
+            rows = []
+            for chunk in iter(lambda: cursor.fetchmany(FETCH_CHUNK_ROWS), []):
+                count_rows(len(chunk))
+                rows.extend(dict(zip(columns, row)) for row in chunk)
+            return rows
+        finally:
+            for alias in attached:
+                conn.execute(f"DETACH DATABASE {alias}")
+
+
+def push_join_into_query(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    A Join right after a Query, whose right side is a Query spec, is run by SQLite as one
+    JOIN over the ATTACHed files when both sides are plain tables of reachable databases
+    (no glob) and the column names of both sides are known.
+    """
+    new_ops = []
+    for op in operations:
+        prev = new_ops[-1] if new_ops else None
+        args = op.get("args", {})
+        if (
+            op.get("tool_name") == "Join"
+            and prev is not None
+            and prev.get("tool_name") == "Query"
+            and args.get("data") == "$result_of_previous_tool"
+            and is_query_spec(args.get("right"))
+        ):
+            left_db = prev.get("args", {}).get("db_path", "")
+            conds = prev.setdefault("args", {}).setdefault("conditions", {})
+            right = args["right"]
+            right_conds = right.get("conditions") or {}
+            try:
+                keys = join_keys(args.get("on"))
+                pushable = (
+                    args.get("how", "inner") in JOIN_HOWS
+                    and not conds.get("join")
+                    and not conds.get("sample")
+                    and all(os.path.isfile(p) and not has_glob(p) for p in (left_db, right["db_path"]))
+                    and not has_glob(conds.get("table", "")) and not has_glob(right_conds.get("table", ""))
+                    and query_columns(left_db, conds) is not None
+                    and query_columns(right["db_path"], right_conds) is not None
+                )
+            except ValueError:
+                pushable = False
+            if pushable:
+                conds["join"] = {
+                    "db_path": right["db_path"],
+                    "conditions": dict(right_conds),
+                    "on": [list(k) for k in keys],
+                    "how": args.get("how", "inner"),
+                    "suffix": args.get("suffix", RIGHT_SUFFIX),
+                }
+                print(f"[DEBUG][Join] pushed JOIN on {keys} into Query")
+                continue
+        new_ops.append(op)
+    return new_ops
@@ -0,0 +1,236 @@
+# LLM_Test/SQL_kpi_views.py
+
+import argparse
+import sqlite3
+from typing import Dict, List, Optional
+
+from SQL_utils import sql_minutes_expr, sql_safe_div_expr
+
+# The KPI columns that used to be PlanKPITool / RealKPITool / QualifiedKPITool
+KPI_SOURCES = {
+    "Plan_KPI": "Plan_Number",
+    "Real_KPI": "Real_Number",
+    "Qualified_KPI": "Qualified_Number",
+}
+
+# One row per source table: the highest source rowid already materialized
+WATERMARK_TABLE = "_kpi_watermarks"
+
+
+def kpi_table_name(table: str) -> str:
+    return f"{table}_KPI"
+
+
+def _kpi_value_exprs(prefix: str = "") -> Dict[str, str]:
+    """
+    SQL expressions for Work_Time and the three KPIs.
+    prefix is "NEW." inside triggers and "" for a plain SELECT.
+    """
+    work_time = f"({sql_minutes_expr(prefix + 'End_Time')} - {sql_minutes_expr(prefix + 'Start_Time')})"
+    exprs = {"Work_Time": work_time}
+    for kpi_col, number_col in KPI_SOURCES.items():
+        exprs[kpi_col] = sql_safe_div_expr(prefix + number_col, work_time)
+    return exprs
+
+
+def drop_kpi_table(conn: sqlite3.Connection, table: str):
+    """
+    Drop the KPI table of a sheet and forget its watermark. Runs in the caller's
+    transaction, so a replace that is rolled back keeps the old KPIs too.
+    """
+    conn.execute(f'DROP TABLE IF EXISTS "{kpi_table_name(table)}"')
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (WATERMARK_TABLE,)).fetchone():
+        conn.execute(f'DELETE FROM "{WATERMARK_TABLE}" WHERE source_table = ?', (table,))
+
+
+def _source_recreated(conn: sqlite3.Connection, table: str) -> bool:
+    """
+    The triggers live on the sheet and are dropped with it: a KPI table whose insert
+    trigger is gone belongs to an earlier table of the same name.
+    """
+    kpi_table = kpi_table_name(table)
+    names = {r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name IN (?, ?)", (kpi_table, f"trg_{kpi_table}_ins")
+    )}
+    return kpi_table in names and f"trg_{kpi_table}_ins" not in names
+
+
+def ensure_kpi_table(conn: sqlite3.Connection, table: str) -> str:
+    """
+    Create (if needed) the materialized KPI table of a worker sheet, the indexes on it,
+    and the triggers that keep it up to date on INSERT / UPDATE / DELETE.
+    Rows that existed before the triggers are picked up by refresh_kpi_table().
+    A KPI table left over from a dropped and recreated sheet is rebuilt from scratch.
+    Return the name of the KPI table.
+    """
+    kpi_table = kpi_table_name(table)
+    if _source_recreated(conn, table):
+        print(f"[DEBUG][KPIView] {table} was recreated, rebuilding {kpi_table}")
+        with conn:
+            drop_kpi_table(conn, table)
+    value_cols = list(_kpi_value_exprs().keys())
+    new_exprs = _kpi_value_exprs("NEW.")
+
+    insert_new = (
+        f'INSERT OR REPLACE INTO "{kpi_table}" (src_rowid, {", ".join(value_cols)}) '
+        f'VALUES (NEW.rowid, {", ".join(new_exprs[c] for c in value_cols)});'
+    )
+
+    statements = [
+        f'CREATE TABLE IF NOT EXISTS "{WATERMARK_TABLE}" (source_table TEXT PRIMARY KEY, max_rowid INTEGER)',
+        f'CREATE TABLE IF NOT EXISTS "{kpi_table}" ('
+        f'src_rowid INTEGER PRIMARY KEY, '
+        + ", ".join(f"{c} REAL" for c in value_cols) + ")",
+    ]
+    for kpi_col in KPI_SOURCES:
+        statements.append(
+            f'CREATE INDEX IF NOT EXISTS "idx_{kpi_table}_{kpi_col}" ON "{kpi_table}" ({kpi_col})'
+        )
+    statements += [
+        f'CREATE TRIGGER IF NOT EXISTS "trg_{kpi_table}_ins" AFTER INSERT ON "{table}" '
+        f"BEGIN {insert_new} END",
+        f'CREATE TRIGGER IF NOT EXISTS "trg_{kpi_table}_upd" AFTER UPDATE ON "{table}" '
+        f'BEGIN DELETE FROM "{kpi_table}" WHERE src_rowid = OLD.rowid; {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS "trg_{kpi_table}_del" AFTER DELETE ON "{table}" '
+        f'BEGIN DELETE FROM "{kpi_table}" WHERE src_rowid = OLD.rowid; END',
+    ]
+
+    with conn:
+        for stmt in statements:
+            conn.execute(stmt)
+    return kpi_table
+
+
+def refresh_kpi_table(conn: sqlite3.Connection, table: str) -> int:
+    """
+    Incremental refresh by rowid watermark: only rows with rowid above the stored
+    watermark are computed. Once the triggers exist this only ever catches up on
+    rows that were loaded before ensure_kpi_table() was called.
+    Return the number of rows materialized.
+    """
+    kpi_table = kpi_table_name(table)
+    exprs = _kpi_value_exprs()
+    value_cols = list(exprs.keys())
+
+    row = conn.execute(
+        f'SELECT max_rowid FROM "{WATERMARK_TABLE}" WHERE source_table = ?', (table,)
+    ).fetchone()
+    watermark = row[0] if row and row[0] is not None else 0
+
+    with conn:
+        cur = conn.execute(
+            f'INSERT OR REPLACE INTO "{kpi_table}" (src_rowid, {", ".join(value_cols)}) '
+            f'SELECT rowid, {", ".join(exprs[c] for c in value_cols)} '
+            f'FROM "{table}" WHERE rowid > ?',
+            (watermark,),
+        )
+        added = cur.rowcount
+        # Nothing new: leave the file untouched so its fingerprint (SQL_op_cache) stays the same
+        if added <= 0:
+            return 0
+        conn.execute(
+            f'INSERT OR REPLACE INTO "{WATERMARK_TABLE}" (source_table, max_rowid) '
+            f'SELECT ?, COALESCE(MAX(rowid), ?) FROM "{table}"',
+            (table, watermark),
+        )
+    print(f"[DEBUG][KPIView] refreshed {kpi_table}: {added} new rows (watermark was {watermark})")
+    return added
+
+
+def materialize_kpi_table(conn: sqlite3.Connection, table: str) -> int:
+    """
+    Explicit, writing step (SQL_ingest.py --kpi or this module's CLI): create the KPI table
+    of a sheet with its triggers and catch up on the rows already loaded.
+    The KPI tool itself never writes, it only reads what this step built.
+    Return the number of rows materialized.
+    """
+    ensure_kpi_table(conn, table)
+    return refresh_kpi_table(conn, table)
+
+
+def kpi_table_ready(conn: sqlite3.Connection, table: str) -> bool:
+    """
+    The KPI table of the sheet exists and its triggers are still on the sheet, so it holds
+    every current row. A missing table, or one left over from a recreated sheet, is not ready.
+    """
+    kpi_table = kpi_table_name(table)
+    names = {r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name IN (?, ?, ?)", (kpi_table, f"trg_{kpi_table}_ins", WATERMARK_TABLE)
+    )}
+    return names == {kpi_table, f"trg_{kpi_table}_ins", WATERMARK_TABLE}
+
+
+def build_kpi_select(
+    table: str,
+    kpis: List[str],
+    fields: Optional[List[str]] = None,
+    where: Optional[str] = None,
+    order_by: Optional[str] = None,
+    reverse: bool = False,
+    limit: Optional[int] = None,
+) -> str:
+    """
+    Build the lookup query joining the sheet with its KPI table.
+    where / order_by may reference both base columns and Work_Time / *_KPI.
+    """
+    kpi_table = kpi_table_name(table)
+    base_fields = fields or ["*"]
+    select_cols = [f"base.{f}" if f != "*" else "base.*" for f in base_fields]
+    select_cols.append("k.Work_Time")
+    select_cols += [f"k.{k}" for k in kpis]
+
+    sql = (
+        f'SELECT {", ".join(select_cols)} FROM "{table}" AS base '
+        f'JOIN "{kpi_table}" AS k ON k.src_rowid = base.rowid'
+    )
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += f" ORDER BY {order_by} {'DESC' if reverse else 'ASC'}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql
+
+
+def build_kpi_fallback_select(
+    table: str,
+    kpis: List[str],
+    fields: Optional[List[str]] = None,
+    where: Optional[str] = None,
+    order_by: Optional[str] = None,
+    reverse: bool = False,
+    limit: Optional[int] = None,
+) -> str:
+    """
+    Same result shape as build_kpi_select, but computes the KPIs on the fly.
+    Used when the sheet has no (current) KPI table, see kpi_table_ready().
+    """
+    exprs = _kpi_value_exprs()
+    inner_cols = ["*", f"{exprs['Work_Time']} AS Work_Time"]
+    inner_cols += [f"{exprs[k]} AS {k}" for k in kpis]
+    outer_cols = list(fields or ["*"])
+    if outer_cols != ["*"]:
+        outer_cols += ["Work_Time"] + list(kpis)
+
+    sql = f'SELECT {", ".join(outer_cols)} FROM (SELECT {", ".join(inner_cols)} FROM "{table}")'
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += f" ORDER BY {order_by} {'DESC' if reverse else 'ASC'}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql
+
+
+if __name__ == "__main__":
+    # python SQL_kpi_views.py Dataset/test_dataset.db Workers_20012025 [Workers_21012025 ...]
+    parser = argparse.ArgumentParser(description="Materialize the KPI tables read by the KPI tool")
+    parser.add_argument("db_path")
+    parser.add_argument("tables", nargs="+")
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db_path)
+    try:
+        for name in args.tables:
+            print(f"[DEBUG][KPIView] {kpi_table_name(name)}: {materialize_kpi_table(conn, name)} rows materialized")
+    finally:
+        conn.close()
@@ -3,8 +3,11 @@
 from SQL_utils import map_column_name, patch_query_conditions
 import re
 import json
+import hashlib
 import operator
-from typing import TypedDict, Annotated, Sequence, List, Dict, Any
+import time
+import uuid
+from typing import TypedDict, Annotated, Sequence, List, Dict, Any, Optional
 
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import (
@@ -18,7 +21,6 @@ from langchain_core.utils.function_calling import convert_to_openai_function
 from langgraph.prebuilt import ToolNode, ToolInvocation
 from langgraph.graph import StateGraph, END
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.prompts import ChatPromptTemplate
 
 # ======= Import the tool functions in tools/SQL_tools_2_2.py ======= #
 from tools.SQL_tools_2_2 import (
@@ -30,10 +32,38 @@ from tools.SQL_tools_2_2 import (
     MultiplicationTool,
     DivisionTool,
     AveragingTool,
-    ModeTool
+    ModeTool,
+    KPIViewTool,
+    ExpressionTool,
+    FilterTool,
+    GroupByTool,
+    JoinTool,
+    FusedArithmeticTool
 )
 
 from SQL_utils import unify_operations
+from SQL_fusion import fuse_arithmetic_ops
+from SQL_expression import push_expressions_into_query
+from SQL_groupby import push_group_by_into_query
+from SQL_join import push_join_into_query
+from SQL_columnar import ColumnarResult
+from SQL_result_file import write_result_file
+from SQL_op_cache import OperationCache, get_operation_cache, input_fingerprint, operation_key
+from SQL_speculative import IncrementalOperationsParser, SpeculativeExecutor
+from SQL_prompt import build_parse_prompt, get_parse_prompt_template
+from SQL_plan_compiler import PlanError, compile_plan, push_projection_into_query
+from SQL_rule_planner import RULE_PLANNER_MIN_CONFIDENCE, plan_request
+from SQL_single_flight import SingleFlight
+from SQL_fake_llm import make_fake_parse_model
+from SQL_query_guard import (
+    PLAN_TIMEOUT_S,
+    QueryAborted,
+    QueryGuard,
+    guarded,
+    print_progress,
+    register_run,
+    unregister_run,
+)
 
 # 1) Load .env, read OPENAI_API_KEY
 from dotenv import load_dotenv
@@ -42,18 +72,52 @@ import os
 # Load environment variables from .env
 load_dotenv()
 
+# Answer parse requests with a local fake model (SQL_fake_llm.py): load tests and offline runs
+fake_llm = os.getenv("SQL_FAKE_LLM", "0") == "1"
+
 # Get OPENAI_API_KEY
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-if openai_api_key is None:
+if openai_api_key is None and not fake_llm:
     raise ValueError("OPENAI_API_KEY is not set in the .env file")
 
+# If set, every tabular operation result is also written to this directory as a
+# columnar result file (see SQL_result_file.py), for audit and re-display
+result_dir = os.getenv("SQL_RESULT_DIR")
+
+# Stream the parse response and start Query operations as soon as they are complete
+speculative_execution = os.getenv("SQL_SPECULATIVE", "1") == "1"
+
+# Plan common request shapes locally and only call the parse model when the rules are not confident
+rule_planner_enabled = os.getenv("SQL_RULE_PLANNER", "1") == "1"
+
+# Print the full parse prompt for every request (only a one-line summary otherwise)
+print_prompt = os.getenv("SQL_PRINT_PROMPT", "0") == "1"
+
+
+# Concurrent identical parse requests share one in-flight LLM call
+parse_flight = SingleFlight("parse")
+# Parse answers of recent prompts (the model runs at temperature 0); the prompt embeds the
+# table schema, so a schema change is a new key. SQL_PARSE_CACHE_SIZE=0 disables it
+parse_cache = OperationCache(int(os.getenv("SQL_PARSE_CACHE_SIZE", "128")))
+
 
 # 2) Define the State structure used by workflow
 class SQLAgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], operator.add]
     pending_operations: Annotated[List[Dict[str, Any]], operator.add]
     results: Annotated[List[Dict[str, Any]], operator.add]
+    # DB operations started while the LLM was still streaming the plan (SQL_speculative.py)
+    speculation: Optional[Any]
+    # Optional id the run is registered under, so another thread can call
+    # SQL_query_guard.cancel_run(run_id); and a callback for progress reports of running queries
+    run_id: Optional[str]
+    on_progress: Optional[Any]
+    # Optional deadline of the whole request (parse and plan) in seconds, PLAN_TIMEOUT_S otherwise
+    timeout: Optional[float]
+    # The run's QueryGuard: passed in by a caller that registered the run itself (SQL_service.py),
+    # otherwise created by agent_input; speculative and planned statements all run under it
+    guard: Optional[Any]
 
 
 # 3) Initializing model and tool
@@ -66,70 +130,109 @@ tools = [
     MultiplicationTool(),
     DivisionTool(),
     AveragingTool(),
-    ModeTool()
+    ModeTool(),
+    KPIViewTool(),
+    ExpressionTool(),
+    FilterTool(),
+    GroupByTool(),
+    JoinTool()
 ]
 
-parse_model = ChatOpenAI(
-    temperature=0.0,
-    streaming=False,
-    openai_api_key=openai_api_key
-)  # No binding tools
+# Tools that read a ColumnarResult directly; every other tool gets it converted back to row dicts
+COLUMNAR_TOOLS = {"Averaging", "Mode", "Sorting", "Filter", "GroupBy", "Join"}
+
+# Tools that are only produced by the executor's own plan rewrites, never bound to the model
+internal_tools = [
+    FusedArithmeticTool()
+]
 
-execution_model = ChatOpenAI(
-    temperature=0.0,
-    streaming=False,
-    openai_api_key=openai_api_key
-).bind_tools(tools)
+if fake_llm:
+    parse_model = make_fake_parse_model()
+    execution_model = None
+else:
+    parse_model = ChatOpenAI(
+        temperature=0.0,
+        streaming=False,
+        openai_api_key=openai_api_key
+    )  # No binding tools
+
+    execution_model = ChatOpenAI(
+        temperature=0.0,
+        streaming=False,
+        openai_api_key=openai_api_key
+    ).bind_tools(tools)
 
 tool_node = ToolNode(tools)
 
 
 def my_unify_operations(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Here we can add some custom processing based on unify_operations:
-    1) If you see 'Subtraction' and output_column = 'Work_Time', forcibly change number_columns to ['End_Time','Start_Time'].
-    2) Also make sure that the fields of the previous query contain 'End_Time' and 'Start_Time'.
+    unify_operations fixes tool and column names, then the plan compiler (SQL_plan_compiler.py):
+    1) checks tools, args and every column reference against the table schema,
+    2) forces Subtraction => Work_Time to End_Time - Start_Time,
+    3) adds the columns later steps read to the Query fields and prunes unused ones,
+    4) drops dead operations and moves filters before computations.
+    Raises PlanError if the plan cannot run, before any table is touched.
     """
     print("[DEBUG] my_unify_operations called, original operations =>", operations)
 
     # First use unify_operations to make basic corrections
     unified_ops = unify_operations(operations)
+    compiled_ops = compile_plan(unified_ops, {t.name for t in tools})
 
-    # To realize the calculation of the intermediate variable of work_time, but the actual effect is not satisfactory
-    # (1) Find Subtraction => Work_Time
-    used_work_time = False
-    for op in unified_ops:
-        if op["tool_name"] == "Subtraction":
-            args = op.get("args", {})
-            if args.get("output_column", "") == "Work_Time":
-                # If number_columns is not 2, change it to End_Time, Start_Time
-                if "number_columns" in args and len(args["number_columns"]) != 2:
-                    print("[DEBUG] Detected Subtraction => Work_Time, fix columns to End_Time - Start_Time")
-                    args["number_columns"] = ["End_Time", "Start_Time"]
-                used_work_time = True
-
-    # (2) If do use Work_Time, need to check End_Time / Start_Time when querying.
-    if used_work_time:
-        # Find the first "Query" operation and complete the fields
-        for op in unified_ops:
-            if op["tool_name"] == "Query":
-                conds = op["args"].get("conditions", {})
-                fields = conds.get("fields", [])
-                # Add End_Time / Start_Time (if not already there)
-                if "End_Time" not in fields:
-                    fields.append("End_Time")
-                if "Start_Time" not in fields:
-                    fields.append("Start_Time")
-                conds["fields"] = fields
-                print("[DEBUG] Because used Work_Time, we also add End_Time, Start_Time to Query fields =>", fields)
-                break
+    print("[DEBUG] my_unify_operations final =>", compiled_ops)
+    return compiled_ops
+
+
+def push_down_operations(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Only select the columns later operations read, let SQLite compute Expressions, Filters,
+    GroupBys and Joins on base columns, then fuse consecutive row-wise arithmetic ops so the
+    rows are traversed once per chain.
+    """
+    operations = push_projection_into_query(operations)
+    operations = push_expressions_into_query(operations)
+    operations = push_group_by_into_query(operations)
+    operations = push_join_into_query(operations)
+    return fuse_arithmetic_ops(operations)
+
+
+def speculative_plan(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    A streamed prefix of the plan prepared exactly as agent_input and single_executor_node
+    prepare the whole plan, so a Query started speculatively is the Query the executor claims.
+    """
+    return push_down_operations(compile_plan(unify_operations(operations), {t.name for t in tools}))
 
-    print("[DEBUG] my_unify_operations final =>", unified_ops)
-    return unified_ops
+
+def _new_run_guard(state: SQLAgentState, run_id: str) -> QueryGuard:
+    # One guard for the whole run: deadline, cancellation and progress of every statement it runs
+    return QueryGuard(timeout=state.get("timeout") or PLAN_TIMEOUT_S, on_progress=state.get("on_progress") or print_progress,
+                      label=f"plan {run_id}")
 
 
 # =========== 3) Define the functions of each node  =========== #
 def agent_input(state: SQLAgentState) -> Dict:
+    """
+    Parse the request into pending_operations under the run's guard. Unless the caller passed
+    a guard, the run is registered here, so cancel_run(run_id) also stops it while the LLM is
+    still answering; the executor unregisters it, or this node when there is nothing to execute.
+    """
+    # Unique per run: cancel_run() handle and prefix of the persisted result files
+    run_id = state.get("run_id") or uuid.uuid4().hex[:12]
+    guard = state.get("guard")
+    if guard is None:
+        guard = _new_run_guard(state, run_id)
+        register_run(run_id, guard)
+    try:
+        update = _parse_request(state, guard)
+    finally:
+        if not state["pending_operations"]:
+            unregister_run(run_id, guard)
+    return dict(update, run_id=run_id, guard=guard)
+
+
+def _parse_request(state: SQLAgentState, guard: QueryGuard) -> Dict:
     messages = state["messages"]
     if not messages:
         return {"messages": [AIMessage(content="No user input. End.")]}
@@ -140,111 +243,68 @@ def agent_input(state: SQLAgentState) -> Dict:
 
     user_input = last_msg.content
 
-    # 1) Build Prompt
-    parse_prompt = ChatPromptTemplate.from_template(
-        """
-        You are an assistant that receives a user's request about database queries and mathematical operations.
-        The user said: {user_input}
-
-        Your task:
-        1) Analyze the user's request and figure out what tools (Query, Sorting, Addition, Subtraction, Multiplication, Division, Mode, Averaging) are needed, which are binded with the model.
-        2) Build a list of operations in JSON form, strictly with the format below.
-        3) Return ONLY valid JSON (no markdown, no extra text).
-
-        VERY IMPORTANT NOTE:
-        There is NO column named Work_Time in any database or table! 
-        If user mention the working time or Work_Time or other similar description, you MUST firstly do a Subtraction operation to produce Work_Time as a new column, like in following example!
-
-        IMPORTANT:
-        - If the user references or needs a column that doesn't literally exist, but is obviously a near-synonym or a different case, you should automatically correct it to the actual column name in the table. 
-        - tool_name must be exactly one of ["Query","Sorting","Addition","Subtraction","Multiplication","Division","Mode","Averaging"] (case-sensitive).
-        - Unless the compute objects/columns are the result of in previous calculation steps (like Work_Time), the only valid compute objects/columns should be one of ["ID","Name","Gender","Start_Time","End_Time","Plan_Number","Real_Number","Qualified_Number"].
-
-        JSON Format:
-        {
-          "success": true,
-          "operations": [
-            {
-              "tool_name": "...",   // One of ["Query","Sorting","Addition","Subtraction","Multiplication","Division","Mode","Averaging"]
-              "args": {
-                 // The exact arguments needed by that tool
-              }
-            },
-            ...
-          ]
-        }
-
-        Result passing / chaining:
-        - If you want to use the result from a previous tool, reference it in the "args" explicitly, for example "args": {"data": "$result_of_previous_tool"}.
-        - Make sure to specify a logical or descriptive placeholder that indicates you are using previous results.
-
-        Error handling:
-        - If a query returns an empty result, subsequent operations might produce 0 or empty results.
-        - Tools should handle unexpected data formats gracefully where possible.
-
-        Example Input:
-        "I have a SQL database named Workers.db in path D:/Test/Dataset, which has a table named Sheet_17_02_2025. First, select all workers who start work before 9:00, subtract the start time from the end time to get the work time, then divide the number of qualified workpieces Qualified_Number by the work time to get the qualified workpiece KPI Qualified_KPI; then select all workers whose end time is later than 17:00, subtract the start time from the end time to get the work time, then divide the number of qualified workpieces Qualified_Number by the work time to get the qualified workpiece KPI Qualified_KPI; finally, list the data of all the above workers in descending order of Qualified_KPI."
-
-        Example Output:
-        {
-          "success": true,
-          "operations": [
-            {
-              "tool_name": "Query",
-              "args": {
-                "db_path": "D:/Test/Dataset/Workers.db",
-                "conditions": {
-                  "table": "Sheet_17_02_2025",
-                  "fields": ["ID","Name","Start_Time","End_Time","Qualified_Number"],
-                  "where": "Start_Time < '09:00' OR End_Time > '17:00'"
-                }
-              }
-            },
-            {
-              "tool_name": "Subtraction",
-              "args": {
-                "data": "$result_of_previous_tool",
-                "number_columns": ["End_Time","Start_Time"],
-                "output_column": "Work_Time"
-              }
-            },
-            {
-              "tool_name": "Division",
-              "args": {
-                "data": "$result_of_previous_tool",
-                "number_columns": ["Qualified_Number","Work_Time"],
-                "output_column": "Qualified_KPI"
-              }
-            },
-            {
-              "tool_name": "Sorting",
-              "args": {
-                "data": "$result_of_previous_tool",
-                "field_index": "Qualified_KPI",
-                "reverse": true
-              }
-            }
-          ]
-        }
-
-        Notes:
-        - Return no other fields except "success" and "operations".
-        - The structure must match the JSON Format strictly (no markdown, no extra keys).
-        """
-    )
-
-    # ---- Log: Print Prompt ----
-    final_prompt_text = parse_prompt.format(user_input=user_input)
-    print("\n=== Final Prompt Text ===")
-    print(final_prompt_text)
-    print("=========================")
+    # 0) Rule-based fast path: same operations JSON as the LLM, without the network round trip
+    if rule_planner_enabled:
+        rule_plan, confidence = plan_request(user_input)
+        if rule_plan is not None and confidence >= RULE_PLANNER_MIN_CONFIDENCE:
+            print(f"[DEBUG] rule planner handled the request (confidence={confidence:.2f}), LLM skipped")
+            print("\n=== Parsed JSON ===")
+            print(rule_plan)
+            print("===================")
+            try:
+                operations = my_unify_operations(rule_plan["operations"])
+            except PlanError as e:
+                return {"messages": [AIMessage(content=f"Plan error: {e}")]}
+            for op in operations:
+                state["pending_operations"].append(op)
+            return {"messages": [AIMessage(content="Parsing successful.")]}
+        print(f"[DEBUG] rule planner confidence {confidence:.2f} < {RULE_PLANNER_MIN_CONFIDENCE}, use the parse model")
+
+    # 1) Build Prompt (static parts are compiled once per process, see SQL_prompt.py)
+    prompt_text, prompt_stats = build_parse_prompt(user_input)
+    print(f"[DEBUG] parse prompt built in {prompt_stats['build_ms']:.2f} ms, ~{prompt_stats['tokens']} tokens "
+          f"(hints={prompt_stats['hints']}, example={prompt_stats['example']})")
+    if print_prompt:
+        print("\n=== Final Prompt Text ===")
+        print(prompt_text)
+        print("=========================")
 
     # 2) Call LLM to get AIMessage
-    prompt_model_chain = parse_prompt | parse_model
+    prompt_model_chain = get_parse_prompt_template() | parse_model
+    llm_start = time.perf_counter()
+    speculator = SpeculativeExecutor(tools, speculative_plan, parent=guard) if speculative_execution else None
+
+    def call_parse_model() -> str:
+        if speculator:
+            # Stream the answer; every operation object is offered to the speculator as soon as it closes
+            ops_parser = IncrementalOperationsParser()
+            streamed = []
+            for chunk in prompt_model_chain.stream({"prompt": prompt_text}):
+                streamed.append(chunk.content)
+                for early_op in ops_parser.feed(chunk.content):
+                    speculator.offer(early_op)
+            return "".join(streamed)
+        return prompt_model_chain.invoke({"prompt": prompt_text}).content
+
     try:
-        ai_msg = prompt_model_chain.invoke({"user_input": user_input})
+        # A recently parsed prompt is answered from parse_cache; identical prompts parsed at the same time share one LLM call
+        parse_key = hashlib.sha256(f"{getattr(parse_model, 'model_name', '')}|{prompt_text}".encode("utf-8")).hexdigest()
+        cached, content = parse_cache.get(parse_key)
+        shared = cached
+        if not cached:
+            content, shared = parse_flight.do(parse_key, call_parse_model)
+        ai_msg = AIMessage(content=content)
     except Exception as e:
+        if speculator:
+            speculator.cancel_all()
         return {"messages": [AIMessage(content=f"LLM error: {e}")]}
+    print(f"[DEBUG] parse response latency: {(time.perf_counter() - llm_start) * 1000:.0f} ms"
+          + (" (parse answer reused)" if shared else ""))
+    # Cancelled (or past the deadline) while the LLM was answering: nothing is executed
+    if guard.abort_reason() is not None:
+        if speculator:
+            speculator.cancel_all()
+        return {"messages": [AIMessage(content=f"Request stopped while parsing ({guard.abort_reason()}).")]}
 
     # ---- Log：Print LLM Return ----
     print("\n=== AI Message Returned ===")
@@ -255,12 +315,16 @@ def agent_input(state: SQLAgentState) -> Dict:
 
     raw_output = ai_msg.content.strip()
     if not raw_output:
+        if speculator:
+            speculator.cancel_all()
         return {"messages": [AIMessage(content="LLM returned empty response.")]}
 
     # 3) JSON parsing
     try:
         parsed = json.loads(raw_output)
     except Exception as e:
+        if speculator:
+            speculator.cancel_all()
         return {"messages": [AIMessage(content=f"Parsing error: {e}")]}
 
     # ---- Log: Print the parsed object ----
@@ -269,17 +333,26 @@ def agent_input(state: SQLAgentState) -> Dict:
     print("===================")
 
     if not parsed.get("success", False):
+        if speculator:
+            speculator.cancel_all()
         return {"messages": [AIMessage(content="LLM parse failed: 'success' != true ")]}
+    # Only answers that parsed are kept for later identical prompts
+    parse_cache.put(parse_key, raw_output)
 
     operations = parsed.get("operations", [])
 
     # ---- KEY POINT!!! Make uniform corrections to all operations ----
-    operations = my_unify_operations(operations)
+    try:
+        operations = my_unify_operations(operations)
+    except PlanError as e:
+        if speculator:
+            speculator.cancel_all()
+        return {"messages": [AIMessage(content=f"Plan error: {e}")]}
 
     for op in operations:
         state["pending_operations"].append(op)
 
-    return {"messages": [AIMessage(content="Parsing successful.")]}
+    return {"messages": [AIMessage(content="Parsing successful.")], "speculation": speculator}
 
 
 def check_agent_input_result(state: SQLAgentState) -> str:
@@ -300,63 +373,122 @@ def single_executor_node(state: SQLAgentState) -> Dict:
     if not state["pending_operations"]:
         return {"messages": [AIMessage(content="No operations to execute.")]}
 
-    while state["pending_operations"]:
-        next_op = state["pending_operations"][0]
-        tool_name = next_op["tool_name"]
-        tool_args = next_op.get("args", {})
+    state["pending_operations"][:] = push_down_operations(state["pending_operations"])
 
-        the_tool = None
-        for t in tools:
-            if t.name == tool_name:
-                the_tool = t
+    speculator = state.get("speculation")
+    run_id = state.get("run_id") or uuid.uuid4().hex[:12]
+    # Normally created (and registered) before parsing; the node can also run a plan on its own
+    guard = state.get("guard")
+    if guard is None:
+        guard = _new_run_guard(state, run_id)
+        register_run(run_id, guard)
+    try:
+        op_cache = get_operation_cache()
+        # Cache key of the op that produced the latest result, the input fingerprint of the next one
+        last_result_key = None
+
+        while state["pending_operations"]:
+            next_op = state["pending_operations"][0]
+            tool_name = next_op["tool_name"]
+            tool_args = next_op.get("args", {})
+
+            try:
+                guard.check()
+            except QueryAborted as e:
+                state["messages"].append(AIMessage(content=f"Plan stopped before '{tool_name}': {e}"))
+                state["pending_operations"].clear()
                 break
 
-        if not the_tool:
-            err_msg = f"Tool '{tool_name}' not found in tools."
-            state["messages"].append(AIMessage(content=err_msg))
-            state["pending_operations"].pop(0)
-            continue
-
-        print(f"[DEBUG] Execute {tool_name}._run() with args: {tool_args}")
-
-        # ---- Replace data = "$result_of_previous_tool" with the real data here ----
-        if "data" in tool_args and isinstance(tool_args["data"], str) and tool_args["data"] == "$result_of_previous_tool":
-            # Find the most recent execution results
-            last_result = None
-            # Search from back to front
-            for r in reversed(state["results"]):
-                # r is of the form { "Query": [...], "Subtraction": [...], ...}
-                # Here, just take the first value as data
-                last_result = list(r.values())[0]
-                break
-            if last_result is None:
-                state["messages"].append(AIMessage(content="No previous result found for substitution."))
-                # Skip this operation
+            the_tool = None
+            for t in tools + internal_tools:
+                if t.name == tool_name:
+                    the_tool = t
+                    break
+
+            if not the_tool:
+                err_msg = f"Tool '{tool_name}' not found in tools."
+                state["messages"].append(AIMessage(content=err_msg))
                 state["pending_operations"].pop(0)
                 continue
-            tool_args["data"] = last_result
-            print("[DEBUG] Replaced data with last_result =>", last_result[:5] if isinstance(last_result, list) else last_result)
-
-        # ---- Perform the operation normally ----
-        try:
-            result = the_tool._run(**tool_args)
-            print(f"[DEBUG] {tool_name}._run() => {result}")
-            state["results"].append({tool_name: result})
-
-            if tool_name == "Query":
-                state["messages"].append(AIMessage(content=f"Query done. Rows={len(result)}"))
-            elif tool_name == "Sorting":
-                state["messages"].append(AIMessage(content=f"Sorting done. Rows={len(result)}"))
-            else:
-                # Other tools
-                if isinstance(result, list):
-                    state["messages"].append(AIMessage(content=f"{tool_name} done. Rows={len(result)}"))
+
+            print(f"[DEBUG] Execute {tool_name}._run() with args: {tool_args}")
+
+            # Computed before "data" is substituted: (tool name, own args, what it reads)
+            input_fp = input_fingerprint(tool_name, tool_args, last_result_key)
+            op_key = operation_key(tool_name, tool_args, input_fp) if input_fp is not None else None
+
+            # An identical op may already have been started while the LLM was streaming
+            speculative_hit, speculative_result = (False, None)
+            if speculator is not None:
+                speculative_hit, speculative_result = speculator.claim(next_op)
+
+            # ---- Replace data = "$result_of_previous_tool" with the real data here ----
+            if "data" in tool_args and isinstance(tool_args["data"], str) and tool_args["data"] == "$result_of_previous_tool":
+                # Find the most recent execution results
+                last_result = None
+                # Search from back to front
+                for r in reversed(state["results"]):
+                    # r is of the form { "Query": [...], "Subtraction": [...], ...}
+                    # Here, just take the first value as data
+                    last_result = list(r.values())[0]
+                    break
+                if last_result is None:
+                    state["messages"].append(AIMessage(content="No previous result found for substitution."))
+                    # Skip this operation
+                    state["pending_operations"].pop(0)
+                    continue
+                if isinstance(last_result, ColumnarResult) and tool_name not in COLUMNAR_TOOLS:
+                    last_result = last_result.to_rows()
+                tool_args["data"] = last_result
+                print("[DEBUG] Replaced data with last_result =>", last_result[:5] if isinstance(last_result, (list, ColumnarResult)) else last_result)
+
+            # ---- Perform the operation normally ----
+            try:
+                hit, result = op_cache.get(op_key) if op_key else (False, None)
+                if hit:
+                    print(f"[DEBUG] {tool_name} inputs unchanged, reuse cached output")
+                elif speculative_hit:
+                    result = speculative_result
+                    if op_key:
+                        op_cache.put(op_key, result)
+                else:
+                    with guarded(guard):
+                        result = the_tool._run(**tool_args)
+                    if op_key:
+                        op_cache.put(op_key, result)
+                print(f"[DEBUG] {tool_name}._run() => {result}")
+                state["results"].append({tool_name: result})
+                last_result_key = op_key
+
+                if result_dir:
+                    result_path = os.path.join(result_dir, f"{run_id}_{len(state['results']) - 1:02d}_{tool_name}.sqlres")
+                    if write_result_file(result_path, result):
+                        print(f"[DEBUG] Persisted {tool_name} result => {result_path}")
+
+                if tool_name == "Query":
+                    state["messages"].append(AIMessage(content=f"Query done. Rows={len(result)}"))
+                elif tool_name == "Sorting":
+                    state["messages"].append(AIMessage(content=f"Sorting done. Rows={len(result)}"))
                 else:
-                    state["messages"].append(AIMessage(content=f"{tool_name} done."))
-        except Exception as e:
-            state["messages"].append(AIMessage(content=f"Error running '{tool_name}': {e}"))
+                    # Other tools
+                    if isinstance(result, list):
+                        state["messages"].append(AIMessage(content=f"{tool_name} done. Rows={len(result)}"))
+                    else:
+                        state["messages"].append(AIMessage(content=f"{tool_name} done."))
+            except QueryAborted as e:
+                # A timeout, row limit or cancel_run() stops the whole plan, later steps would only see partial data
+                state["messages"].append(AIMessage(content=f"Plan stopped at '{tool_name}' ({e.reason}): {e}"))
+                state["pending_operations"].clear()
+                break
+            except Exception as e:
+                state["messages"].append(AIMessage(content=f"Error running '{tool_name}': {e}"))
 
-        state["pending_operations"].pop(0)
+            state["pending_operations"].pop(0)
+    finally:
+        unregister_run(run_id, guard)
+        # Whatever was started speculatively but rewritten by validation is dropped here
+        if speculator is not None:
+            speculator.cancel_all()
 
     return {"messages": [AIMessage(content="All operations done.")]}
 
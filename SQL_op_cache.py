@@ -0,0 +1,155 @@
+# LLM_Test/SQL_op_cache.py
+
+import glob
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from SQL_columnar import ColumnarResult
+
+# Number of operation outputs kept in memory (0 disables the cache)
+OP_CACHE_SIZE = int(os.getenv("SQL_OP_CACHE_SIZE", "64"))
+
+# Tools whose output depends on database files rather than on a previous result
+DB_SOURCE_TOOLS = {"Query", "KPI"}
+
+
+# Byte ranges of the database header's file change counter and of the WAL header's salts
+_DB_CHANGE_COUNTER = (24, 28)
+_WAL_SALTS = (16, 24)
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def canonical_args(args: Dict[str, Any]) -> str:
+    """The op's own arguments in a stable form; 'data' is covered by the input fingerprint."""
+    return json.dumps({k: v for k, v in args.items() if k != "data"}, sort_keys=True, default=str)
+
+
+def source_fingerprint(db_path: str) -> str:
+    """
+    Fingerprint of the database file(s) a Query reads: path, size and mtime of each
+    matching file and of its -wal file, so any committed write invalidates the entry.
+    Two writes within one mtime tick can leave size and mtime unchanged, so the header
+    fields SQLite changes on every commit are read too: the file change counter of the
+    database, and the salts of the WAL (new for every WAL generation, which grows by
+    whole frames in between).
+    """
+    paths = sorted(glob.glob(db_path)) if any(ch in db_path for ch in "*?[") else [db_path]
+    parts = []
+    for path in paths:
+        for p, header in ((path, _DB_CHANGE_COUNTER), (path + "-wal", _WAL_SALTS)):
+            try:
+                st = os.stat(p)
+                with open(p, "rb") as f:
+                    f.seek(header[0])
+                    marker = f.read(header[1] - header[0]).hex()
+                parts.append(f"{p}:{st.st_size}:{st.st_mtime_ns}:{marker}")
+            except OSError:
+                parts.append(f"{p}:missing")
+    return _sha("|".join(parts))
+
+
+def value_fingerprint(value: Any) -> str:
+    """Fingerprint of literal data given directly in the op args."""
+    return _sha(json.dumps(value, sort_keys=True, default=str))
+
+
+def operation_key(tool_name: str, args: Dict[str, Any], input_fingerprint: str) -> str:
+    return _sha(f"{tool_name}|{canonical_args(args)}|{input_fingerprint}")
+
+
+def input_fingerprint(tool_name: str, args: Dict[str, Any], previous_key: Optional[str]) -> Optional[str]:
+    """
+    What the op reads:
+    - Query / KPI             -> the database files
+    - "$result_of_previous_tool" -> the key of the op that produced that result (a build-system chain)
+    - Join with a right Query   -> its input and the right database file
+    - literal data            -> the data itself
+    None means "cannot fingerprint", i.e. do not cache.
+    """
+    if tool_name in DB_SOURCE_TOOLS and isinstance(args.get("db_path"), str):
+        fingerprint = source_fingerprint(args["db_path"])
+        # A pushed-down Join also reads the right side's file
+        join = (args.get("conditions") or {}).get("join")
+        if join:
+            fingerprint = _sha(fingerprint + "|" + source_fingerprint(join["db_path"]))
+        return fingerprint
+    data = args.get("data")
+    right = args.get("right")
+    if isinstance(right, dict) and isinstance(right.get("db_path"), str):
+        # A Join reads its input and a database file
+        if data == "$result_of_previous_tool":
+            return _sha(f"{previous_key}|{source_fingerprint(right['db_path'])}") if previous_key else None
+        try:
+            return _sha(value_fingerprint(data) + "|" + source_fingerprint(right["db_path"]))
+        except (TypeError, ValueError):
+            return None
+    if data == "$result_of_previous_tool":
+        return previous_key
+    if data is None:
+        return "no-input"
+    try:
+        return value_fingerprint(data)
+    except (TypeError, ValueError):
+        return None
+
+
+def copy_result(result: Any) -> Any:
+    # Row-wise tools write their output column into the rows they receive,
+    # so a cached (or shared in-flight) row list must never be handed out (or stored) by reference
+    if isinstance(result, list) and result and isinstance(result[0], dict):
+        return [dict(row) for row in result]
+    if isinstance(result, ColumnarResult):
+        return ColumnarResult(dict(result.columns), result.num_rows)
+    return result
+
+
+class OperationCache:
+    """LRU cache of operation outputs keyed by operation_key()."""
+
+    def __init__(self, max_entries: int = OP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, copy_result(self._entries[key])
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, result: Any):
+        if self.max_entries <= 0:
+            return
+        stored = copy_result(result)
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_op_cache = OperationCache()
+
+
+def get_operation_cache() -> OperationCache:
+    return _op_cache
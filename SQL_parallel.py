@@ -0,0 +1,185 @@
+# LLM_Test/SQL_parallel.py
+
+import heapq
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Below this many rows the pool start-up costs more than it saves
+PARALLEL_MIN_ROWS = int(os.getenv("SQL_PARALLEL_MIN_ROWS", "200000"))
+PARALLEL_WORKERS = int(os.getenv("SQL_PARALLEL_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """One process pool per process, created on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS)
+    return _pool
+
+
+def use_parallel(data: Any, parallel: Optional[bool] = None) -> bool:
+    """
+    parallel=True / False forces the mode, None decides by size.
+    """
+    if parallel is not None:
+        return bool(parallel) and PARALLEL_WORKERS > 1 and isinstance(data, list)
+    return PARALLEL_WORKERS > 1 and isinstance(data, list) and len(data) >= PARALLEL_MIN_ROWS
+
+
+def _chunks(n: int, parts: int) -> List[Tuple[int, int]]:
+    size = max(1, -(-n // parts))
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+class _SharedColumn:
+    """
+    A column copied once into shared memory, so workers read it without pickling rows.
+    Numeric columns are stored as float64; anything else (e.g. 'HH:MM') as fixed-width UTF-8.
+    """
+
+    def __init__(self, values: List[Any]):
+        self.n = len(values)
+        try:
+            buf = array("d", values)
+            self.kind, self.width = "d", 8
+            payload = buf.tobytes()
+        except TypeError:
+            texts = [str(v).encode("utf-8") for v in values]
+            self.kind = "s"
+            self.width = max((len(t) for t in texts), default=1) or 1
+            payload = b"".join(t.ljust(self.width, b" ") for t in texts)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+        self.shm.buf[:len(payload)] = payload
+
+    def spec(self) -> Tuple[str, str, int]:
+        return self.shm.name, self.kind, self.width
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _read_slice(spec: Tuple[str, str, int], start: int, end: int, parse: Callable) -> List[float]:
+    name, kind, width = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        if kind == "d":
+            view = shm.buf.cast("d")
+            values = list(view[start:end])
+            view.release()
+        else:
+            raw = bytes(shm.buf[start * width:end * width])
+            values = [parse(raw[i:i + width].decode("utf-8").strip()) for i in range(0, len(raw), width)]
+    finally:
+        shm.close()
+    return values
+
+
+def _binary_op_worker(a_spec, b_spec, out_name: str, start: int, end: int, op: str, parse: Callable) -> int:
+    a = _read_slice(a_spec, start, end, parse)
+    b = _read_slice(b_spec, start, end, parse)
+    if op == "+":
+        res = [x + y for x, y in zip(a, b)]
+    elif op == "-":
+        res = [x - y for x, y in zip(a, b)]
+    elif op == "*":
+        res = [x * y for x, y in zip(a, b)]
+    else:
+        res = [x / y if y != 0 else 0.0 for x, y in zip(a, b)]
+
+    out = shared_memory.SharedMemory(name=out_name)
+    try:
+        view = out.buf.cast("d")
+        view[start:end] = array("d", res)
+        view.release()
+    finally:
+        out.close()
+    return sum(1 for y in b if y == 0) if op == "/" else 0
+
+
+def parallel_binary_op(
+    data: List[Dict[str, Any]],
+    col1: str,
+    col2: str,
+    op: str,
+    output_col: str,
+    parse: Callable,
+) -> List[Dict[str, Any]]:
+    """
+    Row-wise 'col1 op col2' split into chunks over the process pool.
+    Inputs and output travel through shared memory; only chunk bounds are pickled.
+    """
+    n = len(data)
+    a_col = _SharedColumn([row[col1] for row in data])
+    b_col = _SharedColumn([row[col2] for row in data])
+    out = shared_memory.SharedMemory(create=True, size=max(8, n * 8))
+    try:
+        pool = get_pool()
+        futures = [
+            pool.submit(_binary_op_worker, a_col.spec(), b_col.spec(), out.name, start, end, op, parse)
+            for start, end in _chunks(n, PARALLEL_WORKERS)
+        ]
+        zero_div = sum(f.result() for f in futures)
+
+        view = out.buf.cast("d")
+        for row, val in zip(data, view):
+            row[output_col] = val
+        view.release()
+    finally:
+        a_col.release()
+        b_col.release()
+        out.close()
+        out.unlink()
+
+    if zero_div:
+        print(f"[WARN][Parallel] Divisor is zero in {zero_div} rows, use 0.0 instead.")
+    print(f"[DEBUG][Parallel] {col1} {op} {col2} => {output_col} over {n} rows in {PARALLEL_WORKERS} workers")
+    return data
+
+
+def _sort_worker(spec, start: int, end: int, reverse: bool) -> bytes:
+    name, _, _ = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        view = shm.buf.cast("d")
+        keys = view[start:end].tolist()
+        view.release()
+    finally:
+        shm.close()
+    order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+    return array("q", (start + i for i in order)).tobytes()
+
+
+def parallel_sort(data: List[Dict[str, Any]], field: str, reverse: bool = False) -> Optional[List[Dict[str, Any]]]:
+    """
+    Parallel sort-merge on a numeric key: every worker sorts the row indices of one chunk,
+    then the sorted runs are k-way merged. Return None if the key is not numeric,
+    so the caller can fall back to the plain sorted().
+    """
+    keys = [row.get(field, None) for row in data]
+    if not all(isinstance(k, (int, float)) and not isinstance(k, bool) for k in keys):
+        return None
+
+    key_col = _SharedColumn(keys)
+    try:
+        pool = get_pool()
+        futures = [
+            pool.submit(_sort_worker, key_col.spec(), start, end, reverse)
+            for start, end in _chunks(len(data), PARALLEL_WORKERS)
+        ]
+        runs = []
+        for f in futures:
+            idx = array("q")
+            idx.frombytes(f.result())
+            runs.append(idx)
+    finally:
+        key_col.release()
+
+    merged = heapq.merge(*runs, key=keys.__getitem__, reverse=reverse)
+    print(f"[DEBUG][Parallel] sorted {len(data)} rows by {field} in {len(runs)} runs")
+    return [data[i] for i in merged]
@@ -0,0 +1,494 @@
+# LLM_Test/SQL_plan_compiler.py
+
+from typing import Any, Dict, List, Optional, Set
+
+from SQL_expression import (
+    BASE_SCHEMA,
+    ExpressionError,
+    expression_columns,
+    parse_expression,
+    parse_predicate,
+    type_check,
+    type_check_predicate,
+)
+from SQL_groupby import NUMERIC_AGG_FUNCS, group_by_columns, normalize_aggregates
+from SQL_join import RIGHT_SUFFIX, is_query_spec, join_keys, joined_columns
+from SQL_fusion import ARITHMETIC_OPS, PREVIOUS_RESULT, referenced_columns
+from SQL_kpi_views import KPI_SOURCES
+from SQL_fanout import SOURCE_COLUMN, has_glob
+from SQL_utils import TIME_COLUMNS, table_columns
+
+# Tools that take rows and return the same rows (possibly with one more column)
+ROW_TOOLS = set(ARITHMETIC_OPS) | {"Expression", "Sorting", "Filter"}
+# Tools that reduce rows to a single value; row order does not matter to them
+AGGREGATE_TOOLS = {"Averaging", "Mode"}
+# Tools that turn rows into new rows, one per group; row order does not matter to them either
+GROUPING_TOOLS = {"GroupBy"}
+# Row-removing tools that are moved in front of computations they do not depend on
+FILTER_TOOLS = {"Filter"}
+# Tools that add the columns of another source to their input rows
+JOIN_TOOLS = {"Join"}
+
+# Required args per tool; a tuple of alternatives means "one of these sets"
+REQUIRED_ARGS = {
+    "Query": [("db_path", "conditions")],
+    "KPI": [("db_path", "table")],
+    "Sorting": [("data", "field_index")],
+    "Expression": [("data", "expression", "output_column")],
+    "Filter": [("data", "predicate")],
+    "GroupBy": [("data", "by", "aggregates")],
+    "Join": [("data", "right", "on")],
+    "Averaging": [("data",)],
+    "Mode": [("data",)],
+}
+for _tool in ARITHMETIC_OPS:
+    REQUIRED_ARGS[_tool] = [("number1", "number2"), ("data", "number_columns", "output_column")]
+
+ALL_COLUMNS = None    # "live" marker: every column reaches the output
+
+
+class PlanError(ValueError):
+    pass
+
+
+def _column_type(name: str, decl: str) -> str:
+    if name in TIME_COLUMNS:
+        return "time"
+    if any(t in decl for t in ("INT", "REAL", "FLOA", "DOUB", "NUM")):
+        return "number"
+    if decl:
+        return "text"
+    return BASE_SCHEMA.get(name, "number")
+
+
+def source_schema(db_path: str, table: str) -> Dict[str, str]:
+    """Column types of a source table, introspected when reachable, the worker sheet schema otherwise."""
+    cols = table_columns(db_path, table)
+    if cols:
+        return {name: _column_type(name, decl) for name, decl in cols}
+    return dict(BASE_SCHEMA)
+
+
+def query_output_schema(args: Dict[str, Any]) -> Dict[str, str]:
+    """Columns (and types) a Query op returns."""
+    db_path = args.get("db_path", "")
+    conds = args.get("conditions") or {}
+    table = conds.get("table", "")
+    table_schema = source_schema(db_path, table)
+    fields = conds.get("fields", ["*"])
+
+    schema: Dict[str, str] = {}
+    for field in fields:
+        if field == "*":
+            schema.update(table_schema)
+        elif field in table_schema:
+            schema[field] = table_schema[field]
+        elif field.isidentifier():
+            raise PlanError(f"Query selects unknown column '{field}' of table '{table}', available columns: {list(table_schema)}")
+        else:
+            # An SQL expression in fields, e.g. "COUNT(*)": type unknown
+            schema[field] = "number"
+    for alias in (conds.get("expressions") or {}):
+        schema[alias] = "number"
+    if has_glob(db_path) or has_glob(table):
+        schema[SOURCE_COLUMN] = "text"
+    return schema
+
+
+def _op_inputs(op: Dict[str, Any]) -> Set[str]:
+    """Result columns an op reads from its input rows."""
+    tool_name = op.get("tool_name")
+    args = op.get("args", {})
+    if tool_name == "Expression":
+        try:
+            return expression_columns(parse_expression(args.get("expression", "")))
+        except ExpressionError:
+            return set()
+    if tool_name in ARITHMETIC_OPS:
+        return set(args.get("number_columns") or [])
+    if tool_name == "Filter":
+        try:
+            return expression_columns(parse_predicate(args.get("predicate", "")))
+        except ExpressionError:
+            return set()
+    if tool_name == "GroupBy":
+        try:
+            by = group_by_columns(args.get("by"))
+            aggregates = normalize_aggregates(args.get("aggregates"))
+        except ValueError:
+            return set()
+        return set(by) | {a["column"] for a in aggregates if a["column"] != "*"}
+    if tool_name == "Join":
+        try:
+            return {left for left, _ in join_keys(args.get("on"))}
+        except ValueError:
+            return set()
+    if tool_name == "Sorting" and isinstance(args.get("field_index"), str):
+        return {args["field_index"]}
+    if tool_name == "Sorting" and isinstance(args.get("field_index"), list):
+        return {c for c in args["field_index"] if isinstance(c, str)}
+    if tool_name in AGGREGATE_TOOLS and args.get("column"):
+        return {args["column"]}
+    return set()
+
+
+def _op_output(op: Dict[str, Any]) -> Optional[str]:
+    """The column a row-wise op adds, if any."""
+    if op.get("tool_name") in ROW_TOOLS:
+        return op.get("args", {}).get("output_column")
+    return None
+
+
+def _chained(op: Dict[str, Any]) -> bool:
+    return op.get("args", {}).get("data") == PREVIOUS_RESULT
+
+
+# ---- 1) structure ----
+def check_structure(operations: List[Dict[str, Any]], tool_names: Set[str]):
+    if not isinstance(operations, list) or not operations:
+        raise PlanError("The plan has no operations")
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict) or not isinstance(op.get("args", {}), dict):
+            raise PlanError(f"Operation {index} is not an object with 'tool_name' and 'args'")
+        tool_name = op.get("tool_name")
+        if tool_name not in tool_names:
+            raise PlanError(f"Operation {index}: unknown tool '{tool_name}', must be one of {sorted(tool_names)}")
+        alternatives = REQUIRED_ARGS.get(tool_name)
+        args = op.get("args", {})
+        if alternatives and not any(all(k in args for k in keys) for keys in alternatives):
+            raise PlanError(f"Operation {index} ({tool_name}): args must contain one of {[list(k) for k in alternatives]}")
+        if tool_name == "Query" and not (args.get("conditions") or {}).get("table"):
+            raise PlanError(f"Operation {index} (Query): conditions.table is missing")
+        if _chained(op) and index == 0:
+            raise PlanError(f"Operation 0 ({tool_name}) uses the previous result, but there is none")
+
+
+# ---- 2) normalization of known LLM habits ----
+def normalize_work_time(operations: List[Dict[str, Any]]):
+    """Subtraction => Work_Time is always End_Time - Start_Time."""
+    for op in operations:
+        args = op.get("args", {})
+        if op.get("tool_name") == "Subtraction" and args.get("output_column") == "Work_Time" \
+                and args.get("number_columns") != ["End_Time", "Start_Time"]:
+            print("[DEBUG][PlanCompiler] Subtraction => Work_Time, fix columns to End_Time - Start_Time")
+            args["number_columns"] = ["End_Time", "Start_Time"]
+
+
+# ---- 3) type check along each result chain ----
+def type_check_plan(operations: List[Dict[str, Any]]) -> List[Optional[Dict[str, str]]]:
+    """
+    Propagate result schemas through the plan and check every column reference.
+    Returns the input schema of every op (None if unknown, e.g. literal data).
+    """
+    schema: Optional[Dict[str, str]] = None
+    is_value = False
+    input_schemas = []
+    for index, op in enumerate(operations):
+        tool_name = op["tool_name"]
+        args = op.get("args", {})
+        where = f"Operation {index} ({tool_name})"
+        current = schema if _chained(op) else None
+        input_schemas.append(current)
+
+        if _chained(op) and is_value:
+            raise PlanError(f"{where} needs rows, but the previous operation returns a single value")
+
+        if tool_name == "Query":
+            schema, is_value = query_output_schema(args), False
+            continue
+        if tool_name == "KPI":
+            kpis = args.get("kpi") or list(KPI_SOURCES)
+            kpis = [kpis] if isinstance(kpis, str) else list(kpis)
+            unknown = [k for k in kpis if k not in KPI_SOURCES]
+            if unknown:
+                raise PlanError(f"{where}: unknown KPI {unknown}, must be one of {list(KPI_SOURCES)}")
+            base = source_schema(args.get("db_path", ""), args.get("table", ""))
+            fields = args.get("fields") or list(base)
+            schema = {f: base.get(f, "number") for f in fields}
+            # build_kpi_select always adds Work_Time next to the requested KPIs
+            schema["Work_Time"] = "number"
+            schema.update({k: "number" for k in kpis})
+            is_value = False
+            continue
+
+        if current is not None:
+            if tool_name == "Expression":
+                try:
+                    type_check(parse_expression(args["expression"]), current)
+                except ExpressionError as e:
+                    raise PlanError(f"{where}: {e}")
+            elif tool_name == "Filter":
+                try:
+                    type_check_predicate(parse_predicate(args["predicate"]), current)
+                except ExpressionError as e:
+                    raise PlanError(f"{where}: {e}")
+            elif tool_name in ARITHMETIC_OPS and "number_columns" in args:
+                cols = args["number_columns"]
+                if not isinstance(cols, list) or len(cols) != 2:
+                    raise PlanError(f"{where}: number_columns must be two column names, got {cols}")
+                for col in cols:
+                    if col not in current:
+                        raise PlanError(f"{where}: unknown column '{col}', available columns: {list(current)}")
+                    if current[col] == "text":
+                        raise PlanError(f"{where}: column '{col}' is text and cannot be used in arithmetic")
+            elif tool_name == "GroupBy":
+                schema = _group_by_schema(args, current, where)
+                is_value = False
+                continue
+            elif tool_name == "Join":
+                schema = _join_schema(args, current, where)
+                is_value = False
+                continue
+            else:
+                for col in _op_inputs(op):
+                    if col not in current:
+                        raise PlanError(f"{where}: unknown column '{col}', available columns: {list(current)}")
+                if tool_name == "Averaging" and args.get("column") and current.get(args["column"]) == "text":
+                    raise PlanError(f"{where}: cannot average text column '{args['column']}'")
+
+        if tool_name in AGGREGATE_TOOLS or (tool_name in ARITHMETIC_OPS and "number1" in args):
+            schema, is_value = None, True
+        elif tool_name in GROUPING_TOOLS | JOIN_TOOLS:
+            schema, is_value = None, False
+        elif tool_name in ROW_TOOLS:
+            if current is not None and _op_output(op):
+                schema = dict(current)
+                schema[_op_output(op)] = "number"
+            elif current is None:
+                schema = None
+            is_value = False
+        else:
+            schema, is_value = None, False
+    return input_schemas
+
+
+def _group_by_schema(args: Dict[str, Any], current: Dict[str, str], where: str) -> Dict[str, str]:
+    """Check a GroupBy against its input schema and return the schema of the group rows."""
+    try:
+        by = group_by_columns(args.get("by"))
+        aggregates = normalize_aggregates(args.get("aggregates"))
+    except ValueError as e:
+        raise PlanError(f"{where}: {e}")
+    schema = {}
+    for col in by:
+        if col not in current:
+            raise PlanError(f"{where}: unknown column '{col}', available columns: {list(current)}")
+        schema[col] = current[col]
+    for agg in aggregates:
+        col, func = agg["column"], agg["func"]
+        if col != "*" and col not in current:
+            raise PlanError(f"{where}: unknown column '{col}', available columns: {list(current)}")
+        if func in ("sum", "avg") and current.get(col) == "text":
+            raise PlanError(f"{where}: cannot {func} text column '{col}'")
+        if func == "mode" or (func in NUMERIC_AGG_FUNCS and current.get(col) == "text"):
+            schema[agg["output_column"]] = current[col]
+        else:
+            schema[agg["output_column"]] = "number"
+    return schema
+
+
+def _join_schema(args: Dict[str, Any], current: Dict[str, str], where: str) -> Optional[Dict[str, str]]:
+    """Check the key columns of a Join and return the schema of the joined rows (None if the right side is unknown)."""
+    try:
+        keys = join_keys(args.get("on"))
+    except ValueError as e:
+        raise PlanError(f"{where}: {e}")
+    if args.get("how", "inner") not in ("inner", "left"):
+        raise PlanError(f"{where}: 'how' must be 'inner' or 'left', got '{args.get('how')}'")
+    for left, _ in keys:
+        if left not in current:
+            raise PlanError(f"{where}: unknown key column '{left}', available columns: {list(current)}")
+
+    right = args.get("right")
+    if is_query_spec(right):
+        right_args = {"db_path": right["db_path"], "conditions": right.get("conditions") or {}}
+        if not right_args["conditions"].get("table"):
+            raise PlanError(f"{where}: right.conditions.table is missing")
+        right_schema = query_output_schema(right_args)
+    elif isinstance(right, list) and right and isinstance(right[0], dict):
+        right_schema = {c: "number" for c in right[0]}
+    else:
+        return None
+    for _, col in keys:
+        if col not in right_schema:
+            raise PlanError(f"{where}: unknown right key column '{col}', available columns: {list(right_schema)}")
+
+    schema = dict(current)
+    for col, name in joined_columns(list(current), list(right_schema), keys, args.get("suffix", RIGHT_SUFFIX)):
+        schema[name] = right_schema[col]
+    return schema
+
+
+# ---- 4) filters before computations ----
+def hoist_filters(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Move a filter in front of preceding row-wise ops of the same chain whose output
+    it does not read, so the computations run on fewer rows.
+    """
+    ops = list(operations)
+    for i in range(len(ops)):
+        if ops[i]["tool_name"] not in FILTER_TOOLS or not _chained(ops[i]):
+            continue
+        j = i
+        while j > 0 and _chained(ops[j - 1]) and ops[j - 1]["tool_name"] in ROW_TOOLS - FILTER_TOOLS:
+            produced = _op_output(ops[j - 1])
+            if produced and referenced_columns([ops[j]], {produced}):
+                break
+            ops[j - 1], ops[j] = ops[j], ops[j - 1]
+            j -= 1
+        if j != i:
+            print(f"[DEBUG][PlanCompiler] moved {ops[j]['tool_name']} from step {i} to step {j}")
+    return ops
+
+
+# ---- 5) projection ----
+def _chains(operations: List[Dict[str, Any]]) -> List[List[int]]:
+    """Indices of the ops of every result chain: a source op and the ops that consume its result."""
+    chains: List[List[int]] = []
+    for index, op in enumerate(operations):
+        if _chained(op) and chains:
+            chains[-1].append(index)
+        else:
+            chains.append([index])
+    return chains
+
+
+def complete_query_fields(operations: List[Dict[str, Any]]):
+    """A Query with explicit fields gets the table columns that later ops of its chain read."""
+    for chain in _chains(operations):
+        op = operations[chain[0]]
+        if op["tool_name"] != "Query":
+            continue
+        conds = op["args"].setdefault("conditions", {})
+        fields = conds.get("fields", ["*"])
+        if "*" in fields:
+            continue
+        produced = {_op_output(operations[i]) for i in chain[1:]}
+        provided = set(fields) | set(conds.get("expressions") or {}) | produced
+        schema = source_schema(op["args"].get("db_path", ""), conds.get("table", ""))
+        read = set()
+        for i in chain[1:]:
+            read |= _op_inputs(operations[i])
+        missing = [c for c in schema if c in read and c not in provided]
+        if missing:
+            conds["fields"] = list(fields) + missing
+            print(f"[DEBUG][PlanCompiler] add {missing} to Query fields, later operations read them")
+
+
+def eliminate_dead_ops(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Walk every result chain backwards with the set of live columns. The last op of a
+    chain is what the user sees, so all its columns are live, unless it is an aggregate:
+    - a computed column that nothing downstream reads (and that is not output) is dropped,
+    - a Sorting whose result only feeds an aggregate is dropped,
+    - a Query with explicit fields that only feeds an aggregate loses the unread fields.
+    """
+    keep = [True] * len(operations)
+    for chain in _chains(operations):
+        live: Optional[Set[str]] = ALL_COLUMNS
+        order_matters = True
+        for index in reversed(chain):
+            op = operations[index]
+            tool_name = op["tool_name"]
+            args = op.get("args", {})
+
+            if tool_name in AGGREGATE_TOOLS:
+                live = {args["column"]} if args.get("column") else ALL_COLUMNS
+                order_matters = False
+                continue
+            if tool_name in GROUPING_TOOLS:
+                live = _op_inputs(op) or ALL_COLUMNS
+                order_matters = False
+                continue
+            if tool_name in JOIN_TOOLS:
+                # Which live columns come from the left side is only known at run time
+                live = ALL_COLUMNS
+                order_matters = True
+                continue
+            if tool_name == "Sorting" and not order_matters:
+                print(f"[DEBUG][PlanCompiler] drop Sorting at step {index}: only an aggregate reads its order")
+                keep[index] = False
+                continue
+
+            output = _op_output(op)
+            if output and live is not ALL_COLUMNS:
+                if output not in live:
+                    print(f"[DEBUG][PlanCompiler] drop {tool_name} at step {index}: '{output}' is never used")
+                    keep[index] = False
+                    continue
+                live = (live - {output}) | _op_inputs(op)
+            elif live is not ALL_COLUMNS:
+                live = live | _op_inputs(op)
+            if tool_name not in FILTER_TOOLS:
+                order_matters = True
+
+            if tool_name == "Query" and live is not ALL_COLUMNS:
+                _prune_query_fields(op, live)
+    return [op for op, k in zip(operations, keep) if k]
+
+
+def _prune_query_fields(op: Dict[str, Any], live: Set[str]):
+    conds = op["args"].setdefault("conditions", {})
+    fields = conds.get("fields", ["*"])
+    if "*" in fields:
+        return
+    pruned = [f for f in fields if f in live]
+    if pruned and pruned != fields:
+        print(f"[DEBUG][PlanCompiler] prune Query fields {fields} => {pruned}")
+        conds["fields"] = pruned
+    expressions = conds.get("expressions") or {}
+    for alias in [a for a in expressions if a not in live]:
+        del expressions[alias]
+
+
+def push_projection_into_query(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace "fields": ["*"] of a Query by the table columns the later operations read, when
+    the chain ends in an aggregate or GroupBy. Otherwise the rows reach the user, who asked
+    for every column. "*" is also kept when the table cannot be introspected (glob,
+    unreachable file), an aggregate has no 'column' or the rows are joined.
+    """
+    for chain in _chains(operations):
+        op = operations[chain[0]]
+        if op["tool_name"] != "Query" or len(chain) == 1:
+            continue
+        conds = op["args"].get("conditions") or {}
+        if list(conds.get("fields", ["*"])) != ["*"]:
+            continue
+        table_cols = [name for name, _ in table_columns(op["args"].get("db_path", ""), conds.get("table", ""))]
+        if not table_cols:
+            continue
+
+        consumers = [operations[i] for i in chain[1:]]
+        if consumers[-1]["tool_name"] not in AGGREGATE_TOOLS | GROUPING_TOOLS:
+            continue
+        if any(c["tool_name"] in AGGREGATE_TOOLS and not c.get("args", {}).get("column") for c in consumers):
+            continue
+        if any(c["tool_name"] in JOIN_TOOLS for c in consumers):
+            # The joined rows show the left columns side by side with the right ones
+            continue
+        wanted: Set[str] = set()
+        for consumer in consumers:
+            wanted |= _op_inputs(consumer)
+
+        fields = [c for c in table_cols if c in wanted]
+        if fields and len(fields) < len(table_cols):
+            conds["fields"] = fields
+            print(f"[DEBUG][Projection] Query fields * => {fields} ({len(table_cols) - len(fields)} of {len(table_cols)} columns not read)")
+    return operations
+
+
+def compile_plan(operations: List[Dict[str, Any]], tool_names: Set[str]) -> List[Dict[str, Any]]:
+    """
+    Validate and optimize a plan before anything is executed. Raises PlanError for a
+    plan that would fail at run time (unknown tool or column, missing args, text arithmetic,
+    rows expected after a single value), so bad plans never touch the tables.
+    """
+    check_structure(operations, tool_names)
+    normalize_work_time(operations)
+    complete_query_fields(operations)
+    type_check_plan(operations)
+    operations = hoist_filters(operations)
+    operations = eliminate_dead_ops(operations)
+    print(f"[DEBUG][PlanCompiler] compiled plan => {operations}")
+    return operations
@@ -0,0 +1,148 @@
+# LLM_Test/SQL_prompt.py
+
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from SQL_utils import REAL_COLUMNS, TIME_COLUMNS, table_columns
+
+TOOL_NAMES = ["Query", "Sorting", "Expression", "Filter", "GroupBy", "Join", "Addition", "Subtraction",
+              "Multiplication", "Division", "Mode", "Averaging", "KPI"]
+
+# ---- Static parts, built into one string once per process ----
+_HEADER = """You turn a user's request about worker database tables into a JSON list of tool operations.
+Return ONLY valid JSON (no markdown, no extra text): {"success": true, "operations": [{"tool_name": "...", "args": {...}}, ...]}
+Rules:
+- tool_name must be exactly one of %s (case-sensitive).
+- Correct near-synonyms or different case to the real column names listed under Schema.
+- To use the previous tool's result, set "data": "$result_of_previous_tool".
+- There is NO Work_Time column: if the working time is needed, you MUST first do a Subtraction {"data": ..., "number_columns": ["End_Time", "Start_Time"], "output_column": "Work_Time"}; times are used as minutes.
+- Addition/Subtraction/Multiplication/Division args: {"data": ..., "number_columns": ["<col1>", "<col2>"], "output_column": "..."}. Expression args: {"data": ..., "expression": "...", "output_column": "..."} (+ - * / parentheses, column names and numbers).
+- Unless a column was produced by a previous step (like Work_Time), only the columns listed under Schema can be computed on.
+- Query args: {"db_path": "<dir>/<file>.db", "conditions": {"table": "...", "fields": [...], "where": "..."}}. Sorting args: {"data": ..., "field_index": "<column>", "reverse": true/false}; for several keys "field_index": ["<col1>", "<col2>"], "reverse": [false, true].""" % (
+    "[" + ",".join(f'"{t}"' for t in TOOL_NAMES) + "]"
+)
+
+# Optional hints, only added when the request looks like it needs them: (trigger regex, hint)
+_HINTS: List[Tuple[str, str]] = [
+    (r"positive|negative|greater|less|more than|fewer than|above|below|at least|at most|only|whose|exceed",
+     '- To keep rows by a condition on a computed column, add a Filter after the step that computes it: '
+     '{"data": "$result_of_previous_tool", "predicate": "Difference > 0"} (comparisons, and / or / not). '
+     'Conditions on table columns only go into the Query "where".'),
+    (r"\bkpi\b|per minute|efficien",
+     '- If only Plan_KPI, Real_KPI or Qualified_KPI (Number / work time) is needed, use ONE KPI op: '
+     '{"db_path", "table", "kpi", optional "fields", "where", "order_by", "reverse"}; it reads a precomputed KPI table.'),
+    (r"\bsheets\b|\bdays\b|\bfiles\b|\ball tables\b|\bacross\b|\*",
+     '- For the same data across many daily sheets or database files, use ONE Query with a * wildcard in "table" '
+     '(e.g. "Sheet_*_02_2025") and / or "db_path" (e.g. "D:/Test/Dataset/*.db"); rows get a "_source" column. '
+     'Put "order_by" / "reverse" into "conditions" when the merged result must be sorted.'),
+    (r"\bper\b|\bby (?:gender|name|worker|id|day|sheet|source|group)\b|\beach (?:gender|worker|group|day|sheet)\b|\bgroup",
+     '- For values per group (e.g. average KPI by Gender, totals per worker across days), use ONE GroupBy: '
+     '{"data": "$result_of_previous_tool", "by": ["Gender"], "aggregates": [{"func": "avg", "column": "Qualified_KPI"}]}; '
+     'func is sum, avg, min, max, count or mode (count without column counts rows).'),
+    (r"\bjoin|\bcompare|\bcorrelat|\bboth\b|\bversus\b|\bvs\.?\s|another (?:day|sheet|table)|\bbetween\b.+\band\b",
+     '- To put the rows of two sheets side by side on a key (e.g. one worker on two days), Query the first sheet, then Join: '
+     '{"data": "$result_of_previous_tool", "right": {"db_path": "...", "conditions": {"table": "...", "fields": [...]}}, '
+     '"on": "ID", "how": "inner"}; right columns whose name is taken get the suffix "_right" (e.g. Qualified_Number_right).'),
+    (r"rough|approximate|estimat|\bquick|ballpark|\bsample",
+     '- For a rough / approximate answer on a big table, add "sample": {"fraction": 0.05} (or {"rows": 20000}) to the Query '
+     '"conditions" and "confidence": 0.95 to Averaging / Mode to get the estimate with its confidence interval. '
+     'To refine until the mean is within 1%, use "sample": {"rows": 2000, "column": "<column>", "target_error": 0.01}.'),
+    (r"average|mean|\bmode\b|most common|most frequent|standard deviation|\bstddev\b|\bspread\b|variance",
+     '- If the Query result is only used by Averaging, Mode or Sorting, add "format": "columnar" to its "conditions" '
+     'and give Averaging / Mode a "column" arg, e.g. {"data": "$result_of_previous_tool", "column": "Real_Number"}. '
+     'Add "stats": true to Averaging when the spread (standard deviation) or count is asked for.'),
+]
+
+# Worked example, only added for multi-step requests where the model needs to see chaining
+_EXAMPLE_TRIGGER = r"\bthen\b|\bfinally\b|work(ing)? ?time|divide|subtract|multiply|\bkpi\b"
+_EXAMPLE = """Example input: "Workers.db in D:/Test/Dataset, table Sheet_17_02_2025. Select workers starting before 9:00 or ending after 17:00, divide Qualified_Number by the work time to get Qualified_KPI, list them in descending order of Qualified_KPI."
+Example output: {"success": true, "operations": [
+{"tool_name": "Query", "args": {"db_path": "D:/Test/Dataset/Workers.db", "conditions": {"table": "Sheet_17_02_2025", "fields": ["ID","Name","Start_Time","End_Time","Qualified_Number"], "where": "Start_Time < '09:00' OR End_Time > '17:00'"}}},
+{"tool_name": "Subtraction", "args": {"data": "$result_of_previous_tool", "number_columns": ["End_Time","Start_Time"], "output_column": "Work_Time"}},
+{"tool_name": "Division", "args": {"data": "$result_of_previous_tool", "number_columns": ["Qualified_Number","Work_Time"], "output_column": "Qualified_KPI"}},
+{"tool_name": "Sorting", "args": {"data": "$result_of_previous_tool", "field_index": "Qualified_KPI", "reverse": true}}]}"""
+
+_DEFAULT_SCHEMA = "Columns: " + ", ".join(REAL_COLUMNS) + " (Start_Time / End_Time are 'HH:MM')"
+
+
+@lru_cache(maxsize=1)
+def get_parse_prompt_template():
+    """
+    The ChatPromptTemplate is built once per process. The whole prompt is passed as one
+    variable, so the JSON braces in it are never parsed as template fields.
+    """
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([("human", "{prompt}")])
+
+
+# ---- Dynamic schema snippet ----
+_DB_FILE_RE = re.compile(r"([A-Za-z]:[\\/][^\s,]*?|[\w.\-/\\]+)\.db\b")
+_DIR_RE = re.compile(r"\bpath\s+([^\s,]+)|\b(?:in|under|at)\s+(?:the\s+)?([A-Za-z]:[\\/][^\s,]*|/[^\s,]+)", re.IGNORECASE)
+_TABLE_RE = re.compile(r"\btable\s+(?:named\s+|called\s+)?[\"'`]?([A-Za-z_][\w*]*)", re.IGNORECASE)
+
+
+def find_db_and_table(user_input: str) -> Tuple[Optional[str], Optional[str]]:
+    """Best-effort extraction of the database file and table mentioned in a request."""
+    db_match = _DB_FILE_RE.search(user_input)
+    table_match = _TABLE_RE.search(user_input)
+    db_path = None
+    if db_match:
+        db_path = db_match.group(0)
+        if "/" not in db_path and "\\" not in db_path:
+            dir_match = _DIR_RE.search(user_input)
+            if dir_match:
+                db_path = (dir_match.group(1) or dir_match.group(2)).rstrip("/\\.") + "/" + db_path
+    return db_path, table_match.group(1) if table_match else None
+
+
+def schema_snippet(user_input: str) -> str:
+    """Columns of the table the request is about, read from the database; the default column list otherwise."""
+    db_path, table = find_db_and_table(user_input)
+    cols = table_columns(db_path, table)
+    if not cols:
+        return _DEFAULT_SCHEMA
+    snippet = f"Table {table} columns: " + ", ".join(f"{name} {decl or 'ANY'}" for name, decl in cols)
+    time_decls = [decl for name, decl in cols if name in TIME_COLUMNS]
+    if any("INT" in decl for decl in time_decls):
+        snippet += " (Start_Time / End_Time are minutes since midnight; 'HH:MM' literals are accepted)"
+    elif time_decls:
+        snippet += " (Start_Time / End_Time are 'HH:MM')"
+    return snippet
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise the usual ~4 characters per token estimate."""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        return max(1, len(text) // 4)
+
+
+def build_parse_prompt(user_input: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Assemble the parse prompt for one request and return (prompt text, stats).
+    stats has build_ms, tokens, and which optional parts were included.
+    """
+    start = time.perf_counter()
+    lowered = user_input.lower()
+
+    parts = [_HEADER]
+    hints = [hint for trigger, hint in _HINTS if re.search(trigger, lowered)]
+    parts += hints
+    parts.append("Schema: " + schema_snippet(user_input))
+    with_example = bool(re.search(_EXAMPLE_TRIGGER, lowered))
+    if with_example:
+        parts.append(_EXAMPLE)
+    parts.append("User request: " + user_input)
+    prompt = "\n".join(parts)
+
+    stats = {
+        "build_ms": (time.perf_counter() - start) * 1000,
+        "tokens": count_tokens(prompt),
+        "hints": len(hints),
+        "example": with_example,
+    }
+    return prompt, stats
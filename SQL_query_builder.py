@@ -0,0 +1,46 @@
+# LLM_Test/SQL_query_builder.py
+
+from typing import Any, Dict, List
+
+from SQL_expression import expression_select_list
+from SQL_groupby import group_by_select
+
+
+def build_select_sql(conditions: Dict[str, Any], extra_select: List[str] = None) -> str:
+    """
+    Turn the 'conditions' of a Query operation into a SELECT statement.
+    {
+        "table": "Workers_20012025",
+        "fields": ["*"],
+        "where": "Gender='Female'",
+        "expressions": {"Work_Time": "End_Time - Start_Time"},   // optional
+        "order_by": "Real_Number", "reverse": true,               // optional
+        "limit": 100,                                             // optional
+        "group_by": ["Gender"],                                   // optional, from a pushed GroupBy
+        "aggregates": [{"func": "avg", "column": "Real_Number", "output_column": "avg_Real_Number"}]
+    }
+    extra_select: additional raw SELECT items, e.g. a literal source tag.
+    """
+    table = conditions.get("table", "")
+    fields = conditions.get("fields", ["*"])
+    where_clause = conditions.get("where", None)
+    # Expressions pushed down from Expression operations: {output_column: expression}
+    expressions = conditions.get("expressions", {})
+
+    group_items = []
+    if conditions.get("group_by"):
+        # A pushed GroupBy replaces the selected fields by the group keys and the aggregates
+        select_items, group_items = group_by_select(conditions)
+        sql_fields = ", ".join(select_items + list(extra_select or []))
+    else:
+        sql_fields = ", ".join(list(fields) + expression_select_list(expressions) + list(extra_select or []))
+    sql_query = f"SELECT {sql_fields} FROM {table}"
+    if where_clause:
+        sql_query += f" WHERE {where_clause}"
+    if group_items:
+        sql_query += f" GROUP BY {', '.join(group_items)}"
+    if conditions.get("order_by"):
+        sql_query += f" ORDER BY {conditions['order_by']} {'DESC' if conditions.get('reverse') else 'ASC'}"
+    if conditions.get("limit") is not None:
+        sql_query += f" LIMIT {int(conditions['limit'])}"
+    return sql_query
@@ -0,0 +1,215 @@
+# LLM_Test/SQL_query_guard.py
+
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Seconds one Query statement may run (0 = no limit); conditions["timeout"] overrides it
+QUERY_TIMEOUT_S = float(os.getenv("SQL_QUERY_TIMEOUT", "60"))
+# Seconds a whole request may run, parsing and plan execution (0 = no limit)
+PLAN_TIMEOUT_S = float(os.getenv("SQL_PLAN_TIMEOUT", "300"))
+# Rows one Query may return before it is aborted (0 = no limit); conditions["max_rows"] overrides it
+QUERY_MAX_ROWS = int(os.getenv("SQL_QUERY_MAX_ROWS", "0"))
+# SQLite VM instructions between two progress handler calls
+PROGRESS_VM_STEPS = int(os.getenv("SQL_PROGRESS_VM_STEPS", "100000"))
+# Minimum seconds between two progress callbacks
+PROGRESS_INTERVAL_S = 1.0
+
+
+class QueryAborted(RuntimeError):
+    """A statement or plan was stopped: reason is "timeout", "row_limit" or "cancelled"."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class QueryGuard:
+    """
+    Deadline, row limit and cancellation for the SQLite statements of one Query or plan.
+    While attached to a connection, SQLite calls the progress handler every
+    PROGRESS_VM_STEPS VM instructions; returning 1 interrupts the running statement, so a
+    pathological scan stops even before it returns its first row. cancel() can be called
+    from any thread and also interrupt()s the attached connections.
+    A child guard (one Query inside a plan) also stops when its parent does.
+    Progress reports {"rows", "vm_steps", "elapsed_s"}: rows fetched so far and SQLite VM
+    instructions, the scan work done inside SQLite.
+    """
+
+    def __init__(self, timeout: float = 0, max_rows: int = 0, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 parent: Optional["QueryGuard"] = None, label: str = ""):
+        self.started = time.monotonic()
+        self.deadline = self.started + float(timeout) if timeout else None
+        self.max_rows = int(max_rows or 0)
+        self.on_progress = on_progress if on_progress is not None else (parent.on_progress if parent else None)
+        self.parent = parent
+        self.label = label
+        self.rows = 0
+        self.vm_steps = 0
+        self.reason: Optional[str] = None
+        self._last_report = 0.0
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    # ---- state ----
+    def _stop_reason(self) -> Optional[str]:
+        guard = self
+        while guard is not None:
+            if guard.reason is None and guard.deadline is not None and time.monotonic() > guard.deadline:
+                guard.reason = "timeout"
+            if guard.reason is not None:
+                return guard.reason
+            guard = guard.parent
+        return None
+
+    def abort_reason(self) -> Optional[str]:
+        """Why this guard or a parent stopped ("timeout", "row_limit", "cancelled"), None while it may run."""
+        return self._stop_reason()
+
+    def check(self):
+        """Raise QueryAborted if this guard or a parent was cancelled or is past its deadline."""
+        reason = self._stop_reason()
+        if reason is not None:
+            raise QueryAborted(reason, self._message(reason))
+
+    def _message(self, reason: str) -> str:
+        what = f"Query {self.label}".strip() if self.label else "Query"
+        if reason == "timeout":
+            return f"{what} stopped after {time.monotonic() - self.started:.1f} s (deadline exceeded)"
+        if reason == "row_limit":
+            return f"{what} stopped: more than {self.max_rows} rows"
+        return f"{what} cancelled"
+
+    def cancel(self, reason: str = "cancelled"):
+        """Stop the running statements of this guard (and of its children) as soon as possible."""
+        if self.reason is None:
+            self.reason = reason
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            conn.interrupt()
+
+    # ---- progress ----
+    def _report(self, force: bool = False):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if force or now - self._last_report >= PROGRESS_INTERVAL_S:
+            self._last_report = now
+            self.on_progress({"label": self.label, "rows": self.rows, "vm_steps": self.vm_steps,
+                              "elapsed_s": now - self.started})
+
+    def _progress_handler(self) -> int:
+        self.vm_steps += PROGRESS_VM_STEPS
+        if self._stop_reason() is not None:
+            return 1
+        self._report()
+        return 0
+
+    def add_rows(self, n: int):
+        """Count fetched rows; raises QueryAborted past max_rows or the deadline."""
+        self.rows += n
+        if self.max_rows and self.rows > self.max_rows:
+            self.reason = "row_limit"
+        self.check()
+        if self.parent is not None:
+            self.parent.rows += n
+        self._report()
+
+    # ---- connections ----
+    def _root_register(self, conn: sqlite3.Connection, add: bool):
+        guard = self
+        while guard is not None:
+            with guard._lock:
+                if add:
+                    guard._conns.append(conn)
+                elif conn in guard._conns:
+                    guard._conns.remove(conn)
+            guard = guard.parent
+
+    @contextmanager
+    def attached(self, conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        """Install the progress handler on conn for the duration of the block (pooled connections are reused)."""
+        self.check()
+        conn.set_progress_handler(self._progress_handler, PROGRESS_VM_STEPS)
+        self._root_register(conn, True)
+        try:
+            yield conn
+        except sqlite3.OperationalError as ex:
+            reason = self._stop_reason()
+            if reason is not None and "interrupt" in str(ex):
+                raise QueryAborted(reason, self._message(reason)) from ex
+            raise
+        finally:
+            self._root_register(conn, False)
+            conn.set_progress_handler(None, 0)
+
+
+# The guard of the Query / plan running in the current thread or context
+_current_guard: contextvars.ContextVar[Optional[QueryGuard]] = contextvars.ContextVar("sql_query_guard", default=None)
+
+
+def current_guard() -> Optional[QueryGuard]:
+    return _current_guard.get()
+
+
+@contextmanager
+def guarded(guard: Optional[QueryGuard]) -> Iterator[Optional[QueryGuard]]:
+    """Make guard the current one: every pooled connection taken inside the block is attached to it."""
+    token = _current_guard.set(guard)
+    try:
+        yield guard
+    finally:
+        _current_guard.reset(token)
+
+
+def count_rows(n: int):
+    """Count n fetched rows against the current guard, if any."""
+    guard = _current_guard.get()
+    if guard is not None:
+        guard.add_rows(n)
+
+
+def print_progress(progress: Dict[str, Any]):
+    print(f"[DEBUG][Progress] {progress['label'] or 'query'}: {progress['rows']} rows, "
+          f"{progress['vm_steps']} VM steps, {progress['elapsed_s']:.1f} s")
+
+
+# ---- executor runs that can be cancelled from another thread ----
+_runs: Dict[str, QueryGuard] = {}
+_runs_lock = threading.Lock()
+
+
+def register_run(run_id: str, guard: QueryGuard) -> bool:
+    """Make run_id cancellable through guard; False if run_id is already registered to another guard."""
+    with _runs_lock:
+        if _runs.setdefault(run_id, guard) is not guard:
+            return False
+    return True
+
+
+def unregister_run(run_id: str, guard: Optional[QueryGuard] = None):
+    """Forget run_id; with guard, only if run_id is still registered to that guard."""
+    with _runs_lock:
+        if guard is None or _runs.get(run_id) is guard:
+            _runs.pop(run_id, None)
+
+
+def active_runs() -> List[str]:
+    with _runs_lock:
+        return list(_runs)
+
+
+def cancel_run(run_id: str) -> bool:
+    """Cancel a running plan: its current statement is interrupted and no further operation starts."""
+    with _runs_lock:
+        guard = _runs.get(run_id)
+    if guard is None:
+        return False
+    print(f"[DEBUG][QueryGuard] cancel run {run_id}")
+    guard.cancel()
+    return True
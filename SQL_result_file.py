@@ -0,0 +1,227 @@
+# LLM_Test/SQL_result_file.py
+
+import json
+import mmap
+import struct
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from SQL_columnar import ColumnarResult, DictColumn, typed_column
+
+# File layout:
+#   MAGIC
+#   chunk*            one chunk = one column of one row group, written as the rows arrive
+#   footer (JSON)     schema, row count and the offset / encoding of every chunk
+#   footer length (u64) + MAGIC
+MAGIC = b"SQLRES01"
+ROW_GROUP_ROWS = 65536
+
+ENC_INT64 = "q"
+ENC_FLOAT64 = "d"
+ENC_DICT = "dict"    # dictionary-encoded strings: value table + int32 codes (-1 = NULL)
+ENC_JSON = "json"    # anything else (mixed types)
+
+
+def _encode_column(values) -> Tuple[str, bytes]:
+    if isinstance(values, array):
+        return values.typecode, values.tobytes()
+    if not isinstance(values, DictColumn) and all(v is None or isinstance(v, str) for v in values):
+        values = DictColumn.encode(values)
+    if isinstance(values, DictColumn):
+        header = json.dumps(values.values).encode("utf-8")
+        return ENC_DICT, struct.pack("<Q", len(header)) + header + values.codes.tobytes()
+    return ENC_JSON, json.dumps(list(values)).encode("utf-8")
+
+
+def _decode_column(encoding: str, payload: bytes):
+    if encoding in (ENC_INT64, ENC_FLOAT64):
+        col = array(encoding)
+        col.frombytes(payload)
+        return col
+    if encoding == ENC_DICT:
+        (header_len,) = struct.unpack_from("<Q", payload, 0)
+        table = json.loads(payload[8:8 + header_len].decode("utf-8"))
+        codes = array("i")
+        codes.frombytes(payload[8 + header_len:])
+        return DictColumn(codes, table)
+    return json.loads(payload.decode("utf-8"))
+
+
+class ResultFileWriter:
+    """
+    Streaming writer: rows are buffered up to ROW_GROUP_ROWS and then written as one
+    chunk per column, so a 5M-row result never exists as one big JSON string.
+    The schema is a running one: a column first seen in a later row group is appended
+    to the footer, and the reader fills the row groups written before it with NULL.
+    compression: None or "zlib".
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = "zlib", row_group_rows: int = ROW_GROUP_ROWS):
+        if compression not in (None, "zlib"):
+            raise ValueError(f"Unsupported compression '{compression}'")
+        self.path = path
+        self.compression = compression
+        self.row_group_rows = row_group_rows
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._columns: List[str] = []
+        self._chunks: List[Dict[str, Any]] = []
+        self._pending: List[Dict[str, Any]] = []
+        self._num_rows = 0
+
+    def __enter__(self) -> "ResultFileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write_rows(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self._pending.append(row)
+            if len(self._pending) >= self.row_group_rows:
+                self._flush_rows()
+
+    def write_columnar(self, result: ColumnarResult):
+        self._flush_rows()
+        for batch in result.iter_batches(self.row_group_rows):
+            self._write_group(batch.columns, batch.num_rows)
+
+    def _flush_rows(self):
+        if not self._pending:
+            return
+        names = list(self._columns)
+        known = set(names)
+        for row in self._pending:
+            for name in row:
+                if name not in known:
+                    known.add(name)
+                    names.append(name)
+        columns = {n: typed_column([r.get(n) for r in self._pending]) for n in names}
+        self._write_group(columns, len(self._pending))
+        self._pending = []
+
+    def _write_group(self, columns: Dict[str, Any], num_rows: int):
+        self._columns += [name for name in columns if name not in self._columns]
+        for index, name in enumerate(self._columns):
+            encoding, payload = _encode_column(columns.get(name, [None] * num_rows))
+            if self.compression == "zlib":
+                payload = zlib.compress(payload, 1)
+            self._chunks.append({
+                "column": index,
+                "row_start": self._num_rows,
+                "rows": num_rows,
+                "encoding": encoding,
+                "offset": self._file.tell(),
+                "length": len(payload),
+            })
+            self._file.write(payload)
+        self._num_rows += num_rows
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush_rows()
+        footer = json.dumps({
+            "columns": self._columns,
+            "num_rows": self._num_rows,
+            "compression": self.compression,
+            "chunks": self._chunks,
+        }).encode("utf-8")
+        self._file.write(footer)
+        self._file.write(struct.pack("<Q", len(footer)))
+        self._file.write(MAGIC)
+        self._file.close()
+        print(f"[DEBUG][ResultFile] wrote {self._num_rows} rows x {len(self._columns)} columns to {self.path}")
+
+
+class ResultFileReader:
+    """
+    Memory-maps a result file and only reads the footer on open; a column is
+    decoded the first time it is accessed, so reopening a large report is instant.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC or self._mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a result file")
+        (footer_len,) = struct.unpack_from("<Q", self._mm, len(self._mm) - len(MAGIC) - 8)
+        footer_end = len(self._mm) - len(MAGIC) - 8
+        footer = json.loads(self._mm[footer_end - footer_len:footer_end].decode("utf-8"))
+        self.columns: List[str] = footer["columns"]
+        self.num_rows: int = footer["num_rows"]
+        self.compression: Optional[str] = footer["compression"]
+        self._chunks = footer["chunks"]
+        self._cache: Dict[str, Any] = {}
+
+    def __enter__(self) -> "ResultFileReader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def column(self, name: str):
+        if name in self._cache:
+            return self._cache[name]
+        if name not in self.columns:
+            raise KeyError(f"Column '{name}' not in {self.path}, available columns: {self.columns}")
+        index = self.columns.index(name)
+
+        parts = []
+        covered = 0
+        for chunk in sorted((c for c in self._chunks if c["column"] == index), key=lambda c: c["row_start"]):
+            if chunk["row_start"] > covered:
+                # Row groups written before the column first appeared
+                parts.append([None] * (chunk["row_start"] - covered))
+            covered = chunk["row_start"] + chunk["rows"]
+            payload = self._mm[chunk["offset"]:chunk["offset"] + chunk["length"]]
+            if self.compression == "zlib":
+                payload = zlib.decompress(payload)
+            parts.append(_decode_column(chunk["encoding"], payload))
+        if covered < self.num_rows:
+            parts.append([None] * (self.num_rows - covered))
+
+        if parts and all(isinstance(p, array) and p.typecode == parts[0].typecode for p in parts):
+            col = parts[0]
+            for p in parts[1:]:
+                col.extend(p)
+        elif parts and all(isinstance(p, DictColumn) for p in parts):
+            # Strings stay dictionary-encoded after loading
+            col = parts[0] if len(parts) == 1 else DictColumn.concat(parts)
+        else:
+            col = [v for p in parts for v in p]
+        self._cache[name] = col
+        return col
+
+    def to_columnar(self, columns: Optional[List[str]] = None) -> ColumnarResult:
+        names = columns or self.columns
+        return ColumnarResult({n: self.column(n) for n in names}, self.num_rows)
+
+    def to_rows(self, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return self.to_columnar(columns).to_rows()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def write_result_file(path: str, result: Any, compression: Optional[str] = "zlib") -> bool:
+    """
+    Persist one tool result. Row lists and ColumnarResults are written;
+    scalar results (Averaging, Mode, ...) are not tabular and are skipped (returns False).
+    """
+    if isinstance(result, ColumnarResult):
+        with ResultFileWriter(path, compression) as writer:
+            writer.write_columnar(result)
+        return True
+    if isinstance(result, list) and (not result or isinstance(result[0], dict)):
+        with ResultFileWriter(path, compression) as writer:
+            writer.write_rows(result)
+        return True
+    return False
@@ -0,0 +1,450 @@
+# LLM_Test/SQL_rule_planner.py
+
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from SQL_expression import BASE_SCHEMA, ExpressionError, parse_expression, to_sql
+from SQL_prompt import find_db_and_table
+from SQL_utils import TIME_COLUMNS, synonyms_map
+
+# Plans below this confidence (share of clauses the rules understood) go to the LLM
+RULE_PLANNER_MIN_CONFIDENCE = float(os.getenv("SQL_RULE_PLANNER_MIN_CONFIDENCE", "0.99"))
+
+WORK_TIME_EXPR = "(End_Time - Start_Time)"
+
+_VERBS = r"select|find|filter|keep|choose|pick|subtract|divide|multiply|add|compute|calculate|sort|order|rank|arrange|list|display|show|output|average"
+
+# Sentence ends (not the dot of "x.db" or of a decimal), "then"/"finally" connectors, and a comma before a verb
+_CLAUSE_SPLIT_RE = re.compile(
+    r"[.;!?](?!\d|db\b)\s*"
+    r"|,?\s*\b(?:and\s+)?(?:then|finally|next|after that)\b\s*,?\s*"
+    r"|,\s*(?:and\s+)?(?=(?:%s)\b)" % _VERBS,
+    re.IGNORECASE,
+)
+_LEADING_FILLER_RE = re.compile(r"^(?:first(?:ly)?|second(?:ly)?|please|and|also|now)\b[\s,]*", re.IGNORECASE)
+
+# Natural-language names of columns, checked before synonyms_map
+_TERM_ALIASES: List[Tuple[str, str]] = [
+    (r"work(?:ing)?[ _]?(?:time|hours|duration)", "Work_Time"),
+    (r"start(?:s|ed|ing)?[ _](?:work(?:ing)?|time)|start[ _]?time|clock(?:s|ed)? in", "Start_Time"),
+    (r"(?:end|finish|stop)(?:s|ed|es|ing)?[ _](?:work(?:ing)?|time)|end[ _]?time|leave|leaves|clock(?:s|ed)? out", "End_Time"),
+    (r"qualified (?:work)?pieces|qualified (?:products|number)|number of qualified", "Qualified_Number"),
+    (r"(?:real|actual|produced) (?:work)?(?:pieces|number|output)|number of (?:real|actual|produced)", "Real_Number"),
+    (r"plan(?:ned)? (?:work)?(?:pieces|number|output)|target (?:number|output)|number of plan(?:ned)?", "Plan_Number"),
+]
+
+_COMPARATORS: List[Tuple[str, str]] = [
+    (r"greater than or equal to|at least|not less than|no less than|not fewer than|not below|not under|not earlier than|not before|>=", ">="),
+    (r"less than or equal to|at most|not more than|no more than|not greater than|not larger than|not higher than|not above|not over|not later than|not after|<=", "<="),
+    (r"greater than|more than|larger than|higher than|bigger than|above|over|exceeds?|later than|after|>", ">"),
+    (r"less than|fewer than|smaller than|lower than|below|under|earlier than|before|<", "<"),
+    (r"equal to|equals?|exactly|=", "="),
+]
+_CMP_RE = re.compile(
+    r"^(?P<term>.+?)\s*(?:\b(?:is|are|was|were|has|have|had)\s+)?(?P<cmp>%s)\s*(?P<value>.+)$"
+    % "|".join(p for p, _ in _COMPARATORS),
+    re.IGNORECASE,
+)
+# Words a term may contain besides the column it names; any other word ("not", "top 5", "female")
+# changes the meaning in a way the rules do not model, so the clause goes to the LLM
+_FILLER_WORDS = {
+    "the", "a", "an", "of", "its", "their", "his", "her", "each", "every", "all", "worker", "workers", "worker's",
+    "workers'", "employee", "employees", "people", "is", "are", "was", "were", "has", "have", "had", "whose", "who",
+    "with", "where", "that", "which", "number", "value", "values", "column", "field", "data", "result", "results",
+    "workpiece", "workpieces", "pieces", "products", "output",
+}
+_SIGN_RE = re.compile(r"^(?:(?:with|has|have|having|gets?|giving)\s+)?(?:an?\s+)?(?P<sign>positive|negative|non-negative|nonnegative)\s*(?P<term>.*)$", re.IGNORECASE)
+
+_OUTPUT_RE = r"(?:\s*,?\s*(?:to get|to obtain|to calculate|to compute|to give|as|giving|which is|named|and call it)\s+(?P<out>.+))?"
+_ARITHMETIC_RES = [
+    (re.compile(r"^subtract\s+(?P<a>.+?)\s+from\s+(?P<b>.+?)%s$" % _OUTPUT_RE, re.IGNORECASE), "-", True, "Difference"),
+    (re.compile(r"^divide\s+(?P<a>.+?)\s+by\s+(?P<b>.+?)%s$" % _OUTPUT_RE, re.IGNORECASE), "/", False, "Quotient"),
+    (re.compile(r"^multiply\s+(?P<a>.+?)\s+(?:by|with|and)\s+(?P<b>.+?)%s$" % _OUTPUT_RE, re.IGNORECASE), "*", False, "Product"),
+    (re.compile(r"^add\s+(?P<a>.+?)\s+(?:and|to)\s+(?P<b>.+?)%s$" % _OUTPUT_RE, re.IGNORECASE), "+", False, "Sum"),
+]
+_KPI_RE = re.compile(r"^(?:compute|calculate|get|show|find)\s+(?:the\s+|each worker's\s+|their\s+)*(?P<kind>plan|real|qualified)[ _]?kpi\b", re.IGNORECASE)
+_WORK_TIME_RE = re.compile(r"^(?:compute|calculate|get)\s+(?:the\s+)?work(?:ing)?[ _]?time\b", re.IGNORECASE)
+_SELECT_RE = re.compile(r"^(?:select|find|filter|keep|choose|pick)\s+(?P<rest>.*)$", re.IGNORECASE)
+_SUBJECT_RE = re.compile(
+    r"^(?:only\s+)?(?:out\s+)?(?:all\s+)?(?:of\s+)?(?:the\s+)?(?:those\s+)?"
+    r"(?:workers?|employees?|people|rows?|records?|entries|worker data|data)?(?:\s+data)?\s*"
+    r"(?:(?:whose|who|with|where|that|which)\b)?\s*",
+    re.IGNORECASE,
+)
+_UNION_RE = re.compile(r"\ball\s+(?:of\s+)?the\s+above\b|\b(?:both|either)\s+(?:of\s+)?(?:the\s+)?(?:above|groups|selections)\b", re.IGNORECASE)
+_SORT_RE = re.compile(r"^(?:sort|order|rank|arrange|list|display|show|output)\b(?P<rest>.*)$", re.IGNORECASE)
+_TOP_N_RE = re.compile(r"\b(?P<which>top|first|bottom|last)\s+(?P<n>\d+)\b", re.IGNORECASE)
+_DESC_RE = re.compile(r"descend\w*|\bdesc\b|high(?:est)? to low(?:est)?|largest first|decreasing|from big to small", re.IGNORECASE)
+_ASC_RE = re.compile(r"ascend\w*|\basc\b|low(?:est)? to high(?:est)?|smallest first|increasing|from small to big", re.IGNORECASE)
+_AGG_RE = re.compile(
+    r"^(?:(?:compute|calculate|get|find|show|what is|what's)\s+)?(?:the\s+)?"
+    r"(?P<agg>average|mean|mode|most common|most frequent)\s+(?:value\s+)?(?:of\s+)?(?P<term>.+)$",
+    re.IGNORECASE,
+)
+
+
+def _only_filler(text: str) -> bool:
+    """True if text has no word besides _FILLER_WORDS once the known column phrases are removed."""
+    text = text.lower()
+    for pattern, _ in _TERM_ALIASES:
+        text = re.sub(pattern, " ", text)
+    for synonym in synonyms_map:
+        text = re.sub(r"\b%s\b" % re.escape(synonym), " ", text)
+    return all(w in _FILLER_WORDS for w in re.findall(r"[a-z0-9']+", text))
+
+
+def split_clauses(user_input: str) -> List[str]:
+    clauses = []
+    for part in _CLAUSE_SPLIT_RE.split(user_input):
+        part = _LEADING_FILLER_RE.sub("", (part or "").strip(" ,"))
+        if part:
+            clauses.append(part)
+    return clauses
+
+
+def _is_source_clause(clause: str) -> bool:
+    return bool(re.search(r"\.db\b|\bdatabase\b|\btable\b|\bsheet\b", clause, re.IGNORECASE)) \
+        and not _SELECT_RE.match(clause)
+
+
+def _normalize_time(text: str) -> Optional[str]:
+    m = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?(?:\s*o'?clock)?", text.strip().lower())
+    if not m:
+        return None
+    hour, minute = int(m.group(1)), int(m.group(2) or 0)
+    if m.group(3) and m.group(3).startswith("p") and hour < 12:
+        hour += 12
+    if minute > 59 or (hour > 23 and (hour, minute) != (24, 0)):
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+class _PlanBuilder:
+    """Collects what the clauses ask for and turns it into the operations JSON of agent_input."""
+
+    def __init__(self, db_path: str, table: str):
+        self.db_path = db_path
+        self.table = table
+        # output column -> expression over base columns; Work_Time is never materialized
+        self.named: Dict[str, str] = {"Work_Time": WORK_TIME_EXPR}
+        self.last_expr: Optional[str] = None
+        self.expressions: List[Tuple[str, str]] = []
+        self.where_groups: List[str] = []
+        self.union_groups = False
+        self.tail_ops: List[Dict[str, Any]] = []
+        # "top N": order_by / reverse / limit of the Query
+        self.top_n: Optional[Dict[str, Any]] = None
+        self.used_columns: List[str] = []
+        # expression -> the output column it is materialized as
+        self.outputs: Dict[str, str] = {}
+
+    # ---- terms ----
+    def _use(self, expr: str):
+        for col in sorted(set(re.findall(r"[A-Za-z_]\w*", expr))):
+            if col in BASE_SCHEMA and col not in self.used_columns:
+                self.used_columns.append(col)
+
+    def _known(self, word: str) -> bool:
+        return word in BASE_SCHEMA or word in self.named
+
+    def resolve_term(self, text: str) -> Optional[str]:
+        """
+        A column name, an expression over base columns, or a numeric literal; None if unknown,
+        or if the term has words besides the column ("not", "top 5", "female"), which would be lost.
+        """
+        raw = text.strip(" ,'\"")
+        lowered = re.sub(r"^(?:the|a|an|its|their|each worker's|the worker's)\s+", "", raw.lower())
+        if re.fullmatch(r"-?\d+(?:\.\d+)?", lowered):
+            return lowered
+        # Explicit identifiers win, the last one counts ("the number of qualified workpieces Qualified_Number")
+        idents = [w for w in re.findall(r"[A-Za-z_]\w*", raw) if self._known(w)]
+        if idents:
+            if not _only_filler(re.sub(r"[A-Za-z_]\w*", lambda m: " " if self._known(m.group(0)) else m.group(0), raw)):
+                return None
+            return self.named.get(idents[-1], idents[-1])
+        if re.fullmatch(r"(?:previous |last |calculated |computed )?(?:result|results|it|that|value|difference|quotient|product|sum)", lowered):
+            return self.last_expr
+        if not _only_filler(lowered):
+            return None
+        for pattern, col in _TERM_ALIASES:
+            if re.search(pattern, lowered):
+                return self.named.get(col, col)
+        for synonym, col in synonyms_map.items():
+            if re.search(r"\b%s\b" % re.escape(synonym), lowered):
+                return col
+        return None
+
+    def output_name(self, text: Optional[str], default: str) -> str:
+        if not text:
+            return default
+        idents = [w for w in re.findall(r"[A-Za-z_]\w*", text) if "_" in w or (w[0].isupper() and w[1:] != w[1:].lower())]
+        if idents:
+            return idents[-1]
+        if re.search(r"work(?:ing)?[ _]?time", text, re.IGNORECASE):
+            return "Work_Time"
+        words = [w for w in re.findall(r"[A-Za-z]+", text) if w.lower() not in ("the", "a", "an", "of", "new", "column")]
+        return "_".join(w.capitalize() for w in words[:3]) or default
+
+    # ---- clause handlers; each returns False if the clause is not understood ----
+    def add_arithmetic(self, clause: str) -> bool:
+        for regex, op, swap, default in _ARITHMETIC_RES:
+            m = regex.match(clause)
+            if not m:
+                continue
+            a, b = self.resolve_term(m.group("a")), self.resolve_term(m.group("b"))
+            if a is None or b is None:
+                return False
+            left, right = (b, a) if swap else (a, b)
+            self.define(self.output_name(m.group("out"), default), f"{left} {op} {right}")
+            return True
+        m = _KPI_RE.match(clause)
+        if m:
+            kind = m.group("kind").capitalize()
+            self.define(f"{kind}_KPI", f"{kind}_Number / {WORK_TIME_EXPR}")
+            return True
+        return bool(_WORK_TIME_RE.match(clause))
+
+    def define(self, name: str, expr: str):
+        expr = f"({expr})"
+        self.last_expr = expr
+        self._use(expr)
+        self.named[name] = expr
+        if name != "Work_Time" and (name, expr) not in self.expressions:
+            self.expressions.append((name, expr))
+            self.outputs[expr] = name
+
+    def add_select(self, clause: str) -> bool:
+        m = _SELECT_RE.match(clause)
+        if not m:
+            return False
+        if self.top_n:
+            # The Query would select before taking the top N
+            return False
+        rest = _SUBJECT_RE.sub("", m.group("rest"), count=1).strip()
+        if not rest or re.fullmatch(r"(?:above|of the above|mentioned above)(?: workers| data)?", rest, re.IGNORECASE):
+            return True
+
+        parts = re.split(r"\s+(and|or)\s+", rest, flags=re.IGNORECASE)
+        sql_parts = []
+        for index, part in enumerate(parts):
+            if index % 2 == 1:
+                sql_parts.append(part.upper())
+                continue
+            part = _SUBJECT_RE.sub("", part, count=1).strip()
+            cond = self.condition_sql(part)
+            if cond is None:
+                return False
+            sql_parts.append(cond)
+        self.where_groups.append(" ".join(sql_parts))
+        return True
+
+    def condition_sql(self, text: str) -> Optional[str]:
+        m = _SIGN_RE.match(text)
+        if m:
+            expr = self.resolve_term(m.group("term") or "result")
+            op = {"positive": ">", "negative": "<"}.get(m.group("sign").lower(), ">=")
+            return self._compare_sql(expr, op, "0") if expr else None
+        m = _CMP_RE.match(text)
+        if not m:
+            return None
+        expr = self.resolve_term(m.group("term"))
+        if expr is None:
+            return None
+        op = next(sql_op for pattern, sql_op in _COMPARATORS if re.fullmatch(pattern, m.group("cmp"), re.IGNORECASE))
+        return self._compare_sql(expr, op, m.group("value").strip(" ,"))
+
+    def _compare_sql(self, expr: str, op: str, value: str) -> Optional[str]:
+        if expr in TIME_COLUMNS:
+            hhmm = _normalize_time(value)
+            return f"{expr} {op} '{hhmm}'" if hhmm else None
+        number = re.fullmatch(r"-?\d+(?:\.\d+)?", value.strip())
+        if not number:
+            return None
+        if expr in BASE_SCHEMA:
+            return f"{expr} {op} {number.group(0)}"
+        try:
+            return f"{to_sql(parse_expression(expr))} {op} {number.group(0)}"
+        except ExpressionError:
+            return None
+
+    def add_aggregate(self, clause: str) -> bool:
+        m = _AGG_RE.match(clause)
+        if not m:
+            return False
+        column = self.column_for(m.group("term"))
+        if column is None:
+            return False
+        tool = "Averaging" if m.group("agg").lower() in ("average", "mean") else "Mode"
+        self.tail_ops.append({"tool_name": tool, "args": {"data": "$result_of_previous_tool", "column": column}})
+        return True
+
+    def add_sort(self, clause: str) -> bool:
+        m = _SORT_RE.match(clause)
+        if not m:
+            return False
+        rest = m.group("rest")
+        top = _TOP_N_RE.search(rest)
+        if top:
+            return self._add_top_n(rest, top)
+        if _DESC_RE.search(rest):
+            reverse = True
+        elif _ASC_RE.search(rest):
+            reverse = False
+        else:
+            # "display it" / "list the data": nothing to do, the result is shown anyway
+            return not re.search(r"\b(?:by|order)\b", rest, re.IGNORECASE) and not m.group(0).lower().startswith("sort")
+        column = self._sort_column(rest)
+        if column is None:
+            return False
+        self.tail_ops.append({"tool_name": "Sorting", "args": {"data": "$result_of_previous_tool", "field_index": column, "reverse": reverse}})
+        return True
+
+    def _sort_column(self, rest: str) -> Optional[str]:
+        # The last "of / by ..." names the key: "list the data of all the above workers in descending order of X"
+        key = re.search(r"^.*\b(?:of|by|on|according to)\s+(?P<key>.+?)\s*(?:in\s+\w+(?:ing)?\s+order|descending|ascending)?$", rest, re.IGNORECASE)
+        key_text = key.group("key") if key else None
+        if key_text and re.fullmatch(r"(?:the\s+)?(?:all\s+)?(?:the\s+)?(?:above\s+)?(?:workers?|data|rows|results?)(?:\s+above)?", key_text.strip(), re.IGNORECASE):
+            key_text = None
+        return self.column_for(key_text) if key_text else self._last_output()
+
+    def _add_top_n(self, rest: str, top: re.Match) -> bool:
+        """
+        "show the top 5 workers by Real_Number": the Query orders by the key and keeps N rows.
+        Only understood when nothing changes the rows afterwards and no other word is left over.
+        """
+        which = top.group("which").lower()
+        descending, ascending = bool(_DESC_RE.search(rest)), bool(_ASC_RE.search(rest))
+        if which == "last" or self.top_n or self.tail_ops or (descending and ascending):
+            return False
+        if which == "first" and not (descending or ascending):
+            return False
+        reverse = descending or (which == "top" and not ascending)
+        if (which == "top" and ascending) or (which == "bottom" and descending):
+            return False
+        column = self._sort_column(rest)
+        if column is None:
+            return False
+        leftover = _TOP_N_RE.sub(" ", rest)
+        leftover = re.sub(r"\b(?:of|by|on|according to)\s+.*$", " ", leftover, flags=re.IGNORECASE)
+        leftover = re.sub(r"\bin\s+\w+(?:ing)?\s+order\b", " ", leftover, flags=re.IGNORECASE)
+        leftover = _ASC_RE.sub(" ", _DESC_RE.sub(" ", leftover))
+        if not _only_filler(leftover):
+            return False
+        expr = self.named.get(column, column)
+        if column in BASE_SCHEMA and column not in TIME_COLUMNS:
+            order_by = column
+        elif "*" in self.table or "*" in self.db_path:
+            # Fan-out merges the sorted sources on a result column, not on an expression
+            if column not in TIME_COLUMNS:
+                return False
+            order_by = column
+        else:
+            order_by = to_sql(parse_expression(expr))
+        self.top_n = {"order_by": order_by, "reverse": reverse, "limit": int(top.group("n"))}
+        return True
+
+    def column_for(self, text: str) -> Optional[str]:
+        """Result column for a term: a computed output column or a base column (added to the Query fields)."""
+        idents = [w for w in re.findall(r"[A-Za-z_]\w*", text) if w in self.named and w != "Work_Time"]
+        if idents:
+            rest = re.sub(r"[A-Za-z_]\w*", lambda m: " " if m.group(0) in self.named else m.group(0), text)
+            return idents[-1] if _only_filler(rest) else None
+        expr = self.resolve_term(text)
+        if expr is None:
+            return None
+        if expr in BASE_SCHEMA:
+            self._use(expr)
+            return expr
+        return self.outputs.get(expr)
+
+    def _last_output(self) -> Optional[str]:
+        return self.expressions[-1][0] if self.expressions else None
+
+    # ---- result ----
+    def operations(self) -> List[Dict[str, Any]]:
+        conditions: Dict[str, Any] = {"table": self.table}
+        if self.expressions or self.tail_ops:
+            fields = ["ID", "Name"] + [c for c in self.used_columns if c not in ("ID", "Name")]
+        else:
+            fields = ["*"]
+        conditions["fields"] = fields
+        if self.where_groups:
+            if len(self.where_groups) == 1:
+                conditions["where"] = self.where_groups[0]
+            else:
+                joiner = " OR " if self.union_groups else " AND "
+                conditions["where"] = joiner.join(f"({g})" for g in self.where_groups)
+        if self.top_n:
+            conditions.update(self.top_n)
+
+        ops = [{"tool_name": "Query", "args": {"db_path": self.db_path, "conditions": conditions}}]
+        for name, expr in self.expressions:
+            ops.append({"tool_name": "Expression", "args": {
+                "data": "$result_of_previous_tool",
+                "expression": expr[1:-1] if expr.startswith("(") and expr.endswith(")") else expr,
+                "output_column": name,
+            }})
+        return ops + self.tail_ops
+
+
+def plan_request(user_input: str) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Plan a request with local rules. Returns ({"success": True, "operations": [...]}, confidence)
+    in the same shape agent_input gets from the LLM, or (None, 0.0) if no database / table was named.
+    confidence is the share of clauses that were understood; anything below
+    RULE_PLANNER_MIN_CONFIDENCE should go to the LLM.
+    """
+    db_path, table = find_db_and_table(user_input)
+    if not db_path or not table:
+        return None, 0.0
+
+    builder = _PlanBuilder(db_path, table)
+    clauses = split_clauses(user_input)
+    understood, actions = 0, 0
+    for clause in clauses:
+        if _is_source_clause(clause):
+            understood += 1
+            continue
+        actions += 1
+        if builder.add_arithmetic(clause) or builder.add_select(clause) or builder.add_aggregate(clause) \
+                or builder.add_sort(clause):
+            understood += 1
+        else:
+            print(f"[DEBUG][RulePlanner] clause not understood: {clause!r}")
+
+    # Sequential selections narrow each other (AND). Only "all (of) the above" / "both" / "either"
+    # explicitly asks for the union of separate selections; any other reference to "the above"
+    # leaves it open which one was meant, so the request goes to the LLM
+    if len(builder.where_groups) > 1:
+        builder.union_groups = bool(_UNION_RE.search(user_input))
+        if not builder.union_groups and re.search(r"\babove\b", user_input, re.IGNORECASE):
+            print("[DEBUG][RulePlanner] 'the above' after several selections is ambiguous")
+            understood -= 1
+
+    if actions == 0:
+        return None, 0.0
+    return {"success": True, "operations": builder.operations()}, understood / len(clauses)
+
+
+if __name__ == "__main__":
+    # Offline check: python SQL_rule_planner.py ["request text"]
+    samples = sys.argv[1:] or [
+        "I have a database file in the path E:/LLMTest/Dataset, and is named by test_dataset.db, it has table Workers_20012025. "
+        "Subtract Plan_Number from Real_Number, select the worker data with a positive result, and finally display it in descending order. ",
+        "I have a SQL database named Workers.db in path D:/Test/Dataset, which has a table named Sheet_17_02_2025. "
+        "First, select all workers who start work before 9:00, subtract the start time from the end time to get the work time, "
+        "then divide the number of qualified workpieces Qualified_Number by the work time to get the qualified workpiece KPI Qualified_KPI; "
+        "then select all workers whose end time is later than 17:00, subtract the start time from the end time to get the work time, "
+        "then divide the number of qualified workpieces Qualified_Number by the work time to get the qualified workpiece KPI Qualified_KPI; "
+        "finally, list the data of all the above workers in descending order of Qualified_KPI.",
+        "Database Dataset/test_dataset.db, table Workers_20012025. Select workers whose Real_Number is greater than 100, "
+        "then compute the average of Qualified_Number.",
+        "In test_dataset.db, table Workers_20012025, tell me which worker looks the most tired.",
+    ]
+    for text in samples:
+        plan, confidence = plan_request(text)
+        print(f"\n=== confidence {confidence:.2f} ===\n{text}")
+        print(json.dumps(plan, indent=2) if plan else None)
@@ -0,0 +1,246 @@
+# LLM_Test/SQL_sampling.py
+
+import itertools
+import math
+import random
+from statistics import NormalDist
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from SQL_connection_pool import get_connection_pool
+from SQL_fanout import has_glob, iter_fanout
+from SQL_columnar import FETCH_CHUNK_ROWS
+from SQL_query_builder import build_select_sql
+from SQL_query_guard import count_rows
+from SQL_stream_stats import RunningStats
+
+# Consecutive rowids read per sampled block: larger blocks read fewer pages,
+# smaller ones give rows closer to independent (rows of one block are often similar)
+SAMPLE_BLOCK_ROWS = 32
+DEFAULT_CONFIDENCE = 0.95
+# Progressive refinement doubles the sample at most this many times
+MAX_REFINE_ROUNDS = 8
+# Once the sample would cover this share of the table, the exact query is cheaper
+EXACT_FRACTION = 0.5
+SAMPLE_METHODS = ("rowid", "reservoir")
+
+
+def normalize_sample(sample: Any) -> Dict[str, Any]:
+    """
+    conditions["sample"] as a dict. Accepts 0.05 (fraction), 20000 (rows) or
+    {"fraction" | "rows", "method": "rowid" | "reservoir", "seed", "block_rows",
+     "column", "target_error", "confidence", "max_rounds"}.
+    "fraction" / "rows" size the sample of table rows for "rowid" (rows failing "where" are
+    then dropped) and of result rows for "reservoir".
+    """
+    if isinstance(sample, bool):
+        raise ValueError("sample must be a fraction, a row count or a dict")
+    if isinstance(sample, float):
+        sample = {"fraction": sample}
+    elif isinstance(sample, int):
+        sample = {"rows": sample}
+    spec = dict(sample or {})
+    fraction, rows = spec.get("fraction"), spec.get("rows")
+    if (fraction is None) == (rows is None):
+        raise ValueError(f"sample needs exactly one of 'fraction' or 'rows', got {sample}")
+    if fraction is not None and not 0 < float(fraction) <= 1:
+        raise ValueError(f"sample fraction must be in (0, 1], got {fraction}")
+    if rows is not None and int(rows) < 1:
+        raise ValueError(f"sample rows must be positive, got {rows}")
+    spec.setdefault("method", "rowid")
+    if spec["method"] not in SAMPLE_METHODS:
+        raise ValueError(f"Unknown sample method '{spec['method']}', must be one of {list(SAMPLE_METHODS)}")
+    if spec.get("target_error") is not None and not spec.get("column"):
+        raise ValueError("sample 'target_error' needs the 'column' whose mean is refined")
+    return spec
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, str) and ":" in value:
+        hh, mm = value.split(":")
+        return float(hh) * 60.0 + float(mm)
+    return float(value)
+
+
+# ---- estimates ----
+def z_score(confidence: float) -> float:
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be in (0, 1), got {confidence}")
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def mean_interval(stats: RunningStats, confidence: float = DEFAULT_CONFIDENCE,
+                  population: Optional[int] = None) -> Tuple[float, float]:
+    """
+    Normal-approximation confidence interval of the mean from a sample, with the finite
+    population correction when the population size is known.
+    """
+    if stats.count < 2:
+        return stats.mean, stats.mean
+    half = z_score(confidence) * stats.stddev / math.sqrt(stats.count)
+    if population and population > 1:
+        half *= math.sqrt(max(0.0, (population - stats.count) / (population - 1)))
+    return stats.mean - half, stats.mean + half
+
+
+def proportion_interval(count: int, n: int, confidence: float = DEFAULT_CONFIDENCE) -> Tuple[float, float]:
+    """Wilson score interval of a share count / n; stays inside [0, 1] for small samples."""
+    if n == 0:
+        return 0.0, 1.0
+    z = z_score(confidence)
+    p = count / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+# ---- sampling ----
+def reservoir_sample(rows: Iterable[Dict[str, Any]], k: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    Uniform sample of k rows from a stream of unknown length in one pass (Li's Algorithm L:
+    skips ahead geometrically instead of drawing a random number per row).
+    """
+    rows = iter(rows)
+    reservoir = list(itertools.islice(rows, k))
+    if len(reservoir) < k:
+        return reservoir
+    w = math.exp(math.log(rng.random()) / k)
+    while True:
+        skip = int(math.log(rng.random()) / math.log(1 - w))
+        row = next(itertools.islice(rows, skip, None), None)
+        if row is None:
+            return reservoir
+        reservoir[rng.randrange(k)] = row
+        w *= math.exp(math.log(rng.random()) / k)
+
+
+def bernoulli_sample(rows: Iterable[Dict[str, Any]], fraction: float, rng: random.Random) -> List[Dict[str, Any]]:
+    return [row for row in rows if rng.random() < fraction]
+
+
+def rowid_bounds(conn, table: str) -> Optional[Tuple[int, int]]:
+    """(min rowid, max rowid) read from the rowid b-tree; None for views, WITHOUT ROWID or empty tables."""
+    try:
+        lo, hi = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    except Exception:
+        return None
+    return None if lo is None else (lo, hi)
+
+
+def _ranges_sql(blocks: List[int], lo: int, block_rows: int) -> str:
+    """rowid BETWEEN ranges of the chosen blocks, adjacent blocks merged into one range."""
+    ranges = []
+    for block in sorted(blocks):
+        start = lo + block * block_rows
+        end = start + block_rows - 1
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return " OR ".join(f"rowid BETWEEN {a} AND {b}" for a, b in ranges)
+
+
+def _fetch(conn, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+    cursor = conn.execute(build_select_sql(conditions))
+    columns = [desc[0] for desc in cursor.description]
+    rows = cursor.fetchall()
+    count_rows(len(rows))
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _precise_enough(rows: List[Dict[str, Any]], spec: Dict[str, Any]) -> bool:
+    stats = RunningStats()
+    stats.add_chunk([row.get(spec["column"]) for row in rows], _number)
+    if stats.count < 2:
+        return False
+    low, high = mean_interval(stats, spec.get("confidence", DEFAULT_CONFIDENCE))
+    half = (high - low) / 2
+    print(f"[DEBUG][Sample] {len(rows)} rows: mean({spec['column']}) = {stats.mean:.6g} +/- {half:.3g}")
+    return half <= float(spec["target_error"]) * abs(stats.mean)
+
+
+def sample_query(db_path: str, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Run a Query on a sample of the table rows instead of all of them.
+    - "rowid": random blocks of consecutive rowids, read through the rowid b-tree, so only
+      the sampled pages are touched. With "target_error" the sample grows (new blocks only)
+      until the confidence interval of the mean of "column" is within target_error * |mean|,
+      and turns into the exact query once it would cover EXACT_FRACTION of the table.
+    - "reservoir": one pass over the query result keeping a uniform sample (Bernoulli for
+      a fraction); also used for globs, views and tables without rowid.
+    ORDER BY / LIMIT are applied to the sample.
+    """
+    spec = normalize_sample(conditions["sample"])
+    rng = random.Random(spec.get("seed"))
+    base = {k: v for k, v in conditions.items() if k not in ("sample", "order_by", "reverse", "limit", "format")}
+    table = conditions.get("table", "")
+
+    rows = None
+    if spec["method"] == "rowid" and not has_glob(db_path) and not has_glob(table):
+        with get_connection_pool().connection(db_path, conditions.get("access_profile")) as conn:
+            bounds = rowid_bounds(conn, table)
+            if bounds is not None:
+                rows = _rowid_sample(conn, base, spec, bounds, rng)
+    if rows is None:
+        source = iter_fanout(db_path, base) if has_glob(db_path) or has_glob(table) else _iter_rows(db_path, base)
+        if spec.get("fraction") is not None:
+            rows = bernoulli_sample(source, float(spec["fraction"]), rng)
+        else:
+            rows = reservoir_sample(source, int(spec["rows"]), rng)
+        print(f"[DEBUG][Sample] {spec['method']} sample => {len(rows)} rows")
+
+    if conditions.get("order_by"):
+        key = conditions["order_by"]
+        if rows and key in rows[0]:
+            rows.sort(key=lambda r: (r.get(key) is not None, r.get(key)), reverse=bool(conditions.get("reverse")))
+        else:
+            print(f"[WARN][Sample] cannot order the sample by '{key}', not a result column")
+    if conditions.get("limit") is not None:
+        rows = rows[:int(conditions["limit"])]
+    return rows
+
+
+def _iter_rows(db_path: str, conditions: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    with get_connection_pool().connection(db_path, conditions.get("access_profile")) as conn:
+        cursor = conn.execute(build_select_sql(conditions))
+        columns = [desc[0] for desc in cursor.description]
+        for chunk in iter(lambda: cursor.fetchmany(FETCH_CHUNK_ROWS), []):
+            count_rows(len(chunk))
+            for row in chunk:
+                yield dict(zip(columns, row))
+
+
+def _rowid_sample(conn, base: Dict[str, Any], spec: Dict[str, Any], bounds: Tuple[int, int],
+                  rng: random.Random) -> List[Dict[str, Any]]:
+    lo, hi = bounds
+    span = hi - lo + 1
+    block_rows = max(1, int(spec.get("block_rows", SAMPLE_BLOCK_ROWS)))
+    slots = -(-span // block_rows)
+    if spec.get("fraction") is not None:
+        wanted = math.ceil(float(spec["fraction"]) * span)
+    else:
+        wanted = int(spec["rows"])
+    max_rounds = int(spec.get("max_rounds", MAX_REFINE_ROUNDS)) if spec.get("target_error") is not None else 1
+
+    used = set()
+    rows: List[Dict[str, Any]] = []
+    for round_no in range(max_rounds):
+        if wanted >= EXACT_FRACTION * span:
+            print(f"[DEBUG][Sample] sample of {wanted} rows would cover most of {span} rowids, run the exact query")
+            return _fetch(conn, base)
+        new_blocks = []
+        while len(used) < min(slots, -(-wanted // block_rows)):
+            block = rng.randrange(slots)
+            if block not in used:
+                used.add(block)
+                new_blocks.append(block)
+        if new_blocks:
+            ranges = _ranges_sql(new_blocks, lo, block_rows)
+            sub = dict(base)
+            sub["where"] = f"({base['where']}) AND ({ranges})" if base.get("where") else ranges
+            rows += _fetch(conn, sub)
+        print(f"[DEBUG][Sample] round {round_no}: {len(used)} of {slots} blocks => {len(rows)} rows")
+        if spec.get("target_error") is None or _precise_enough(rows, spec):
+            break
+        wanted *= 2
+    return rows
@@ -0,0 +1,474 @@
+# LLM_Test/SQL_service.py
+
+import argparse
+import itertools
+import json
+import math
+import os
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from SQL_columnar import ColumnarResult
+from SQL_connection_pool import get_connection_pool
+from SQL_op_cache import get_operation_cache
+from SQL_prompt import build_parse_prompt, get_parse_prompt_template
+from SQL_query_guard import (PLAN_TIMEOUT_S, QueryGuard, active_runs, cancel_run, print_progress, register_run,
+                             unregister_run)
+from SQL_utils import table_columns
+
+# Requests executed at the same time (graph runs in worker threads)
+SERVICE_WORKERS = int(os.getenv("SQL_SERVICE_WORKERS", "4"))
+# Requests admitted beyond the running ones; any further request is rejected with 429
+SERVICE_QUEUE_SIZE = int(os.getenv("SQL_SERVICE_QUEUE", "32"))
+# Seconds an admitted request may wait for a worker before it is dropped unrun
+SERVICE_QUEUE_TIMEOUT_S = float(os.getenv("SQL_SERVICE_QUEUE_TIMEOUT", "30"))
+# Rows of each tabular result sent back in a response
+SERVICE_RESULT_ROWS = int(os.getenv("SQL_SERVICE_RESULT_ROWS", "1000"))
+# Latest latencies kept for the percentiles in /stats
+LATENCY_WINDOW = 2048
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class ServiceBusy(RuntimeError):
+    """Every worker is busy and the admission queue is full."""
+
+
+class DuplicateRun(RuntimeError):
+    """A request with the same run_id is already queued or running."""
+
+
+class LatencyWindow:
+    """The latest LATENCY_WINDOW samples (ms) of one latency, summarized as percentiles."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, ms: float):
+        with self._lock:
+            self._values.append(ms)
+            self.count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return {"count": self.count}
+
+        def pct(p: float) -> float:
+            # Nearest-rank percentile
+            return round(values[max(0, math.ceil(p / 100 * len(values)) - 1)], 1)
+
+        return {"count": self.count, "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+                "max_ms": round(values[-1], 1)}
+
+
+def result_payload(result: Any, max_rows: int = SERVICE_RESULT_ROWS) -> Any:
+    """A tool result as JSON-ready data; tabular results are cut to max_rows rows."""
+    if isinstance(result, ColumnarResult):
+        return {"rows": result.num_rows, "data": result.to_rows(0, max_rows), "truncated": result.num_rows > max_rows}
+    if isinstance(result, list):
+        return {"rows": len(result), "data": result[:max_rows], "truncated": len(result) > max_rows}
+    return result
+
+
+def warm_databases(specs: List[str]):
+    """
+    Open pooled connections and load table schemas before the first request.
+    Each spec is "path.db" (all tables) or "path.db:Table1,Table2".
+    """
+    for spec in specs:
+        db_path, sep, names = spec.rpartition(":")
+        if not sep or "/" in names or "\\" in names or os.path.exists(spec):
+            db_path, names = spec, ""
+        start = time.perf_counter()
+        with get_connection_pool().connection(db_path) as conn:
+            tables = [t for t in names.split(",") if t] or [
+                row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")]
+        for table in tables:
+            table_columns(db_path, table)
+        print(f"[DEBUG][Service] warmed {db_path}: {len(tables)} table schemas in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+class QueryService:
+    """
+    Runs requests through the compiled LangGraph app in a bounded worker pool.
+    Admission control: at most workers + queue_size requests are inside the service; the
+    next one is rejected at once (ServiceBusy, HTTP 429) instead of piling up, and a request
+    that waited longer than queue_timeout for a worker is dropped without running. A run_id
+    that is already queued or running is rejected (DuplicateRun, HTTP 409).
+    Models, tools, the graph and every cache (connection pool, schemas, parse answers,
+    operation outputs, single-flights) are built once and shared by all requests.
+    """
+
+    def __init__(self, workers: int = SERVICE_WORKERS, queue_size: int = SERVICE_QUEUE_SIZE,
+                 queue_timeout: float = SERVICE_QUEUE_TIMEOUT_S, result_rows: int = SERVICE_RESULT_ROWS):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self.result_rows = result_rows
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sql-service")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        # run_id -> future of every admitted request (None until it is handed to the pool)
+        self._pending = {}
+        # Cancels of admitted runs whose guard was not registered yet
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._running = 0
+        self.counters = Counter()
+        self.latency = LatencyWindow()
+        self.queue_wait = LatencyWindow()
+        self.started = time.time()
+        self._main = None
+
+    # ---- graph ----
+    def load(self):
+        """Import the main module once: builds the models, tools and compiled graph."""
+        if self._main is None:
+            import SQL_main_2_3
+            self._main = SQL_main_2_3
+            get_parse_prompt_template()
+            build_parse_prompt("warm up")
+        return self._main
+
+    def run_graph(self, request_text: str, run_id: str, guard: QueryGuard) -> Dict[str, Any]:
+        main = self.load()
+        init_state = {
+            "messages": [main.HumanMessage(content=request_text)],
+            "pending_operations": [],
+            "results": [],
+            "run_id": run_id,
+            "guard": guard,
+        }
+        return main.app.invoke(init_state)
+
+    # ---- requests ----
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def submit(self, request_text: str, run_id: Optional[str] = None, timeout: Optional[float] = None,
+               result_rows: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run one request and wait for its answer; raises ServiceBusy when the service is saturated
+        and DuplicateRun when run_id is already queued or running.
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise ServiceBusy(f"{self.workers} workers busy and {self.queue_size} requests queued")
+        run_id = run_id or uuid.uuid4().hex[:12]
+        with self._lock:
+            duplicate = run_id in self._pending or run_id in active_runs()
+            if not duplicate:
+                self._pending[run_id] = None
+        if duplicate:
+            self._slots.release()
+            self._count("duplicate")
+            raise DuplicateRun(f"run {run_id} is already queued or running")
+        self._count("accepted")
+        try:
+            future = self._pool.submit(self._run, request_text, run_id, float(timeout) if timeout else None, time.monotonic(),
+                                       self.result_rows if result_rows is None else int(result_rows))
+            with self._lock:
+                self._pending[run_id] = future
+            try:
+                return future.result()
+            except CancelledError:
+                self._count("cancelled")
+                return {"run_id": run_id, "status": "cancelled", "messages": ["Cancelled before it started."]}
+        finally:
+            with self._lock:
+                self._pending.pop(run_id, None)
+                self._cancel_requested.discard(run_id)
+            self._slots.release()
+
+    def _run(self, request_text: str, run_id: str, timeout: Optional[float], enqueued: float,
+             result_rows: int) -> Dict[str, Any]:
+        waited = time.monotonic() - enqueued
+        self.queue_wait.add(waited * 1000)
+        if self.queue_timeout and waited > self.queue_timeout:
+            self._count("expired")
+            return {"run_id": run_id, "status": "expired",
+                    "messages": [f"Waited {waited:.1f} s for a worker (limit {self.queue_timeout:.0f} s)."]}
+
+        # Registered before the graph starts, so a cancel also stops parsing and speculative queries
+        guard = QueryGuard(timeout=timeout or PLAN_TIMEOUT_S, on_progress=print_progress, label=f"plan {run_id}")
+        if not register_run(run_id, guard):
+            self._count("failed")
+            return {"run_id": run_id, "status": "error", "error": f"run {run_id} is already running"}
+        with self._lock:
+            if run_id in self._cancel_requested:
+                guard.cancel()
+            self._running += 1
+        start = time.monotonic()
+        try:
+            final_state = self.run_graph(request_text, run_id, guard)
+        except Exception as e:
+            self._count("failed")
+            return {"run_id": run_id, "status": "error", "error": str(e)}
+        finally:
+            unregister_run(run_id, guard)
+            elapsed = time.monotonic() - start
+            self.latency.add(elapsed * 1000)
+            with self._lock:
+                self._running -= 1
+
+        status = "cancelled" if guard.abort_reason() == "cancelled" else "ok"
+        self._count("completed" if status == "ok" else status)
+        print(f"[DEBUG][Service] run {run_id} {status} in {elapsed * 1000:.0f} ms (queued {waited * 1000:.0f} ms)")
+        return {
+            "run_id": run_id,
+            "status": status,
+            "latency_ms": round(elapsed * 1000, 1),
+            "queue_ms": round(waited * 1000, 1),
+            "messages": [m.content for m in final_state.get("messages", []) if getattr(m, "type", "") == "ai"],
+            "results": [{name: result_payload(value, result_rows) for name, value in r.items()}
+                        for r in final_state.get("results", [])],
+        }
+
+    def cancel(self, run_id: str) -> bool:
+        """
+        Drop a queued request, or stop the run of run_id wherever it is (parsing, speculative
+        or planned queries); a run admitted but not started yet is stopped as soon as it starts.
+        """
+        with self._lock:
+            if run_id not in self._pending:
+                return cancel_run(run_id)
+            future = self._pending[run_id]
+            if future is not None and (future.cancel() or future.done()):
+                return future.cancelled()
+            # Under the lock: _run checks the requests right after registering its guard
+            if not cancel_run(run_id):
+                self._cancel_requested.add(run_id)
+            return True
+
+    # ---- monitoring ----
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            running, inside = self._running, len(self._pending)
+        capacity = self.workers + self.queue_size
+        return {
+            "status": "saturated" if inside >= capacity else "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "running": running,
+            "queued": max(0, inside - running),
+            "capacity": capacity,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        stats = {
+            "requests": counters,
+            "latency": self.latency.summary(),
+            "queue_wait": self.queue_wait.summary(),
+            "op_cache": get_operation_cache().stats(),
+            "active_runs": active_runs(),
+        }
+        if self._main is not None:
+            from tools.SQL_tools_2_2 import query_flight
+            stats["parse_cache"] = self._main.parse_cache.stats()
+            stats["parse_flight"] = self._main.parse_flight.stats()
+            stats["query_flight"] = query_flight.stats()
+        return stats
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        get_connection_pool().close_all()
+
+
+# ---- HTTP front end ----
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health                 liveness and load
+    GET  /stats                  counters, latency percentiles, cache and single-flight stats
+    POST /query  {"request", "run_id"?, "timeout"?, "result_rows"?}
+    POST /cancel {"run_id"}
+    """
+    service: QueryService = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("request body must be a JSON object")
+        return body
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, self.service.health())
+        elif self.path == "/stats":
+            self._send(200, self.service.stats())
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+        except ValueError as e:
+            self._send(400, {"error": f"bad request body: {e}"})
+            return
+
+        if self.path == "/query":
+            if not isinstance(body.get("request"), str) or not body["request"].strip():
+                self._send(400, {"error": "'request' must be a non-empty string"})
+                return
+            try:
+                answer = self.service.submit(body["request"], body.get("run_id"), body.get("timeout"),
+                                             body.get("result_rows"))
+            except ServiceBusy as e:
+                self._send(429, {"error": str(e)}, {"Retry-After": "1"})
+                return
+            except DuplicateRun as e:
+                self._send(409, {"error": str(e)})
+                return
+            status = {"ok": 200, "cancelled": 200, "expired": 503, "error": 500}[answer["status"]]
+            self._send(status, answer)
+        elif self.path == "/cancel":
+            self._send(200, {"run_id": body.get("run_id"), "cancelled": self.service.cancel(str(body.get("run_id")))})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def log_message(self, format: str, *args: Any):
+        # One [DEBUG][Service] line per run is printed by the service itself
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: Optional[str] = None):
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, handler)
+        where = unix_socket
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        where = f"http://{host}:{server.server_address[1]}"
+    print(f"[DEBUG][Service] listening on {where} ({service.workers} workers, queue {service.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+# ---- load test client ----
+def _post(url: str, payload: Dict[str, Any], timeout: float) -> int:
+    request = urllib.request.Request(url, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def load_test(url: str, texts: List[str], concurrency: int = 16, total: int = 200, timeout: float = 120.0) -> Dict[str, Any]:
+    """Send total /query requests (cycling through texts) from concurrency threads and summarize the answers."""
+    next_index = itertools.count()
+    latency = LatencyWindow(size=max(total, 1))
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            i = next(next_index)
+            if i >= total:
+                return
+            start = time.perf_counter()
+            try:
+                status = _post(url.rstrip("/") + "/query", {"request": texts[i % len(texts)]}, timeout)
+            except OSError:
+                status = "connection error"
+            latency.add((time.perf_counter() - start) * 1000)
+            with lock:
+                statuses[status] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"requests": total, "concurrency": concurrency, "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 2), "statuses": dict(statuses), "latency": latency.summary()}
+
+
+if __name__ == "__main__":
+    # python SQL_service.py serve [--port 8765 | --unix /tmp/sql.sock] [--workers 4] [--queue 32] [--warm Dataset/test_dataset.db] [--fake-llm]
+    # python SQL_service.py loadtest [--url http://127.0.0.1:8765] [--concurrency 16] [--requests 200] [--text "..."]
+    # Load tests of the parse path: serve with --fake-llm and SQL_RULE_PLANNER=0, so every request goes to the (fake) model
+    parser = argparse.ArgumentParser(description="SQL agent as a long-running local service")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_args = sub.add_parser("serve")
+    serve_args.add_argument("--host", default=DEFAULT_HOST)
+    serve_args.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_args.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    serve_args.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    serve_args.add_argument("--queue", type=int, default=SERVICE_QUEUE_SIZE)
+    serve_args.add_argument("--queue-timeout", type=float, default=SERVICE_QUEUE_TIMEOUT_S)
+    serve_args.add_argument("--warm", nargs="*", default=[], help="path.db or path.db:Table1,Table2 to open at start")
+    serve_args.add_argument("--fake-llm", action="store_true", help="answer parse requests with SQL_fake_llm.py")
+    serve_args.add_argument("--fake-latency-ms", type=float)
+
+    load_args = sub.add_parser("loadtest")
+    load_args.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    load_args.add_argument("--concurrency", type=int, default=16)
+    load_args.add_argument("--requests", type=int, default=200)
+    load_args.add_argument("--text", action="append", help="request text (repeat to cycle through several)")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        # Read by SQL_main_2_3 / SQL_fake_llm at import, which happens in service.load()
+        if args.fake_llm:
+            os.environ["SQL_FAKE_LLM"] = "1"
+        if args.fake_latency_ms is not None:
+            os.environ["SQL_FAKE_LLM_LATENCY_MS"] = str(args.fake_latency_ms)
+        query_service = QueryService(args.workers, args.queue, args.queue_timeout)
+        query_service.load()
+        warm_databases(args.warm)
+        serve(query_service, args.host, args.port, args.unix)
+    else:
+        texts = args.text or [
+            "Database Dataset/test_dataset.db, table Workers_20012025. Select workers whose Real_Number is greater than 100, "
+            "then compute the average of Qualified_Number."
+        ]
+        report = load_test(args.url, texts, args.concurrency, args.requests)
+        print(json.dumps(report, indent=2))
+        with urllib.request.urlopen(args.url.rstrip("/") + "/stats") as response:
+            print(json.dumps(json.loads(response.read()), indent=2))
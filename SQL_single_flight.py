@@ -0,0 +1,79 @@
+# LLM_Test/SQL_single_flight.py
+
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from SQL_op_cache import copy_result
+
+# Seconds between two checks of a waiter's own deadline / cancellation
+WAIT_POLL_S = 0.1
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Request coalescing: concurrent calls with the same key share one computation.
+    The first caller (the leader) runs fn; callers that arrive while it is in flight wait
+    for it and get the same answer. The result is stored as a private copy, and the leader
+    and every waiter get their own copy_result() of it, since later tools write into rows.
+    Nothing is kept after the call completes (that is the operation cache's job).
+    retry_if(error): a waiter retries (and may become the leader) instead of taking
+    the leader's exception, e.g. when the leader's own request was cancelled.
+    """
+
+    def __init__(self, name: str, retry_if: Optional[Callable[[BaseException], bool]] = None):
+        self.name = name
+        self.retry_if = retry_if
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any], wait_check: Optional[Callable[[], None]] = None) -> Tuple[Any, bool]:
+        """
+        (result, shared): shared is True if another caller computed it.
+        wait_check is called while waiting and may raise (the waiter's own deadline).
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.leaders += 1
+
+            if leader:
+                try:
+                    result = fn()
+                    call.result = copy_result(result)
+                    return result, False
+                except BaseException as ex:
+                    call.error = ex
+                    raise
+                finally:
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    call.done.set()
+
+            while not call.done.wait(WAIT_POLL_S if wait_check else None):
+                wait_check()
+            if call.error is not None:
+                if self.retry_if is not None and self.retry_if(call.error):
+                    continue
+                raise call.error
+            with self._lock:
+                self.shared += 1
+            print(f"[DEBUG][SingleFlight] {self.name}: joined an identical call in flight")
+            return copy_result(call.result), True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._calls)}
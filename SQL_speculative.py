@@ -0,0 +1,168 @@
+# LLM_Test/SQL_speculative.py
+
+import copy
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from SQL_query_guard import QueryGuard, guarded
+
+# Only Query is started early: it is side-effect free and is where the latency is.
+# KPI waits for the validated plan, which checks its KPI names first.
+# Everything else depends on their results anyway.
+SPECULATIVE_TOOLS = {"Query"}
+
+
+class IncrementalOperationsParser:
+    """
+    Fed with the LLM output as it streams in; returns each object of the
+    "operations" array as soon as its closing brace arrives.
+    Strings and escapes are tracked so braces inside SQL literals do not confuse it.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._last_key = None
+        self._string_start = -1
+        self._ops_depth = None      # depth of the "operations" array once it is opened
+        self._obj_start = -1
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self.buffer += text
+        completed = []
+        buf = self.buffer
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_key = buf[self._string_start + 1:self._pos]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "[{":
+                self._depth += 1
+                if ch == "[" and self._ops_depth is None and self._last_key == "operations":
+                    self._ops_depth = self._depth
+                elif ch == "{" and self._ops_depth is not None and self._depth == self._ops_depth + 1:
+                    self._obj_start = self._pos
+            elif ch in "]}":
+                if ch == "}" and self._ops_depth is not None and self._depth == self._ops_depth + 1 \
+                        and self._obj_start >= 0:
+                    try:
+                        completed.append(json.loads(buf[self._obj_start:self._pos + 1]))
+                    except ValueError:
+                        pass
+                    self._obj_start = -1
+                if ch == "]" and self._ops_depth is not None and self._depth == self._ops_depth:
+                    self._ops_depth = -1    # array closed, stop looking
+                self._depth -= 1
+            self._pos += 1
+        return completed
+
+
+def canonical_operation(op: Dict[str, Any]) -> str:
+    return json.dumps({"tool_name": op.get("tool_name"), "args": op.get("args", {})}, sort_keys=True, default=str)
+
+
+class SpeculativeExecutor:
+    """
+    Starts DB operations while the LLM is still generating the rest of the plan.
+    normalize: the whole preparation the executor applies to a plan (name fixes, plan compiler,
+    pushdowns), called with every streamed prefix of the plan, so a speculative op is the op the
+    executor will run. A later op that rewrites an earlier Query (e.g. an Expression folded into
+    it) replaces the Query started for the shorter prefix, which is interrupted.
+    The executor later claim()s a result for an identical operation; anything not
+    claimed is discarded by cancel_all(). Operations are read-only, so dropping them is safe.
+    They all run under one QueryGuard, a child of the run's guard (parent): the plan deadline
+    and cancel_run() stop them too, and cancel_all() interrupts the running ones.
+    """
+
+    def __init__(self, tools: List[Any], normalize: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]], max_workers: int = 2,
+                 parent: Optional[QueryGuard] = None):
+        self._tools = {t.name: t for t in tools}
+        self._normalize = normalize
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures: Dict[str, Tuple[Future, QueryGuard]] = {}
+        self._streamed: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._guard = QueryGuard(parent=parent, label="speculative")
+        self.stats = {"started": 0, "replaced": 0, "hits": 0}
+
+    def offer(self, op: Dict[str, Any]) -> bool:
+        """Add op to the streamed plan and start its new speculatable operations; return True if one was started."""
+        self._streamed.append(copy.deepcopy(op))
+        try:
+            plan = self._normalize(copy.deepcopy(self._streamed))
+        except Exception as ex:
+            print(f"[WARN][Speculative] cannot normalize the plan up to {op.get('tool_name')}: {ex}")
+            return False
+        wanted = {}
+        for normalized in plan:
+            if normalized.get("tool_name") in SPECULATIVE_TOOLS and normalized.get("tool_name") in self._tools \
+                    and "data" not in normalized.get("args", {}):
+                wanted[canonical_operation(normalized)] = normalized
+
+        with self._lock:
+            # Rewritten by the ops that arrived since: the executor will never claim these
+            replaced = [self._futures.pop(key) for key in list(self._futures) if key not in wanted]
+            new_keys = [key for key in wanted if key not in self._futures]
+            for key in new_keys:
+                guard = QueryGuard(parent=self._guard, label="speculative")
+                args = copy.deepcopy(wanted[key].get("args", {}))
+                self._futures[key] = (self._executor.submit(self._run_guarded, self._tools[wanted[key]["tool_name"]], args, guard), guard)
+            self.stats["started"] += len(new_keys)
+            self.stats["replaced"] += len(replaced)
+        for future, guard in replaced:
+            future.cancel()
+            guard.cancel()
+        if replaced:
+            print(f"[DEBUG][Speculative] {len(replaced)} speculative operations rewritten by {op.get('tool_name')}, dropped")
+        for key in new_keys:
+            print(f"[DEBUG][Speculative] started {wanted[key]['tool_name']} before the plan is complete")
+        return bool(new_keys)
+
+    def _run_guarded(self, tool: Any, args: Dict[str, Any], guard: QueryGuard) -> Any:
+        # The Query guard takes the current guard as its parent, so cancelling ours stops it
+        with guarded(guard):
+            return tool._run(**args)
+
+    def claim(self, op: Dict[str, Any], timeout: Optional[float] = None) -> Tuple[bool, Any]:
+        """
+        (True, result) if an identical operation was started speculatively and succeeded.
+        Call before "data" substitution, with the op exactly as the executor will run it.
+        """
+        key = canonical_operation(op)
+        with self._lock:
+            future, _ = self._futures.pop(key, (None, None))
+        if future is None:
+            return False, None
+        try:
+            result = future.result(timeout=timeout)
+        except Exception as ex:
+            print(f"[WARN][Speculative] speculative {op.get('tool_name')} failed, run it normally: {ex}")
+            return False, None
+        self.stats["hits"] += 1
+        print(f"[DEBUG][Speculative] reuse speculative result of {op.get('tool_name')}")
+        return True, result
+
+    def cancel_all(self):
+        """Drop every unclaimed speculative operation (e.g. validation rewrote it) and interrupt the running ones."""
+        with self._lock:
+            futures = [future for future, _ in self._futures.values()]
+            self._futures.clear()
+        for f in futures:
+            f.cancel()
+        self._guard.cancel()
+        if futures:
+            print(f"[DEBUG][Speculative] discarded {len(futures)} unclaimed speculative operations")
+        self._executor.shutdown(wait=False)
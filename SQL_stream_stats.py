@@ -0,0 +1,165 @@
+# LLM_Test/SQL_stream_stats.py
+
+import math
+import os
+from array import array
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from SQL_columnar import FETCH_CHUNK_ROWS, ColumnarResult, DictColumn
+
+# Counters kept by the approximate (Misra-Gries) mode
+MODE_SKETCH_SIZE = int(os.getenv("SQL_MODE_SKETCH_SIZE", "1024"))
+
+
+def iter_value_chunks(data: Any, column: Optional[str] = None, chunk_rows: int = FETCH_CHUNK_ROWS) -> Iterator[Sequence]:
+    """
+    The values an aggregation tool works on, chunk_rows at a time:
+    - ColumnarResult + column          -> slices of that column buffer
+    - list of dicts + column           -> the column, extracted chunk by chunk
+    - plain list / array               -> slices of it
+    - any other iterable (a stream)    -> its items may be chunks (lists, arrays, ColumnarResult
+                                          batches), row dicts or single values
+    """
+    if isinstance(data, ColumnarResult):
+        if column is None:
+            raise ValueError("'column' is required when data is a columnar result")
+        col = data.column(column)
+        for start in range(0, data.num_rows, chunk_rows):
+            # Dictionary-encoded chunks stay encoded, so the exact mode counts integer codes
+            yield col.slice(start, start + chunk_rows) if isinstance(col, DictColumn) else col[start:start + chunk_rows]
+        return
+    if isinstance(data, (list, tuple, array)):
+        for start in range(0, len(data), chunk_rows):
+            chunk = data[start:start + chunk_rows]
+            if column is not None and chunk and isinstance(chunk[0], dict):
+                chunk = [row.get(column) for row in chunk]
+            yield chunk
+        return
+
+    pending: List[Any] = []
+    for item in data:
+        if isinstance(item, (ColumnarResult, list, tuple, array)):
+            if pending:
+                yield pending
+                pending = []
+            yield from iter_value_chunks(item, column, chunk_rows)
+            continue
+        pending.append(item.get(column) if isinstance(item, dict) else item)
+        if len(pending) >= chunk_rows:
+            yield pending
+            pending = []
+    if pending:
+        yield pending
+
+
+# ---- Averaging: count / mean / stddev in one pass ----
+class RunningStats:
+    """
+    Numerically stable one-pass count, mean and variance. Each chunk is reduced with a
+    two-pass mean / sum of squared deviations and merged into the running state with
+    the parallel form of Welford's update (Chan et al.), so no value is kept.
+    NULLs are skipped, 'HH:MM' strings are parsed as minutes.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add_chunk(self, values: Sequence, parse: Callable = float):
+        if not isinstance(values, array):
+            values = [parse(v) if isinstance(v, str) else v for v in values if v is not None]
+        n = len(values)
+        if not n:
+            return
+        mean = math.fsum(values) / n
+        m2 = math.fsum((v - mean) ** 2 for v in values)
+        self.merge(n, mean, m2)
+
+    def merge(self, n: int, mean: float, m2: float):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    @property
+    def stddev(self) -> float:
+        """Sample standard deviation (n - 1), 0.0 for fewer than two values."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def result(self) -> Dict[str, Any]:
+        return {"count": self.count, "mean": self.mean, "stddev": self.stddev}
+
+
+def running_stats(chunks: Iterable[Sequence], parse: Callable = float) -> RunningStats:
+    stats = RunningStats()
+    for chunk in chunks:
+        stats.add_chunk(chunk, parse)
+    return stats
+
+
+# ---- Mode: exact hash count, or bounded-memory heavy hitters ----
+def exact_mode(chunks: Iterable[Sequence]) -> Tuple[Any, int, int]:
+    """
+    (most common value, its count, number of non-NULL values) over all chunks;
+    NULLs are not counted, ties go to the first seen value.
+    """
+    counts = Counter()
+    for chunk in chunks:
+        if isinstance(chunk, DictColumn):
+            code_counts = chunk.code_counts()
+            counts.update({chunk.values[code]: c for code, c in enumerate(code_counts) if c})
+        else:
+            counts.update(chunk)
+    counts.pop(None, None)
+    if not counts:
+        return None, 0, 0
+    value, count = counts.most_common(1)[0]
+    return value, count, sum(counts.values())
+
+
+class MisraGries:
+    """
+    Misra-Gries heavy-hitters summary with at most `capacity` counters. Every value that
+    occurs more than n / (capacity + 1) times is kept, and each kept count is at most
+    n / (capacity + 1) below the true count. Chunks are counted first and merged into the
+    summary (mergeable summaries), which is the same bound with far fewer decrements.
+    """
+
+    def __init__(self, capacity: int = MODE_SKETCH_SIZE):
+        self.capacity = max(1, capacity)
+        self.counters: Dict[Any, int] = {}
+        self.total = 0
+
+    def add_chunk(self, values: Sequence):
+        chunk_counts = Counter(v for v in values if v is not None)
+        self.total += sum(chunk_counts.values())
+        counters = self.counters
+        for value, c in chunk_counts.items():
+            counters[value] = counters.get(value, 0) + c
+        if len(counters) > self.capacity:
+            # Subtract the (capacity + 1)-th largest count from all and drop what reaches zero
+            cut = sorted(counters.values(), reverse=True)[self.capacity]
+            self.counters = {v: c - cut for v, c in counters.items() if c > cut}
+
+    @property
+    def error_bound(self) -> int:
+        return self.total // (self.capacity + 1)
+
+    def top(self) -> Tuple[Any, int]:
+        """(candidate mode, lower bound of its count); (None, 0) when nothing was counted."""
+        if not self.counters:
+            return None, 0
+        value = max(self.counters, key=self.counters.__getitem__)
+        return value, self.counters[value]
+
+
+def approximate_mode(chunks: Iterable[Sequence], capacity: int = MODE_SKETCH_SIZE) -> Tuple[Any, int, int]:
+    """(candidate mode, count lower bound, error bound) in memory bounded by capacity counters."""
+    sketch = MisraGries(capacity)
+    for chunk in chunks:
+        sketch.add_chunk(chunk)
+    value, count = sketch.top()
+    return value, count, sketch.error_bound
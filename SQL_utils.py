@@ -1,8 +1,11 @@
 # my_project/SQL_main_2.py
 
+import os
+import re
 import sqlite3
 import difflib
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 
 ########################################
 # 1) 全局同义词/大小写/列名映射
@@ -66,6 +69,31 @@ def map_column_name(user_col: str) -> str:
     # 3) 实在找不到，就返回原值
     return user_col
 
+# where 中不参与列名映射的 SQL 关键字（否则 THEN / END 之类会被 difflib 误映射成列名）
+SQL_KEYWORDS = {
+    "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "GLOB", "BETWEEN", "EXISTS",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "AS", "CAST", "COLLATE", "ESCAPE",
+    "TRUE", "FALSE", "SELECT", "FROM", "WHERE", "DISTINCT",
+    "TEXT", "REAL", "INTEGER", "NUMERIC", "BLOB",
+}
+
+_WHERE_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|[A-Za-z_][A-Za-z0-9_]*")
+
+
+def patch_where_columns(where: str) -> str:
+    """对 where 中的标识符逐个做 map_column_name，跳过字符串字面量、关键字和函数名。"""
+    def replace(match):
+        token = match.group(0)
+        if token[0] in "'\"" or token.upper() in SQL_KEYWORDS:
+            return token
+        # 后面紧跟 "(" 的是函数调用，例如 instr(...)、substr(...)
+        if where[match.end():].lstrip().startswith("("):
+            return token
+        return map_column_name(token)
+
+    return _WHERE_TOKEN_RE.sub(replace, where)
+
+
 def patch_query_conditions(conditions: Dict[str, Any]) -> Dict[str, Any]:
     """
     对 conditions 里的 table, fields, where 做进一步替换。
@@ -84,32 +112,11 @@ def patch_query_conditions(conditions: Dict[str, Any]) -> Dict[str, Any]:
             new_fields.append(mapped)
         new_conditions["fields"] = new_fields
 
-    # 2) 修正 where 里的列名（简单做法）
-    # 比如 "where Gender='Female'" -> "where Gender='Female'"
-    # 如果 user 输入 "qualifiedproducts > 10" -> "Qualified_Number > 10"
-    # 这里只做最简单替换：按空格/标点分割拿到词，可能并不完美
+    # 2) 修正 where 里的列名
+    # 比如 "qualifiedproducts >= 10 and gender='Female'" -> "Qualified_Number >= 10 and Gender='Female'"
+    # 只替换标识符：引号内的字面量、SQL 关键字和函数名保持不变，标点也原样保留
     if "where" in new_conditions and isinstance(new_conditions["where"], str):
-        old_where = new_conditions["where"]
-        # 我们简单地对可能的列名进行分词匹配:
-        # 例如 old_where = "qualifiedproducts >= 10 and gender='Female'"
-        # => words = ["qualifiedproducts", ">=", "10", "and", "gender='Female'"]
-        words = old_where.replace("=", " = ").replace(">", " > ").replace("<", " < ") \
-                         .replace("(", " ( ").replace(")", " ) ") \
-                         .split()
-        new_words = []
-        for w in words:
-            # 去掉标点后再映射
-            stripped_w = w.strip("=><()'\"")  # 可能还要更多符号
-            mapped = map_column_name(stripped_w)
-            # 如果 w 原本带有标点，则还要还原
-            # 这里很简略，只要 mapped != stripped_w 就替换，否则不变
-            if mapped != stripped_w:
-                # 这可能不够完善(例如当 w="qualifiedproducts>10" 没有空格)
-                # 实际可以更精细化地处理
-                w = w.replace(stripped_w, mapped)
-            new_words.append(w)
-        new_where = " ".join(new_words)
-        new_conditions["where"] = new_where
+        new_conditions["where"] = patch_where_columns(new_conditions["where"])
 
     return new_conditions
 
@@ -170,6 +177,108 @@ def unify_operations(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return new_ops
 
 
+########################################
+# 5) SQL 表达式辅助
+########################################
+
+# 时间列：库里是 'HH:MM' 文本，导入的新表可能已是整数分钟
+TIME_COLUMNS = ["Start_Time", "End_Time"]
+
+
+def sql_minutes_expr(col: str) -> str:
+    """
+    生成把某列转换成分钟数 (REAL) 的 SQL 表达式，与 parse_time_string 的行为一致：
+    'HH:MM' -> HH*60+MM；否则直接 CAST 成 REAL。
+    col 可以是 "Start_Time" 或带前缀的 "NEW.Start_Time"。
+    """
+    return (
+        f"(CASE WHEN instr(CAST({col} AS TEXT), ':') > 0 "
+        f"THEN CAST(substr({col}, 1, instr({col}, ':') - 1) AS REAL) * 60 "
+        f"+ CAST(substr({col}, instr({col}, ':') + 1) AS REAL) "
+        f"ELSE CAST({col} AS REAL) END)"
+    )
+
+
+def sql_safe_div_expr(numerator: str, denominator: str) -> str:
+    """除数为 0 时返回 0.0，与 DivisionTool 的行为一致。"""
+    return f"(CASE WHEN ({denominator}) = 0 THEN 0.0 ELSE ({numerator}) * 1.0 / ({denominator}) END)"
+
+
+########################################
+# 6) 表结构内省
+########################################
+
+@lru_cache(maxsize=256)
+def _table_columns(db_path: str, table: str, mtime_ns: int) -> Tuple[Tuple[str, str], ...]:
+    # mtime_ns 只作为缓存键的一部分：文件变化后会重新读取
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return ()
+    return tuple((r[1], (r[2] or "").upper()) for r in rows)
+
+
+def table_columns(db_path: str, table: str) -> List[Tuple[str, str]]:
+    """
+    读取表的 (列名, 声明类型) 列表，按文件 mtime 缓存。
+    文件不存在、表不存在或 table/db_path 含通配符时返回 []。
+    """
+    if not db_path or not table or "*" in db_path or "*" in table or not os.path.exists(db_path):
+        return []
+    return list(_table_columns(db_path, table, os.stat(db_path).st_mtime_ns))
+
+
+# where 里带引号的 'HH:MM' / 'H:MM' 字面量
+_HHMM_LITERAL = r"'(?:[01]?\d|2[0-3]):[0-5]\d'"
+_TIME_COLUMN = r'\b(?:\w+\.)?"?(?:' + "|".join(TIME_COLUMNS) + r')"?'
+_COMPARISON = r"(?:==|=|!=|<>|<=|>=|<|>)"
+# 只匹配和时间列比较的字面量：列 op 'HH:MM'、'HH:MM' op 列、列 BETWEEN 'HH:MM' AND 'HH:MM'
+_TIME_COMPARISON_RES = [
+    re.compile(r"(" + _TIME_COLUMN + r"\s*" + _COMPARISON + r"\s*)(" + _HHMM_LITERAL + r")()", re.IGNORECASE),
+    re.compile(r"()(" + _HHMM_LITERAL + r")(\s*" + _COMPARISON + r"\s*" + _TIME_COLUMN + r")", re.IGNORECASE),
+    re.compile(r"(" + _TIME_COLUMN + r"\s+(?:NOT\s+)?BETWEEN\s+)(" + _HHMM_LITERAL + r")(\s+AND\s+)(" + _HHMM_LITERAL + r")",
+               re.IGNORECASE),
+]
+
+
+def time_columns_are_minutes(db_path: str, table: str) -> bool:
+    """时间列声明为数值类型（SQL_ingest.py 默认按整数分钟导入）时返回 True。"""
+    decls = {name: decl for name, decl in table_columns(db_path, table)}
+    return any(any(t in decls.get(col, "") for t in ("INT", "REAL", "NUM")) for col in TIME_COLUMNS)
+
+
+def _literal_minutes(literal: str) -> str:
+    hours, minutes = literal.strip("'").split(":")
+    return str(int(hours) * 60 + int(minutes))
+
+
+def where_times_as_minutes(where: str) -> str:
+    """
+    把 where 中和时间列比较的 'HH:MM' 字面量换成分钟数，例如 "Start_Time < '09:00'" -> "Start_Time < 540"。
+    时间列是整数分钟的表才需要：SQLite 里整数和文本比较时整数总是更小，结果会全错。
+    和其它列比较的字面量（例如 Name = '10:30'）保持原样。
+    """
+    for pattern in _TIME_COMPARISON_RES:
+        where = pattern.sub(
+            lambda m: "".join(_literal_minutes(g) if g.startswith("'") else g for g in m.groups()), where
+        )
+    return where
+
+
+def where_for_table(db_path: str, table: str, where: Optional[str]) -> Optional[str]:
+    """
+    按某一张表的时间列类型调整 where：整数分钟的表换成分钟数，'HH:MM' 文本的表保持原样。
+    通配查询要对展开后的每个数据源分别调用，同一批表里两种格式可能并存。
+    """
+    if where and time_columns_are_minutes(db_path, table):
+        return where_times_as_minutes(where)
+    return where
+
+
 
 
 
@@ -0,0 +1,241 @@
+# LLM_Test/tests/conftest.py
+
+import json
+import os
+import random
+import sqlite3
+import sys
+import types
+
+import pytest
+
+# The modules live at the repository root, next to SQL_main_2_3.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# SQL_main_2_3 answers parse requests locally (SQL_fake_llm.py) and needs no API key
+os.environ.setdefault("SQL_FAKE_LLM", "1")
+os.environ.setdefault("SQL_FAKE_LLM_LATENCY_MS", "0")
+
+
+def _stub_module(name: str, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def _install_langchain_stubs():
+    """
+    Minimal stand-ins for the langchain / langgraph / dotenv APIs the tools and the graph use,
+    installed only when the real packages are not importable, so the real tools/SQL_tools_2_2.py
+    and SQL_main_2_3.py are tested.
+    """
+    try:
+        import langchain.tools  # noqa: F401
+        import langchain_core  # noqa: F401
+        import langgraph  # noqa: F401
+        import dotenv  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    class BaseTool:
+        name: str = ""
+        description: str = ""
+
+    class BaseMessage:
+        type = "base"
+
+        def __init__(self, content: str = "", **kwargs):
+            self.content = content
+            self.__dict__.update(kwargs)
+
+        def __repr__(self):
+            return f"{type(self).__name__}(content={self.content!r})"
+
+    messages = {cls_name: type(cls_name, (BaseMessage,), {"type": kind}) for cls_name, kind in
+                [("HumanMessage", "human"), ("AIMessage", "ai"), ("SystemMessage", "system"), ("FunctionMessage", "function")]}
+
+    class Runnable:
+        def invoke(self, value):
+            raise NotImplementedError
+
+        def stream(self, value):
+            yield self.invoke(value)
+
+        def __or__(self, other):
+            return RunnableSequence(self, other)
+
+    class RunnableSequence(Runnable):
+        def __init__(self, first, last):
+            self.first, self.last = first, last
+
+        def invoke(self, value):
+            return self.last.invoke(self.first.invoke(value))
+
+        def stream(self, value):
+            yield from self.last.stream(self.first.invoke(value))
+
+    class RunnableLambda(Runnable):
+        def __init__(self, func, name=None):
+            self.func, self.name = func, name
+
+        def invoke(self, value):
+            return self.func(value)
+
+    class PromptValue:
+        def __init__(self, text):
+            self.text = text
+
+        def to_string(self):
+            return self.text
+
+    class ChatPromptTemplate(Runnable):
+        def __init__(self, template):
+            self.template = template
+
+        @classmethod
+        def from_messages(cls, message_templates):
+            return cls("\n".join(text for _, text in message_templates))
+
+        def invoke(self, values):
+            return PromptValue(self.template.format(**values))
+
+    class ChatOpenAI(Runnable):
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def bind_tools(self, tools):
+            return self
+
+    class JsonOutputParser:
+        def parse(self, text):
+            return json.loads(text)
+
+    class CompiledGraph:
+        def __init__(self, graph):
+            self.graph = graph
+
+        def invoke(self, state):
+            state = dict(state)
+            node = self.graph.entry
+            while node != END:
+                update = self.graph.nodes[node](state) or {}
+                for key, value in update.items():
+                    # The list fields of the agent state are Annotated[..., operator.add]
+                    state[key] = state[key] + list(value) if isinstance(state.get(key), list) else value
+                if node in self.graph.conditional:
+                    condition, targets = self.graph.conditional[node]
+                    node = targets[condition(state)]
+                else:
+                    node = self.graph.edges.get(node, END)
+            return state
+
+    class StateGraph:
+        def __init__(self, schema):
+            self.schema = schema
+            self.nodes, self.edges, self.conditional, self.entry = {}, {}, {}, None
+
+        def add_node(self, name, func):
+            self.nodes[name] = func
+
+        def add_edge(self, source, target):
+            self.edges[source] = target
+
+        def add_conditional_edges(self, source, condition, targets):
+            self.conditional[source] = (condition, targets)
+
+        def set_entry_point(self, name):
+            self.entry = name
+
+        def compile(self):
+            return CompiledGraph(self)
+
+    END = "__end__"
+
+    _stub_module("langchain")
+    _stub_module("langchain.tools", BaseTool=BaseTool)
+    _stub_module("langchain_core")
+    _stub_module("langchain_core.messages", BaseMessage=BaseMessage, **messages)
+    _stub_module("langchain_core.runnables", Runnable=Runnable, RunnableLambda=RunnableLambda)
+    _stub_module("langchain_core.prompts", ChatPromptTemplate=ChatPromptTemplate)
+    _stub_module("langchain_core.output_parsers", JsonOutputParser=JsonOutputParser)
+    _stub_module("langchain_core.utils")
+    _stub_module("langchain_core.utils.function_calling",
+                 convert_to_openai_function=lambda tool: {"name": tool.name, "description": tool.description})
+    _stub_module("langchain_openai", ChatOpenAI=ChatOpenAI)
+    _stub_module("langgraph")
+    _stub_module("langgraph.graph", StateGraph=StateGraph, END=END)
+    _stub_module("langgraph.prebuilt", ToolNode=lambda tools: list(tools),
+                 ToolInvocation=lambda **kwargs: types.SimpleNamespace(**kwargs))
+    _stub_module("dotenv", load_dotenv=lambda *args, **kwargs: False)
+
+
+_install_langchain_stubs()
+
+WORKERS_TABLE = "Workers_20012025"
+WORKERS_COLUMNS = ["ID", "Name", "Gender", "Start_Time", "End_Time", "Plan_Number", "Real_Number", "Qualified_Number", "Others"]
+
+
+def make_workers(n_rows: int, seed: int = 7):
+    """Worker rows as in Dataset/test_dataset.db: 'HH:MM' times, a few NULL Qualified_Number."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_rows):
+        start = rng.randrange(6 * 60, 10 * 60)
+        end = start + rng.randrange(4 * 60, 10 * 60)
+        plan = rng.randrange(20, 120)
+        real = rng.randrange(0, plan + 20)
+        qualified = None if i % 17 == 5 else rng.randrange(0, real + 1)
+        rows.append((10000 + i, f"Worker{i % 40}", rng.choice(["Female", "Male"]),
+                     f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}",
+                     plan, real, qualified, None))
+    return rows
+
+
+def create_workers_db(path: str, rows, table: str = WORKERS_TABLE) -> str:
+    conn = sqlite3.connect(path)
+    conn.execute(
+        f'CREATE TABLE "{table}" ("ID" INTEGER, "Name" TEXT, "Gender" INTEGER, "Start_Time" TEXT, "End_Time" TEXT, '
+        f'"Plan_Number" INTEGER, "Real_Number" INTEGER, "Qualified_Number" INTEGER, "Others" TEXT)'
+    )
+    conn.executemany(f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(WORKERS_COLUMNS))})', rows)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def fetch_rows(db_path: str, sql: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(sql)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+from tools.SQL_tools_2_2 import parse_time_string  # noqa: E402
+
+
+@pytest.fixture
+def workers_db(tmp_path):
+    return create_workers_db(str(tmp_path / "Workers.db"), make_workers(200))
+
+
+def run_executor(operations, **state):
+    """Run operations through SQL_main_2_3.single_executor_node; returns the final state."""
+    import SQL_main_2_3
+    state = dict({"messages": [], "pending_operations": list(operations), "results": []}, **state)
+    SQL_main_2_3.single_executor_node(state)
+    return state
+
+
+def run_request(text, **state):
+    """Run a request through the compiled graph of SQL_main_2_3; returns the final state."""
+    import SQL_main_2_3
+    init_state = dict({"messages": [SQL_main_2_3.HumanMessage(content=text)], "pending_operations": [], "results": []}, **state)
+    return SQL_main_2_3.app.invoke(init_state)
@@ -0,0 +1,172 @@
+# LLM_Test/tests/test_columnar.py
+
+from array import array
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows, run_executor
+from SQL_columnar import ColumnarResult, DictColumn, column_values, typed_column
+from tools.SQL_tools_2_2 import SQLQueryTool
+
+FIELDS = ["ID", "Name", "Gender", "Start_Time", "Real_Number", "Qualified_Number"]
+
+
+def _query(db_path, **conditions):
+    return SQLQueryTool()._run(db_path, dict({"table": WORKERS_TABLE, "fields": FIELDS, "order_by": "ID"}, **conditions))
+
+
+@pytest.fixture
+def columnar(workers_db):
+    return _query(workers_db, format="columnar")
+
+
+# ---- column packing ----
+@pytest.mark.parametrize("values, kind", [
+    ([1, 2, 3], "q"),
+    ([1, 2.5], "d"),
+    ([1, None], list),                        # NULL keeps a numeric column a list
+    (["a", "b", "a", "a"], DictColumn),
+    (["a", "b", "c"], list),                  # too many distinct values to be worth a dictionary
+    (["a", 1, "a", "a"], list),
+])
+def test_typed_column(values, kind):
+    col = typed_column(values)
+    if kind in ("q", "d"):
+        assert isinstance(col, array) and col.typecode == kind
+    else:
+        assert isinstance(col, kind)
+    assert list(col) == values
+
+
+# ---- Query results ----
+def test_columnar_query_matches_row_query(workers_db, columnar):
+    rows = _query(workers_db)
+    assert isinstance(columnar, ColumnarResult) and len(columnar) == len(rows) == 200
+    assert columnar.to_rows() == rows
+    assert columnar[10:13] == rows[10:13]
+    assert isinstance(columnar.column("ID"), array)
+    assert isinstance(columnar.column("Gender"), DictColumn)
+    # Qualified_Number has NULLs
+    assert isinstance(columnar.column("Qualified_Number"), list)
+    with pytest.raises(KeyError, match="available columns"):
+        columnar.column("Work_Time")
+
+
+def test_column_buffer_is_zero_copy(columnar):
+    view = columnar.column_buffer("Real_Number")
+    assert view.format == "q" and len(view) == 200
+    columnar.column("Real_Number")[0] = -1
+    assert view[0] == -1
+    view.release()
+    assert columnar.column_buffer("Name") is None
+
+
+def test_take_and_batches(columnar):
+    rows = columnar.to_rows()
+    picked = columnar.take([5, 0, 5])
+    assert picked.to_rows() == [rows[5], rows[0], rows[5]]
+    assert isinstance(picked.column("ID"), array) and isinstance(picked.column("Gender"), DictColumn)
+    batches = list(columnar.iter_batches(64))
+    assert [len(b) for b in batches] == [64, 64, 64, 8]
+    assert [r for b in batches for r in b.to_rows()] == rows
+
+
+def test_column_values(columnar):
+    rows = columnar.to_rows()
+    assert column_values(columnar, "ID") is columnar.column("ID")
+    assert column_values(rows, "ID") == [r["ID"] for r in rows]
+    assert column_values([1, 2], None) == [1, 2]
+    with pytest.raises(ValueError):
+        column_values(columnar, None)
+
+
+def test_executor_converts_for_row_tools(workers_db):
+    query = {"tool_name": "Query", "args": {"db_path": workers_db, "conditions": {
+        "table": WORKERS_TABLE, "fields": ["ID", "Real_Number", "Plan_Number"], "format": "columnar"}}}
+    subtract = {"tool_name": "Subtraction", "args": {"data": "$result_of_previous_tool",
+                                                     "number_columns": ["Real_Number", "Plan_Number"], "output_column": "Gap"}}
+    state = run_executor([query, subtract])
+    assert isinstance(state["results"][0]["Query"], ColumnarResult)
+    gaps = [r["Gap"] for r in state["results"][1]["Subtraction"]]
+    expected = fetch_rows(workers_db, f'SELECT Real_Number - Plan_Number AS g FROM "{WORKERS_TABLE}"')
+    assert gaps == [r["g"] for r in expected]
+
+
+# ---- Arrow export ----
+def test_to_arrow(columnar):
+    pa = pytest.importorskip("pyarrow")
+    batch = columnar.to_arrow()
+    assert batch.num_rows == 200 and batch.schema.names == FIELDS
+    assert batch.schema.field("ID").type == pa.int64()
+    assert pa.types.is_dictionary(batch.schema.field("Gender").type)
+    assert batch.to_pylist() == columnar.to_rows()
+
+
+def test_to_arrow_without_pyarrow(columnar):
+    try:
+        import pyarrow  # noqa: F401
+        pytest.skip("pyarrow is installed")
+    except ImportError:
+        pass
+    with pytest.raises(ImportError, match="pip install pyarrow"):
+        columnar.to_arrow()
+
+
+# ---- dictionary encoding ----
+def test_dict_column_encoding():
+    col = DictColumn.encode(["Male", None, "Female", "Male"])
+    assert list(col.codes) == [0, -1, 1, 0] and col.values == ["Male", "Female"]
+    assert col[1] is None and col[3] == "Male" and col[1:3] == [None, "Female"]
+    assert list(col) == ["Male", None, "Female", "Male"]
+    assert col.code_of("Female") == 1 and col.code_of("Other") is None
+    assert list(col.take([2, 2, 1])) == ["Female", "Female", None]
+    assert list(col.slice(1, 3)) == [None, "Female"]
+
+
+def test_dict_column_concat_recodes():
+    merged = DictColumn.concat([DictColumn.encode(["a", "b", "a"]), DictColumn.encode([None, "c", "a"])])
+    assert list(merged) == ["a", "b", "a", None, "c", "a"]
+    assert merged.values == ["a", "b", "c"]
+
+
+def test_dict_column_counts_and_mode():
+    col = DictColumn.encode(["x", "y", None, "y", "z", "y"])
+    assert col.code_counts() == [1, 3, 1]
+    assert col.value_counts() == {"x": 1, "y": 3, "z": 1}
+    assert col.mode() == ("y", 3)
+    assert DictColumn.encode([None, None]).mode() == (None, 0)
+
+
+def test_mode_tool_on_codes_matches_rows(columnar):
+    from collections import Counter
+    from tools.SQL_tools_2_2 import ModeTool
+    counts = Counter(r["Gender"] for r in columnar.to_rows())
+    value = ModeTool()._run(data=columnar, column="Gender")
+    assert counts[value] == max(counts.values())
+    assert columnar.value_counts("Gender") == dict(counts)
+
+
+@pytest.mark.parametrize("predicate", [
+    "Gender = 'Female'",
+    "Name == 'Worker1' or Name = 'Worker3' or 'Worker7' == Name",
+    "Gender = 'Unknown'",
+])
+def test_filter_compares_dictionary_codes(columnar, monkeypatch, predicate):
+    from tools.SQL_tools_2_2 import FilterTool
+    expected = FilterTool()._run(data=columnar.to_rows(), predicate=predicate)
+
+    def no_decoding(*args):
+        raise AssertionError("dictionary column decoded")
+    monkeypatch.setattr(DictColumn, "__getitem__", no_decoding)
+    monkeypatch.setattr(DictColumn, "__iter__", no_decoding)
+    result = FilterTool()._run(data=columnar, predicate=predicate)
+    monkeypatch.undo()
+    assert isinstance(result, ColumnarResult)
+    assert result.to_rows() == expected
+
+
+def test_filter_in_on_plain_columns(columnar):
+    rows = columnar.to_rows()
+    assert columnar.filter_in("ID", [10003, 10001]).to_rows() == [rows[1], rows[3]]
+    # NULL never matches, as in SQL
+    assert columnar.filter_in("Qualified_Number", [None]).to_rows() == []
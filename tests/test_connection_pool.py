@@ -0,0 +1,85 @@
+# LLM_Test/tests/test_connection_pool.py
+
+import sqlite3
+
+import pytest
+
+import SQL_connection_pool
+from conftest import WORKERS_TABLE
+from SQL_connection_pool import ConnectionPool, resolve_profile
+
+
+def _header_versions(path):
+    # Bytes 18 / 19 of the file header: 1 = rollback journal, 2 = WAL
+    with open(path, "rb") as f:
+        return tuple(f.read(20)[18:20])
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(size_per_db=2)
+    yield pool
+    pool.close_all()
+
+
+@pytest.mark.parametrize("profile", ["default", "read_optimized", "archive"])
+def test_profiles_read_without_touching_the_file(workers_db, pool, profile):
+    before = _header_versions(workers_db)
+    with pool.connection(workers_db, profile) as conn:
+        assert conn.execute(f'SELECT COUNT(*) FROM "{WORKERS_TABLE}"').fetchone() == (200,)
+    pool.close_all()
+    assert before == (1, 1)
+    assert _header_versions(workers_db) == before
+
+
+@pytest.mark.parametrize("profile", ["read_optimized", "archive"])
+def test_read_profiles_cannot_write(workers_db, pool, profile):
+    with pool.connection(workers_db, profile) as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute(f'DELETE FROM "{WORKERS_TABLE}"')
+
+
+def test_read_optimized_pragmas(workers_db, pool):
+    with pool.connection(workers_db, "read_optimized") as conn:
+        assert conn.execute("PRAGMA query_only").fetchone() == (1,)
+        assert conn.execute("PRAGMA temp_store").fetchone() == (2,)
+        assert conn.execute("PRAGMA cache_size").fetchone() == (-64 * 1024,)
+
+
+def test_journal_mode_only_on_write_profiles(workers_db, pool, monkeypatch):
+    monkeypatch.setitem(SQL_connection_pool.ACCESS_PROFILES, "bulk_write", {"journal_mode": "WAL"})
+    monkeypatch.setitem(SQL_connection_pool.ACCESS_PROFILES, "wal_reader", {"journal_mode": "WAL", "query_only": True})
+    with pool.connection(workers_db, "wal_reader") as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    with pool.connection(workers_db, "bulk_write") as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    pool.close_all()
+    assert _header_versions(workers_db) == (2, 2)
+
+
+def test_connections_are_reused_and_broken_ones_dropped(workers_db, pool):
+    with pool.connection(workers_db, "default") as first:
+        pass
+    with pool.connection(workers_db, "default") as again:
+        assert again is first
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection(workers_db, "default") as conn:
+            conn.execute("SELECT * FROM missing_table")
+    with pool.connection(workers_db, "default") as fresh:
+        assert fresh is not first
+
+
+def test_open_transactions_are_rolled_back_on_release(workers_db, pool):
+    with pool.connection(workers_db, "default") as conn:
+        conn.execute(f'DELETE FROM "{WORKERS_TABLE}"')
+        assert conn.in_transaction
+    with pool.connection(workers_db, "default") as conn:
+        assert conn.execute(f'SELECT COUNT(*) FROM "{WORKERS_TABLE}"').fetchone() == (200,)
+
+
+def test_archive_patterns(monkeypatch):
+    monkeypatch.setattr(SQL_connection_pool, "ARCHIVE_PATTERNS", ["*/archive/*.db"])
+    assert resolve_profile("E:/Dataset/archive/Workers_20012025.db") == "archive"
+    assert resolve_profile("E:/Dataset/today.db") == SQL_connection_pool.DEFAULT_PROFILE
+    assert resolve_profile(":memory:") == SQL_connection_pool.DEFAULT_PROFILE
+    assert resolve_profile("E:/Dataset/archive/x.db", "default") == "default"
@@ -0,0 +1,149 @@
+# LLM_Test/tests/test_expression.py
+
+import sqlite3
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows, parse_time_string
+from SQL_expression import (
+    BASE_SCHEMA,
+    ExpressionError,
+    compile_expression,
+    expression_columns,
+    parse_expression,
+    push_expressions_into_query,
+    schema_from_rows,
+    to_sql,
+    type_check,
+)
+from SQL_query_builder import build_select_sql
+
+EXPRESSIONS = [
+    "Real_Number - Plan_Number",
+    "(Real_Number - Plan_Number) / (End_Time - Start_Time)",
+    "-Real_Number * 2 + 0.5",
+    "Real_Number / (Plan_Number - Plan_Number)",
+    "(End_Time - Start_Time) / 60",
+]
+
+
+def _plan(db_path, expression, output_column="Value"):
+    return [
+        {"tool_name": "Query", "args": {"db_path": db_path, "conditions": {
+            "table": WORKERS_TABLE, "fields": ["ID", "Real_Number", "Plan_Number", "Start_Time", "End_Time"]}}},
+        {"tool_name": "Expression", "args": {"data": "$result_of_previous_tool",
+                                             "expression": expression, "output_column": output_column}},
+    ]
+
+
+# ---- parsing and type checking ----
+def test_parse_expression_columns():
+    node = parse_expression("(Real_Number - Plan_Number) / Work_Time")
+    assert expression_columns(node) == {"Real_Number", "Plan_Number", "Work_Time"}
+    assert parse_expression("Real_Number * 2") is parse_expression("Real_Number * 2")
+
+
+@pytest.mark.parametrize("text", [
+    "Real_Number **",
+    "Real_Number ** 2",
+    "Real_Number % 3",
+    "abs(Real_Number)",
+    "Gender == 'Female'",
+    "Real_Number if Plan_Number else 0",
+    "True + Real_Number",
+    "row['ID']",
+])
+def test_parse_expression_rejects(text):
+    with pytest.raises(ExpressionError):
+        parse_expression(text)
+
+
+def test_type_check():
+    type_check(parse_expression("End_Time - Start_Time + Plan_Number"), BASE_SCHEMA)
+    with pytest.raises(ExpressionError, match="Unknown column 'Work_Time'"):
+        type_check(parse_expression("Work_Time * 2"), BASE_SCHEMA)
+    with pytest.raises(ExpressionError, match="text"):
+        type_check(parse_expression("Name + 1"), BASE_SCHEMA)
+
+
+def test_schema_from_rows():
+    schema = schema_from_rows([{"Name": "a", "Work_Time": 480.0, "Label": "x", "Shift_Start": "08:00"}])
+    assert schema == {"Name": "text", "Work_Time": "number", "Label": "text", "Shift_Start": "number"}
+    assert schema_from_rows([]) == {}
+
+
+# ---- Python evaluation ----
+def test_compile_expression_writes_the_column():
+    rows = [{"Real_Number": 30, "Plan_Number": 20, "Start_Time": "08:00", "End_Time": "18:00"},
+            {"Real_Number": 5, "Plan_Number": 10, "Start_Time": "09:30", "End_Time": "10:00"}]
+    fn = compile_expression("(Real_Number - Plan_Number) / (End_Time - Start_Time)", "Speed")
+    assert fn(rows, parse_time_string) is rows
+    assert [r["Speed"] for r in rows] == pytest.approx([10 / 600, -5 / 30])
+
+
+def test_division_by_zero_gives_zero():
+    rows = [{"Real_Number": 7, "Plan_Number": 0}]
+    compile_expression("Real_Number / Plan_Number", "Ratio")(rows, float)
+    assert rows[0]["Ratio"] == 0.0
+
+
+def test_null_operand_gives_null():
+    rows = [{"Qualified_Number": None, "Work_Time": 60}, {"Qualified_Number": 30, "Work_Time": None},
+            {"Qualified_Number": 30, "Work_Time": 60}]
+    compile_expression("Qualified_Number / Work_Time * 2", "KPI")(rows, parse_time_string)
+    assert [r["KPI"] for r in rows] == [None, None, 1.0]
+
+
+# ---- SQL translation ----
+def test_to_sql_converts_times_and_guards_division():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (Real_Number INTEGER, Plan_Number INTEGER, Start_Time TEXT, End_Time TEXT)")
+    conn.execute("INSERT INTO t VALUES (30, 0, '08:15', '17:45')")
+    select = lambda text: conn.execute(f"SELECT {to_sql(parse_expression(text))} FROM t").fetchone()[0]
+    assert select("End_Time - Start_Time") == 570.0
+    assert select("Real_Number / Plan_Number") == 0.0
+    # Integer columns still divide as REAL
+    assert select("Real_Number / 4") == 7.5
+    conn.close()
+
+
+@pytest.mark.parametrize("expression", EXPRESSIONS)
+def test_sql_pushdown_agrees_with_python(workers_db, expression):
+    ops = _plan(workers_db, expression)
+    python_rows = fetch_rows(workers_db, build_select_sql(ops[0]["args"]["conditions"]))
+    compile_expression(expression, "Value")(python_rows, parse_time_string)
+
+    pushed = push_expressions_into_query(_plan(workers_db, expression))
+    assert [op["tool_name"] for op in pushed] == ["Query"]
+    assert pushed[0]["args"]["conditions"]["expressions"] == {"Value": expression}
+    sql_rows = fetch_rows(workers_db, build_select_sql(pushed[0]["args"]["conditions"]))
+
+    assert len(sql_rows) == len(python_rows) == 200
+    expected = {r["ID"]: r["Value"] for r in python_rows}
+    for row in sql_rows:
+        assert row["Value"] == pytest.approx(expected[row["ID"]]), row["ID"]
+
+
+def test_null_agrees_between_sql_and_python(workers_db):
+    expression = "Qualified_Number / (End_Time - Start_Time)"
+    ops = _plan(workers_db, expression)
+    ops[0]["args"]["conditions"]["fields"].append("Qualified_Number")
+    python_rows = fetch_rows(workers_db, build_select_sql(ops[0]["args"]["conditions"]))
+    compile_expression(expression, "Value")(python_rows, parse_time_string)
+
+    pushed = push_expressions_into_query(ops)
+    sql_rows = fetch_rows(workers_db, build_select_sql(pushed[0]["args"]["conditions"]))
+    nulls = [r["ID"] for r in sql_rows if r["Value"] is None]
+    assert nulls and nulls == [r["ID"] for r in python_rows if r["Value"] is None]
+    assert nulls == [r["ID"] for r in python_rows if r["Qualified_Number"] is None]
+
+
+@pytest.mark.parametrize("expression, output_column", [
+    ("Real_Number - Work_Time", "Value"),     # Work_Time is computed later, not a base column
+    ("Name * 2", "Value"),                    # text column
+    ("Real_Number * 2", "Bad Name"),          # not usable as a SQL alias
+])
+def test_expression_stays_in_python(workers_db, expression, output_column):
+    pushed = push_expressions_into_query(_plan(workers_db, expression, output_column))
+    assert [op["tool_name"] for op in pushed] == ["Query", "Expression"]
+    assert "expressions" not in pushed[0]["args"]["conditions"]
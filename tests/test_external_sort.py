@@ -0,0 +1,116 @@
+# LLM_Test/tests/test_external_sort.py
+
+import os
+import random
+
+import pytest
+
+import SQL_external_sort
+from SQL_external_sort import external_sort, sort_run, sort_spec
+
+
+def _rows(n, seed=1, null_every=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        value = None if null_every and i % null_every == 0 else rng.randrange(20)
+        rows.append({"seq": i, "Gender": rng.choice(["Female", "Male"]), "Real_Number": value})
+    return rows
+
+
+def _expected(rows, spec):
+    """Reference order: SQLite puts NULLs first ascending and last descending; ties keep input order."""
+    out = list(rows)
+    for column, descending in reversed(spec):
+        out.sort(key=lambda r: (r[column] is not None, r[column]), reverse=descending)
+    return out
+
+
+def _run_files(tmp_path):
+    return [name for name in os.listdir(tmp_path) if name.startswith("sql_sort_")]
+
+
+def test_sort_spec_forms():
+    assert sort_spec("Qualified_KPI") == [("Qualified_KPI", False)]
+    assert sort_spec(["Gender", "Real_Number"], True) == [("Gender", True), ("Real_Number", True)]
+    assert sort_spec(["Gender", "Real_Number"], [False, True]) == [("Gender", False), ("Real_Number", True)]
+    with pytest.raises(ValueError):
+        sort_spec(["Gender", "Real_Number"], [True])
+    with pytest.raises(ValueError):
+        sort_spec([])
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_null_keys_follow_sqlite_order(tmp_path, descending):
+    rows = _rows(300, null_every=7)
+    spec = [("Real_Number", descending)]
+    result = list(external_sort(rows, spec, memory_rows=32, tmp_dir=str(tmp_path)))
+    assert result == _expected(rows, spec)
+    values = [r["Real_Number"] for r in result]
+    if descending:
+        assert values[-1] is None and values[0] is not None
+    else:
+        assert values[0] is None and values[-1] is not None
+
+
+def test_mixed_directions(tmp_path):
+    rows = _rows(500, null_every=11)
+    spec = sort_spec(["Gender", "Real_Number"], [False, True])
+    result = list(external_sort(rows, spec, memory_rows=40, tmp_dir=str(tmp_path)))
+    assert result == _expected(rows, spec)
+
+
+def test_tied_keys_keep_input_order(tmp_path):
+    rows = [{"seq": i, "Real_Number": i % 3} for i in range(200)]
+    for descending in (False, True):
+        result = list(external_sort(rows, [("Real_Number", descending)], memory_rows=16, tmp_dir=str(tmp_path)))
+        for key in range(3):
+            seqs = [r["seq"] for r in result if r["Real_Number"] == key]
+            assert seqs == sorted(seqs)
+
+
+def test_multi_pass_merge_removes_run_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQL_external_sort, "MAX_MERGE_FANIN", 3)
+    rows = _rows(1000, seed=3, null_every=13)
+    spec = sort_spec(["Real_Number", "Gender"], [True, False])
+    stream = external_sort(rows, spec, memory_rows=25, tmp_dir=str(tmp_path))
+    first = next(stream)
+    # 40 runs merged 3 at a time: the intermediate passes have already been written
+    assert _run_files(tmp_path)
+    result = [first] + list(stream)
+    assert result == _expected(rows, spec)
+    assert _run_files(tmp_path) == []
+
+
+def test_input_that_fits_in_memory_is_not_spilled(tmp_path):
+    rows = _rows(50)
+    result = list(external_sort(rows, [("Real_Number", False)], memory_rows=50, tmp_dir=str(tmp_path)))
+    assert result == _expected(rows, [("Real_Number", False)])
+    assert _run_files(tmp_path) == []
+
+
+def test_empty_input(tmp_path):
+    assert list(external_sort([], [("Real_Number", False)], memory_rows=4, tmp_dir=str(tmp_path))) == []
+    assert list(external_sort(iter([]), [("Real_Number", True)], tmp_dir=str(tmp_path))) == []
+    assert sort_run([], [("Real_Number", False)]) == []
+
+
+def test_single_row_per_run(tmp_path):
+    rows = _rows(9, null_every=4)
+    spec = [("Real_Number", False)]
+    assert list(external_sort(rows, spec, memory_rows=1, tmp_dir=str(tmp_path))) == _expected(rows, spec)
+
+
+def test_sorting_tool_leaves_the_input_list_alone(tmp_path, monkeypatch):
+    from tools.SQL_tools_2_2 import SQLSortingTool
+    monkeypatch.setattr(SQL_external_sort.tempfile, "tempdir", str(tmp_path))
+    rows = _rows(60, null_every=7)
+    before = list(rows)
+    spec = [("Gender", False), ("Real_Number", True)]
+    out = SQLSortingTool()._run(data=rows, field_index=["Gender", "Real_Number"], reverse=[False, True], memory_rows=8)
+    assert out == _expected(rows, spec) and out is not rows
+    assert rows == before
+    # A row stream is sorted in spilled runs
+    assert SQLSortingTool()._run(data=iter(rows), field_index=["Gender", "Real_Number"], reverse=[False, True],
+                                 memory_rows=8) == _expected(rows, spec)
+    assert _run_files(tmp_path) == []
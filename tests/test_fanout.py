@@ -0,0 +1,148 @@
+# LLM_Test/tests/test_fanout.py
+
+import csv
+import sqlite3
+
+import pytest
+
+from conftest import WORKERS_COLUMNS, WORKERS_TABLE, create_workers_db, make_workers
+from SQL_ingest import ingest
+from SQL_connection_pool import get_connection_pool
+from SQL_fanout import SOURCE_COLUMN, expand_sources, iter_fanout, union_all_query
+from SQL_query_guard import QueryAborted, QueryGuard, guarded
+
+
+def _canonical(rows):
+    return sorted(repr(sorted(row.items())) for row in rows)
+
+
+@pytest.fixture
+def february(tmp_path):
+    """Two files with two daily sheets each, plus tables a table glob must skip."""
+    for week, seed in (("w1", 1), ("w2", 3)):
+        path = str(tmp_path / f"{week}.db")
+        for day in range(2):
+            create_workers_db(path, make_workers(40, seed=seed + day), table=f"Sheet_{week}_{day}_02_2025")
+        with sqlite3.connect(path) as conn:
+            conn.execute(f'CREATE TABLE "Sheet_{week}_0_02_2025_KPI" (src_rowid INTEGER)')
+            conn.execute('CREATE TABLE "_kpi_watermarks" (source_table TEXT, max_rowid INTEGER)')
+            # Real_Number NULL in a few rows of every sheet
+            for day in range(2):
+                conn.execute(f'UPDATE "Sheet_{week}_{day}_02_2025" SET Real_Number = NULL WHERE ID % 9 = 0')
+    return str(tmp_path / "*.db"), "Sheet_*_02_2025"
+
+
+def test_expand_sources_skips_internal_tables(february):
+    db_glob, table_glob = february
+    sources = expand_sources(db_glob, table_glob)
+    assert [table for _, table in sources] == ["Sheet_w1_0_02_2025", "Sheet_w1_1_02_2025",
+                                               "Sheet_w2_0_02_2025", "Sheet_w2_1_02_2025"]
+
+
+def test_fanout_agrees_with_union_all(february):
+    db_glob, table_glob = february
+    conditions = {"table": table_glob, "fields": ["ID", "Name", "Real_Number"], "where": "Gender = 'Female'"}
+    fanned = list(iter_fanout(db_glob, conditions, max_workers=3))
+    assert fanned and _canonical(fanned) == _canonical(union_all_query(db_glob, conditions))
+    assert {r[SOURCE_COLUMN] for r in fanned} == {"w1.db:Sheet_w1_0_02_2025", "w1.db:Sheet_w1_1_02_2025",
+                                                 "w2.db:Sheet_w2_0_02_2025", "w2.db:Sheet_w2_1_02_2025"}
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_ordered_merge_with_nulls(february, reverse):
+    db_glob, table_glob = february
+    conditions = {"table": table_glob, "fields": ["ID", "Real_Number"], "order_by": "Real_Number", "reverse": reverse}
+    merged = [r["Real_Number"] for r in iter_fanout(db_glob, conditions)]
+    union = [r["Real_Number"] for r in union_all_query(db_glob, conditions)]
+    assert len(merged) == 160 and None in merged
+    # SQLite puts NULLs first ascending and last descending; the merge keeps that order
+    assert merged == union
+    values = [v for v in merged if v is not None]
+    assert values == sorted(values, reverse=reverse)
+    assert (merged[0] is None) != reverse and (merged[-1] is None) == reverse
+
+
+def test_limit_applies_to_the_merged_stream(february):
+    db_glob, table_glob = february
+    conditions = {"table": table_glob, "fields": ["ID", "Plan_Number"], "order_by": "Plan_Number",
+                  "reverse": True, "limit": 7}
+    merged = list(iter_fanout(db_glob, conditions))
+    assert [r["Plan_Number"] for r in merged] == [r["Plan_Number"] for r in union_all_query(db_glob, conditions)]
+    assert len(merged) == 7
+
+
+@pytest.fixture
+def mixed_formats(tmp_path):
+    """One file, one sheet with 'HH:MM' text times and one with integer minutes (the ingest default)."""
+    path = str(tmp_path / "mixed.db")
+    for day, time_format in (("20", "hhmm"), ("21", "minutes")):
+        csv_path = str(tmp_path / f"Workers_{day}012025.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(WORKERS_COLUMNS)
+            writer.writerows(["" if v is None else v for v in row] for row in make_workers(30, seed=int(day)))
+        ingest(path, [csv_path], time_format=time_format)
+    return path
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_ordered_merge_across_time_formats(mixed_formats, reverse):
+    rows = list(iter_fanout(mixed_formats, {"table": "Workers_*", "fields": ["ID", "Start_Time"],
+                                            "order_by": "Start_Time", "reverse": reverse}))
+    assert len(rows) == 60
+    assert {type(r["Start_Time"]) for r in rows} == {str, int}
+    minutes = [int(v[:2]) * 60 + int(v[3:]) if isinstance(v, str) else v for v in (r["Start_Time"] for r in rows)]
+    assert minutes == sorted(minutes, reverse=reverse)
+
+
+def test_ordered_merge_of_mixed_types_follows_sqlite(tmp_path):
+    path = str(tmp_path / "coded.db")
+    create_workers_db(path, make_workers(30, seed=5), table="Workers_20012025")
+    create_workers_db(path, make_workers(30, seed=6), table="Workers_21012025")
+    with sqlite3.connect(path) as conn:
+        # One day codes Gender as 0 / 1 / NULL, the other keeps the text
+        conn.execute('UPDATE "Workers_21012025" SET Gender = CASE WHEN ID % 4 = 0 THEN NULL ELSE ID % 2 END')
+    conditions = {"table": "Workers_*", "fields": ["ID", "Gender"], "order_by": "Gender"}
+    merged = [r["Gender"] for r in iter_fanout(path, conditions)]
+    assert {type(v) for v in merged} == {type(None), int, str}
+    # NULL < numbers < text, as in one SQLite ORDER BY over all sheets
+    assert merged == [r["Gender"] for r in union_all_query(path, conditions)]
+
+
+def test_single_file_tags_are_table_names(tmp_path):
+    path = create_workers_db(str(tmp_path / "one.db"), make_workers(5))
+    rows = list(iter_fanout(path, {"table": "Workers_*", "fields": ["ID"]}))
+    assert {r[SOURCE_COLUMN] for r in rows} == {WORKERS_TABLE}
+    assert list(iter_fanout(str(tmp_path / "none_*.db"), {"table": WORKERS_TABLE, "fields": ["ID"]})) == []
+
+
+def test_aborted_union_detaches_its_files(february):
+    db_glob, table_glob = february
+    pool = get_connection_pool()
+    # A row-limit abort is not a database error: the connection goes back to the pool
+    with guarded(QueryGuard(max_rows=5, label="test")):
+        with pytest.raises(QueryAborted):
+            union_all_query(db_glob, {"table": table_glob, "fields": ["ID"]})
+    with pool.connection(":memory:") as conn:
+        assert [r[1] for r in conn.execute("PRAGMA database_list")] == ["main"]
+    assert len(union_all_query(db_glob, {"table": table_glob, "fields": ["ID"]})) == 160
+
+
+def _minutes(value):
+    return int(value[:2]) * 60 + int(value[3:]) if isinstance(value, str) else value
+
+
+@pytest.mark.parametrize("conditions", [
+    {"fanout_mode": "parallel"},
+    {"fanout_mode": "union"},
+    {"sample": {"fraction": 1.0}},
+])
+def test_time_literals_match_every_source_format(mixed_formats, conditions):
+    from tools.SQL_tools_2_2 import SQLQueryTool
+    conditions = dict(conditions, table="Workers_*", fields=["ID", "Start_Time"], where="Start_Time < '09:00'")
+    rows = SQLQueryTool()._run(db_path=mixed_formats, conditions=conditions)
+    expected = [r for r in iter_fanout(mixed_formats, {"table": "Workers_*", "fields": ["ID", "Start_Time"]})
+                if _minutes(r["Start_Time"]) < 540]
+    # Both sheets contribute, and none of their rows starts at 09:00 or later
+    assert {r[SOURCE_COLUMN] for r in rows} == {"Workers_20012025", "Workers_21012025"}
+    assert _canonical(rows) == _canonical(expected)
@@ -0,0 +1,141 @@
+# LLM_Test/tests/test_filter.py
+
+from array import array
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows, parse_time_string
+from SQL_expression import (
+    ExpressionError,
+    compile_expression,
+    compile_predicate,
+    equality_values,
+    expression_columns,
+    parse_predicate,
+    push_expressions_into_query,
+)
+from SQL_query_builder import build_select_sql
+
+PREDICATES = [
+    "Real_Number > 50",
+    "Gender = 'Female' AND Real_Number >= Plan_Number",
+    "Start_Time < '08:00' or End_Time >= '17:30'",
+    "Qualified_Number > 10",
+    "Qualified_Number > 10 or Real_Number > 50",
+    "not (Qualified_Number > 10 and Real_Number > 50)",
+    "NOT Qualified_Number <= Real_Number / 2",
+    "20 < Real_Number <= 60 and Gender <> 'Male'",
+    "Difference > 0",
+    "Difference / Plan_Number < -0.25 or Qualified_Number == 0",
+]
+
+
+def _plan(db_path, predicate, limit=None):
+    conditions = {"table": WORKERS_TABLE, "fields": ["*"]}
+    if limit is not None:
+        conditions["limit"] = limit
+    return [
+        {"tool_name": "Query", "args": {"db_path": db_path, "conditions": conditions}},
+        {"tool_name": "Expression", "args": {"data": "$result_of_previous_tool",
+                                             "expression": "Real_Number - Plan_Number", "output_column": "Difference"}},
+        {"tool_name": "Filter", "args": {"data": "$result_of_previous_tool", "predicate": predicate}},
+    ]
+
+
+def _python_filter(rows, predicate, chunk_rows=16):
+    """Same chunked evaluation as the Filter tool on a row list."""
+    cols = sorted(expression_columns(parse_predicate(predicate)))
+    mask_of = compile_predicate(predicate)
+    kept = []
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        mask = mask_of({c: [row.get(c) for row in chunk] for c in cols}, parse_time_string)
+        kept.extend(row for row, keep in zip(chunk, mask) if keep)
+    return kept
+
+
+# ---- parsing ----
+def test_sql_spellings_are_accepted():
+    assert parse_predicate("Real_Number = 5 AND NOT Gender <> 'Male'") is not None
+    # Keywords and '=' inside string literals are left alone
+    mask = compile_predicate("Name = 'AND = OR'")
+    assert mask({"Name": ["AND = OR", "and == or"]}, parse_time_string) == [True, False]
+
+
+@pytest.mark.parametrize("text", ["Real_Number", "Real_Number + 1", "Real_Number in (1, 2)",
+                                  "Name.startswith('W')", "Real_Number >"])
+def test_parse_predicate_rejects(text):
+    with pytest.raises(ExpressionError):
+        parse_predicate(text)
+
+
+# ---- Python masks ----
+def test_nulls_follow_three_valued_logic():
+    columns = {"Qualified_Number": [None, None, 20, 5], "Real_Number": [60, 10, None, 10]}
+    assert compile_predicate("Qualified_Number > 10")(columns, float) == [False, False, True, False]
+    assert compile_predicate("Qualified_Number > 10 or Real_Number > 50")(columns, float) == [True, False, True, False]
+    assert compile_predicate("not Qualified_Number > 10")(columns, float) == [False, False, False, True]
+    # NULL AND false is false, so its negation is true; true AND NULL stays NULL
+    assert compile_predicate("not (Qualified_Number > 10 and Real_Number > 50)")(columns, float) == [
+        False, True, False, True]
+
+
+def test_time_literals_are_minutes():
+    mask = compile_predicate("Start_Time < '08:30'")
+    assert mask({"Start_Time": ["08:29", "08:30", "7:05", None]}, parse_time_string) == [True, False, True, False]
+
+
+def test_typed_array_columns_are_not_parsed():
+    def parse(_):
+        raise AssertionError("typed columns must not be parsed")
+    mask = compile_predicate("Real_Number >= 2.5")
+    assert mask({"Real_Number": array("d", [1.0, 2.5, 4.0])}, parse) == [False, True, True]
+
+
+# ---- WHERE pushdown ----
+@pytest.mark.parametrize("predicate", PREDICATES)
+def test_sql_pushdown_agrees_with_python(workers_db, predicate):
+    ops = _plan(workers_db, predicate)
+    rows = fetch_rows(workers_db, build_select_sql(ops[0]["args"]["conditions"]))
+    compile_expression("Real_Number - Plan_Number", "Difference")(rows, parse_time_string)
+    python_ids = [r["ID"] for r in _python_filter(rows, predicate)]
+
+    pushed = push_expressions_into_query(_plan(workers_db, predicate))
+    assert [op["tool_name"] for op in pushed] == ["Query"]
+    sql_ids = [r["ID"] for r in fetch_rows(workers_db, build_select_sql(pushed[0]["args"]["conditions"]))]
+
+    assert 0 < len(python_ids) < 200
+    assert sorted(sql_ids) == sorted(python_ids)
+
+
+def test_filter_is_and_ed_with_an_existing_where(workers_db):
+    ops = _plan(workers_db, "Difference > 0")
+    ops[0]["args"]["conditions"]["where"] = "Gender = 'Male' OR Real_Number > 90"
+    pushed = push_expressions_into_query(ops)
+    sql_ids = {r["ID"] for r in fetch_rows(workers_db, build_select_sql(pushed[0]["args"]["conditions"]))}
+    rows = fetch_rows(workers_db, f'SELECT * FROM "{WORKERS_TABLE}"')
+    assert sql_ids == {r["ID"] for r in rows
+                       if (r["Gender"] == "Male" or r["Real_Number"] > 90) and r["Real_Number"] > r["Plan_Number"]}
+
+
+def test_filter_stays_in_python(workers_db):
+    # A LIMIT applies before the filter
+    pushed = push_expressions_into_query(_plan(workers_db, "Difference > 0", limit=10))
+    assert [op["tool_name"] for op in pushed] == ["Query", "Filter"]
+    assert "where" not in pushed[0]["args"]["conditions"]
+    # A column the Query does not compute
+    pushed = push_expressions_into_query(_plan(workers_db, "Work_Time > 480"))
+    assert [op["tool_name"] for op in pushed] == ["Query", "Filter"]
+
+
+@pytest.mark.parametrize("predicate, expected", [
+    ("Gender = 'Female'", ("Gender", ["Female"])),
+    ("'A' == Name or Name = 'B'", ("Name", ["A", "B"])),
+    ("Gender = 'Female' or Name = 'B'", None),      # two columns
+    ("Gender = 'Female' and Name = 'B'", None),
+    ("Start_Time = '08:00'", None),                  # compared as minutes
+    ("Real_Number = 5", None),
+    ("Gender != 'Female'", None),
+])
+def test_equality_values(predicate, expected):
+    assert equality_values(parse_predicate(predicate)) == expected
@@ -0,0 +1,99 @@
+# LLM_Test/tests/test_fusion.py
+
+import copy
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows, run_executor
+from SQL_fusion import compile_steps, fuse_arithmetic_ops, referenced_columns
+from tools.SQL_tools_2_2 import (
+    AdditionTool,
+    DivisionTool,
+    FusedArithmeticTool,
+    MultiplicationTool,
+    SubtractionTool,
+    parse_time_string,
+)
+
+PREV = "$result_of_previous_tool"
+
+
+def _arith(tool_name, columns, output):
+    return {"tool_name": tool_name, "args": {"data": PREV, "number_columns": list(columns), "output_column": output}}
+
+
+KPI_CHAIN = [
+    _arith("Subtraction", ["End_Time", "Start_Time"], "Work_Time"),
+    _arith("Division", ["Qualified_Number", "Work_Time"], "Qualified_KPI"),
+    _arith("Multiplication", ["Qualified_KPI", "Plan_Number"], "Weighted_KPI"),
+]
+
+
+def _rows(db_path):
+    return fetch_rows(db_path, f'SELECT ID, Start_Time, End_Time, Plan_Number, Real_Number, '
+                               f'COALESCE(Qualified_Number, 0) AS Qualified_Number FROM "{WORKERS_TABLE}"')
+
+
+# ---- plan rewrite ----
+def test_consecutive_arithmetic_ops_are_fused():
+    sort = {"tool_name": "Sorting", "args": {"data": PREV, "field_index": "Weighted_KPI", "reverse": True}}
+    fused = fuse_arithmetic_ops(copy.deepcopy(KPI_CHAIN) + [sort])
+    assert [op["tool_name"] for op in fused] == ["FusedArithmetic", "Sorting"]
+    assert [s["op"] for s in fused[0]["args"]["steps"]] == ["-", "/", "*"]
+    # Only the last output is read later
+    assert fused[0]["args"]["materialize"] == ["Weighted_KPI"]
+
+
+def test_outputs_read_later_are_materialized():
+    average = {"tool_name": "Averaging", "args": {"data": PREV, "column": "Work_Time"}}
+    fused = fuse_arithmetic_ops(copy.deepcopy(KPI_CHAIN[:2]) + [average])
+    assert fused[0]["args"]["materialize"] == ["Work_Time", "Qualified_KPI"]
+
+
+def test_single_op_and_scalar_mode_are_not_fused():
+    ops = [_arith("Addition", ["Plan_Number", "Real_Number"], "Total"),
+           {"tool_name": "Query", "args": {"db_path": "x.db", "conditions": {}}},
+           {"tool_name": "Subtraction", "args": {"number1": 5, "number2": 3}},
+           {"tool_name": "Addition", "args": {"number1": 1, "number2": 2}}]
+    assert fuse_arithmetic_ops(copy.deepcopy(ops)) == ops
+
+
+def test_referenced_columns_matches_whole_words():
+    ops = [{"tool_name": "Filter", "args": {"predicate": "Work_Time_2 < 3 AND KPI > 0"}}]
+    assert referenced_columns(ops, {"Work_Time", "Time", "KPI"}) == {"KPI"}
+
+
+# ---- single-pass evaluation ----
+def test_fused_tool_matches_one_tool_per_step(workers_db):
+    tools = {"Addition": AdditionTool(), "Subtraction": SubtractionTool(),
+             "Multiplication": MultiplicationTool(), "Division": DivisionTool()}
+    expected = _rows(workers_db)
+    for op in KPI_CHAIN:
+        expected = tools[op["tool_name"]]._run(**dict(op["args"], data=expected))
+
+    fused_op = fuse_arithmetic_ops(copy.deepcopy(KPI_CHAIN))[0]
+    actual = FusedArithmeticTool()._run(**dict(fused_op["args"], data=_rows(workers_db)))
+    assert [r["Weighted_KPI"] for r in actual] == pytest.approx([r["Weighted_KPI"] for r in expected])
+    # Intermediate outputs stay in locals
+    assert "Work_Time" not in actual[0] and "Qualified_KPI" not in actual[0]
+
+
+def test_zero_divisor_counted_and_replaced():
+    fused = compile_steps([{"op": "-", "inputs": ["a", "b"], "output": "d"},
+                           {"op": "/", "inputs": ["c", "d"], "output": "q"}], ["d", "q"])
+    rows = [{"a": 5, "b": 5, "c": 3}, {"a": "10:00", "b": "08:00", "c": 60}]
+    assert fused(rows, parse_time_string) == 1
+    assert rows == [{"a": 5, "b": 5, "c": 3, "d": 0.0, "q": 0.0},
+                    {"a": "10:00", "b": "08:00", "c": 60, "d": 120.0, "q": 0.5}]
+
+
+def test_executor_runs_the_fused_chain(workers_db):
+    query = {"tool_name": "Query", "args": {"db_path": workers_db, "conditions": {
+        "table": WORKERS_TABLE, "fields": ["ID", "Start_Time", "End_Time", "Plan_Number", "Real_Number"]}}}
+    chain = [_arith("Subtraction", ["Real_Number", "Plan_Number"], "Gap"),
+             _arith("Multiplication", ["Gap", "Plan_Number"], "Weighted_Gap")]
+    state = run_executor([query] + chain)
+    assert [list(r)[0] for r in state["results"]] == ["Query", "FusedArithmetic"]
+    rows = state["results"][-1]["FusedArithmetic"]
+    expected = fetch_rows(workers_db, f'SELECT (Real_Number - Plan_Number) * Plan_Number AS w FROM "{WORKERS_TABLE}"')
+    assert [r["Weighted_Gap"] for r in rows] == pytest.approx([r["w"] for r in expected])
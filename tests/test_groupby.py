@@ -0,0 +1,96 @@
+# LLM_Test/tests/test_groupby.py
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows, parse_time_string
+from SQL_expression import compile_expression, push_expressions_into_query
+from SQL_groupby import group_by_columns, hash_aggregate, iter_column_chunks, normalize_aggregates, push_group_by_into_query
+from SQL_query_builder import build_select_sql
+
+AGGREGATES = [
+    {"func": "avg", "column": "Work_Time"},
+    {"func": "sum", "column": "Real_Number"},
+    {"func": "min", "column": "Start_Time"},
+    {"func": "max", "column": "End_Time"},
+    {"func": "count", "column": "Qualified_Number"},
+    {"func": "count"},
+]
+
+
+def _plan(db_path, by, aggregates, where=None):
+    conditions = {"table": WORKERS_TABLE, "fields": ["*"]}
+    if where:
+        conditions["where"] = where
+    return [
+        {"tool_name": "Query", "args": {"db_path": db_path, "conditions": conditions}},
+        {"tool_name": "Expression", "args": {"data": "$result_of_previous_tool",
+                                             "expression": "End_Time - Start_Time", "output_column": "Work_Time"}},
+        {"tool_name": "GroupBy", "args": {"data": "$result_of_previous_tool", "by": by, "aggregates": aggregates}},
+    ]
+
+
+def _python_group_by(db_path, ops, chunk_rows=16):
+    """The unpushed path: plain Query rows, Expression in Python, hash aggregation."""
+    rows = fetch_rows(db_path, build_select_sql(ops[0]["args"]["conditions"]))
+    compile_expression(ops[1]["args"]["expression"], ops[1]["args"]["output_column"])(rows, parse_time_string)
+    args = ops[2]["args"]
+    by, aggregates = group_by_columns(args["by"]), normalize_aggregates(args["aggregates"])
+    columns = list(dict.fromkeys(by + [a["column"] for a in aggregates if a["column"] != "*"]))
+    return hash_aggregate(iter_column_chunks(rows, columns, chunk_rows), by, aggregates, parse_time_string)
+
+
+def _by_group(rows, by):
+    return {tuple(row[b] for b in by): row for row in rows}
+
+
+def test_normalize_aggregates_forms():
+    assert normalize_aggregates({"Real_Number": ["sum", "mean"]}) == [
+        {"func": "sum", "column": "Real_Number", "output_column": "sum_Real_Number"},
+        {"func": "avg", "column": "Real_Number", "output_column": "avg_Real_Number"},
+    ]
+    assert normalize_aggregates([{"func": "count"}]) == [{"func": "count", "column": "*", "output_column": "count"}]
+    for bad in ([{"func": "median", "column": "ID"}], [{"func": "sum"}], []):
+        with pytest.raises(ValueError):
+            normalize_aggregates(bad)
+
+
+def test_hash_aggregate_skips_nulls_and_keeps_first_seen_order():
+    chunks = [{"Gender": ["Male", "Female"], "Real_Number": [3, None]},
+              {"Gender": ["Male", "Female"], "Real_Number": [5, 2]}]
+    aggregates = normalize_aggregates([{"func": "avg", "column": "Real_Number"}, {"func": "count", "column": "Real_Number"},
+                                       {"func": "count"}, {"func": "mode", "column": "Real_Number"}])
+    assert hash_aggregate(chunks, ["Gender"], aggregates, float) == [
+        {"Gender": "Male", "avg_Real_Number": 4.0, "count_Real_Number": 2, "count": 2, "mode_Real_Number": 3},
+        {"Gender": "Female", "avg_Real_Number": 2.0, "count_Real_Number": 1, "count": 2, "mode_Real_Number": 2},
+    ]
+
+
+def test_hash_aggregate_all_null_group():
+    rows = hash_aggregate([{"Gender": ["Male"], "Real_Number": [None]}], ["Gender"],
+                          normalize_aggregates({"Real_Number": ["avg", "min", "sum"]}), float)
+    assert rows == [{"Gender": "Male", "avg_Real_Number": None, "min_Real_Number": None, "sum_Real_Number": 0}]
+
+
+@pytest.mark.parametrize("by, where", [(["Gender"], None), (["Name", "Gender"], "Real_Number > 20"), (["Gender"], "ID < 0")])
+def test_sql_pushdown_agrees_with_python_path(workers_db, by, where):
+    python_rows = _python_group_by(workers_db, _plan(workers_db, by, AGGREGATES, where))
+
+    pushed = push_group_by_into_query(push_expressions_into_query(_plan(workers_db, by, AGGREGATES, where)))
+    assert [op["tool_name"] for op in pushed] == ["Query"]
+    sql_rows = fetch_rows(workers_db, build_select_sql(pushed[0]["args"]["conditions"]))
+
+    assert len(sql_rows) == len(python_rows)
+    expected = _by_group(python_rows, by)
+    for key, row in _by_group(sql_rows, by).items():
+        assert set(row) == set(expected[key])
+        for column, value in row.items():
+            assert value == pytest.approx(expected[key][column]), (key, column)
+
+
+def test_mode_and_limited_queries_stay_in_python(workers_db):
+    ops = _plan(workers_db, ["Gender"], [{"func": "mode", "column": "Real_Number"}])
+    assert [op["tool_name"] for op in push_group_by_into_query(push_expressions_into_query(ops))] == ["Query", "GroupBy"]
+
+    ops = _plan(workers_db, ["Gender"], AGGREGATES)
+    ops[0]["args"]["conditions"]["limit"] = 10
+    assert [op["tool_name"] for op in push_group_by_into_query(ops)][-1] == "GroupBy"
@@ -0,0 +1,156 @@
+# LLM_Test/tests/test_ingest.py
+
+import csv
+import sqlite3
+
+import pytest
+
+from conftest import WORKERS_COLUMNS, fetch_rows, make_workers
+from SQL_ingest import IngestError, count_of, ingest, minutes_of, table_name_for
+from SQL_kpi_views import WATERMARK_TABLE, build_kpi_fallback_select, build_kpi_select, ensure_kpi_table, refresh_kpi_table
+from SQL_utils import where_times_as_minutes
+
+TABLE = "Workers_21012025"
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(WORKERS_COLUMNS)
+        writer.writerows(["" if v is None else v for v in row] for row in rows)
+    return str(path)
+
+
+@pytest.fixture
+def sheet_csv(tmp_path):
+    return _write_csv(tmp_path / f"{TABLE}.csv", make_workers(120, seed=21))
+
+
+# ---- value conversion ----
+@pytest.mark.parametrize("value, minutes", [("08:30", 510), ("8:05", 485), ("17:45:10", 1065), (0.5, 720), ("600", 600),
+                                            (None, None), ("", None)])
+def test_minutes_of(value, minutes):
+    assert minutes_of(value) == minutes
+
+
+@pytest.mark.parametrize("value", ["8:75", "24:00", "noon", "-5", 1440])
+def test_minutes_of_rejects(value):
+    with pytest.raises(ValueError):
+        minutes_of(value)
+
+
+def test_count_of():
+    assert count_of("12") == 12 and count_of(7.0) == 7 and count_of("") is None
+    for bad in ("-1", 2.5, "x"):
+        with pytest.raises(ValueError):
+            count_of(bad)
+
+
+def test_table_name_for():
+    assert table_name_for("Workers_17_02_2025") == "Workers_17022025"
+    assert table_name_for("report 2025-02-17") == "Workers_17022025"
+    assert table_name_for("Night shift") == "Night_shift"
+
+
+# ---- loading ----
+@pytest.mark.parametrize("time_format", ["minutes", "hhmm"])
+def test_ingest_round_trip(tmp_path, sheet_csv, time_format):
+    db_path = str(tmp_path / "workers.db")
+    [stats] = ingest(db_path, [sheet_csv], time_format=time_format, batch_rows=32)
+    assert (stats["table"], stats["rows"], stats["bad_rows"]) == (TABLE, 120, 0)
+    rows = fetch_rows(db_path, f'SELECT * FROM "{TABLE}" ORDER BY ID')
+    source = make_workers(120, seed=21)
+    if time_format == "minutes":
+        assert rows[0]["Start_Time"] == minutes_of(source[0][3])
+    else:
+        assert rows[0]["Start_Time"] == source[0][3]
+    assert [r["Qualified_Number"] for r in rows] == [row[7] for row in source]
+
+
+def test_bad_rows_are_skipped_or_roll_back(tmp_path):
+    rows = make_workers(10, seed=3)
+    rows[4] = rows[4][:3] + ("25:00",) + rows[4][4:]
+    path = _write_csv(tmp_path / f"{TABLE}.csv", rows)
+    db_path = str(tmp_path / "workers.db")
+    [stats] = ingest(db_path, [path])
+    assert (stats["rows"], stats["bad_rows"]) == (9, 1)
+    with pytest.raises(IngestError):
+        ingest(db_path, [path], if_exists="replace", strict=True)
+    # The strict replace was rolled back: the first load is still there
+    assert len(fetch_rows(db_path, f'SELECT ID FROM "{TABLE}"')) == 9
+    with pytest.raises(IngestError, match="already exists"):
+        ingest(db_path, [path])
+
+
+def test_replace_rebuilds_the_kpi_table(tmp_path, sheet_csv):
+    db_path = str(tmp_path / "workers.db")
+    ingest(db_path, [sheet_csv])
+    conn = sqlite3.connect(db_path)
+    ensure_kpi_table(conn, TABLE)
+    assert refresh_kpi_table(conn, TABLE) == 120
+    conn.close()
+
+    # The new sheet has fewer rows: no KPI row or watermark of the old one may survive
+    ingest(db_path, [_write_csv(tmp_path / f"{TABLE}.csv", make_workers(30, seed=22))], if_exists="replace")
+    assert fetch_rows(db_path, f'SELECT * FROM "{WATERMARK_TABLE}"') == []
+
+    conn = sqlite3.connect(db_path)
+    ensure_kpi_table(conn, TABLE)
+    assert refresh_kpi_table(conn, TABLE) == 30
+    conn.close()
+    kpis = ["Plan_KPI", "Real_KPI", "Qualified_KPI"]
+    materialized = fetch_rows(db_path, build_kpi_select(TABLE, kpis, ["ID"], order_by="ID"))
+    computed = fetch_rows(db_path, build_kpi_fallback_select(TABLE, kpis, ["ID"], order_by="ID"))
+    assert len(materialized) == 30
+    assert materialized == computed
+
+
+def test_kpi_option_materializes_every_loaded_table(tmp_path, sheet_csv):
+    db_path = str(tmp_path / "workers.db")
+    ingest(db_path, [sheet_csv], kpi=True)
+    kpis = ["Plan_KPI", "Real_KPI", "Qualified_KPI"]
+    materialized = fetch_rows(db_path, build_kpi_select(TABLE, kpis, ["ID"], order_by="ID"))
+    assert len(materialized) == 120
+    assert materialized == fetch_rows(db_path, build_kpi_fallback_select(TABLE, kpis, ["ID"], order_by="ID"))
+
+
+def test_kpi_table_of_a_recreated_sheet_is_rebuilt(tmp_path, sheet_csv):
+    db_path = str(tmp_path / "workers.db")
+    ingest(db_path, [sheet_csv])
+    conn = sqlite3.connect(db_path)
+    ensure_kpi_table(conn, TABLE)
+    refresh_kpi_table(conn, TABLE)
+    # Dropped and recreated outside the ingest command: the triggers go with the old table
+    with conn:
+        conn.execute(f'CREATE TABLE "tmp" AS SELECT * FROM "{TABLE}" WHERE ID < 10010')
+        conn.execute(f'DROP TABLE "{TABLE}"')
+        conn.execute(f'ALTER TABLE "tmp" RENAME TO "{TABLE}"')
+    ensure_kpi_table(conn, TABLE)
+    assert refresh_kpi_table(conn, TABLE) == 10
+    conn.execute(f'DELETE FROM "{TABLE}" WHERE ID = 10003')
+    conn.commit()
+    conn.close()
+    assert len(fetch_rows(db_path, build_kpi_select(TABLE, ["Real_KPI"], ["ID"]))) == 9
+
+
+# ---- 'HH:MM' literals in a WHERE on minute columns ----
+@pytest.mark.parametrize("where, expected", [
+    ("Start_Time < '09:00'", "Start_Time < 540"),
+    ("'8:30' <= End_Time", "510 <= End_Time"),
+    ("base.\"End_Time\" >= '17:30' AND Name = '10:30'", "base.\"End_Time\" >= 1050 AND Name = '10:30'"),
+    ("Start_Time BETWEEN '07:00' AND '08:15'", "Start_Time BETWEEN 420 AND 495"),
+    ("Others = '12:00' OR Start_Time > '12:00'", "Others = '12:00' OR Start_Time > 720"),
+    ("Name LIKE '%09:00%'", "Name LIKE '%09:00%'"),
+])
+def test_where_times_as_minutes(where, expected):
+    assert where_times_as_minutes(where) == expected
+
+
+def test_converted_where_selects_the_same_rows(tmp_path, sheet_csv):
+    minutes_db, text_db = str(tmp_path / "minutes.db"), str(tmp_path / "text.db")
+    ingest(minutes_db, [sheet_csv], time_format="minutes")
+    ingest(text_db, [sheet_csv], time_format="hhmm")
+    where = "Start_Time < '08:00' OR End_Time BETWEEN '15:00' AND '16:30'"
+    by_minutes = fetch_rows(minutes_db, f'SELECT ID FROM "{TABLE}" WHERE {where_times_as_minutes(where)}')
+    by_text = fetch_rows(text_db, f'SELECT ID FROM "{TABLE}" WHERE {where}')
+    assert by_minutes and by_minutes == by_text
@@ -0,0 +1,164 @@
+# LLM_Test/tests/test_join.py
+
+import sqlite3
+
+import pytest
+
+from conftest import WORKERS_TABLE, create_workers_db, fetch_rows, make_workers
+from SQL_join import hash_join, join_keys, join_query, join_rows, push_join_into_query
+from SQL_query_builder import build_select_sql
+
+
+def _canonical(rows):
+    # Order-free comparison; repr() so rows with NULLs still sort
+    return sorted(repr(sorted(row.items())) for row in rows)
+
+
+@pytest.fixture
+def two_days(tmp_path):
+    day1 = make_workers(60, seed=1)
+    # Day 2: a third of the workers are missing, some appear twice, one has no ID
+    day2 = [row for row in make_workers(60, seed=2) if row[0] % 3 != 0]
+    day2 += [row for row in make_workers(60, seed=3) if row[0] % 10 == 1]
+    day2.append((None,) + make_workers(1, seed=4)[0][1:])
+    left_db = create_workers_db(str(tmp_path / "day1.db"), day1)
+    right_db = create_workers_db(str(tmp_path / "day2.db"), day2)
+    # A left row without ID never matches either
+    with sqlite3.connect(left_db) as conn:
+        conn.execute(f'UPDATE "{WORKERS_TABLE}" SET ID = NULL WHERE ID = 10004')
+    return left_db, right_db
+
+
+def _plan(left_db, right_db, how):
+    return [
+        {"tool_name": "Query", "args": {"db_path": left_db, "conditions": {
+            "table": WORKERS_TABLE, "fields": ["ID", "Name", "Real_Number"], "where": "Real_Number > 10"}}},
+        {"tool_name": "Join", "args": {
+            "data": "$result_of_previous_tool",
+            "right": {"db_path": right_db, "conditions": {"table": WORKERS_TABLE, "fields": ["ID", "Real_Number", "Gender"]}},
+            "on": "ID", "how": how}},
+    ]
+
+
+def test_join_keys_forms():
+    assert join_keys("ID") == [("ID", "ID")]
+    assert join_keys(["ID", "Name"]) == [("ID", "ID"), ("Name", "Name")]
+    assert join_keys({"left": "ID", "right": "Worker_ID"}) == [("ID", "Worker_ID")]
+    assert join_keys([["ID", "Worker_ID"]]) == [("ID", "Worker_ID")]
+    with pytest.raises(ValueError):
+        join_keys({"left": ["ID", "Name"], "right": "ID"})
+    with pytest.raises(ValueError):
+        join_keys([])
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_build_side_does_not_change_the_result(how):
+    left = [{"ID": i % 7 if i != 3 else None, "Real_Number": i} for i in range(20)]
+    right = [{"ID": i % 5, "Real_Number": 100 + i, "Gender": "Female"} for i in range(12)]
+    keys = join_keys("ID")
+    built_right = hash_join(right, left, keys, how, build_is_left=False)
+    built_left = hash_join(left, right, keys, how, build_is_left=True)
+    assert _canonical(built_right) == _canonical(built_left)
+    expected_matches = sum(1 for l in left for r in right if l["ID"] is not None and l["ID"] == r["ID"])
+    unmatched = sum(1 for l in left if l["ID"] is None or l["ID"] >= 5)
+    assert len(built_right) == expected_matches + (unmatched if how == "left" else 0)
+    # The clashing right column gets the suffix, the shared key is not repeated
+    assert set(built_right[0]) == {"ID", "Real_Number", "Real_Number_right", "Gender"}
+
+
+def test_left_join_fills_unmatched_rows_with_none():
+    left = [{"ID": 1, "Name": "a"}, {"ID": None, "Name": "b"}, {"ID": 2, "Name": "c"}]
+    right = [{"ID": 1, "Gender": "Male"}, {"ID": None, "Gender": "Female"}]
+    result = hash_join(right, left, join_keys("ID"), "left")
+    assert _canonical(result) == _canonical([
+        {"ID": 1, "Name": "a", "Gender": "Male"},
+        {"ID": None, "Name": "b", "Gender": None},
+        {"ID": 2, "Name": "c", "Gender": None},
+    ])
+    assert hash_join(right, left, join_keys("ID"), "inner") == [{"ID": 1, "Name": "a", "Gender": "Male"}]
+
+
+def test_unknown_join_type():
+    with pytest.raises(ValueError):
+        hash_join([], [], join_keys("ID"), "outer")
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_sql_pushdown_agrees_with_python_join(two_days, how):
+    left_db, right_db = two_days
+    ops = _plan(left_db, right_db, how)
+
+    left_rows = fetch_rows(left_db, build_select_sql(ops[0]["args"]["conditions"]))
+    python_rows = join_rows(left_rows, ops[1]["args"]["right"], join_keys("ID"), how, chunk_rows=8)
+
+    pushed = push_join_into_query(ops)
+    assert len(pushed) == 1 and "join" in pushed[0]["args"]["conditions"]
+    sql_rows = join_query(left_db, pushed[0]["args"]["conditions"])
+
+    assert python_rows
+    assert _canonical(sql_rows) == _canonical(python_rows)
+    assert set(sql_rows[0]) == {"ID", "Name", "Real_Number", "Real_Number_right", "Gender"}
+
+
+def test_python_join_streams_the_larger_right_side(two_days):
+    left_db, right_db = two_days
+    left_rows = fetch_rows(left_db, f'SELECT ID, Name FROM "{WORKERS_TABLE}" WHERE ID < 10010')
+    right = {"db_path": right_db, "conditions": {"table": WORKERS_TABLE, "fields": ["ID", "Plan_Number"]}}
+    result = join_rows(left_rows, right, join_keys("ID"), "inner", chunk_rows=4)
+    reference = fetch_rows(right_db, f'SELECT ID, Plan_Number FROM "{WORKERS_TABLE}" WHERE ID < 10010 AND ID IS NOT NULL')
+    names = {r["ID"]: r["Name"] for r in left_rows}
+    assert _canonical(result) == _canonical(
+        [{"ID": r["ID"], "Name": names[r["ID"]], "Plan_Number": r["Plan_Number"]} for r in reference if r["ID"] in names]
+    )
+
+
+def test_join_is_not_pushed_for_a_glob_or_missing_file(two_days, tmp_path):
+    left_db, right_db = two_days
+    ops = _plan(left_db, str(tmp_path / "*.db"), "inner")
+    assert [op["tool_name"] for op in push_join_into_query(ops)] == ["Query", "Join"]
+    ops = _plan(left_db, str(tmp_path / "missing.db"), "inner")
+    assert [op["tool_name"] for op in push_join_into_query(ops)] == ["Query", "Join"]
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_sql_pushdown_within_one_file(tmp_path, how):
+    db_path = create_workers_db(str(tmp_path / "workers.db"), make_workers(80, seed=5))
+    create_workers_db(db_path, [row for row in make_workers(80, seed=6) if row[0] % 4], table="Workers_21012025")
+    ops = _plan(db_path, db_path, how)
+    ops[1]["args"]["right"]["conditions"]["table"] = "Workers_21012025"
+
+    left_rows = fetch_rows(db_path, build_select_sql(ops[0]["args"]["conditions"]))
+    python_rows = join_rows(left_rows, ops[1]["args"]["right"], join_keys("ID"), how, chunk_rows=8)
+
+    pushed = push_join_into_query(ops)
+    assert len(pushed) == 1
+    sql_rows = join_query(db_path, pushed[0]["args"]["conditions"])
+    assert python_rows and _canonical(sql_rows) == _canonical(python_rows)
+    if how == "left":
+        assert len(sql_rows) == len(left_rows)
+
+
+def test_right_side_time_literals_match_a_minute_sheet(two_days, tmp_path):
+    import csv
+    from conftest import WORKERS_COLUMNS
+    from SQL_ingest import ingest
+    left_db, _ = two_days
+    csv_path = str(tmp_path / "Workers_21012025.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(WORKERS_COLUMNS)
+        writer.writerows(["" if v is None else v for v in row] for row in make_workers(60, seed=2))
+    right_db = str(tmp_path / "minutes.db")
+    ingest(right_db, [csv_path], time_format="minutes")
+    ops = _plan(left_db, right_db, "inner")
+    ops[1]["args"]["right"]["conditions"].update(table="Workers_21012025", where="Start_Time < '09:00'")
+    ops[1]["args"]["right"]["conditions"]["fields"].append("Start_Time")
+
+    left_rows = fetch_rows(left_db, build_select_sql(ops[0]["args"]["conditions"]))
+    python_rows = join_rows(left_rows, ops[1]["args"]["right"], join_keys("ID"), "inner")
+    sql_rows = join_query(left_db, push_join_into_query(ops)[0]["args"]["conditions"])
+
+    early = {r["ID"] for r in fetch_rows(right_db, 'SELECT ID FROM "Workers_21012025" WHERE Start_Time < 540')}
+    expected = {r["ID"] for r in left_rows} & early
+    assert expected and {r["ID"] for r in python_rows} == {r["ID"] for r in sql_rows} == expected
+    assert all(r["Start_Time"] < 540 for r in sql_rows)
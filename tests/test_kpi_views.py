@@ -0,0 +1,103 @@
+# LLM_Test/tests/test_kpi_views.py
+
+import hashlib
+import sqlite3
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows
+from SQL_kpi_views import (
+    WATERMARK_TABLE,
+    build_kpi_fallback_select,
+    kpi_table_name,
+    kpi_table_ready,
+    materialize_kpi_table,
+)
+from tools.SQL_tools_2_2 import KPIViewTool
+
+KPIS = ["Plan_KPI", "Real_KPI", "Qualified_KPI"]
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _tables(db_path):
+    return {r["name"] for r in fetch_rows(db_path, "SELECT name FROM sqlite_master")}
+
+
+def _materialize(db_path, table=WORKERS_TABLE):
+    conn = sqlite3.connect(db_path)
+    try:
+        return materialize_kpi_table(conn, table)
+    finally:
+        conn.close()
+
+
+def test_tool_never_writes_to_the_database(workers_db):
+    before, tables = _digest(workers_db), _tables(workers_db)
+    rows = KPIViewTool()._run(workers_db, WORKERS_TABLE, KPIS, ["ID"], order_by="ID")
+    assert len(rows) == 200
+    assert rows == fetch_rows(workers_db, build_kpi_fallback_select(WORKERS_TABLE, KPIS, ["ID"], order_by="ID"))
+    assert _digest(workers_db) == before and _tables(workers_db) == tables
+
+
+def test_materialized_table_is_read_and_kept_current(workers_db):
+    assert _materialize(workers_db) == 200
+    conn = sqlite3.connect(workers_db)
+    assert kpi_table_ready(conn, WORKERS_TABLE)
+    # Maintained by the triggers without the tool writing anything
+    with conn:
+        conn.execute(f'INSERT INTO "{WORKERS_TABLE}" (ID, Start_Time, End_Time, Plan_Number, Real_Number, Qualified_Number) '
+                     "VALUES (99999, '08:00', '10:00', 60, 30, 12)")
+    conn.close()
+
+    before = _digest(workers_db)
+    rows = KPIViewTool()._run(workers_db, WORKERS_TABLE, "Qualified_KPI", ["ID"], where="ID = 99999")
+    assert rows == [{"ID": 99999, "Work_Time": 120.0, "Qualified_KPI": 0.1}]
+    assert _digest(workers_db) == before
+    all_rows = KPIViewTool()._run(workers_db, WORKERS_TABLE, KPIS, ["ID"], order_by="ID")
+    assert all_rows == fetch_rows(workers_db, build_kpi_fallback_select(WORKERS_TABLE, KPIS, ["ID"], order_by="ID"))
+
+
+def test_kpi_table_of_a_recreated_sheet_is_not_used(workers_db):
+    _materialize(workers_db)
+    conn = sqlite3.connect(workers_db)
+    with conn:
+        conn.execute(f'CREATE TABLE "tmp" AS SELECT * FROM "{WORKERS_TABLE}" WHERE ID < 10010')
+        conn.execute(f'DROP TABLE "{WORKERS_TABLE}"')
+        conn.execute(f'ALTER TABLE "tmp" RENAME TO "{WORKERS_TABLE}"')
+    assert not kpi_table_ready(conn, WORKERS_TABLE)
+    conn.close()
+    # The stale KPI table still has 200 rows; the tool computes from the current sheet
+    assert len(fetch_rows(workers_db, f'SELECT * FROM "{kpi_table_name(WORKERS_TABLE)}"')) == 200
+    assert len(KPIViewTool()._run(workers_db, WORKERS_TABLE, "Real_KPI", ["ID"])) == 10
+
+
+def test_unknown_kpi_is_rejected(workers_db):
+    with pytest.raises(ValueError, match="Unknown KPI"):
+        KPIViewTool()._run(workers_db, WORKERS_TABLE, "Speed_KPI")
+    assert WATERMARK_TABLE not in _tables(workers_db)
+
+
+@pytest.mark.parametrize("materialized", [False, True])
+def test_time_literals_on_an_ingested_sheet(tmp_path, materialized):
+    import csv
+    from conftest import WORKERS_COLUMNS, make_workers
+    from SQL_ingest import ingest
+    csv_path = str(tmp_path / f"{WORKERS_TABLE}.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(WORKERS_COLUMNS)
+        writer.writerows(["" if v is None else v for v in row] for row in make_workers(50, seed=9))
+    db_path = str(tmp_path / "minutes.db")
+    # Start_Time / End_Time are stored as integer minutes
+    ingest(db_path, [csv_path], kpi=materialized)
+    conn = sqlite3.connect(db_path)
+    assert kpi_table_ready(conn, WORKERS_TABLE) is materialized
+    conn.close()
+
+    rows = KPIViewTool()._run(db_path, WORKERS_TABLE, "Real_KPI", ["ID", "Start_Time"], where="Start_Time < '09:00'")
+    expected = fetch_rows(db_path, f'SELECT ID FROM "{WORKERS_TABLE}" WHERE Start_Time < 540')
+    assert expected and sorted(r["ID"] for r in rows) == sorted(r["ID"] for r in expected)
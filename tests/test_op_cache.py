@@ -0,0 +1,147 @@
+# LLM_Test/tests/test_op_cache.py
+
+import os
+import sqlite3
+
+import pytest
+
+from conftest import WORKERS_TABLE, run_executor
+from SQL_columnar import ColumnarResult
+from SQL_op_cache import (
+    OperationCache,
+    get_operation_cache,
+    input_fingerprint,
+    operation_key,
+    source_fingerprint,
+)
+
+PREV = "$result_of_previous_tool"
+
+
+def _query_op(db_path, where="Real_Number > 50"):
+    return {"tool_name": "Query", "args": {"db_path": db_path, "conditions": {
+        "table": WORKERS_TABLE, "fields": ["ID", "Real_Number", "Plan_Number"], "where": where}}}
+
+
+def _insert_worker(conn, worker_id, real_number=99):
+    conn.execute(f'INSERT INTO "{WORKERS_TABLE}" (ID, Real_Number, Plan_Number) VALUES (?, ?, 10)', (worker_id, real_number))
+    conn.commit()
+
+
+# ---- fingerprints ----
+def test_source_fingerprint_follows_the_file(workers_db):
+    before = source_fingerprint(workers_db)
+    assert source_fingerprint(workers_db) == before
+    st = os.stat(workers_db)
+    os.utime(workers_db, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert source_fingerprint(workers_db) != before
+
+
+def test_source_fingerprint_sees_uncheckpointed_wal_writes(workers_db):
+    writer = sqlite3.connect(workers_db)
+    writer.execute("PRAGMA journal_mode=WAL")
+    writer.execute("PRAGMA wal_autocheckpoint=0")
+    _insert_worker(writer, 90000)
+    main_stat = os.stat(workers_db)
+    before = source_fingerprint(workers_db)
+    # Committed into the -wal file only: the main file is untouched
+    _insert_worker(writer, 90001)
+    assert os.stat(workers_db).st_mtime_ns == main_stat.st_mtime_ns
+    assert source_fingerprint(workers_db) != before
+    writer.close()
+
+
+def test_glob_fingerprint_covers_new_files(tmp_path, workers_db):
+    pattern = str(tmp_path / "*.db")
+    before = source_fingerprint(pattern)
+    sqlite3.connect(str(tmp_path / "other.db")).close()
+    assert source_fingerprint(pattern) != before
+
+
+def test_input_fingerprint_chains_and_literals(workers_db):
+    query_fp = input_fingerprint("Query", _query_op(workers_db)["args"], None)
+    assert query_fp == source_fingerprint(workers_db)
+    query_key = operation_key("Query", _query_op(workers_db)["args"], query_fp)
+    assert operation_key("Query", _query_op(workers_db, "Real_Number > 60")["args"], query_fp) != query_key
+
+    sort_args = {"data": PREV, "field_index": "ID"}
+    assert input_fingerprint("Sorting", sort_args, query_key) == query_key
+    assert input_fingerprint("Sorting", sort_args, None) is None
+    assert input_fingerprint("Averaging", {"data": [1, 2]}, None) == input_fingerprint("Averaging", {"data": [1, 2]}, "x")
+    assert input_fingerprint("Averaging", {"data": [1, 2]}, None) != input_fingerprint("Averaging", {"data": [1, 3]}, None)
+    assert input_fingerprint("Addition", {"number1": 1, "number2": 2}, None) == "no-input"
+
+
+# ---- the cache ----
+def test_lru_eviction_and_copies():
+    cache = OperationCache(max_entries=2)
+    rows = [{"a": 1}]
+    cache.put("k1", rows)
+    rows[0]["a"] = 2
+    hit, cached = cache.get("k1")
+    assert hit and cached == [{"a": 1}]
+    # A row tool writing into the returned rows does not change the cached entry
+    cached[0]["b"] = 3
+    assert cache.get("k1")[1] == [{"a": 1}]
+    cache.put("k2", 2)
+    cache.get("k1")
+    cache.put("k3", 3)
+    assert cache.get("k2") == (False, None) and cache.get("k1")[0] and cache.get("k3") == (True, 3)
+    assert cache.stats() == {"entries": 2, "hits": 5, "misses": 1}
+    columnar = ColumnarResult({"a": [1, 2]}, 2)
+    cache.put("k4", columnar)
+    assert cache.get("k4")[1].columns is not columnar.columns
+
+
+def test_disabled_cache_stores_nothing():
+    cache = OperationCache(max_entries=0)
+    cache.put("k", 1)
+    assert cache.get("k") == (False, None)
+
+
+# ---- re-execution ----
+@pytest.fixture
+def op_cache():
+    cache = get_operation_cache()
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def _plan(db_path):
+    return [_query_op(db_path), {"tool_name": "Averaging", "args": {"data": PREV, "column": "Real_Number"}}]
+
+
+def test_unchanged_inputs_reuse_cached_outputs(workers_db, op_cache):
+    first = run_executor(_plan(workers_db))
+    hits = op_cache.stats()["hits"]
+    second = run_executor(_plan(workers_db))
+    assert op_cache.stats()["hits"] == hits + 2
+    assert second["results"] == first["results"]
+
+
+@pytest.mark.parametrize("wal", [False, True])
+def test_a_write_invalidates_the_chain(workers_db, op_cache, wal):
+    first = run_executor(_plan(workers_db))
+    writer = sqlite3.connect(workers_db)
+    if wal:
+        writer.execute("PRAGMA journal_mode=WAL")
+        writer.execute("PRAGMA wal_autocheckpoint=0")
+    _insert_worker(writer, 90000, real_number=1000)
+    hits = op_cache.stats()["hits"]
+    second = run_executor(_plan(workers_db))
+    writer.close()
+    assert op_cache.stats()["hits"] == hits
+    assert len(second["results"][0]["Query"]) == len(first["results"][0]["Query"]) + 1
+    assert second["results"][1]["Averaging"] > first["results"][1]["Averaging"]
+
+
+def test_fingerprint_sees_a_commit_within_one_mtime_tick(workers_db):
+    conn = sqlite3.connect(workers_db)
+    before, st = source_fingerprint(workers_db), os.stat(workers_db)
+    # Same size (the row fits into a free page slot) and, with the mtime reset, same timestamp
+    _insert_worker(conn, 90000)
+    conn.close()
+    os.utime(workers_db, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(workers_db).st_size == st.st_size
+    assert source_fingerprint(workers_db) != before
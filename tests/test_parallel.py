@@ -0,0 +1,80 @@
+# LLM_Test/tests/test_parallel.py
+
+import copy
+import random
+
+import pytest
+
+import SQL_parallel
+from conftest import make_workers, WORKERS_COLUMNS
+from SQL_parallel import parallel_binary_op, parallel_sort, use_parallel
+from tools.SQL_tools_2_2 import DivisionTool, SQLSortingTool, SubtractionTool, parse_time_string
+
+
+@pytest.fixture
+def two_workers(monkeypatch):
+    # The pool itself is sized once per process; the chunking follows PARALLEL_WORKERS
+    monkeypatch.setattr(SQL_parallel, "PARALLEL_WORKERS", 2)
+
+
+@pytest.fixture
+def rows():
+    return [dict(zip(WORKERS_COLUMNS, r)) for r in make_workers(1000, seed=29)]
+
+
+def test_use_parallel_by_size_and_flag(two_workers, monkeypatch):
+    monkeypatch.setattr(SQL_parallel, "PARALLEL_MIN_ROWS", 100)
+    assert use_parallel([{}] * 100) and not use_parallel([{}] * 99)
+    assert use_parallel([{}], True) and not use_parallel([{}] * 100, False)
+    # Only row lists are split over the pool
+    assert not use_parallel(iter([{}] * 100), True)
+    monkeypatch.setattr(SQL_parallel, "PARALLEL_WORKERS", 1)
+    assert not use_parallel([{}] * 100, True)
+
+
+@pytest.mark.parametrize("col1, col2, op", [
+    ("End_Time", "Start_Time", "-"),       # 'HH:MM' text through the parse function
+    ("Real_Number", "Plan_Number", "+"),
+    ("Real_Number", "Plan_Number", "*"),
+    ("Real_Number", "Plan_Number", "/"),
+])
+def test_binary_op_matches_row_by_row(two_workers, rows, col1, col2, op):
+    apply = {"+": float.__add__, "-": float.__sub__, "*": float.__mul__,
+             "/": lambda a, b: a / b if b != 0 else 0.0}[op]
+    expected = [apply(parse_time_string(r[col1]), parse_time_string(r[col2])) for r in rows]
+    out = parallel_binary_op(rows, col1, col2, op, "Out", parse_time_string)
+    assert out is rows
+    assert [r["Out"] for r in rows] == pytest.approx(expected)
+
+
+def test_zero_divisor_gives_zero(two_workers):
+    data = [{"a": 5, "b": 0}, {"a": 6, "b": 3}, {"a": 1, "b": 0}]
+    assert [r["q"] for r in parallel_binary_op(data, "a", "b", "/", "q", float)] == [0.0, 2.0, 0.0]
+
+
+def test_tools_agree_in_both_modes(two_workers, rows):
+    for tool, columns in ((SubtractionTool(), ["End_Time", "Start_Time"]), (DivisionTool(), ["Real_Number", "Plan_Number"])):
+        serial = tool._run(data=copy.deepcopy(rows), number_columns=columns, output_column="Out", parallel=False)
+        parallel = tool._run(data=copy.deepcopy(rows), number_columns=columns, output_column="Out", parallel=True)
+        assert [r["Out"] for r in parallel] == pytest.approx([r["Out"] for r in serial])
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_sort_matches_sorted_and_is_stable(two_workers, reverse):
+    rnd = random.Random(3)
+    data = [{"k": rnd.randrange(20) / 2, "i": i} for i in range(1001)]
+    expected = sorted(data, key=lambda r: r["k"], reverse=reverse)
+    assert parallel_sort(data, "k", reverse) == expected
+
+
+def test_sort_of_non_numeric_key_is_left_to_the_caller(two_workers, rows):
+    assert parallel_sort(rows, "Start_Time") is None
+    assert parallel_sort([{"k": 1}, {"k": None}], "k") is None
+    # The tool falls back to the plain sort
+    out = SQLSortingTool()._run(data=rows, field_index="Name", parallel=True)
+    assert [r["Name"] for r in out] == sorted(r["Name"] for r in rows)
+
+
+def test_sorting_tool_parallel_mode(two_workers, rows):
+    out = SQLSortingTool()._run(data=rows, field_index="Real_Number", reverse=True, parallel=True)
+    assert out == sorted(rows, key=lambda r: r["Real_Number"], reverse=True)
@@ -0,0 +1,226 @@
+# LLM_Test/tests/test_plan_compiler.py
+
+import copy
+
+import pytest
+
+from conftest import WORKERS_TABLE
+from SQL_plan_compiler import (
+    PREVIOUS_RESULT,
+    PlanError,
+    check_structure,
+    compile_plan,
+    eliminate_dead_ops,
+    hoist_filters,
+    normalize_work_time,
+    push_projection_into_query,
+    type_check_plan,
+)
+from SQL_prompt import TOOL_NAMES
+
+TOOLS = set(TOOL_NAMES)
+
+
+def _query(db_path, fields=("*",), where=None):
+    conditions = {"table": WORKERS_TABLE, "fields": list(fields)}
+    if where:
+        conditions["where"] = where
+    return {"tool_name": "Query", "args": {"db_path": db_path, "conditions": conditions}}
+
+
+def _op(tool_name, **args):
+    return {"tool_name": tool_name, "args": dict(args, data=PREVIOUS_RESULT)}
+
+
+def _names(ops):
+    return [op["tool_name"] for op in ops]
+
+
+# ---- structure ----
+@pytest.mark.parametrize("operations, message", [
+    ([], "no operations"),
+    ([{"tool_name": "Select", "args": {}}], "unknown tool"),
+    ([{"tool_name": "Sorting", "args": {"data": [], "reverse": True}}], "args must contain"),
+    ([{"tool_name": "Query", "args": {"db_path": "x.db", "conditions": {}}}], "table is missing"),
+    ([_op("Averaging", column="Real_Number")], "there is none"),
+])
+def test_check_structure_rejects(operations, message):
+    with pytest.raises(PlanError, match=message):
+        check_structure(operations, TOOLS)
+
+
+def test_normalize_work_time():
+    ops = [_op("Subtraction", number_columns=["Start_Time", "End_Time"], output_column="Work_Time")]
+    normalize_work_time(ops)
+    assert ops[0]["args"]["number_columns"] == ["End_Time", "Start_Time"]
+
+
+# ---- type check ----
+def test_type_check_follows_computed_columns(workers_db):
+    ops = [
+        _query(workers_db),
+        _op("Subtraction", number_columns=["End_Time", "Start_Time"], output_column="Work_Time"),
+        _op("Division", number_columns=["Qualified_Number", "Work_Time"], output_column="Qualified_KPI"),
+        _op("Filter", predicate="Qualified_KPI > 0.1 and Gender = 'Female'"),
+        _op("Sorting", field_index="Qualified_KPI", reverse=True),
+    ]
+    schemas = type_check_plan(ops)
+    assert schemas[0] is None
+    assert "Work_Time" in schemas[2] and "Qualified_KPI" in schemas[4]
+
+
+@pytest.mark.parametrize("bad_op, message", [
+    (_op("Sorting", field_index="Work_Time"), "unknown column 'Work_Time'"),
+    (_op("Division", number_columns=["Name", "Real_Number"], output_column="x"), "text"),
+    (_op("Expression", expression="Real_Number / Gender2", output_column="x"), "Gender2"),
+    (_op("Averaging", column="Name"), "cannot average text"),
+    (_op("GroupBy", by="Gender", aggregates=[{"func": "sum", "column": "Name"}]), "cannot sum text"),
+    (_op("Join", right=[{"ID": 1}], on="Worker_ID"), "unknown key column"),
+])
+def test_type_check_rejects(workers_db, bad_op, message):
+    with pytest.raises(PlanError, match=message):
+        type_check_plan([_query(workers_db), bad_op])
+
+
+def test_rows_expected_after_a_single_value(workers_db):
+    ops = [_query(workers_db), _op("Averaging", column="Real_Number"), _op("Sorting", field_index="Real_Number")]
+    with pytest.raises(PlanError, match="single value"):
+        type_check_plan(ops)
+
+
+def test_kpi_output_has_work_time(workers_db):
+    ops = [{"tool_name": "KPI", "args": {"db_path": workers_db, "table": WORKERS_TABLE, "kpi": "Real_KPI"}},
+           _op("Sorting", field_index="Work_Time"), _op("Averaging", column="Real_KPI")]
+    type_check_plan(ops)
+    with pytest.raises(PlanError, match="unknown KPI"):
+        type_check_plan([{"tool_name": "KPI", "args": {"db_path": workers_db, "table": WORKERS_TABLE, "kpi": "Speed_KPI"}}])
+
+
+def test_group_by_and_join_schemas(workers_db):
+    ops = [
+        _query(workers_db),
+        _op("Join", right={"db_path": workers_db, "conditions": {"table": WORKERS_TABLE, "fields": ["ID", "Real_Number"]}},
+            on="ID"),
+        _op("GroupBy", by="Gender", aggregates=[{"func": "avg", "column": "Real_Number_right"}]),
+        _op("Sorting", field_index="avg_Real_Number_right"),
+    ]
+    schemas = type_check_plan(ops)
+    assert "Real_Number_right" in schemas[2]
+    assert set(schemas[3]) == {"Gender", "avg_Real_Number_right"}
+
+
+# ---- optimizations ----
+def test_hoist_filter_before_unrelated_computation(workers_db):
+    ops = [
+        _query(workers_db),
+        _op("Expression", expression="Real_Number - Plan_Number", output_column="Difference"),
+        _op("Filter", predicate="Real_Number > 50"),
+        _op("Filter", predicate="Difference > 0"),
+    ]
+    hoisted = hoist_filters(ops)
+    assert [op["args"].get("predicate") or op["args"].get("expression") for op in hoisted[1:]] == [
+        "Real_Number > 50", "Real_Number - Plan_Number", "Difference > 0"]
+
+
+def test_dead_computations_and_sorts_before_an_aggregate_are_dropped(workers_db):
+    ops = [
+        _query(workers_db, fields=["ID", "Name", "Real_Number", "Plan_Number"]),
+        _op("Expression", expression="Real_Number * 2", output_column="Unused"),
+        _op("Sorting", field_index="Real_Number"),
+        _op("Averaging", column="Real_Number"),
+    ]
+    optimized = eliminate_dead_ops(copy.deepcopy(ops))
+    assert _names(optimized) == ["Query", "Averaging"]
+    assert optimized[0]["args"]["conditions"]["fields"] == ["Real_Number"]
+
+
+def test_computed_output_columns_are_kept(workers_db):
+    ops = [
+        _query(workers_db, fields=["ID", "Name", "Real_Number", "Plan_Number"]),
+        _op("Expression", expression="Real_Number - Plan_Number", output_column="Difference"),
+        _op("Sorting", field_index="Real_Number"),
+    ]
+    optimized = eliminate_dead_ops(copy.deepcopy(ops))
+    assert _names(optimized) == ["Query", "Expression", "Sorting"]
+    assert optimized[0]["args"]["conditions"]["fields"] == ["ID", "Name", "Real_Number", "Plan_Number"]
+
+
+def test_projection_narrows_star_only_for_aggregate_chains(workers_db):
+    averaged = push_projection_into_query([_query(workers_db), _op("Averaging", column="Real_Number")])
+    assert averaged[0]["args"]["conditions"]["fields"] == ["Real_Number"]
+
+    grouped = push_projection_into_query([
+        _query(workers_db), _op("Sorting", field_index="Name"),
+        _op("GroupBy", by="Gender", aggregates=[{"func": "max", "column": "Real_Number"}])])
+    assert set(grouped[0]["args"]["conditions"]["fields"]) == {"Name", "Gender", "Real_Number"}
+
+    # The user sees these rows and asked for every column
+    sorted_rows = push_projection_into_query([_query(workers_db), _op("Sorting", field_index="Real_Number")])
+    assert sorted_rows[0]["args"]["conditions"]["fields"] == ["*"]
+
+    joined = push_projection_into_query([
+        _query(workers_db), _op("Join", right=[{"ID": 1}], on="ID"), _op("Averaging", column="Real_Number")])
+    assert joined[0]["args"]["conditions"]["fields"] == ["*"]
+
+
+def test_compile_plan_end_to_end(workers_db):
+    ops = [
+        _query(workers_db, fields=["ID", "Name"], where="Start_Time < '09:00'"),
+        _op("Subtraction", number_columns=["Start_Time", "End_Time"], output_column="Work_Time"),
+        _op("Division", number_columns=["Qualified_Number", "Work_Time"], output_column="Qualified_KPI"),
+        _op("Sorting", field_index="Qualified_KPI", reverse=True),
+    ]
+    compiled = compile_plan(ops, TOOLS)
+    assert _names(compiled) == ["Query", "Subtraction", "Division", "Sorting"]
+    assert compiled[1]["args"]["number_columns"] == ["End_Time", "Start_Time"]
+    # The columns the later steps read are added to the explicit Query fields
+    assert set(compiled[0]["args"]["conditions"]["fields"]) == {"ID", "Name", "Start_Time", "End_Time", "Qualified_Number"}
+
+
+def test_projection_keeps_star_it_cannot_narrow(workers_db, tmp_path):
+    # Aggregate without a column: the tool picks one from the rows
+    no_column = push_projection_into_query([_query(workers_db), _op("Averaging")])
+    assert no_column[0]["args"]["conditions"]["fields"] == ["*"]
+    # Tables that cannot be introspected
+    glob = _query(workers_db)
+    glob["args"]["conditions"]["table"] = "Workers_*"
+    missing = _query(str(tmp_path / "missing.db"))
+    for query in (glob, missing):
+        ops = push_projection_into_query([query, _op("Averaging", column="Real_Number")])
+        assert ops[0]["args"]["conditions"]["fields"] == ["*"]
+
+
+def test_projection_reads_every_column_of_the_chain(workers_db):
+    ops = push_projection_into_query([
+        _query(workers_db, where="Gender = 1"),
+        _op("Filter", predicate="Plan_Number > 20"),
+        _op("Expression", expression="Real_Number - Plan_Number", output_column="Difference"),
+        _op("Averaging", column="Difference"),
+        # A second chain is narrowed on its own
+        _query(workers_db),
+        _op("Mode", column="Gender"),
+    ])
+    assert ops[0]["args"]["conditions"]["fields"] == ["Plan_Number", "Real_Number"]
+    assert ops[4]["args"]["conditions"]["fields"] == ["Gender"]
+
+
+def test_projected_plan_gives_the_same_answer(workers_db, monkeypatch):
+    import SQL_main_2_3
+    from conftest import run_executor
+    from SQL_op_cache import get_operation_cache
+    ops = [
+        _query(workers_db, where="Start_Time < '09:00'"),
+        _op("Expression", expression="Qualified_Number / (End_Time - Start_Time)", output_column="Qualified_KPI"),
+        _op("Filter", predicate="Qualified_KPI > 0.04"),
+        _op("Mode", column="Gender"),
+    ]
+    get_operation_cache().clear()
+    narrowed = run_executor(copy.deepcopy(ops))["results"]
+    get_operation_cache().clear()
+    monkeypatch.setattr(SQL_main_2_3, "push_projection_into_query", lambda operations: operations)
+    full = run_executor(copy.deepcopy(ops))["results"]
+    assert narrowed[-1]["Mode"] is not None and narrowed[-1] == full[-1]
+    # The narrowed rows are the full rows without the columns nothing reads
+    narrowed_rows, full_rows = narrowed[0]["Query"], full[0]["Query"]
+    assert set(narrowed_rows[0]) < set(full_rows[0])
+    assert narrowed_rows == [{k: row[k] for k in narrowed_rows[0]} for row in full_rows]
@@ -0,0 +1,86 @@
+# LLM_Test/tests/test_prompt.py
+
+import json
+
+import pytest
+
+from conftest import WORKERS_TABLE
+from SQL_fake_llm import make_fake_parse_model
+from SQL_ingest import ingest
+from SQL_prompt import (_DEFAULT_SCHEMA, _EXAMPLE, _HEADER, _HINTS, build_parse_prompt, count_tokens,
+                        find_db_and_table, get_parse_prompt_template, schema_snippet)
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("Workers.db in D:/Test/Dataset, table Sheet_17_02_2025. Show all.", ("D:/Test/Dataset/Workers.db", "Sheet_17_02_2025")),
+    ("Database /data/w/Workers.db, table named Workers_01.", ("/data/w/Workers.db", "Workers_01")),
+    ("Use Workers.db under path /srv/db. table 'Sheet_*_02_2025'", ("/srv/db/Workers.db", "Sheet_*_02_2025")),
+    ("Average Real_Number of every worker", (None, None)),
+])
+def test_find_db_and_table(text, expected):
+    assert find_db_and_table(text) == expected
+
+
+def test_schema_snippet_reads_the_table(workers_db):
+    snippet = schema_snippet(f"Database {workers_db}, table {WORKERS_TABLE}.")
+    assert snippet.startswith(f"Table {WORKERS_TABLE} columns: ID INTEGER, Name TEXT")
+    assert snippet.endswith("(Start_Time / End_Time are 'HH:MM')")
+    assert schema_snippet(f"Database {workers_db}, table Missing_Table.") == _DEFAULT_SCHEMA
+    assert schema_snippet("no database here") == _DEFAULT_SCHEMA
+
+
+def test_schema_snippet_of_minute_typed_sheet(tmp_path):
+    db = str(tmp_path / "Ingested.db")
+    csv_path = tmp_path / "Sheet_01_03_2025.csv"
+    csv_path.write_text("ID,Name,Gender,Start_Time,End_Time,Plan_Number,Real_Number,Qualified_Number,Others\n"
+                        "1,A,0,08:30,17:00,10,12,11,\n", encoding="utf-8")
+    ingest(db, [str(csv_path)])
+    snippet = schema_snippet(f"Database {db}, table Workers_01032025.")
+    assert "Start_Time INTEGER" in snippet and "minutes since midnight" in snippet
+
+
+def test_simple_request_gets_no_optional_parts():
+    prompt, stats = build_parse_prompt("Database Workers.db, table Workers_01. Show every worker.")
+    assert prompt.startswith(_HEADER)
+    assert prompt.endswith("User request: Database Workers.db, table Workers_01. Show every worker.")
+    assert "Schema: " + _DEFAULT_SCHEMA in prompt
+    assert stats["hints"] == 0 and stats["example"] is False
+    assert _EXAMPLE not in prompt
+    assert stats["tokens"] == count_tokens(prompt) and stats["build_ms"] >= 0
+
+
+def test_hints_and_example_follow_the_request():
+    text = "Table Workers_01: subtract Plan_Number from Real_Number, keep the positive ones, then the average per Gender."
+    prompt, stats = build_parse_prompt(text)
+    included = [hint for _, hint in _HINTS if hint in prompt]
+    # positive -> Filter hint, per -> GroupBy hint, average -> columnar hint
+    assert stats["hints"] == len(included) == 3
+    assert stats["example"] is True and _EXAMPLE in prompt
+    # Optional parts make the prompt longer than the plain one
+    assert stats["tokens"] > build_parse_prompt("Table Workers_01. Show every worker.")[1]["tokens"]
+
+
+def test_prompt_template_is_built_once():
+    assert get_parse_prompt_template() is get_parse_prompt_template()
+    # The JSON braces of the prompt are passed through, not read as template fields
+    prompt, _ = build_parse_prompt("Table Workers_01. Show every worker.")
+    assert get_parse_prompt_template().invoke({"prompt": prompt}).to_string().endswith(prompt)
+
+
+def test_fake_model_answers_through_the_prompt_chain(workers_db):
+    text = f"Database {workers_db}, table {WORKERS_TABLE}. Sort the workers by Real_Number in descending order."
+    chain = get_parse_prompt_template() | make_fake_parse_model(latency_ms=0)
+    plan = json.loads(chain.invoke({"prompt": build_parse_prompt(text)[0]}).content)
+    assert [op["tool_name"] for op in plan["operations"]] == ["Query", "Sorting"]
+    assert plan["operations"][0]["args"]["db_path"] == workers_db
+
+
+def test_fake_model_uses_canned_plans(tmp_path):
+    canned = {"success": True, "operations": [{"tool_name": "KPI", "args": {"table": "T"}}]}
+    plans_path = tmp_path / "plans.json"
+    plans_path.write_text(json.dumps({"Give me the KPI.": canned}), encoding="utf-8")
+    chain = get_parse_prompt_template() | make_fake_parse_model(latency_ms=0, plans_path=str(plans_path))
+    prompt, _ = build_parse_prompt("Give me the KPI.")
+    assert json.loads(chain.invoke({"prompt": prompt}).content) == canned
+    unknown, _ = build_parse_prompt("qwerty")
+    assert json.loads(chain.invoke({"prompt": unknown}).content) == {"success": False, "operations": []}
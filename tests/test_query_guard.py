@@ -0,0 +1,120 @@
+# LLM_Test/tests/test_query_guard.py
+
+import threading
+import time
+
+import pytest
+
+from SQL_connection_pool import ConnectionPool
+from SQL_query_guard import (
+    QueryAborted,
+    QueryGuard,
+    active_runs,
+    cancel_run,
+    count_rows,
+    guarded,
+    register_run,
+    unregister_run,
+)
+
+# Never finishes on its own: SQLite keeps counting until interrupted
+ENDLESS_SQL = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT max(x) FROM n"
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool()
+    yield pool
+    pool.close_all()
+
+
+def test_row_limit():
+    guard = QueryGuard(max_rows=10, label="Workers")
+    with guarded(guard):
+        count_rows(6)
+        count_rows(4)
+        with pytest.raises(QueryAborted, match="more than 10 rows") as info:
+            count_rows(1)
+    assert info.value.reason == "row_limit"
+    # Outside the block no guard is current
+    count_rows(10 ** 6)
+
+
+def test_deadline_interrupts_a_running_statement(pool):
+    started = time.monotonic()
+    with guarded(QueryGuard(timeout=0.2)):
+        with pytest.raises(QueryAborted) as info:
+            with pool.connection(":memory:") as conn:
+                conn.execute(ENDLESS_SQL).fetchall()
+    assert info.value.reason == "timeout"
+    assert time.monotonic() - started < 5
+    # The interrupted connection was dropped, a new one works without the handler
+    with pool.connection(":memory:") as conn:
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+
+
+def test_cancel_from_another_thread(pool):
+    guard = QueryGuard()
+    register_run("run-1", guard)
+    try:
+        assert "run-1" in active_runs()
+        timer = threading.Timer(0.2, cancel_run, args=("run-1",))
+        timer.start()
+        with guarded(guard):
+            with pytest.raises(QueryAborted) as info:
+                with pool.connection(":memory:") as conn:
+                    conn.execute(ENDLESS_SQL).fetchall()
+        timer.join()
+        assert info.value.reason == "cancelled"
+    finally:
+        unregister_run("run-1")
+    assert "run-1" not in active_runs()
+    assert cancel_run("run-1") is False
+
+
+def test_child_guard_stops_with_its_parent(pool):
+    plan = QueryGuard(label="plan")
+    query = QueryGuard(parent=plan, label="Query")
+    with guarded(query):
+        count_rows(3)
+    assert plan.rows == 3
+    assert query.abort_reason() is None
+
+    threading.Timer(0.2, plan.cancel).start()
+    with guarded(query):
+        with pytest.raises(QueryAborted) as info:
+            with pool.connection(":memory:") as conn:
+                conn.execute(ENDLESS_SQL).fetchall()
+    assert info.value.reason == "cancelled"
+    assert query.abort_reason() == plan.abort_reason() == "cancelled"
+    # A new statement under the cancelled plan does not even start
+    with pytest.raises(QueryAborted):
+        with guarded(QueryGuard(parent=plan)):
+            with pool.connection(":memory:"):
+                pass
+
+
+def test_progress_reports():
+    reports = []
+    with guarded(QueryGuard(on_progress=reports.append, label="Workers")):
+        count_rows(5)
+    assert reports and reports[-1]["rows"] == 5 and reports[-1]["label"] == "Workers"
+    # A child reports through the parent's callback
+    child = QueryGuard(parent=QueryGuard(on_progress=reports.append))
+    assert child.on_progress == reports.append
+
+
+def test_other_database_errors_are_not_rewritten(pool):
+    with guarded(QueryGuard(timeout=30)):
+        with pytest.raises(Exception) as info:
+            with pool.connection(":memory:") as conn:
+                conn.execute("SELECT * FROM missing_table")
+    assert not isinstance(info.value, QueryAborted)
+
+
+def test_abort_reason_of_a_past_deadline():
+    guard = QueryGuard(parent=QueryGuard(timeout=0.01))
+    time.sleep(0.02)
+    assert guard.abort_reason() == "timeout"
+    with pytest.raises(QueryAborted, match="deadline exceeded"):
+        guard.check()
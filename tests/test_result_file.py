@@ -0,0 +1,60 @@
+# LLM_Test/tests/test_result_file.py
+
+from array import array
+
+import pytest
+
+from SQL_columnar import ColumnarResult, DictColumn
+from SQL_result_file import ResultFileReader, ResultFileWriter, write_result_file
+
+
+def _rows(n):
+    return [{"ID": i, "Name": f"Worker{i % 3}", "Real_Number": i * 1.5, "Others": None if i % 2 else {"k": i}}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_rows_round_trip_across_row_groups(tmp_path, compression):
+    path = str(tmp_path / "result.sqlres")
+    rows = _rows(25)
+    with ResultFileWriter(path, compression, row_group_rows=4) as writer:
+        writer.write_rows(iter(rows))
+    with ResultFileReader(path) as reader:
+        assert len(reader) == 25 and reader.columns == ["ID", "Name", "Real_Number", "Others"]
+        assert reader.to_rows() == rows
+        # Typed and dictionary-encoded columns survive the round trip
+        assert isinstance(reader.column("ID"), array) and reader.column("ID").typecode == "q"
+        assert isinstance(reader.column("Name"), DictColumn)
+
+
+def test_columns_first_seen_in_a_later_row_group(tmp_path):
+    path = str(tmp_path / "late.sqlres")
+    rows = [{"ID": i} for i in range(5)] + [{"ID": i, "Difference": i - 5} for i in range(5, 9)] + [{"ID": 9}]
+    with ResultFileWriter(path, row_group_rows=3) as writer:
+        writer.write_rows(rows)
+    with ResultFileReader(path) as reader:
+        assert reader.columns == ["ID", "Difference"]
+        assert reader.column("Difference") == [None] * 5 + [0, 1, 2, 3, None]
+        assert reader.to_rows() == [dict(row, Difference=row.get("Difference")) for row in rows]
+
+
+def test_scalar_results_are_not_written(tmp_path):
+    path = tmp_path / "scalar.sqlres"
+    assert write_result_file(str(path), {"Average": 3.5}) is False
+    assert not path.exists()
+
+
+def test_columnar_result_and_projection(tmp_path):
+    path = str(tmp_path / "columnar.sqlres")
+    assert write_result_file(path, ColumnarResult.from_rows(_rows(10)))
+    with ResultFileReader(path) as reader:
+        assert reader.to_rows(["ID", "Name"]) == [{"ID": r["ID"], "Name": r["Name"]} for r in _rows(10)]
+        with pytest.raises(KeyError):
+            reader.column("Missing")
+
+
+def test_not_a_result_file(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a result file at all")
+    with pytest.raises(ValueError):
+        ResultFileReader(str(path))
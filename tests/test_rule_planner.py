@@ -0,0 +1,189 @@
+# LLM_Test/tests/test_rule_planner.py
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows
+from SQL_expression import push_expressions_into_query
+from SQL_plan_compiler import compile_plan
+from SQL_prompt import TOOL_NAMES
+from SQL_query_builder import build_select_sql
+from SQL_rule_planner import RULE_PLANNER_MIN_CONFIDENCE, plan_request, split_clauses
+
+SOURCE = f"Database Dataset/test_dataset.db, table {WORKERS_TABLE}. "
+
+SUBTRACT_AND_SORT = (
+    "I have a database file in the path E:/LLMTest/Dataset, and is named by test_dataset.db, it has table Workers_20012025. "
+    "Subtract Plan_Number from Real_Number, select the worker data with a positive result, and finally display it in descending order. "
+)
+TWO_SELECTIONS = (
+    "I have a SQL database named Workers.db in path D:/Test/Dataset, which has a table named Sheet_17_02_2025. "
+    "First, select all workers who start work before 9:00, subtract the start time from the end time to get the work time, "
+    "then divide the number of qualified workpieces Qualified_Number by the work time to get the qualified workpiece KPI Qualified_KPI; "
+    "then select all workers whose end time is later than 17:00, subtract the start time from the end time to get the work time, "
+    "then divide the number of qualified workpieces Qualified_Number by the work time to get the qualified workpiece KPI Qualified_KPI; "
+    "finally, list the data of all the above workers in descending order of Qualified_KPI."
+)
+
+
+def _plan(text):
+    plan, confidence = plan_request(text)
+    assert plan is not None and plan["success"] is True
+    return plan["operations"], confidence
+
+
+def _conditions(ops):
+    assert ops[0]["tool_name"] == "Query"
+    return ops[0]["args"]["conditions"]
+
+
+def test_split_clauses_keeps_file_names_and_decimals():
+    assert split_clauses("Open test_dataset.db. Select workers whose Real_Number is over 2.5, then sort by Name") == [
+        "Open test_dataset.db", "Select workers whose Real_Number is over 2.5", "sort by Name"]
+
+
+def test_no_source_means_no_plan():
+    assert plan_request("Subtract Plan_Number from Real_Number.") == (None, 0.0)
+    assert plan_request("In test_dataset.db, table Workers_20012025, tell me which worker looks the most tired.") == (None, 0.0)
+
+
+# ---- the offline samples of SQL_rule_planner.py ----
+def test_subtract_select_and_sort():
+    ops, confidence = _plan(SUBTRACT_AND_SORT)
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert [op["tool_name"] for op in ops] == ["Query", "Expression", "Sorting"]
+    conditions = _conditions(ops)
+    assert ops[0]["args"]["db_path"] == "E:/LLMTest/Dataset/test_dataset.db"
+    assert conditions["where"] == "(Real_Number - Plan_Number) > 0"
+    assert ops[1]["args"] == {"data": "$result_of_previous_tool", "expression": "Real_Number - Plan_Number",
+                              "output_column": "Difference"}
+    assert ops[2]["args"]["field_index"] == "Difference" and ops[2]["args"]["reverse"] is True
+
+
+def test_all_the_above_is_a_union():
+    ops, confidence = _plan(TWO_SELECTIONS)
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    conditions = _conditions(ops)
+    assert ops[0]["args"]["db_path"] == "D:/Test/Dataset/Workers.db"
+    assert conditions["table"] == "Sheet_17_02_2025"
+    assert conditions["where"] == "(Start_Time < '09:00') OR (End_Time > '17:00')"
+    # The repeated KPI definition becomes one Expression; Work_Time is inlined, never materialized
+    assert [op["tool_name"] for op in ops] == ["Query", "Expression", "Sorting"]
+    assert ops[1]["args"]["expression"] == "Qualified_Number / (End_Time - Start_Time)"
+    assert ops[1]["args"]["output_column"] == "Qualified_KPI"
+    assert ops[2]["args"]["field_index"] == "Qualified_KPI"
+    assert set(conditions["fields"]) == {"ID", "Name", "Start_Time", "End_Time", "Qualified_Number"}
+
+
+def test_select_then_average():
+    ops, confidence = _plan(SOURCE + "Select workers whose Real_Number is greater than 100, "
+                                     "then compute the average of Qualified_Number.")
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert _conditions(ops)["where"] == "Real_Number > 100"
+    assert ops[1] == {"tool_name": "Averaging", "args": {"data": "$result_of_previous_tool", "column": "Qualified_Number"}}
+
+
+# ---- comparisons and combinations ----
+@pytest.mark.parametrize("phrase, where", [
+    ("whose Real_Number is not greater than 40", "Real_Number <= 40"),
+    ("whose Real_Number is at least 40", "Real_Number >= 40"),
+    ("whose Real_Number is no more than 40", "Real_Number <= 40"),
+    ("whose planned number is above 40", "Plan_Number > 40"),
+    ("who clock out after 6 pm", "End_Time > '18:00'"),
+    ("who start work not before 8:30", "Start_Time >= '08:30'"),
+    ("with a negative Real_Number", "Real_Number < 0"),
+])
+def test_comparison_phrases(phrase, where):
+    ops, confidence = _plan(SOURCE + f"Select workers {phrase}.")
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert _conditions(ops)["where"] == where
+
+
+def test_sequential_selections_narrow_each_other():
+    ops, confidence = _plan(SOURCE + "Select workers whose Real_Number is greater than 50, "
+                                     "then select workers who start work before 9:00.")
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert _conditions(ops)["where"] == "(Real_Number > 50) AND (Start_Time < '09:00')"
+
+
+@pytest.mark.parametrize("union", ["list both groups", "list either of the above", "list all of the above"])
+def test_explicit_union(union):
+    ops, confidence = _plan(SOURCE + "Select workers whose Real_Number is greater than 50, "
+                                     f"then select workers who start work before 9:00, then {union}.")
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert _conditions(ops)["where"] == "(Real_Number > 50) OR (Start_Time < '09:00')"
+
+
+@pytest.mark.parametrize("phrase, order_by, reverse", [
+    ("show the top 5 workers by Real_Number", "Real_Number", True),
+    ("show the top 5 workers by Real_Number in descending order", "Real_Number", True),
+    ("show the bottom 5 workers by Real_Number", "Real_Number", False),
+    ("list the first 5 workers by Real_Number in ascending order", "Real_Number", False),
+])
+def test_top_n_goes_into_the_query(phrase, order_by, reverse):
+    ops, confidence = _plan(SOURCE + f"Select workers whose Plan_Number is above 10, then {phrase}.")
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert [op["tool_name"] for op in ops] == ["Query"]
+    conditions = _conditions(ops)
+    assert conditions["where"] == "Plan_Number > 10"
+    assert (conditions["order_by"], conditions["reverse"], conditions["limit"]) == (order_by, reverse, 5)
+
+
+def test_top_n_of_a_computed_column_orders_by_its_sql():
+    ops, confidence = _plan(SOURCE + "Subtract Plan_Number from Real_Number, then show the top 3 by the difference.")
+    assert confidence >= RULE_PLANNER_MIN_CONFIDENCE
+    assert [op["tool_name"] for op in ops] == ["Query", "Expression"]
+    conditions = _conditions(ops)
+    assert (conditions["order_by"], conditions["reverse"], conditions["limit"]) == ("(Real_Number - Plan_Number)", True, 3)
+
+
+@pytest.mark.parametrize("time_text, hhmm", [("9", "09:00"), ("6 pm", "18:00"), ("24:00", "24:00")])
+def test_time_literals(time_text, hhmm):
+    ops, _ = _plan(SOURCE + f"Select workers who start work before {time_text}.")
+    assert _conditions(ops)["where"] == f"Start_Time < '{hhmm}'"
+
+
+# ---- requests that go to the LLM ----
+@pytest.mark.parametrize("request_text", [
+    # Which of the two selections is "the above"?
+    "Select workers whose Real_Number is greater than 50, then select workers who start work before 9:00, "
+    "then sort the above workers by Real_Number in descending order.",
+    # Words the rules do not model would be dropped silently
+    "Select female workers whose Real_Number is greater than 50.",
+    "Select the top 5 workers whose Real_Number is greater than 50.",
+    "Select workers whose Real_Number is greater than 50, then tell me who looks tired.",
+    # Top N: contradicting or unknown directions, extra words, and selections after the limit
+    "Show the top 5 workers by Real_Number in ascending order.",
+    "Show the bottom 5 workers by Real_Number in descending order.",
+    "Show the last 5 workers by Real_Number.",
+    "Show the first 5 workers by Real_Number.",
+    "Show the top 5 female workers by Real_Number.",
+    "Show the top 5 workers by Real_Number, then select workers whose Plan_Number is above 10.",
+    # Hours past midnight
+    "Select workers who start work before 24:30.",
+    "Select workers who start work before 25:00.",
+])
+def test_low_confidence(request_text):
+    _, confidence = plan_request(SOURCE + request_text)
+    assert confidence < RULE_PLANNER_MIN_CONFIDENCE
+
+
+# ---- the plans run ----
+def test_rule_plan_compiles_and_matches_direct_sql(workers_db):
+    ops, _ = _plan(f"Database {workers_db}, table {WORKERS_TABLE}. Subtract Plan_Number from Real_Number, "
+                   "select the worker data with a positive result, and finally display it in descending order.")
+    ops = push_expressions_into_query(compile_plan(ops, set(TOOL_NAMES)))
+    assert [op["tool_name"] for op in ops] == ["Query", "Sorting"]
+    rows = fetch_rows(workers_db, build_select_sql(ops[0]["args"]["conditions"]))
+    expected = fetch_rows(workers_db, f'SELECT ID, Real_Number - Plan_Number AS Difference FROM "{WORKERS_TABLE}" '
+                                      f"WHERE Real_Number > Plan_Number")
+    assert rows and {(r["ID"], r["Difference"]) for r in rows} == {(r["ID"], float(r["Difference"])) for r in expected}
+
+
+def test_top_n_plan_runs(workers_db):
+    ops, _ = _plan(f"Database {workers_db}, table {WORKERS_TABLE}. Subtract Plan_Number from Real_Number, "
+                   "then show the top 3 by the difference.")
+    ops = push_expressions_into_query(compile_plan(ops, set(TOOL_NAMES)))
+    rows = fetch_rows(workers_db, build_select_sql(ops[0]["args"]["conditions"]))
+    differences = sorted((r["Real_Number"] - r["Plan_Number"] for r in
+                          fetch_rows(workers_db, f'SELECT Real_Number, Plan_Number FROM "{WORKERS_TABLE}"')), reverse=True)
+    assert [r["Real_Number"] - r["Plan_Number"] for r in rows] == differences[:3]
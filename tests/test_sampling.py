@@ -0,0 +1,142 @@
+# LLM_Test/tests/test_sampling.py
+
+import random
+import statistics
+from collections import Counter
+
+import pytest
+
+from conftest import WORKERS_TABLE, create_workers_db, fetch_rows, make_workers
+from SQL_sampling import (
+    bernoulli_sample,
+    mean_interval,
+    normalize_sample,
+    proportion_interval,
+    reservoir_sample,
+    sample_query,
+)
+from SQL_stream_stats import running_stats
+
+
+@pytest.fixture
+def big_db(tmp_path):
+    return create_workers_db(str(tmp_path / "Workers.db"), make_workers(5000, seed=11))
+
+
+# ---- Algorithm L reservoir ----
+def test_reservoir_returns_k_distinct_input_rows():
+    rows = [{"ID": i} for i in range(1000)]
+    sample = reservoir_sample(iter(rows), 50, random.Random(1))
+    assert len(sample) == 50
+    assert len({r["ID"] for r in sample}) == 50
+    assert all(r in rows for r in sample)
+
+
+def test_reservoir_shorter_stream_than_k():
+    rows = [{"ID": i} for i in range(7)]
+    assert reservoir_sample(iter(rows), 10, random.Random(1)) == rows
+    assert reservoir_sample(iter([]), 3, random.Random(1)) == []
+
+
+def test_reservoir_is_uniform():
+    n, k, trials = 20, 5, 4000
+    rng = random.Random(3)
+    counts = Counter()
+    for _ in range(trials):
+        counts.update(r["ID"] for r in reservoir_sample(({"ID": i} for i in range(n)), k, rng))
+    expected = trials * k / n
+    # Every position, including the first k and the last one, is kept with probability k / n
+    for i in range(n):
+        assert abs(counts[i] - expected) < 0.15 * expected, (i, counts[i])
+
+
+def test_reservoir_is_reproducible_with_a_seed():
+    rows = [{"ID": i} for i in range(500)]
+    assert reservoir_sample(rows, 10, random.Random(42)) == reservoir_sample(rows, 10, random.Random(42))
+
+
+# ---- Bernoulli ----
+def test_bernoulli_sample_size_and_order():
+    rows = [{"ID": i} for i in range(10000)]
+    sample = bernoulli_sample(rows, 0.2, random.Random(5))
+    assert abs(len(sample) - 2000) < 200
+    assert [r["ID"] for r in sample] == sorted(r["ID"] for r in sample)
+    assert bernoulli_sample(rows, 1.0, random.Random(5)) == rows
+
+
+# ---- sample spec and intervals ----
+def test_normalize_sample_forms():
+    assert normalize_sample(0.05) == {"fraction": 0.05, "method": "rowid"}
+    assert normalize_sample(200) == {"rows": 200, "method": "rowid"}
+    for bad in (True, 0, 1.5, {"fraction": 0.1, "rows": 5}, {"rows": 5, "method": "tablesample"},
+                {"rows": 5, "target_error": 0.01}):
+        with pytest.raises(ValueError):
+            normalize_sample(bad)
+
+
+def test_mean_interval_coverage():
+    rng = random.Random(8)
+    population = [rng.expovariate(1 / 30) for _ in range(20000)]
+    true_mean = statistics.fmean(population)
+    trials, hits = 400, 0
+    for _ in range(trials):
+        low, high = mean_interval(running_stats([rng.sample(population, 200)]), 0.95, len(population))
+        hits += low <= true_mean <= high
+    assert 0.91 <= hits / trials <= 0.99
+
+
+def test_mean_interval_finite_population_correction():
+    stats = running_stats([[1.0, 2.0, 3.0, 4.0]])
+    assert mean_interval(stats, 0.95, population=4) == pytest.approx((2.5, 2.5))
+    low, high = mean_interval(stats, 0.95)
+    assert low < 2.5 < high
+
+
+def test_proportion_interval_stays_in_range():
+    assert proportion_interval(0, 0) == (0.0, 1.0)
+    low, high = proportion_interval(0, 10)
+    assert low == pytest.approx(0.0, abs=1e-12) and 0 < high < 1
+    low, high = proportion_interval(10, 10)
+    assert 0 < low < 1 and high == pytest.approx(1.0)
+    low, high = proportion_interval(30, 100)
+    assert low < 0.3 < high
+
+
+# ---- sample_query on a table ----
+def _ids(rows):
+    return {r["ID"] for r in rows}
+
+
+def test_rowid_sample_respects_where(big_db):
+    conditions = {"table": WORKERS_TABLE, "fields": ["ID", "Gender", "Real_Number"], "where": "Gender = 'Female'",
+                  "sample": {"fraction": 0.1, "seed": 1}}
+    rows = sample_query(big_db, conditions)
+    female = fetch_rows(big_db, f"SELECT ID FROM \"{WORKERS_TABLE}\" WHERE Gender = 'Female'")
+    assert rows and _ids(rows) <= _ids(female)
+    assert all(r["Gender"] == "Female" for r in rows)
+    # About 10 % of the table rows are read, of which about half pass the WHERE
+    assert 0.05 * len(female) < len(rows) < 0.2 * len(female)
+
+
+def test_large_rowid_sample_runs_the_exact_query(big_db):
+    rows = sample_query(big_db, {"table": WORKERS_TABLE, "fields": ["ID"], "sample": {"fraction": 0.8, "seed": 1}})
+    assert len(rows) == 5000
+
+
+def test_reservoir_method_sorts_and_limits_the_sample(big_db):
+    conditions = {"table": WORKERS_TABLE, "fields": ["ID", "Real_Number"], "order_by": "Real_Number", "reverse": True,
+                  "limit": 20, "sample": {"rows": 300, "method": "reservoir", "seed": 2}}
+    rows = sample_query(big_db, conditions)
+    assert len(rows) == 20
+    values = [r["Real_Number"] for r in rows]
+    assert values == sorted(values, reverse=True)
+
+
+def test_progressive_refinement_reaches_the_target(big_db):
+    spec = {"rows": 64, "block_rows": 8, "column": "Real_Number", "target_error": 0.03, "seed": 4}
+    rows = sample_query(big_db, {"table": WORKERS_TABLE, "fields": ["ID", "Real_Number"], "sample": spec})
+    stats = running_stats([[r["Real_Number"] for r in rows]])
+    low, high = mean_interval(stats)
+    assert (high - low) / 2 <= 0.03 * stats.mean
+    exact = statistics.fmean(r["Real_Number"] for r in fetch_rows(big_db, f'SELECT Real_Number FROM "{WORKERS_TABLE}"'))
+    assert abs(stats.mean - exact) < 0.1 * exact
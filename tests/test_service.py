@@ -0,0 +1,181 @@
+# LLM_Test/tests/test_service.py
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import SQL_service
+from conftest import WORKERS_TABLE
+from SQL_query_guard import active_runs
+from SQL_service import DuplicateRun, QueryService, ServiceBusy, ServiceHandler
+
+
+@pytest.fixture
+def service():
+    query_service = QueryService(workers=1, queue_size=1, queue_timeout=0)
+    yield query_service
+    query_service.close()
+
+
+@pytest.fixture
+def blocked(service, monkeypatch):
+    """run_graph waits until release is set; started is set once a run is inside the graph."""
+    started, release = threading.Event(), threading.Event()
+
+    def run_graph(request_text, run_id, guard):
+        started.set()
+        assert release.wait(10)
+        return {"messages": [], "results": []}
+
+    monkeypatch.setattr(service, "run_graph", run_graph)
+    yield started, release
+    release.set()
+
+
+def _submit_in_thread(service, **kwargs):
+    answers = []
+    thread = threading.Thread(target=lambda: answers.append(service.submit("request", **kwargs)))
+    thread.start()
+    return thread, answers
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+# ---- admission ----
+def test_saturated_service_rejects(service, blocked):
+    started, release = blocked
+    first, first_answer = _submit_in_thread(service, run_id="first")
+    assert started.wait(5)
+    queued, queued_answer = _submit_in_thread(service, run_id="queued")
+    _wait_for(lambda: service.health()["queued"] == 1)
+    with pytest.raises(ServiceBusy):
+        service.submit("request")
+    assert service.health()["status"] == "saturated"
+    release.set()
+    first.join(5)
+    queued.join(5)
+    assert first_answer[0]["status"] == queued_answer[0]["status"] == "ok"
+    assert service.counters["rejected"] == 1 and service.counters["completed"] == 2
+
+
+def test_duplicate_run_id_is_rejected(service, blocked):
+    started, release = blocked
+    first, answer = _submit_in_thread(service, run_id="same")
+    assert started.wait(5)
+    with pytest.raises(DuplicateRun):
+        service.submit("request", run_id="same")
+    # The first run keeps its registration and can still be cancelled
+    assert "same" in active_runs()
+    assert service.cancel("same")
+    release.set()
+    first.join(5)
+    assert answer[0]["status"] == "cancelled"
+    assert service.counters["duplicate"] == 1 and "same" not in active_runs()
+
+
+def test_cancel_while_queued(service, blocked):
+    started, release = blocked
+    first, _ = _submit_in_thread(service, run_id="first")
+    assert started.wait(5)
+    queued, answer = _submit_in_thread(service, run_id="queued")
+    _wait_for(lambda: service._pending.get("queued") is not None)
+    assert service.cancel("queued")
+    queued.join(5)
+    assert answer == [{"run_id": "queued", "status": "cancelled", "messages": ["Cancelled before it started."]}]
+    release.set()
+    first.join(5)
+    assert not service.cancel("queued")
+
+
+# ---- cancellation through the graph ----
+@pytest.fixture
+def graph(service, monkeypatch):
+    main = service.load()
+    from SQL_op_cache import get_operation_cache
+    monkeypatch.setattr(main, "rule_planner_enabled", False)
+    main.parse_cache.clear()
+    get_operation_cache().clear()
+    yield main
+    main.parse_cache.clear()
+
+
+def test_cancel_while_parsing(service, graph, workers_db, monkeypatch):
+    from langchain_core.runnables import RunnableLambda
+    plan = {"operations": [{"tool_name": "Query", "args": {"db_path": workers_db, "conditions": {"table": WORKERS_TABLE}}}]}
+
+    def cancel_then_answer(_prompt):
+        assert service.cancel("parsing")
+        return graph.AIMessage(content=json.dumps(plan))
+
+    monkeypatch.setattr(graph, "parse_model", RunnableLambda(cancel_then_answer))
+    answer = service.submit(f"Database {workers_db}, table {WORKERS_TABLE}. Show every worker.", run_id="parsing")
+    assert answer["status"] == "cancelled" and answer["results"] == []
+    assert answer["messages"][-1].startswith("Request stopped while parsing")
+    assert "parsing" not in active_runs()
+
+
+def test_cancel_before_the_guard_is_registered(service, graph, workers_db, monkeypatch):
+    register_run = SQL_service.register_run
+
+    def register_late(run_id, guard):
+        # The cancel arrives after admission but before the run has a guard
+        assert service.cancel(run_id)
+        return register_run(run_id, guard)
+
+    monkeypatch.setattr(SQL_service, "register_run", register_late)
+    answer = service.submit(f"Database {workers_db}, table {WORKERS_TABLE}. Show every worker.", run_id="early")
+    assert answer["status"] == "cancelled" and answer["results"] == []
+    assert "early" not in active_runs()
+
+
+def test_completed_run(service, graph, workers_db):
+    answer = service.submit(f"Database {workers_db}, table {WORKERS_TABLE}. Show every worker.", result_rows=3)
+    assert answer["status"] == "ok"
+    rows = answer["results"][0]["Query"]
+    assert rows["rows"] == 200 and len(rows["data"]) == 3 and rows["truncated"] is True
+    assert active_runs() == []
+
+
+# ---- HTTP ----
+def test_http_status_codes(service, blocked):
+    started, release = blocked
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(path, payload):
+        request = urllib.request.Request(url + path, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        first = threading.Thread(target=post, args=("/query", {"request": "first", "run_id": "http"}))
+        first.start()
+        assert started.wait(5)
+        assert post("/query", {"request": "again", "run_id": "http"})[0] == 409
+        assert post("/query", {"request": ""})[0] == 400
+        queued = threading.Thread(target=post, args=("/query", {"request": "queued"}))
+        queued.start()
+        _wait_for(lambda: service.health()["queued"] == 1)
+        assert post("/query", {"request": "one too many"})[0] == 429
+        assert post("/cancel", {"run_id": "http"}) == (200, {"run_id": "http", "cancelled": True})
+        release.set()
+        first.join(5)
+        queued.join(5)
+    finally:
+        server.shutdown()
+        server.server_close()
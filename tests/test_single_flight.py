@@ -0,0 +1,131 @@
+# LLM_Test/tests/test_single_flight.py
+
+import threading
+
+import pytest
+
+from SQL_query_guard import QueryAborted
+from SQL_single_flight import SingleFlight
+
+
+def _run_concurrently(n, target):
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        try:
+            results[i] = target(i)
+        except BaseException as ex:
+            errors[i] = ex
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results, errors
+
+
+def test_identical_calls_share_one_computation():
+    flight = SingleFlight("Query")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [{"ID": 1, "Real_Number": 5}]
+
+    def call(i):
+        if i:
+            # Join once the leader is in flight; it finishes well after every waiter arrived
+            started.wait(5)
+        return flight.do("key", compute)
+
+    threading.Timer(0.5, release.set).start()
+    results, errors = _run_concurrently(5, call)
+    assert errors == [None] * 5
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(False) == 1
+    rows = [result for result, _ in results]
+    assert all(r == [{"ID": 1, "Real_Number": 5}] for r in rows)
+    # Every caller gets its own rows, since later tools write into them
+    assert len({id(r[0]) for r in rows}) == 5
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_leader_error_reaches_the_waiters():
+    flight = SingleFlight("Parse")
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("bad plan")
+
+    def call(i):
+        if i:
+            started.wait(5)
+            threading.Timer(0.1, release.set).start()
+        return flight.do("key", fail)
+
+    _, errors = _run_concurrently(2, call)
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_waiter_retries_after_an_aborted_leader():
+    flight = SingleFlight("Query", retry_if=lambda ex: isinstance(ex, QueryAborted))
+    started, release = threading.Event(), threading.Event()
+
+    def leader_fn():
+        started.set()
+        release.wait(5)
+        raise QueryAborted("timeout", "Query stopped after 60.0 s (deadline exceeded)")
+
+    def call(i):
+        if i == 0:
+            return flight.do("key", leader_fn)
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+        return flight.do("key", lambda: "rows of the waiter")
+
+    results, errors = _run_concurrently(2, call)
+    assert isinstance(errors[0], QueryAborted)
+    # The waiter's own request was fine: it ran the Query itself
+    assert errors[1] is None and results[1] == ("rows of the waiter", False)
+
+
+def test_waiter_deadline():
+    flight = SingleFlight("Query")
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 1
+
+    def waiter_check():
+        raise QueryAborted("timeout", "waiter deadline")
+
+    def call(i):
+        if i == 0:
+            return flight.do("key", slow)
+        started.wait(5)
+        try:
+            return flight.do("key", slow, wait_check=waiter_check)
+        finally:
+            release.set()
+
+    results, errors = _run_concurrently(2, call)
+    assert results[0] == (1, False)
+    assert isinstance(errors[1], QueryAborted)
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight("Query")
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+    assert flight.stats() == {"leaders": 2, "shared": 0, "in_flight": 0}
+    with pytest.raises(KeyError):
+        flight.do("a", lambda: {}["missing"])
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,177 @@
+# LLM_Test/tests/test_speculative.py
+
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import WORKERS_TABLE, fetch_rows, run_request
+from SQL_connection_pool import get_connection_pool
+from SQL_query_builder import build_select_sql
+from SQL_query_guard import QueryAborted, QueryGuard, current_guard, guarded
+from SQL_speculative import IncrementalOperationsParser, SpeculativeExecutor
+
+ENDLESS_SQL = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT max(x) FROM n"
+
+
+class _QueryTool:
+    """Runs conditions the way QueryTool does, under a child of the current guard."""
+    name = "Query"
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+
+    def _run(self, db_path, conditions):
+        self.calls += 1
+        with guarded(QueryGuard(parent=current_guard(), label="Query")):
+            with get_connection_pool().connection(db_path) as conn:
+                self.started.set()
+                cursor = conn.execute(ENDLESS_SQL if conditions.get("endless") else build_select_sql(conditions))
+                columns = [d[0] for d in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class _KPITool:
+    name = "KPI"
+
+    def _run(self, **_):
+        raise AssertionError("KPI must not run speculatively")
+
+
+def _query(db_path, **conditions):
+    return {"tool_name": "Query", "args": {"db_path": db_path, "conditions": dict({"table": WORKERS_TABLE}, **conditions)}}
+
+
+def test_parser_emits_each_operation_when_it_closes():
+    ops = [{"tool_name": "Query", "args": {"conditions": {"where": "Name = '{ \\\"x\\\" }' AND ID > 1"}}},
+           {"tool_name": "Sorting", "args": {"data": "$result_of_previous_tool", "field_index": "ID"}}]
+    text = json.dumps({"success": True, "operations": ops, "note": {"tool_name": "not an op"}})
+    parser = IncrementalOperationsParser()
+    emitted = []
+    for i in range(0, len(text), 7):
+        emitted += parser.feed(text[i:i + 7])
+    assert emitted == ops
+
+
+def test_only_queries_are_started_and_claimed_once(workers_db):
+    tool = _QueryTool()
+    executor = SpeculativeExecutor([tool, _KPITool()], normalize=lambda ops: ops)
+    try:
+        op = _query(workers_db, fields=["ID"], where="Real_Number > 50")
+        assert executor.offer(op) is True
+        assert executor.offer(json.loads(json.dumps(op))) is False
+        assert executor.offer({"tool_name": "KPI", "args": {"db_path": workers_db, "table": WORKERS_TABLE}}) is False
+        assert executor.offer({"tool_name": "Query", "args": {"data": "$result_of_previous_tool"}}) is False
+
+        ok, rows = executor.claim(op, timeout=5)
+        expected = fetch_rows(workers_db, f'SELECT ID FROM "{WORKERS_TABLE}" WHERE Real_Number > 50')
+        assert ok and rows == expected
+        assert executor.claim(op) == (False, None)
+        # A plan that validation changed does not match
+        assert executor.claim(_query(workers_db, fields=["ID"])) == (False, None)
+        assert tool.calls == 1
+    finally:
+        executor.cancel_all()
+
+
+def test_cancel_all_interrupts_a_running_query(workers_db):
+    tool = _QueryTool()
+    executor = SpeculativeExecutor([tool], normalize=lambda ops: ops)
+    op = _query(workers_db, endless=True)
+    assert executor.offer(op)
+    assert tool.started.wait(5)
+    with executor._lock:
+        future, _ = next(iter(executor._futures.values()))
+    started = time.monotonic()
+    executor.cancel_all()
+    with pytest.raises(QueryAborted):
+        future.result(timeout=5)
+    assert time.monotonic() - started < 5
+
+
+def test_parent_guard_stops_speculative_queries(workers_db):
+    run_guard = QueryGuard(label="plan")
+    tool = _QueryTool()
+    executor = SpeculativeExecutor([tool], normalize=lambda ops: ops, parent=run_guard)
+    assert executor.offer(_query(workers_db, endless=True))
+    assert tool.started.wait(5)
+    with executor._lock:
+        future, _ = next(iter(executor._futures.values()))
+    run_guard.cancel()
+    with pytest.raises(QueryAborted):
+        future.result(timeout=5)
+    executor.cancel_all()
+
+
+def test_rewritten_prefix_replaces_the_started_query(workers_db):
+    tool = _QueryTool()
+
+    def fold_filter(ops):
+        # Stand-in for the pushdowns: a Filter is folded into the Query before it
+        ops = [op for op in ops]
+        if len(ops) > 1 and ops[1]["tool_name"] == "Filter":
+            ops[0]["args"]["conditions"]["where"] = ops[1]["args"]["predicate"]
+            del ops[1]
+        return ops
+
+    executor = SpeculativeExecutor([tool], normalize=fold_filter)
+    try:
+        assert executor.offer(_query(workers_db, fields=["ID"]))
+        assert executor.offer({"tool_name": "Filter", "args": {"data": "$result_of_previous_tool",
+                                                               "predicate": "Real_Number > 50"}})
+        assert executor.stats == {"started": 2, "replaced": 1, "hits": 0}
+        assert executor.claim(_query(workers_db, fields=["ID"])) == (False, None)
+        ok, rows = executor.claim(_query(workers_db, fields=["ID"], where="Real_Number > 50"), timeout=5)
+        assert ok and rows == fetch_rows(workers_db, f'SELECT ID FROM "{WORKERS_TABLE}" WHERE Real_Number > 50')
+    finally:
+        executor.cancel_all()
+
+
+# ---- through the graph ----
+@pytest.fixture
+def llm_only(monkeypatch):
+    """Every request goes to the (fake) parse model, with speculation on and nothing cached."""
+    import SQL_main_2_3
+    from SQL_op_cache import get_operation_cache
+    monkeypatch.setattr(SQL_main_2_3, "rule_planner_enabled", False)
+    monkeypatch.setattr(SQL_main_2_3, "speculative_execution", True)
+    SQL_main_2_3.parse_cache.clear()
+    get_operation_cache().clear()
+    yield SQL_main_2_3
+    SQL_main_2_3.parse_cache.clear()
+
+
+def test_claim_hits_the_compiled_query(workers_db, llm_only):
+    text = (f"Database {workers_db}, table {WORKERS_TABLE}. Subtract Plan_Number from Real_Number, "
+            "select the worker data with a positive result, and finally display it in descending order.")
+    state = run_request(text)
+    speculator = state["speculation"]
+    # The Expression is pushed into the Query, so the Query streamed first was replaced
+    assert speculator.stats["hits"] == 1 and speculator.stats["replaced"] >= 1
+    assert [list(r)[0] for r in state["results"]] == ["Query", "Sorting"]
+    rows = state["results"][-1]["Sorting"]
+    expected = fetch_rows(workers_db, f'SELECT ID, Real_Number - Plan_Number AS d FROM "{WORKERS_TABLE}" '
+                                      f'WHERE Real_Number - Plan_Number > 0')
+    assert sorted(r["Difference"] for r in rows) == sorted(r["d"] for r in expected)
+    assert [r["Difference"] for r in rows] == sorted((r["Difference"] for r in rows), reverse=True)
+
+
+def test_cancel_while_parsing_stops_the_run(workers_db, llm_only, monkeypatch):
+    from SQL_main_2_3 import AIMessage
+    from SQL_query_guard import active_runs, cancel_run
+    try:
+        from langchain_core.runnables import RunnableLambda
+    except ImportError:
+        from langchain.schema.runnable import RunnableLambda
+
+    def answer_after_cancel(_prompt):
+        assert cancel_run("parse-cancel")
+        return AIMessage(content=json.dumps({"operations": [
+            {"tool_name": "Query", "args": {"db_path": workers_db, "conditions": {"table_name": WORKERS_TABLE}}}]}))
+
+    monkeypatch.setattr(llm_only, "parse_model", RunnableLambda(answer_after_cancel))
+    state = run_request(f"Database {workers_db}, table {WORKERS_TABLE}. Show every worker.", run_id="parse-cancel")
+    assert state["messages"][-1].content.startswith("Request stopped while parsing")
+    assert state["results"] == [] and "parse-cancel" not in active_runs()
@@ -0,0 +1,116 @@
+# LLM_Test/tests/test_stream_stats.py
+
+import random
+import statistics
+from array import array
+from collections import Counter
+
+import pytest
+
+from conftest import parse_time_string
+from SQL_columnar import ColumnarResult
+from SQL_stream_stats import MisraGries, RunningStats, approximate_mode, exact_mode, iter_value_chunks, running_stats
+
+
+def _chunks(values, size):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+# ---- Welford / Chan running statistics ----
+@pytest.mark.parametrize("chunk_rows", [1, 7, 1000])
+def test_running_stats_matches_statistics(chunk_rows):
+    rng = random.Random(5)
+    values = [rng.gauss(50, 12) for _ in range(1000)]
+    stats = running_stats(_chunks(values, chunk_rows))
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(statistics.fmean(values), rel=1e-12)
+    assert stats.stddev == pytest.approx(statistics.stdev(values), rel=1e-9)
+
+
+def test_running_stats_is_stable_with_a_large_offset():
+    # The naive sum / sum-of-squares formula loses every digit of the variance here
+    values = [1e9 + v for v in (4.0, 7.0, 13.0, 16.0)] * 250
+    stats = running_stats(_chunks(values, 3))
+    assert stats.mean == pytest.approx(1e9 + 10.0)
+    assert stats.stddev == pytest.approx(statistics.stdev(values), rel=1e-9)
+
+
+def test_running_stats_skips_nulls_and_parses_times():
+    stats = running_stats([["08:00", None, "10:30"], [None], array("d", [600.0])], parse=parse_time_string)
+    assert stats.count == 3
+    assert stats.mean == pytest.approx((480 + 630 + 600) / 3)
+
+
+def test_running_stats_merge_equals_one_pass():
+    rng = random.Random(9)
+    left = [rng.uniform(0, 100) for _ in range(300)]
+    right = [rng.uniform(50, 500) for _ in range(77)]
+    a, b = running_stats([left]), running_stats([right])
+    a.merge(b.count, b.mean, b.m2)
+    whole = running_stats([left + right])
+    assert a.count == whole.count
+    assert a.mean == pytest.approx(whole.mean, rel=1e-12)
+    assert a.stddev == pytest.approx(whole.stddev, rel=1e-9)
+
+
+def test_running_stats_edge_counts():
+    assert RunningStats().result() == {"count": 0, "mean": 0.0, "stddev": 0.0}
+    one = running_stats([[42]])
+    assert (one.count, one.mean, one.stddev) == (1, 42.0, 0.0)
+
+
+# ---- Mode: exact and Misra-Gries ----
+def test_exact_mode_counts_across_chunks():
+    values = ["Female", None, "Male", "Female", None, "Male", "Female"]
+    assert exact_mode(_chunks(values, 2)) == ("Female", 3, 5)
+    assert exact_mode([[None, None]]) == (None, 0, 0)
+
+
+def test_exact_mode_on_dictionary_encoded_column():
+    data = ColumnarResult.from_rows([{"Gender": g} for g in ["Male", "Female", "Male", None, "Male"]])
+    assert exact_mode(iter_value_chunks(data, "Gender", chunk_rows=2)) == ("Male", 3, 4)
+
+
+@pytest.mark.parametrize("capacity", [1, 4, 16])
+def test_misra_gries_guarantee(capacity):
+    rng = random.Random(capacity)
+    values = [rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(3000)]
+    values += ["hot"] * 900 + ["warm"] * 400
+    rng.shuffle(values)
+    truth = Counter(values)
+
+    sketch = MisraGries(capacity)
+    for chunk in _chunks(values, 97):
+        sketch.add_chunk(chunk)
+        assert len(sketch.counters) <= capacity
+
+    bound = sketch.error_bound
+    assert bound == len(values) // (capacity + 1)
+    for value, true_count in truth.items():
+        kept = sketch.counters.get(value, 0)
+        # Never over-counted, under-counted by at most the bound
+        assert kept <= true_count
+        assert true_count - kept <= bound
+        if true_count > len(values) / (capacity + 1):
+            assert value in sketch.counters
+
+
+def test_approximate_mode_finds_the_majority():
+    values = [1, 2, 3, 1, 4, 1, 5, 1, None, 1]
+    value, count, bound = approximate_mode(_chunks(values, 3), capacity=2)
+    assert value == 1
+    assert count <= 5 and 5 - count <= bound
+
+
+def test_approximate_mode_empty():
+    assert approximate_mode([]) == (None, 0, 0)
+    assert approximate_mode([[None]]) == (None, 0, 0)
+
+
+def test_iter_value_chunks_shapes():
+    rows = [{"Real_Number": i} for i in range(5)]
+    assert list(iter_value_chunks(rows, "Real_Number", chunk_rows=2)) == [[0, 1], [2, 3], [4]]
+    streamed = list(iter_value_chunks(iter([{"Real_Number": 1}, [2, 3], {"Real_Number": 4}]), "Real_Number", chunk_rows=10))
+    assert [v for chunk in streamed for v in chunk] == [1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        list(iter_value_chunks(ColumnarResult.from_rows(rows)))
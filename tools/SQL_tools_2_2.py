@@ -5,6 +5,52 @@ from typing import List, Any, Dict
 import sqlite3
 from langchain.tools import BaseTool
 
+from SQL_kpi_views import (
+    KPI_SOURCES,
+    kpi_table_ready,
+    build_kpi_select,
+    build_kpi_fallback_select,
+)
+from SQL_fusion import compile_steps
+from SQL_expression import (
+    parse_expression,
+    type_check,
+    schema_from_rows,
+    compile_expression,
+    expression_columns,
+    parse_predicate,
+    type_check_predicate,
+    compile_predicate,
+    equality_values,
+)
+from SQL_groupby import group_by_columns, normalize_aggregates, iter_column_chunks, hash_aggregate
+from SQL_join import RIGHT_SUFFIX, join_keys, join_rows, join_query
+from SQL_external_sort import sort_spec, sort_run, external_sort
+from SQL_stream_stats import MODE_SKETCH_SIZE, iter_value_chunks, running_stats, exact_mode, approximate_mode
+from SQL_sampling import mean_interval, proportion_interval, sample_query
+from SQL_op_cache import input_fingerprint, operation_key
+from SQL_single_flight import SingleFlight
+from SQL_query_guard import (
+    QUERY_MAX_ROWS,
+    QUERY_TIMEOUT_S,
+    QueryAborted,
+    QueryGuard,
+    count_rows,
+    current_guard,
+    guarded,
+)
+from SQL_query_builder import build_select_sql
+from SQL_utils import where_for_table
+from SQL_connection_pool import get_connection_pool
+from SQL_fanout import has_glob, iter_fanout, union_all_query
+from SQL_parallel import use_parallel, parallel_binary_op, parallel_sort
+from SQL_columnar import FETCH_CHUNK_ROWS, ColumnarResult, DictColumn, column_values
+
+
+# A waiter does not inherit a leader's timeout, row limit or cancellation: the leader's guard is
+# not the waiter's, so it runs the Query itself and its own wait_check decides when it stops
+query_flight = SingleFlight("Query", retry_if=lambda ex: isinstance(ex, QueryAborted))
+
 
 def parse_time_string(time_str: str) -> float:
     """
@@ -23,7 +69,8 @@ class SQLQueryTool(BaseTool):
     name: str = "Query"
     description: str = (
         "Perform a basic SQL query on a given database. "
-        "Args should contain 'db_path' and 'conditions' (if any)."
+        "Args should contain 'db_path' and 'conditions' (if any). "
+        "'db_path' and 'conditions.table' may contain * wildcards to query many files or daily sheets at once."
     )
 
     def _run(self, db_path: str, conditions: Dict[str, Any] = None) -> List[Dict[str, Any]]:
@@ -35,6 +82,10 @@ class SQLQueryTool(BaseTool):
             "fields": ["*"],
             "where": "Gender='female'"
         }
+        db_path and table may be globs ("E:/Dataset/*.db", "Sheet_*_02_2025"): every match is queried,
+        each row gets a "_source" column, and "order_by"/"reverse" results are merged in order.
+        "sample": 0.05 / 20000 / {...} runs the Query on a random sample of the rows (see SQL_sampling).
+        "timeout" (seconds) and "max_rows" stop a runaway statement (see SQL_query_guard).
         Return: [ {col1: val1, col2: val2, ...}, ... ]
         """
         print(f"[DEBUG][Query] _run called with db_path={db_path}")
@@ -43,32 +94,111 @@ class SQLQueryTool(BaseTool):
         if conditions is None:
             conditions = {}
 
+        # Every statement of this Query runs under its own deadline / row limit,
+        # and stops as well when the plan it belongs to is cancelled
+        guard = QueryGuard(
+            timeout=conditions.get("timeout", QUERY_TIMEOUT_S),
+            max_rows=conditions.get("max_rows", QUERY_MAX_ROWS),
+            parent=current_guard(),
+            label=conditions.get("table", ""),
+        )
+        with guarded(guard):
+            # Identical Queries in flight at the same time (e.g. a dashboard refresh) share one scan
+            args = {"db_path": db_path, "conditions": conditions}
+            key = operation_key(self.name, args, input_fingerprint(self.name, args, None))
+            result, _ = query_flight.do(key, lambda: self._execute(db_path, conditions), wait_check=guard.check)
+            return result
+
+    def _execute(self, db_path: str, conditions: Dict[str, Any]) -> Any:
+
         table = conditions.get("table", "")
         fields = conditions.get("fields", ["*"])
         where_clause = conditions.get("where", None)
 
-        print(f"[DEBUG][Query] table={table}, fields={fields}, where_clause={where_clause}")
+        # Sheets ingested with integer-minute times compare against minutes, not 'HH:MM' text;
+        # a glob is resolved per source by the fan-out
+        if where_clause and not has_glob(db_path) and not has_glob(table):
+            where_clause = where_for_table(db_path, table, where_clause)
+            conditions = dict(conditions, where=where_clause)
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        print(f"[DEBUG][Query] table={table}, fields={fields}, where_clause={where_clause}")
 
-        sql_fields = ", ".join(fields)
-        sql_query = f"SELECT {sql_fields} FROM {table}"
-        if where_clause:
-            sql_query += f" WHERE {where_clause}"
+        # Approximate mode: the Query runs on a sample of the rows
+        if conditions.get("sample"):
+            try:
+                dict_list = sample_query(db_path, conditions)
+            except QueryAborted:
+                raise
+            except Exception as ex:
+                print("[ERROR][Query] Exception during sampled execution:", ex)
+                traceback.print_exc()
+                dict_list = []
+            print(f"[DEBUG][Query] returned dict_list => {dict_list[:5]}... (show first 5)")
+            if conditions.get("format") == "columnar":
+                return ColumnarResult.from_rows(dict_list)
+            return dict_list
+
+        # Fan-out mode: a file glob and / or a table glob, scanned in parallel and merged
+        if has_glob(db_path) or has_glob(table):
+            mode = conditions.get("fanout_mode", "parallel")
+            print(f"[DEBUG][Query] fan-out ({mode}) over {db_path} / {table}")
+            try:
+                if mode == "union":
+                    dict_list = union_all_query(db_path, conditions)
+                else:
+                    dict_list = list(iter_fanout(db_path, conditions))
+            except QueryAborted:
+                raise
+            except Exception as ex:
+                print("[ERROR][Query] Exception during fan-out execution:", ex)
+                traceback.print_exc()
+                dict_list = []
+            print(f"[DEBUG][Query] returned dict_list => {dict_list[:5]}... (show first 5)")
+            if conditions.get("format") == "columnar":
+                return ColumnarResult.from_rows(dict_list)
+            return dict_list
+
+        # A Join pushed down into this Query: both tables are joined by SQLite
+        if conditions.get("join"):
+            try:
+                dict_list = join_query(db_path, conditions)
+            except QueryAborted:
+                raise
+            except Exception as ex:
+                print("[ERROR][Query] Exception during join execution:", ex)
+                traceback.print_exc()
+                dict_list = []
+            print(f"[DEBUG][Query] returned dict_list => {dict_list[:5]}... (show first 5)")
+            if conditions.get("format") == "columnar":
+                return ColumnarResult.from_rows(dict_list)
+            return dict_list
+
+        sql_query = build_select_sql(conditions)
         print(f"[DEBUG][Query] final SQL => {sql_query}")
 
+        # "format": "columnar" builds the result column by column straight from the cursor
+        columnar = conditions.get("format") == "columnar"
+
         rows = []
         columns = []
         try:
-            cursor.execute(sql_query)
-            rows = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
+            with get_connection_pool().connection(db_path, conditions.get("access_profile")) as conn:
+                cursor = conn.execute(sql_query)
+                if columnar:
+                    result = ColumnarResult.from_cursor(cursor)
+                    print(f"[DEBUG][Query] returned {result}")
+                    return result
+                columns = [desc[0] for desc in cursor.description]
+                for chunk in iter(lambda: cursor.fetchmany(FETCH_CHUNK_ROWS), []):
+                    count_rows(len(chunk))
+                    rows.extend(chunk)
+        except QueryAborted:
+            raise
         except Exception as ex:
             print("[ERROR][Query] Exception during SQL execution:", ex)
             traceback.print_exc()
-        finally:
-            conn.close()
+            if columnar:
+                return ColumnarResult({}, 0)
 
         # Convert rows to a list [dic]
         dict_list = []
@@ -88,24 +218,49 @@ class SQLSortingTool(BaseTool):
     name: str = "Sorting"
     description: str = (
         "Sort the given list of data by a specified field, "
-        "in ascending or descending order."
+        "in ascending or descending order. "
+        "'field_index' may be a list of columns and 'reverse' a list of flags, one per column."
     )
 
-    def _run(self, data: List[Dict[str, Any]], field_index, reverse: bool = False) -> List[Dict[str, Any]]:
+    def _run(self, data: Any, field_index, reverse: Any = False, parallel: bool = None,
+             memory_rows: int = None) -> List[Dict[str, Any]]:
         """
-        data: list of dict
-        field_index: might be an integer subscript (in old code) or a string
+        data: list of dict, a ColumnarResult, or an iterator of dicts (sorted with spilling)
+        field_index: might be an integer subscript (in old code), a string or a list of strings
+        reverse: bool, or one bool per column of a list field_index
+        parallel: True / False forces the process-pool sort, None decides by data size
+        memory_rows: rows of a row stream sorted in memory at once before spilling to disk
         """
         print(f"[DEBUG][Sorting] _run called with field_index={field_index}, reverse={reverse}")
+        if not isinstance(data, (list, ColumnarResult)):
+            # A row stream: sort it in runs that spill to disk and merge them back
+            spec = sort_spec(field_index, reverse)
+            sorted_data = list(external_sort(data, spec, memory_rows))
+            print(f"[DEBUG][Sorting] sorted_data preview => {sorted_data[:3]}")
+            return sorted_data
         print(f"[DEBUG][Sorting] data preview => {data[:3]}")  # Only print the first 3 lines to avoid too much output
 
-        if isinstance(field_index, str):
-            # Sort by column name
-            sorted_data = sorted(
-                data,
-                key=lambda x: x.get(field_index, None),
-                reverse=reverse
-            )
+        if isinstance(data, ColumnarResult):
+            # Sort only the key columns' indices, then gather every column once
+            order = list(range(len(data)))
+            for column, descending in reversed(sort_spec(field_index, reverse)):
+                keys = data.column(column)
+                order.sort(key=keys.__getitem__, reverse=descending)
+            sorted_data = data.take(order)
+        elif isinstance(field_index, (list, tuple)):
+            # The rows are in memory already: sort a copy, the caller's list stays as it was
+            sorted_data = sort_run(list(data), sort_spec(field_index, reverse))
+        elif isinstance(field_index, str):
+            # Sort by column name, large numeric keys are sort-merged on the process pool
+            sorted_data = None
+            if use_parallel(data, parallel):
+                sorted_data = parallel_sort(data, field_index, reverse)
+            if sorted_data is None:
+                sorted_data = sorted(
+                    data,
+                    key=lambda x: x.get(field_index, None),
+                    reverse=reverse
+                )
         elif isinstance(field_index, int):
             # In old code, if each row is a list
             # But now we change row to dict and no longer use this pattern
@@ -183,6 +338,9 @@ class AdditionTool(BaseTool):
             output_col = kwargs["output_column"]
             print(f"[DEBUG][AdditionTool] Column-based addition: col1={col1}, col2={col2}, output_col={output_col}")
 
+            if use_parallel(data, kwargs.get("parallel")):
+                return parallel_binary_op(data, col1, col2, "+", output_col, parse_time_string)
+
             for row in data:
                 val1 = parse_time_string(row[col1])
                 val2 = parse_time_string(row[col2])
@@ -234,6 +392,9 @@ class SubtractionTool(BaseTool):
             output_col = kwargs["output_column"]
             print(f"[DEBUG][SubtractionTool] Column-based subtraction: col1={col1}, col2={col2}, output_col={output_col}")
 
+            if use_parallel(data, kwargs.get("parallel")):
+                return parallel_binary_op(data, col1, col2, "-", output_col, parse_time_string)
+
             for row in data:
                 val1 = parse_time_string(row[col1])
                 val2 = parse_time_string(row[col2])
@@ -285,6 +446,9 @@ class MultiplicationTool(BaseTool):
             output_col = kwargs["output_column"]
             print(f"[DEBUG][MultiplicationTool] Column-based multiplication: col1={col1}, col2={col2}, output_col={output_col}")
 
+            if use_parallel(data, kwargs.get("parallel")):
+                return parallel_binary_op(data, col1, col2, "*", output_col, parse_time_string)
+
             for row in data:
                 val1 = parse_time_string(row[col1])
                 val2 = parse_time_string(row[col2])
@@ -339,6 +503,9 @@ class DivisionTool(BaseTool):
             output_col = kwargs["output_column"]
             print(f"[DEBUG][DivisionTool] Column-based division: col1={col1}, col2={col2}, output_col={output_col}")
 
+            if use_parallel(data, kwargs.get("parallel")):
+                return parallel_binary_op(data, col1, col2, "/", output_col, parse_time_string)
+
             for row in data:
                 val1 = parse_time_string(row[col1])
                 val2 = parse_time_string(row[col2])
@@ -354,18 +521,242 @@ class DivisionTool(BaseTool):
         raise ValueError("Invalid arguments for DivisionTool.")
 
 
+class ExpressionTool(BaseTool):
+    """
+    Evaluate an arithmetic expression over columns and numeric literals for every row.
+    Example 'args':
+    {
+      "data": ...,
+      "expression": "(Real_Number - Plan_Number) / (End_Time - Start_Time)",
+      "output_column": "Real_Gain_KPI"
+    }
+    """
+    name: str = "Expression"
+    description: str = (
+        "Compute a new column from an arithmetic expression (+ - * / and parentheses) over columns and numbers. "
+        "'HH:MM' time columns are used as minutes, division by zero gives 0. "
+        "Args should contain 'data', 'expression' and 'output_column'."
+    )
+
+    def _run(self, data: List[Dict[str, Any]], expression: str, output_column: str) -> List[Dict[str, Any]]:
+        print(f"[DEBUG][Expression] _run called with expression={expression}, output_column={output_column}")
+        if not data:
+            return data
+
+        node = parse_expression(expression)
+        type_check(node, schema_from_rows(data))
+        compile_expression(expression, output_column)(data, parse_time_string)
+        return data
+
+    def _arun(self, *args, **kwargs):
+        print("[WARN][Expression] Async run not implemented.")
+        raise NotImplementedError("Async run not implemented.")
+
+
+class FilterTool(BaseTool):
+    """
+    Keep the rows that satisfy a predicate over result columns, including computed ones.
+    Example 'args':
+    {
+      "data": ...,
+      "predicate": "Difference > 0 and Gender = 'Female'"
+    }
+    """
+    name: str = "Filter"
+    description: str = (
+        "Keep only the rows whose columns satisfy a condition, e.g. 'Difference > 0' or "
+        "\"Qualified_KPI >= 0.5 and Start_Time < '09:00'\". Works on computed columns too. "
+        "Args should contain 'data' and 'predicate'."
+    )
+
+    def _run(self, data: Any, predicate: str, chunk_rows: int = FETCH_CHUNK_ROWS) -> Any:
+        print(f"[DEBUG][Filter] _run called with predicate={predicate}")
+        node = parse_predicate(predicate)
+        cols = sorted(expression_columns(node))
+        mask_of = compile_predicate(predicate)
+
+        if isinstance(data, ColumnarResult):
+            type_check_predicate(node, {c: "number" for c in data.column_names()})
+            equality = equality_values(node)
+            if equality is not None and isinstance(data.column(equality[0]), DictColumn):
+                # "Gender = 'Female'" / "Name = 'A' or Name = 'B'": compare codes, never decode the column
+                result = data.filter_in(*equality)
+                print(f"[DEBUG][Filter] kept {len(result)} of {len(data)} rows (dictionary codes)")
+                return result
+            columns = {c: data.column(c) for c in cols}
+            indices = []
+            for start in range(0, data.num_rows, chunk_rows):
+                chunk = {c: col[start:start + chunk_rows] for c, col in columns.items()}
+                mask = mask_of(chunk, parse_time_string)
+                indices.extend(start + i for i, keep in enumerate(mask) if keep)
+            result = data.take(indices)
+        else:
+            if not data:
+                return data
+            type_check_predicate(node, {c: "number" for c in data[0].keys()})
+            result = []
+            for start in range(0, len(data), chunk_rows):
+                rows = data[start:start + chunk_rows]
+                mask = mask_of({c: [row.get(c) for row in rows] for c in cols}, parse_time_string)
+                result.extend(row for row, keep in zip(rows, mask) if keep)
+
+        print(f"[DEBUG][Filter] kept {len(result)} of {len(data)} rows")
+        return result
+
+    def _arun(self, *args, **kwargs):
+        print("[WARN][Filter] Async run not implemented.")
+        raise NotImplementedError("Async run not implemented.")
+
+
+class GroupByTool(BaseTool):
+    """
+    Per-group aggregates with hash aggregation in one pass over the rows.
+    Example 'args':
+    {
+      "data": ...,
+      "by": ["Gender"],
+      "aggregates": [
+        {"func": "avg", "column": "Qualified_KPI", "output_column": "avg_Qualified_KPI"},
+        {"func": "count"}
+      ]
+    }
+    """
+    name: str = "GroupBy"
+    description: str = (
+        "Group rows by one or more columns and compute sum, avg, min, max, count or mode per group. "
+        "Args should contain 'data', 'by' (column or list of columns) and 'aggregates' "
+        "(list of {'func', 'column', optional 'output_column'}; count without column counts rows)."
+    )
+
+    def _run(self, data: Any, by: Any, aggregates: Any, chunk_rows: int = FETCH_CHUNK_ROWS) -> List[Dict[str, Any]]:
+        print(f"[DEBUG][GroupBy] _run called with by={by}, aggregates={aggregates}")
+        by = group_by_columns(by)
+        aggregates = normalize_aggregates(aggregates)
+        if not data:
+            return []
+
+        columns = list(dict.fromkeys(by + [a["column"] for a in aggregates if a["column"] != "*"]))
+        available = data.column_names() if isinstance(data, ColumnarResult) else list(data[0].keys())
+        missing = [c for c in columns if c not in available]
+        if missing:
+            raise ValueError(f"GroupBy columns {missing} not in data, available columns: {available}")
+
+        result = hash_aggregate(iter_column_chunks(data, columns, chunk_rows), by, aggregates, parse_time_string)
+        print(f"[DEBUG][GroupBy] {len(data)} rows => {len(result)} groups")
+        return result
+
+    def _arun(self, *args, **kwargs):
+        print("[WARN][GroupBy] Async run not implemented.")
+        raise NotImplementedError("Async run not implemented.")
+
+
+class JoinTool(BaseTool):
+    """
+    Combine the previous result with the rows of another table on key columns (hash join).
+    Example 'args':
+    {
+      "data": ...,
+      "right": {"db_path": "E:/LLMTest/Dataset/test_dataset.db",
+                "conditions": {"table": "Workers_21012025", "fields": ["ID","Qualified_Number"]}},
+      "on": ["ID"],
+      "how": "inner",
+      "suffix": "_right"
+    }
+    """
+    name: str = "Join"
+    description: str = (
+        "Join the input rows with the rows of another table (or a list of rows) on key columns, "
+        "e.g. to compare a worker between two daily sheets. Args should contain 'data', 'right' "
+        "({'db_path', 'conditions'} like a Query, or rows), 'on' (key column(s), or {'left': ..., 'right': ...}) "
+        "and optionally 'how' ('inner' or 'left') and 'suffix' for right columns whose name is taken (default '_right')."
+    )
+
+    def _run(self, data: Any, right: Any, on: Any, how: str = "inner", suffix: str = RIGHT_SUFFIX,
+             chunk_rows: int = FETCH_CHUNK_ROWS) -> List[Dict[str, Any]]:
+        print(f"[DEBUG][Join] _run called with on={on}, how={how}")
+        keys = join_keys(on)
+        if not data:
+            return []
+
+        available = data.column_names() if isinstance(data, ColumnarResult) else list(data[0].keys())
+        missing = [l for l, _ in keys if l not in available]
+        if missing:
+            raise ValueError(f"Join key columns {missing} not in data, available columns: {available}")
+
+        result = join_rows(data, right, keys, how, suffix, chunk_rows)
+        print(f"[DEBUG][Join] {len(data)} left rows => {len(result)} joined rows")
+        return result
+
+    def _arun(self, *args, **kwargs):
+        print("[WARN][Join] Async run not implemented.")
+        raise NotImplementedError("Async run not implemented.")
+
+
+class FusedArithmeticTool(BaseTool):
+    """
+    Runs a chain of Addition / Subtraction / Multiplication / Division in a single pass.
+    It is not planned by the LLM: the executor builds it with SQL_fusion.fuse_arithmetic_ops.
+    Example 'args':
+    {
+      "data": ...,
+      "steps": [
+        {"op": "-", "inputs": ["End_Time","Start_Time"], "output": "Work_Time"},
+        {"op": "/", "inputs": ["Qualified_Number","Work_Time"], "output": "Qualified_KPI"}
+      ],
+      "materialize": ["Qualified_KPI"]
+    }
+    """
+    name: str = "FusedArithmetic"
+    description: str = (
+        "Perform several row-wise arithmetic steps on input data in one pass. "
+        "Args should contain 'data', 'steps' and 'materialize'."
+    )
+
+    def _run(self, data: List[Dict[str, Any]], steps: List[Dict[str, Any]], materialize: List[str] = None) -> List[Dict[str, Any]]:
+        if materialize is None:
+            materialize = [steps[-1]["output"]]
+        print(f"[DEBUG][FusedArithmetic] steps={steps}, materialize={materialize}")
+
+        fused = compile_steps(steps, materialize)
+        zero_div = fused(data, parse_time_string)
+        if zero_div:
+            print(f"[WARN][FusedArithmetic] Divisor is zero in {zero_div} rows, use 0.0 instead.")
+        return data
+
+    def _arun(self, *args, **kwargs):
+        print("[WARN][FusedArithmetic] Async run not implemented.")
+        raise NotImplementedError("Async run not implemented.")
+
+
 class AveragingTool(BaseTool):
     name: str = "Averaging"
     description: str = (
         "Compute the average of a list of numeric values. "
-        "Args should be something like {'data': [1,2,3]}."
+        "Args should be something like {'data': [1,2,3]}, "
+        "or {'data': ..., 'column': 'Real_Number'} for a column of a previous result. "
+        "With 'stats': true it returns {'count', 'mean', 'stddev'}; with 'confidence': 0.95 also the "
+        "confidence interval of the mean (for a sampled Query result)."
     )
 
-    def _run(self, data: List[float]) -> float:
-        print(f"[DEBUG][AveragingTool] data => {data[:5]} ...")
-        if not data:
-            return 0.0
-        val = sum(data) / len(data)
+    def _run(self, data: Any, column: str = None, stats: bool = False, confidence: float = None,
+             chunk_rows: int = FETCH_CHUNK_ROWS) -> Any:
+        """
+        data: list, ColumnarResult, or a stream of values / rows / chunks, read once chunk by chunk
+        stats: return count, mean and (sample) stddev instead of the mean only
+        confidence: e.g. 0.95 for a sampled input, adds the confidence interval of the mean (ci_low, ci_high)
+        """
+        if isinstance(data, (list, ColumnarResult)):
+            preview = column_values(data if isinstance(data, ColumnarResult) else data[:5], column)[:5]
+            print(f"[DEBUG][AveragingTool] data => {preview} ...")
+        running = running_stats(iter_value_chunks(data, column, chunk_rows), parse_time_string)
+        if confidence is not None:
+            val = running.result()
+            val["confidence"] = confidence
+            val["ci_low"], val["ci_high"] = mean_interval(running, confidence)
+        elif stats:
+            val = running.result()
+        else:
+            val = running.mean if running.count else 0.0
         print(f"[DEBUG][AveragingTool] return => {val}")
         return val
 
@@ -377,17 +768,44 @@ class AveragingTool(BaseTool):
 class ModeTool(BaseTool):
     name: str = "Mode"
     description: str = (
-        "Find the most common value (mode) of a list of numeric or string values."
+        "Find the most common value (mode) of a list of numeric or string values. "
+        "Args should be {'data': [...]} or {'data': ..., 'column': 'Gender'} for a column of a previous result. "
+        "'approximate': true uses a small fixed-size summary for columns with very many distinct values; "
+        "'confidence': 0.95 returns the mode with the confidence interval of its share (for a sampled Query result)."
     )
 
-    def _run(self, data: List[Any]) -> Any:
-        print(f"[DEBUG][ModeTool] data => {data[:5]} ...")
-        if not data:
-            return None
-        from collections import Counter
-        c = Counter(data)
-        most_common_val, count = c.most_common(1)[0]
-        print(f"[DEBUG][ModeTool] return => {most_common_val}, count={count}")
+    def _run(self, data: Any, column: str = None, approximate: bool = False, capacity: int = MODE_SKETCH_SIZE,
+             confidence: float = None, chunk_rows: int = FETCH_CHUNK_ROWS) -> Any:
+        """
+        data: list, ColumnarResult, or a stream of values / rows / chunks, read once chunk by chunk
+        approximate: Misra-Gries heavy hitters with at most 'capacity' counters instead of a full hash count
+        confidence: e.g. 0.95 for a sampled input, returns {'value', 'count', 'share', 'ci_low', 'ci_high'}
+                    with the confidence interval of the mode's share of the rows
+        """
+        if confidence is not None:
+            most_common_val, count, total = exact_mode(iter_value_chunks(data, column, chunk_rows))
+            low, high = proportion_interval(count, total, confidence)
+            val = {"value": most_common_val, "count": count, "share": count / total if total else 0.0,
+                   "confidence": confidence, "ci_low": low, "ci_high": high}
+            print(f"[DEBUG][ModeTool] return => {val}")
+            return val
+
+        if isinstance(data, (list, ColumnarResult)):
+            preview = column_values(data if isinstance(data, ColumnarResult) else data[:5], column)
+            print(f"[DEBUG][ModeTool] data => {preview[:5]} ...")
+            if isinstance(preview, DictColumn) and not approximate:
+                # Count integer codes instead of hashing every string
+                most_common_val, count = preview.mode()
+                print(f"[DEBUG][ModeTool] return => {most_common_val}, count={count}")
+                return most_common_val
+
+        chunks = iter_value_chunks(data, column, chunk_rows)
+        if approximate:
+            most_common_val, count, error = approximate_mode(chunks, capacity)
+            print(f"[DEBUG][ModeTool] return => {most_common_val}, count>={count} (error <= {error})")
+        else:
+            most_common_val, count, _ = exact_mode(chunks)
+            print(f"[DEBUG][ModeTool] return => {most_common_val}, count={count}")
         return most_common_val
 
     def _arun(self, *args, **kwargs):
@@ -395,5 +813,69 @@ class ModeTool(BaseTool):
         raise NotImplementedError("Async run not implemented.")
 
 
+class KPIViewTool(BaseTool):
+    """
+    Look up Plan/Real/Qualified KPI (*_Number / Work_Time) from the materialized KPI table
+    of a worker sheet instead of recomputing Subtraction + Division on every request.
+    Sheets without a KPI table are answered with the same columns computed on the fly.
+    Example 'args':
+    {
+      "db_path": "E:/LLMTest/Dataset/test_dataset.db",
+      "table": "Workers_20012025",
+      "kpi": ["Qualified_KPI"],
+      "fields": ["ID","Name"],
+      "where": "Qualified_KPI > 0.1",
+      "order_by": "Qualified_KPI",
+      "reverse": true
+    }
+    """
+    name: str = "KPI"
+    description: str = (
+        "Get Plan_KPI / Real_KPI / Qualified_KPI (Number divided by Work_Time in minutes) of a worker table. "
+        "Args should contain 'db_path', 'table', 'kpi' and optionally 'fields', 'where', 'order_by', 'reverse', 'limit'."
+    )
+
+    def _run(
+        self,
+        db_path: str,
+        table: str,
+        kpi: Any = None,
+        fields: List[str] = None,
+        where: str = None,
+        order_by: str = None,
+        reverse: bool = False,
+        limit: int = None,
+    ) -> List[Dict[str, Any]]:
+        print(f"[DEBUG][KPIView] _run called with db_path={db_path}, table={table}, kpi={kpi}")
+
+        if kpi is None:
+            kpis = list(KPI_SOURCES.keys())
+        elif isinstance(kpi, str):
+            kpis = [kpi]
+        else:
+            kpis = list(kpi)
+        for k in kpis:
+            if k not in KPI_SOURCES:
+                raise ValueError(f"Unknown KPI '{k}', must be one of {list(KPI_SOURCES.keys())}")
+
+        # Read only: the KPI table is built by an explicit step (SQL_ingest.py --kpi or
+        # SQL_kpi_views.py), a sheet without one gets its KPIs computed in the query
+        where = where_for_table(db_path, table, where)
+        with get_connection_pool().connection(db_path) as conn:
+            if kpi_table_ready(conn, table):
+                sql_query = build_kpi_select(table, kpis, fields, where, order_by, reverse, limit)
+            else:
+                print(f"[DEBUG][KPIView] {table} has no materialized KPI table, computing KPIs inline")
+                sql_query = build_kpi_fallback_select(table, kpis, fields, where, order_by, reverse, limit)
+
+            print(f"[DEBUG][KPIView] final SQL => {sql_query}")
+            cursor = conn.execute(sql_query)
+            columns = [desc[0] for desc in cursor.description]
+            dict_list = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+        print(f"[DEBUG][KPIView] returned dict_list => {dict_list[:5]}... (show first 5)")
+        return dict_list
 
+    def _arun(self, *args, **kwargs):
+        print("[WARN][KPIView] Async run not implemented.")
+        raise NotImplementedError("Async run not implemented.")